@@ -3,10 +3,17 @@
 #endif
 #include "backends.h"
 #include "redismodule.h"
+#include "lazyfree.h"
 
+#include <stdio.h>
 #include <string.h>
+#include <unistd.h>
 #include <dlfcn.h>
 #include <libgen.h>
+#include <sys/stat.h>
+
+// directory where backends cache compiled models, NULL if disabled
+static char* RAI_CompileCacheDir = NULL;
 
 RedisModuleString* RAI_GetModulePath(RedisModuleCtx *ctx) {
   Dl_info info;
@@ -49,6 +56,36 @@ const char* RAI_BackendName(int backend) {
   return NULL;
 }
 
+/* Resolve the functions backends get from the main module, and the
+ * RedisModule_* functions otherwise. */
+static int RAI_GetApi(const char* name, void* func) {
+  if (strcmp(name, "RAI_LazyFreeLarge") == 0) {
+    *(void**)func = (void*)RAI_LazyFreeLarge;
+    return REDISMODULE_OK;
+  }
+  return RedisModule_GetApi(name, func);
+}
+
+/* Every run queue worker gets its own intra-op pool, size the pools so that
+ * together they use about one thread per core. AI.CONFIG BACKEND <backend>
+ * INTRA_OP_THREADS overrides this. */
+static void RAI_SetDefaultIntraOpThreads(RedisModuleCtx *ctx, RAI_LoadedBackend *backend, const char *name) {
+  if (backend->set_option == NULL) {
+    return;
+  }
+  long long threads = sysconf(_SC_NPROCESSORS_ONLN) / perqueueThreadPoolSize;
+  if (threads < 1) {
+    threads = 1;
+  }
+  char value[32];
+  snprintf(value, sizeof(value), "%lld", threads);
+  RAI_Error err = {0};
+  if (backend->set_option("INTRA_OP_THREADS", value, &err) != REDISMODULE_OK) {
+    RedisModule_Log(ctx, "warning", "Could not set %s intra-op threads: %s", name, err.detail);
+  }
+  RAI_ClearError(&err);
+}
+
 int RAI_LoadBackend_TensorFlow(RedisModuleCtx *ctx, const char *path) {
   if (RAI_backends.tf.model_run != NULL) {
     RedisModule_Log(ctx, "warning", "Could not load TF backend: backend already loaded");
@@ -72,7 +109,7 @@ int RAI_LoadBackend_TensorFlow(RedisModuleCtx *ctx, const char *path) {
     RedisModule_Log(ctx, "warning", "Backend does not export RAI_InitBackendTF. TF backend not loaded from %s", path);
     return REDISMODULE_ERR;
   }
-  init_backend(RedisModule_GetApi);
+  init_backend(RAI_GetApi);
 
   backend.model_create_with_nodes = (RAI_Model* (*)(RAI_Backend, const char*, RAI_ModelOpts,
                                      size_t, const char**, size_t, const char**,
@@ -108,10 +145,19 @@ int RAI_LoadBackend_TensorFlow(RedisModuleCtx *ctx, const char *path) {
     return REDISMODULE_ERR;
   }
 
+  // not required, models without a signature need SHAPE to be warmed up
+  backend.model_signature = (int (*)(RAI_Model*, RAI_ModelInputShape**, size_t*, RAI_Error*))
+                            (unsigned long) dlsym(handle, "RAI_ModelSignatureTF");
+
+  backend.set_option = (int (*)(const char*, const char*, RAI_Error*))
+                       (unsigned long) dlsym(handle, "RAI_SetOptionTF");
+
   RAI_backends.tf = backend;
 
   RedisModule_Log(ctx, "notice", "TF backend loaded from %s", path);
 
+  RAI_SetDefaultIntraOpThreads(ctx, &backend, "TF");
+
   return REDISMODULE_OK;
 }
 
@@ -138,7 +184,7 @@ int RAI_LoadBackend_TFLite(RedisModuleCtx *ctx, const char *path) {
     RedisModule_Log(ctx, "warning", "Backend does not export RAI_InitBackendTFLite. TFLITE backend not loaded from %s", path);
     return REDISMODULE_ERR;
   }
-  init_backend(RedisModule_GetApi);
+  init_backend(RAI_GetApi);
 
   backend.model_create = (RAI_Model* (*)(RAI_Backend, const char*, RAI_ModelOpts,
                           const char*, size_t, RAI_Error*))
@@ -173,6 +219,13 @@ int RAI_LoadBackend_TFLite(RedisModuleCtx *ctx, const char *path) {
     return REDISMODULE_ERR;
   }
 
+  // not required, models without a signature need SHAPE to be warmed up
+  backend.model_signature = (int (*)(RAI_Model*, RAI_ModelInputShape**, size_t*, RAI_Error*))
+                            (unsigned long) dlsym(handle, "RAI_ModelSignatureTFLite");
+
+  backend.set_option = (int (*)(const char*, const char*, RAI_Error*))
+                       (unsigned long) dlsym(handle, "RAI_SetOptionTFLite");
+
   RAI_backends.tflite = backend;
 
   RedisModule_Log(ctx, "notice", "TFLITE backend loaded from %s", path);
@@ -203,7 +256,7 @@ int RAI_LoadBackend_Torch(RedisModuleCtx *ctx, const char *path) {
     RedisModule_Log(ctx, "warning", "Backend does not export RAI_InitBackendTorch. TORCH backend not loaded from %s", path);
     return REDISMODULE_ERR;
   }
-  init_backend(RedisModule_GetApi);
+  init_backend(RAI_GetApi);
 
   backend.model_create = (RAI_Model* (*)(RAI_Backend, const char*, RAI_ModelOpts,
                           const char*, size_t, RAI_Error*))
@@ -262,10 +315,15 @@ int RAI_LoadBackend_Torch(RedisModuleCtx *ctx, const char *path) {
     return REDISMODULE_ERR;
   }
 
+  backend.set_option = (int (*)(const char*, const char*, RAI_Error*))
+                       (unsigned long) dlsym(handle, "RAI_SetOptionTorch");
+
   RAI_backends.torch = backend;
 
   RedisModule_Log(ctx, "notice", "TORCH backend loaded from %s", path);
 
+  RAI_SetDefaultIntraOpThreads(ctx, &backend, "TORCH");
+
   return REDISMODULE_OK;
 }
 
@@ -292,12 +350,13 @@ int RAI_LoadBackend_ONNXRuntime(RedisModuleCtx *ctx, const char *path) {
     RedisModule_Log(ctx, "warning", "Backend does not export RAI_InitBackendORT. ONNX backend not loaded from %s", path);
     return REDISMODULE_ERR;
   }
-  init_backend(RedisModule_GetApi);
+  init_backend(RAI_GetApi);
 
-  backend.model_create = (RAI_Model* (*)(RAI_Backend, const char*, RAI_ModelOpts,
-                          const char*, size_t, RAI_Error*))
-                         (unsigned long) dlsym(handle, "RAI_ModelCreateORT");
-  if (backend.model_create == NULL) {
+  backend.model_create_with_nodes = (RAI_Model* (*)(RAI_Backend, const char*, RAI_ModelOpts,
+                                     size_t, const char**, size_t, const char**,
+                                     const char*, size_t, RAI_Error*))
+                                     (unsigned long) dlsym(handle, "RAI_ModelCreateORT");
+  if (backend.model_create_with_nodes == NULL) {
     dlclose(handle);
     RedisModule_Log(ctx, "warning", "Backend does not export RAI_ModelCreateORT. ONNX backend not loaded from %s", path);
     return REDISMODULE_ERR;
@@ -327,10 +386,25 @@ int RAI_LoadBackend_ONNXRuntime(RedisModuleCtx *ctx, const char *path) {
     return REDISMODULE_ERR;
   }
 
+  // not required, models without a signature need SHAPE to be warmed up
+  backend.model_signature = (int (*)(RAI_Model*, RAI_ModelInputShape**, size_t*, RAI_Error*))
+                            (unsigned long) dlsym(handle, "RAI_ModelSignatureORT");
+
+  backend.set_compile_cache_dir = (void (*)(const char*))
+                                  (unsigned long) dlsym(handle, "RAI_SetCompileCacheDirORT");
+  if (backend.set_compile_cache_dir) {
+    backend.set_compile_cache_dir(RAI_CompileCacheDir);
+  }
+
+  backend.set_option = (int (*)(const char*, const char*, RAI_Error*))
+                       (unsigned long) dlsym(handle, "RAI_SetOptionORT");
+
   RAI_backends.onnx = backend;
 
   RedisModule_Log(ctx, "notice", "ONNX backend loaded from %s", path);
 
+  RAI_SetDefaultIntraOpThreads(ctx, &backend, "ONNX");
+
   return REDISMODULE_OK;
 }
 
@@ -374,3 +448,90 @@ int RAI_LoadDefaultBackend(RedisModuleCtx *ctx, int backend) {
 
   return REDISMODULE_ERR;
 }
+
+int RAI_IsBackendLoaded(int backend) {
+  switch (backend) {
+    case RAI_BACKEND_TENSORFLOW:
+      return RAI_backends.tf.model_run != NULL;
+    case RAI_BACKEND_TFLITE:
+      return RAI_backends.tflite.model_run != NULL;
+    case RAI_BACKEND_TORCH:
+      return RAI_backends.torch.model_run != NULL;
+    case RAI_BACKEND_ONNXRUNTIME:
+      return RAI_backends.onnx.model_run != NULL;
+  }
+
+  return 0;
+}
+
+/* Load the default library for the backend, unless a backend is already loaded. */
+int RAI_EnsureBackendLoaded(RedisModuleCtx *ctx, int backend) {
+  if (RAI_IsBackendLoaded(backend)) {
+    return REDISMODULE_OK;
+  }
+
+  RedisModule_Log(ctx, "warning", "backend %s not loaded, will try loading default backend", RAI_BackendName(backend));
+
+  return RAI_LoadDefaultBackend(ctx, backend);
+}
+
+/* Set the directory where backends cache the models they compile, an empty
+ * path disables the cache. Backends that don't produce compiled artifacts
+ * ignore it. */
+int RAI_SetCompileCacheDir(const char *path) {
+  if (path[0] != '\0') {
+    struct stat st;
+    if (stat(path, &st) != 0 || !S_ISDIR(st.st_mode)) {
+      return REDISMODULE_ERR;
+    }
+  }
+
+  if (RAI_CompileCacheDir) {
+    RedisModule_Free(RAI_CompileCacheDir);
+  }
+  RAI_CompileCacheDir = path[0] != '\0' ? RedisModule_Strdup(path) : NULL;
+
+  RAI_LoadedBackend* backends[] = {&RAI_backends.tf, &RAI_backends.tflite,
+                                   &RAI_backends.torch, &RAI_backends.onnx};
+  for (size_t i=0; i<sizeof(backends)/sizeof(backends[0]); i++) {
+    if (backends[i]->set_compile_cache_dir) {
+      backends[i]->set_compile_cache_dir(RAI_CompileCacheDir);
+    }
+  }
+
+  return REDISMODULE_OK;
+}
+
+/* Set an option of a backend, such as the number of threads it runs models
+ * with. The backend is loaded first if needed, so that options needing to be
+ * set before any model is created take effect. */
+int RAI_SetBackendOption(RedisModuleCtx *ctx, int backend, const char *name, const char *value,
+                         RAI_Error *err) {
+  if (RAI_EnsureBackendLoaded(ctx, backend) != REDISMODULE_OK) {
+    RAI_SetError(err, RAI_EBACKENDNOTLOADED, "ERR Could not load backend");
+    return REDISMODULE_ERR;
+  }
+
+  RAI_LoadedBackend* loaded = NULL;
+  switch (backend) {
+    case RAI_BACKEND_TENSORFLOW:
+      loaded = &RAI_backends.tf;
+      break;
+    case RAI_BACKEND_TFLITE:
+      loaded = &RAI_backends.tflite;
+      break;
+    case RAI_BACKEND_TORCH:
+      loaded = &RAI_backends.torch;
+      break;
+    case RAI_BACKEND_ONNXRUNTIME:
+      loaded = &RAI_backends.onnx;
+      break;
+  }
+
+  if (loaded == NULL || loaded->set_option == NULL) {
+    RAI_SetError(err, RAI_EBACKENDCONFIGURE, "ERR backend does not support options");
+    return REDISMODULE_ERR;
+  }
+
+  return loaded->set_option(name, value, err);
+}
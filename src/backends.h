@@ -16,6 +16,12 @@ typedef struct RAI_LoadedBackend {
   void (*model_free)(RAI_Model*, RAI_Error*);
   int (*model_run)(RAI_ModelRunCtx*, RAI_Error*);
   int (*model_serialize)(RAI_Model*, char**, size_t*, RAI_Error*);
+  // optional, reports input shapes and the number of outputs of a model
+  int (*model_signature)(RAI_Model*, RAI_ModelInputShape**, size_t*, RAI_Error*);
+  // optional, sets the directory where compiled models are cached
+  void (*set_compile_cache_dir)(const char*);
+  // optional, sets a backend wide option given with AI.CONFIG BACKEND
+  int (*set_option)(const char*, const char*, RAI_Error*);
 
   RAI_Script* (*script_create)(const char*, const char*, RAI_Error*);
   void (*script_free)(RAI_Script*, RAI_Error*);
@@ -31,9 +37,16 @@ typedef struct RAI_LoadedBackends {
 
 RAI_LoadedBackends RAI_backends;
 char* RAI_BackendsPath;
+// number of workers serving each run queue, see THREADS_PER_QUEUE
+extern long long perqueueThreadPoolSize;
 
 int RAI_LoadBackend(RedisModuleCtx *ctx, int backend, const char *path);
 int RAI_LoadDefaultBackend(RedisModuleCtx *ctx, int backend);
+int RAI_IsBackendLoaded(int backend);
+int RAI_EnsureBackendLoaded(RedisModuleCtx *ctx, int backend);
+int RAI_SetCompileCacheDir(const char *path);
+int RAI_SetBackendOption(RedisModuleCtx *ctx, int backend, const char *name, const char *value,
+                         RAI_Error *err);
 
 const char* RAI_BackendName(int backend);
 
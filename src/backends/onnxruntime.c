@@ -6,12 +6,40 @@
 
 #include "onnxruntime_c_api.h"
 
+#include <limits.h>
+#include <pthread.h>
+#include <stdio.h>
+#include <string.h>
+#include <strings.h>
+#include <unistd.h>
+
+// Threads of the intra-op pool of each session, 0 for the ONNXRuntime default
+static int ortIntraOpThreads = 0;
+
 int RAI_InitBackendORT(int (*get_api_fn)(const char *, void *)) {
   get_api_fn("RedisModule_Alloc", ((void **)&RedisModule_Alloc));
   get_api_fn("RedisModule_Calloc", ((void **)&RedisModule_Calloc));
   get_api_fn("RedisModule_Free", ((void **)&RedisModule_Free));
   get_api_fn("RedisModule_Realloc", ((void **)&RedisModule_Realloc));
   get_api_fn("RedisModule_Strdup", ((void **)&RedisModule_Strdup));
+  get_api_fn("RAI_LazyFreeLarge", ((void **)&RAI_TensorLazyFree));
+
+  return REDISMODULE_OK;
+}
+
+int RAI_SetOptionORT(const char* name, const char* value, RAI_Error* error) {
+  if (strcasecmp(name, "INTRA_OP_THREADS") != 0) {
+    RAI_SetError(error, RAI_EBACKENDCONFIGURE, "ERR ONNX: unsupported option");
+    return REDISMODULE_ERR;
+  }
+
+  char* end;
+  long long threads = strtoll(value, &end, 10);
+  if (*value == '\0' || *end != '\0' || threads < 1 || threads > INT_MAX) {
+    RAI_SetError(error, RAI_EBACKENDCONFIGURE, "ERR ONNX: invalid number of threads");
+    return REDISMODULE_ERR;
+  }
+  ortIntraOpThreads = threads;
 
   return REDISMODULE_OK;
 }
@@ -163,14 +191,22 @@ error:
   return NULL;
 }
 
-RAI_Tensor* RAI_TensorCreateFromOrtValue(OrtValue* v, size_t batch_offset, size_t batch_size, RAI_Error *error) {
+static void RAI_OrtValueRelease(void* value) {
+  const OrtApi* ort = OrtGetApiBase()->GetApi(1);
+  ort->ReleaseValue(value);
+}
+
+// Creates the tensor for a batch of an output held by buffer. Unless
+// RAI_COPY_RUN_OUTPUT is defined, the tensor points into the OrtValue
+// data, which is released when the last tensor referencing it is freed.
+RAI_Tensor* RAI_TensorCreateFromOrtValue(RAI_TensorBuffer* buffer, size_t batch_offset, size_t batch_size, RAI_Error *error) {
   OrtStatus* status = NULL;
   const OrtApi* ort = OrtGetApiBase()->GetApi(1);
 
+  OrtValue* v = buffer->owner;
   RAI_Tensor* ret = NULL;
-  int64_t *shape = NULL;
-  int64_t *strides = NULL;
- 
+  OrtTensorTypeAndShapeInfo* info = NULL;
+
   int is_tensor;
   status = ort->IsTensor(v, &is_tensor);
   if (status != NULL) goto error;
@@ -181,14 +217,6 @@ RAI_Tensor* RAI_TensorCreateFromOrtValue(OrtValue* v, size_t batch_offset, size_
     return NULL;
   }
 
-  ret = RedisModule_Calloc(1, sizeof(*ret));
-
-  DLContext ctx = (DLContext){
-      .device_type = kDLCPU,
-      .device_id = 0
-  };
-
-  OrtTensorTypeAndShapeInfo* info;
   status = ort->GetTensorTypeAndShape(v, &info);
   if (status != NULL) goto error;
 
@@ -205,82 +233,51 @@ RAI_Tensor* RAI_TensorCreateFromOrtValue(OrtValue* v, size_t batch_offset, size_
     status = ort->GetTensorElementType(info, &ort_dtype);
     if (status != NULL) goto error;
 
-    int64_t total_batch_size = dims[0];
-
-    shape = RedisModule_Calloc(ndims, sizeof(*shape));
-    strides = RedisModule_Calloc(ndims, sizeof(*strides));
-    for (int64_t i=0; i<ndims; ++i)
-    {
-      shape[i] = dims[i];
-      strides[i] = 1;
-    }
-    shape[0] = batch_size;
-    for (int64_t i = ndims - 2; i >= 0; --i)
-    {
-      strides[i] *= strides[i + 1] * shape[i + 1];
-    }
-
-    // size_t sample_bytesize = TF_TensorByteSize(tensor) / total_batch_size;
+    size_t elem_count;
+    status = ort->GetTensorShapeElementCount(info, &elem_count);
+    if (status != NULL) goto error;
 
-    DLDataType dtype = RAI_GetDLDataTypeFromORT(ort_dtype);
-#ifdef RAI_COPY_RUN_OUTPUT
     char *ort_data;
     status = ort->GetTensorMutableData(v, (void **)&ort_data);
-    if (status != NULL) {
-      goto error;
-    }
-    size_t elem_count;
-    status = ort->GetTensorShapeElementCount(info, &elem_count);
-    if (status != NULL) {
-      goto error;
-    }
+    if (status != NULL) goto error;
 
-    const size_t len = dtype.bits * elem_count / 8;
+    ort->ReleaseTensorTypeAndShapeInfo(info);
+    info = NULL;
 
-    const size_t total_bytesize = len * sizeof(char);
-    const size_t sample_bytesize = total_bytesize / total_batch_size;
-    const size_t batch_bytesize = sample_bytesize * batch_size;
+    int64_t total_batch_size = dims[0];
 
-    char *data = RedisModule_Calloc(batch_bytesize, sizeof(*data));
-    memcpy(data, ort_data + batch_offset * sample_bytesize, batch_bytesize);
-#endif
+    long long shape[ndims];
+    for (int64_t i=0; i<ndims; ++i) {
+      shape[i] = dims[i];
+    }
+    shape[0] = batch_size;
 
-    ort->ReleaseTensorTypeAndShapeInfo(info);
+    DLDataType dtype = RAI_GetDLDataTypeFromORT(ort_dtype);
 
-    // TODO: use manager_ctx to ensure ORT tensor doesn't get deallocated
-    // This applies to outputs
+    const size_t total_bytesize = dtype.bits * elem_count / 8;
+    const size_t sample_bytesize = total_batch_size > 0 ? total_bytesize / total_batch_size : 0;
+    char* data = ort_data + batch_offset * sample_bytesize;
 
-    ret->tensor = (DLManagedTensor){
-        .dl_tensor = (DLTensor){
-            .ctx = ctx,
 #ifdef RAI_COPY_RUN_OUTPUT
-            .data = data,
+    ret = RAI_TensorCreateWithDLDataType(dtype, shape, ndims, TENSORALLOC_ALLOC);
+    if (ret) {
+      memcpy(RAI_TensorData(ret), data, sample_bytesize * batch_size);
+    }
 #else
-#error zero-copy passing output memory from ORT not currently supported
+    ret = RAI_TensorCreateFromBuffer(buffer, dtype, shape, ndims, data);
 #endif
-            .ndim = ndims,
-            .dtype = dtype,
-            .shape = shape,
-            .strides = strides,
-            .byte_offset = 0},
-        .manager_ctx = NULL,
-        .deleter = NULL};
-
-    ret->refCount = 1;
+    if (ret == NULL) {
+      RAI_SetError(error, RAI_EMODELRUN, "ERR unsupported data type in model output");
+    }
+
     return ret;
   }
 
 error:
   RAI_SetError(error, RAI_EMODELCREATE, ort->GetErrorMessage(status));
   ort->ReleaseStatus(status);
-  if (shape != NULL) {
-    RedisModule_Free(shape);
-  }
-  if (strides != NULL) {
-    RedisModule_Free(shape);
-  }
-  if (ret != NULL) {
-    RedisModule_Free(ret);
+  if (info != NULL) {
+    ort->ReleaseTensorTypeAndShapeInfo(info);
   }
   return NULL;
 }
@@ -291,8 +288,128 @@ typedef struct RAI_ONNXBuffer {
 } RAI_ONNXBuffer;
 
 OrtEnv* env = NULL;
+// models can be created concurrently, e.g. by the RDB loading threads
+static pthread_mutex_t env_lock = PTHREAD_MUTEX_INITIALIZER;
+// directory where optimized models are cached, also protected by env_lock
+static char* compile_cache_dir = NULL;
+
+void RAI_SetCompileCacheDirORT(const char* path) {
+  pthread_mutex_lock(&env_lock);
+  if (compile_cache_dir) {
+    RedisModule_Free(compile_cache_dir);
+  }
+  compile_cache_dir = path ? RedisModule_Strdup(path) : NULL;
+  pthread_mutex_unlock(&env_lock);
+}
+
+/* Path of the optimized model cached for a blob and the options used to
+ * create its session, NULL if no cache directory is set. */
+static char* RAI_CompileCachePathORT(const char* devicestr, GraphOptimizationLevel optlevel,
+                                              const char *modeldef, size_t modellen) {
+  pthread_mutex_lock(&env_lock);
+  if (compile_cache_dir == NULL) {
+    pthread_mutex_unlock(&env_lock);
+    return NULL;
+  }
+
+  // the blob length and the terminating NUL of devicestr keep the fields
+  // from running into each other
+  const uint64_t len = modellen;
+  RAI_Sha256 sha;
+  RAI_Sha256Init(&sha);
+  RAI_Sha256Update(&sha, &len, sizeof(len));
+  RAI_Sha256Update(&sha, modeldef, modellen);
+  RAI_Sha256Update(&sha, devicestr, strlen(devicestr) + 1);
+  RAI_Sha256Update(&sha, &optlevel, sizeof(optlevel));
+  unsigned char digest[RAI_SHA256_SIZE];
+  RAI_Sha256Final(&sha, digest);
+
+  char* path = RedisModule_Alloc(strlen(compile_cache_dir) + 2 * RAI_SHA256_SIZE + 16);
+  int pos = sprintf(path, "%s/ort-", compile_cache_dir);
+  for (size_t i=0; i<RAI_SHA256_SIZE; i++) {
+    pos += sprintf(path + pos, "%02x", digest[i]);
+  }
+  sprintf(path + pos, ".onnx");
+  pthread_mutex_unlock(&env_lock);
+
+  return path;
+}
+
+static char* RAI_ReadCachedModelORT(const char* path, size_t* len) {
+  FILE* f = fopen(path, "rb");
+  if (f == NULL) {
+    return NULL;
+  }
+
+  char* buffer = NULL;
+  if (fseek(f, 0, SEEK_END) == 0) {
+    long size = ftell(f);
+    if (size > 0 && fseek(f, 0, SEEK_SET) == 0) {
+      buffer = RedisModule_Alloc(size);
+      if (fread(buffer, 1, size, f) == (size_t)size) {
+        *len = size;
+      }
+      else {
+        RedisModule_Free(buffer);
+        buffer = NULL;
+      }
+    }
+  }
+  fclose(f);
+
+  return buffer;
+}
+
+/* Check that the outputs named in MODELSET are outputs of the model and
+ * return a copy of their names. */
+static char** RAI_OrtOutputNames(OrtSession *session, size_t noutputs, const char **outputs,
+                                 RAI_Error *error) {
+  const OrtApi* ort = OrtGetApiBase()->GetApi(1);
+
+  OrtAllocator *allocator;
+  OrtStatus *status = ort->GetAllocatorWithDefaultOptions(&allocator);
+  size_t n_output_nodes = 0;
+  if (status == NULL) {
+    status = ort->SessionGetOutputCount(session, &n_output_nodes);
+  }
+  if (status != NULL) {
+    RAI_SetError(error, RAI_EMODELCREATE, ort->GetErrorMessage(status));
+    ort->ReleaseStatus(status);
+    return NULL;
+  }
+
+  char **outputs_ = array_new(char*, noutputs);
+  for (size_t i = 0; i < noutputs; i++) {
+    int found = 0;
+    for (size_t j = 0; j < n_output_nodes && !found; j++) {
+      char *output_name;
+      status = ort->SessionGetOutputName(session, j, allocator, &output_name);
+      if (status != NULL) {
+        ort->ReleaseStatus(status);
+        break;
+      }
+      found = strcmp(output_name, outputs[i]) == 0;
+      ort->AllocatorFree(allocator, output_name);
+    }
+    if (!found) {
+      char msg[strlen(outputs[i]) + 32];
+      sprintf(msg, "ERR Output not found in model: %s", outputs[i]);
+      RAI_SetError(error, RAI_EMODELCREATE, msg);
+      for (size_t k = 0; k < array_len(outputs_); k++) {
+        RedisModule_Free(outputs_[k]);
+      }
+      array_free(outputs_);
+      return NULL;
+    }
+    outputs_ = array_append(outputs_, RedisModule_Strdup(outputs[i]));
+  }
+
+  return outputs_;
+}
 
 RAI_Model *RAI_ModelCreateORT(RAI_Backend backend, const char* devicestr, RAI_ModelOpts opts,
+                              size_t ninputs, const char **inputs,
+                              size_t noutputs, const char **outputs,
                               const char *modeldef, size_t modellen,
                               RAI_Error *error) {
   const OrtApi* ort = OrtGetApiBase()->GetApi(1);
@@ -312,9 +429,11 @@ RAI_Model *RAI_ModelCreateORT(RAI_Backend backend, const char* devicestr, RAI_Mo
 
   OrtStatus* status = NULL;
 
+  pthread_mutex_lock(&env_lock);
   if (env == NULL) {
     status = ort->CreateEnv(ORT_LOGGING_LEVEL_WARNING, "test", &env);
   }
+  pthread_mutex_unlock(&env_lock);
 
   if (status != NULL || env == NULL) {
     goto error;
@@ -327,13 +446,63 @@ RAI_Model *RAI_ModelCreateORT(RAI_Backend backend, const char* devicestr, RAI_Mo
     goto error;
   }
 
-  // status = ort->SetSessionThreadPoolSize(session_options, 1);
+  if (ortIntraOpThreads > 0) {
+    status = ort->SetIntraOpNumThreads(session_options, ortIntraOpThreads);
+  }
   if (status != NULL) {
     ort->ReleaseSessionOptions(session_options);
     goto error;
   }
 
-  status = ort->SetSessionGraphOptimizationLevel(session_options, 1);
+  GraphOptimizationLevel optlevel;
+  switch (opts.optlevel) {
+    case RAI_OPTLEVEL_DISABLE:
+      optlevel = ORT_DISABLE_ALL;
+      break;
+    case RAI_OPTLEVEL_EXTENDED:
+      optlevel = ORT_ENABLE_EXTENDED;
+      break;
+    case RAI_OPTLEVEL_ALL:
+      optlevel = ORT_ENABLE_ALL;
+      break;
+    default:
+      optlevel = ORT_ENABLE_BASIC;
+  }
+
+  if (opts.execmode != RAI_EXECMODE_DEFAULT) {
+    status = ort->SetSessionExecutionMode(session_options,
+                                          opts.execmode == RAI_EXECMODE_PARALLEL ? ORT_PARALLEL : ORT_SEQUENTIAL);
+  }
+  if (status == NULL && opts.mempattern != RAI_SWITCH_DEFAULT) {
+    status = opts.mempattern == RAI_SWITCH_ON ? ort->EnableMemPattern(session_options)
+                                              : ort->DisableMemPattern(session_options);
+  }
+  if (status == NULL && opts.cpuarena != RAI_SWITCH_DEFAULT) {
+    status = opts.cpuarena == RAI_SWITCH_ON ? ort->EnableCpuMemArena(session_options)
+                                            : ort->DisableCpuMemArena(session_options);
+  }
+  if (status != NULL) {
+    ort->ReleaseSessionOptions(session_options);
+    goto error;
+  }
+
+  // An optimized model found in the compile cache is loaded as is,
+  // otherwise ORT is asked to write the one it produces there. There is
+  // nothing to cache when optimizations are disabled.
+  char* cache_path = optlevel == ORT_DISABLE_ALL ? NULL
+                     : RAI_CompileCachePathORT(devicestr, optlevel, modeldef, modellen);
+  char* cache_tmp_path = NULL;
+  size_t cachedlen = 0;
+  char* cached = cache_path ? RAI_ReadCachedModelORT(cache_path, &cachedlen) : NULL;
+
+  status = ort->SetSessionGraphOptimizationLevel(session_options, cached ? ORT_DISABLE_ALL : optlevel);
+  if (status == NULL && cache_path && !cached) {
+    // written under a temporary name, so that other instances sharing the
+    // cache never read a partial file
+    cache_tmp_path = RedisModule_Alloc(strlen(cache_path) + 48);
+    sprintf(cache_tmp_path, "%s.%d.%lx.tmp", cache_path, (int)getpid(), (unsigned long)pthread_self());
+    status = ort->SetOptimizedModelFilePath(session_options, cache_tmp_path);
+  }
   if (status != NULL) {
     ort->ReleaseSessionOptions(session_options);
     goto error;
@@ -354,14 +523,50 @@ RAI_Model *RAI_ModelCreateORT(RAI_Backend backend, const char* devicestr, RAI_Mo
 
   OrtSession* session;
 
-  status = ort->CreateSessionFromArray(env, modeldef, modellen, session_options, &session);
+  if (cached) {
+    status = ort->CreateSessionFromArray(env, cached, cachedlen, session_options, &session);
+    RedisModule_Free(cached);
+    if (status != NULL) {
+      // unusable cache entry, e.g. written by another ORT version
+      ort->ReleaseStatus(status);
+      unlink(cache_path);
+      status = ort->SetSessionGraphOptimizationLevel(session_options, optlevel);
+      if (status == NULL) {
+        status = ort->CreateSessionFromArray(env, modeldef, modellen, session_options, &session);
+      }
+    }
+  }
+  else {
+    status = ort->CreateSessionFromArray(env, modeldef, modellen, session_options, &session);
+  }
 
   ort->ReleaseSessionOptions(session_options);
 
+  if (cache_tmp_path) {
+    if (status != NULL || rename(cache_tmp_path, cache_path) != 0) {
+      unlink(cache_tmp_path);
+    }
+    RedisModule_Free(cache_tmp_path);
+  }
+  if (cache_path) {
+    RedisModule_Free(cache_path);
+  }
+
   if (status != NULL) {
     goto error;
   }
 
+  // Only the outputs named in MODELSET are fetched by MODELRUN, all of them
+  // if none are named
+  char **outputs_ = NULL;
+  if (noutputs > 0) {
+    outputs_ = RAI_OrtOutputNames(session, noutputs, outputs, error);
+    if (outputs_ == NULL) {
+      ort->ReleaseSession(session);
+      return NULL;
+    }
+  }
+
   // Since ONNXRuntime doesn't have a re-serialization function,
   // we cache the blob in order to re-serialize it.
   // Not optimal for storage purposes, but again, it may be temporary
@@ -380,6 +585,7 @@ RAI_Model *RAI_ModelCreateORT(RAI_Backend backend, const char* devicestr, RAI_Mo
   ret->refCount = 1;
   ret->opts = opts;
   ret->data = onnxbuffer;
+  ret->outputs = outputs_;
 
   return ret;
 
@@ -397,6 +603,20 @@ void RAI_ModelFreeORT(RAI_Model* model, RAI_Error* error) {
   RedisModule_Free(model->devicestr);
   ort->ReleaseSession(model->session);
 
+  if (model->inputs) {
+    for (size_t i=0; i<array_len(model->inputs); i++) {
+      RedisModule_Free(model->inputs[i]);
+    }
+    array_free(model->inputs);
+  }
+
+  if (model->outputs) {
+    for (size_t i=0; i<array_len(model->outputs); i++) {
+      RedisModule_Free(model->outputs[i]);
+    }
+    array_free(model->outputs);
+  }
+
   model->model = NULL;
   model->session = NULL;
 }
@@ -451,12 +671,6 @@ int RAI_ModelRunORT(RAI_ModelRunCtx *mctx, RAI_Error *error)
   }
 
   {
-    const char *input_names[n_input_nodes];
-    const char *output_names[n_output_nodes];
-
-    OrtValue *inputs[n_input_nodes];
-    OrtValue *outputs[n_output_nodes];
-
     const size_t ninputs = array_len(mctx->batches[0].inputs);
     const size_t noutputs = array_len(mctx->batches[0].outputs);
 
@@ -467,13 +681,23 @@ int RAI_ModelRunORT(RAI_ModelRunCtx *mctx, RAI_Error *error)
       return 1;
     }
 
-    if (noutputs != n_output_nodes) {
+    // Models set with OUTPUTS names only fetch those outputs, the others are
+    // neither copied nor, where ORT can prune them, computed
+    const int named_outputs = mctx->model->outputs != NULL;
+
+    if (!named_outputs && noutputs != n_output_nodes) {
       char msg[70];
       sprintf(msg, "ERR Expected %li outputs but got %li", n_output_nodes, noutputs);
       RAI_SetError(error, RAI_EMODELRUN, msg);
       return 1;
     }
 
+    const char *input_names[n_input_nodes];
+    const char *output_names[noutputs];
+
+    OrtValue *inputs[n_input_nodes];
+    OrtValue *outputs[noutputs];
+
     for (size_t i = 0; i < n_input_nodes; i++) {
       char *input_name;
       status = ort->SessionGetInputName(session, i, allocator, &input_name);
@@ -514,14 +738,18 @@ int RAI_ModelRunORT(RAI_ModelRunCtx *mctx, RAI_Error *error)
 #endif
     }
 
-    for (size_t i = 0; i < n_output_nodes; i++) {
-      char *output_name;
-      status = ort->SessionGetOutputName(session, i, allocator, &output_name);
-      if (status != NULL) {
-        goto error;
+    for (size_t i = 0; i < noutputs; i++) {
+      if (named_outputs) {
+        output_names[i] = mctx->batches[0].outputs[i].name;
+      }
+      else {
+        char *output_name;
+        status = ort->SessionGetOutputName(session, i, allocator, &output_name);
+        if (status != NULL) {
+          goto error;
+        }
+        output_names[i] = output_name;
       }
-
-      output_names[i] = output_name;
       outputs[i] = NULL;
     }
 
@@ -531,17 +759,21 @@ int RAI_ModelRunORT(RAI_ModelRunCtx *mctx, RAI_Error *error)
     //                _In_ const char* const* output_names, size_t output_names_len, _Out_ OrtValue** output);
     OrtRunOptions *run_options = NULL;
     status = ort->Run(session, run_options, input_names, (const OrtValue *const *)inputs,
-                     n_input_nodes, output_names, n_output_nodes, outputs);
+                     n_input_nodes, output_names, noutputs, outputs);
 
     if (status) {
       goto error;
     }
 
-    for (size_t i = 0; i < n_output_nodes; i++) {
+    for (size_t i = 0; i < noutputs; i++) {
+      RAI_TensorBuffer* buffer = RAI_TensorBufferCreate(outputs[i], RAI_OrtValueRelease);
       for (size_t b=0; b<nbatches; b++) {
-        RAI_Tensor* output_tensor = RAI_TensorCreateFromOrtValue(outputs[i], batch_offsets[b], batch_sizes[b], error);
+        RAI_Tensor* output_tensor = RAI_TensorCreateFromOrtValue(buffer, batch_offsets[b], batch_sizes[b], error);
         if (error->code != RAI_OK) {
-          ort->ReleaseStatus(status);
+          RAI_TensorBufferRelease(buffer);
+          for (size_t j = i + 1; j < noutputs; j++) {
+            ort->ReleaseValue(outputs[j]);
+          }
           return 1;
         }
         if (output_tensor) {
@@ -553,7 +785,7 @@ int RAI_ModelRunORT(RAI_ModelRunCtx *mctx, RAI_Error *error)
         }
       }
 
-      ort->ReleaseValue(outputs[i]);
+      RAI_TensorBufferRelease(buffer);
     }
 
     for (size_t i = 0; i < n_input_nodes; i++) {
@@ -569,6 +801,93 @@ error:
   return 1;
 }
 
+int RAI_ModelSignatureORT(RAI_Model *model, RAI_ModelInputShape **inputshapes, size_t *noutputs,
+                          RAI_Error *error) {
+  const OrtApi* ort = OrtGetApiBase()->GetApi(1);
+
+  OrtSession *session = model->session;
+  RAI_ModelInputShape *shapes = NULL;
+
+  OrtStatus *status = NULL;
+
+  size_t n_input_nodes;
+  status = ort->SessionGetInputCount(session, &n_input_nodes);
+  if (status != NULL) {
+    goto error;
+  }
+
+  size_t n_output_nodes;
+  status = ort->SessionGetOutputCount(session, &n_output_nodes);
+  if (status != NULL) {
+    goto error;
+  }
+
+  shapes = array_new(RAI_ModelInputShape, n_input_nodes);
+
+  for (size_t i = 0; i < n_input_nodes; i++) {
+    OrtTypeInfo* typeinfo;
+    status = ort->SessionGetInputTypeInfo(session, i, &typeinfo);
+    if (status != NULL) {
+      goto error;
+    }
+
+    const OrtTensorTypeAndShapeInfo* tensor_info;
+    status = ort->CastTypeInfoToTensorInfo(typeinfo, &tensor_info);
+    if (status != NULL || tensor_info == NULL) {
+      ort->ReleaseTypeInfo(typeinfo);
+      if (status == NULL) {
+        RAI_SetError(error, RAI_EMODELRUN, "ERR Non-tensor inputs are not supported");
+        goto cleanup;
+      }
+      goto error;
+    }
+
+    ONNXTensorElementDataType type;
+    size_t ndims;
+    status = ort->GetTensorElementType(tensor_info, &type);
+    if (status == NULL) {
+      status = ort->GetDimensionsCount(tensor_info, &ndims);
+    }
+    if (status != NULL) {
+      ort->ReleaseTypeInfo(typeinfo);
+      goto error;
+    }
+
+    int64_t dims[ndims];
+    status = ort->GetDimensions(tensor_info, dims, ndims);
+    ort->ReleaseTypeInfo(typeinfo);
+    if (status != NULL) {
+      goto error;
+    }
+
+    RAI_ModelInputShape shape = {
+      .dtype = RAI_GetDLDataTypeFromORT(type),
+      .dims = array_new(long long, ndims)
+    };
+    for (size_t j = 0; j < ndims; j++) {
+      shape.dims = array_append(shape.dims, dims[j]);
+    }
+    shapes = array_append(shapes, shape);
+  }
+
+  *inputshapes = shapes;
+  *noutputs = n_output_nodes;
+
+  return 0;
+
+error:
+  RAI_SetError(error, RAI_EMODELRUN, ort->GetErrorMessage(status));
+  ort->ReleaseStatus(status);
+cleanup:
+  if (shapes) {
+    for (size_t i = 0; i < array_len(shapes); i++) {
+      array_free(shapes[i].dims);
+    }
+    array_free(shapes);
+  }
+  return 1;
+}
+
 int RAI_ModelSerializeORT(RAI_Model *model, char **buffer, size_t *len, RAI_Error *error) {
   RAI_ONNXBuffer* onnxbuffer = (RAI_ONNXBuffer*)model->data;
   *buffer = RedisModule_Calloc(onnxbuffer->len, sizeof(char));
@@ -8,7 +8,13 @@
 
 int RAI_InitBackendORT(int (*get_api_fn)(const char *, void *));
 
+int RAI_SetOptionORT(const char* name, const char* value, RAI_Error* error);
+
+void RAI_SetCompileCacheDirORT(const char* path);
+
 RAI_Model *RAI_ModelCreateORT(RAI_Backend backend,  const char* devicestr, RAI_ModelOpts opts,
+                              size_t ninputs, const char **inputs,
+                              size_t noutputs, const char **outputs,
                               const char *modeldef, size_t modellen,
                               RAI_Error *err);
 
@@ -16,6 +22,9 @@ void RAI_ModelFreeORT(RAI_Model *model, RAI_Error *error);
 
 int RAI_ModelRunORT(RAI_ModelRunCtx *mctx, RAI_Error *error);
 
+int RAI_ModelSignatureORT(RAI_Model *model, RAI_ModelInputShape **inputshapes, size_t *noutputs,
+                          RAI_Error *error);
+
 int RAI_ModelSerializeORT(RAI_Model *model, char **buffer, size_t *len, RAI_Error *error);
 
 #endif /* SRC_BACKENDS_ONNXRUNTIME_H_ */
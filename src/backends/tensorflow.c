@@ -5,12 +5,37 @@
 
 #include "tensorflow/c/c_api.h"
 
+#include <limits.h>
+#include <string.h>
+#include <strings.h>
+
+// intra_op_parallelism_threads of each session, 0 for the TensorFlow default
+static long long tfIntraOpThreads = 0;
+
 int RAI_InitBackendTF(int (*get_api_fn)(const char *, void *)) {
   get_api_fn("RedisModule_Alloc", ((void **)&RedisModule_Alloc));
   get_api_fn("RedisModule_Calloc", ((void **)&RedisModule_Calloc));
   get_api_fn("RedisModule_Free", ((void **)&RedisModule_Free));
   get_api_fn("RedisModule_Realloc", ((void **)&RedisModule_Realloc));
   get_api_fn("RedisModule_Strdup", ((void **)&RedisModule_Strdup));
+  get_api_fn("RAI_LazyFreeLarge", ((void **)&RAI_TensorLazyFree));
+
+  return REDISMODULE_OK;
+}
+
+int RAI_SetOptionTF(const char* name, const char* value, RAI_Error* error) {
+  if (strcasecmp(name, "INTRA_OP_THREADS") != 0) {
+    RAI_SetError(error, RAI_EBACKENDCONFIGURE, "ERR TF: unsupported option");
+    return REDISMODULE_ERR;
+  }
+
+  char* end;
+  long long threads = strtoll(value, &end, 10);
+  if (*value == '\0' || *end != '\0' || threads < 1 || threads > INT_MAX) {
+    RAI_SetError(error, RAI_EBACKENDCONFIGURE, "ERR TF: invalid number of threads");
+    return REDISMODULE_ERR;
+  }
+  tfIntraOpThreads = threads;
 
   return REDISMODULE_OK;
 }
@@ -78,64 +103,40 @@ DLDataType RAI_GetDLDataTypeFromTF(TF_DataType dtype) {
   return (DLDataType){ .bits = 0 };
 }
 
-RAI_Tensor* RAI_TensorCreateFromTFTensor(TF_Tensor *tensor, size_t batch_offset, size_t batch_size) {
-  RAI_Tensor* ret = RedisModule_Calloc(1, sizeof(*ret));
+static void RAI_TFTensorRelease(void* tensor) {
+  TF_DeleteTensor(tensor);
+}
 
-  DLContext ctx = (DLContext){
-      .device_type = kDLCPU,
-      .device_id = 0
-  };
+// Creates the tensor for a batch of an output held by buffer. Unless
+// RAI_COPY_RUN_OUTPUT is defined, the tensor points into the TF_Tensor
+// data, which is deleted when the last tensor referencing it is freed.
+RAI_Tensor* RAI_TensorCreateFromTFTensor(RAI_TensorBuffer *buffer, size_t batch_offset, size_t batch_size) {
+  TF_Tensor* tensor = buffer->owner;
 
   const size_t ndims = TF_NumDims(tensor);
 
   const int64_t total_batch_size = TF_Dim(tensor, 0);
 
-  int64_t* shape = RedisModule_Calloc(ndims, sizeof(*shape));
-  int64_t* strides = RedisModule_Calloc(ndims, sizeof(*strides));
+  long long shape[ndims];
   for (int64_t i = 0 ; i < ndims ; ++i) {
     shape[i] = TF_Dim(tensor, i);
-    strides[i] = 1;
   }
   shape[0] = batch_size;
-  for (int64_t i = ndims-2 ; i >= 0 ; --i) {
-    strides[i] *= strides[i+1] * shape[i+1];
-  }
 
   const size_t sample_bytesize = TF_TensorByteSize(tensor) / total_batch_size;
+  char* data = (char*)TF_TensorData(tensor) + sample_bytesize * batch_offset;
 
-  // FIXME: In TF, RunSession allocates memory for output tensors
-  // This means that we either memcpy the tensor data and let
-  // Redis be responsible for the memory, or we reuse the TF
-  // allocated memory, which might not be optimal down the road
-  // Note: on YOLO this has no impact on perf
-#ifdef RAI_COPY_RUN_OUTPUT
-  const size_t len = sample_bytesize * batch_size;
-  char* data = RedisModule_Calloc(len, sizeof(*data));
-  memcpy(data, TF_TensorData(tensor) + sample_bytesize * batch_offset, len);
-#endif
-
-  // TODO: use manager_ctx to ensure TF tensor doesn't get deallocated
-  // This applies to outputs
+  DLDataType dtype = RAI_GetDLDataTypeFromTF(TF_TensorType(tensor));
 
-  ret->tensor = (DLManagedTensor){
-    .dl_tensor = (DLTensor){
-      .ctx = ctx,
 #ifdef RAI_COPY_RUN_OUTPUT
-      .data = data,
+  RAI_Tensor* ret = RAI_TensorCreateWithDLDataType(dtype, shape, ndims, TENSORALLOC_ALLOC);
+  if (ret) {
+    memcpy(RAI_TensorData(ret), data, sample_bytesize * batch_size);
+  }
 #else
-      .data = TF_TensorData(tensor),
+  RAI_Tensor* ret = RAI_TensorCreateFromBuffer(buffer, dtype, shape, ndims, data);
 #endif
-      .ndim = ndims,
-      .dtype = RAI_GetDLDataTypeFromTF(TF_TensorType(tensor)),
-      .shape = shape,
-      .strides = strides,
-      .byte_offset = 0
-    },
-    .manager_ctx = NULL,
-    .deleter = NULL
-  };
 
-  ret->refCount = 1;
   return ret;
 }
 
@@ -290,31 +291,54 @@ RAI_Model *RAI_ModelCreateTF(RAI_Backend backend, const char* devicestr, RAI_Mod
   // result = list(map(hex, serialized))
   // print(result)
 
+  uint8_t config[32];
+  size_t configlen = 0;
+
   if (device == RAI_DEVICE_CPU) {
     // Set number of GPU to 0 with
     // config.device_count = {'GPU': 0} 
-    uint8_t config[9] = {0x0a, 0x07, 0x0a, 0x03, 0x47, 0x50, 0x55, 0x10, 0x00};
-    TF_SetConfig(sessionOptions, (void *)config, 9, status);
+    const uint8_t cpu_config[9] = {0x0a, 0x07, 0x0a, 0x03, 0x47, 0x50, 0x55, 0x10, 0x00};
+    memcpy(config, cpu_config, sizeof(cpu_config));
+    configlen = sizeof(cpu_config);
   }
   else if (device == RAI_DEVICE_GPU) {
     if (deviceid == -1) {
       // Set
       // config.gpu_options.allow_growth = True
-      uint8_t config[4] = {0x32, 0x02, 0x20, 0x01};
-      TF_SetConfig(sessionOptions, (void *)config, 4, status);
+      const uint8_t gpu_config[4] = {0x32, 0x02, 0x20, 0x01};
+      memcpy(config, gpu_config, sizeof(gpu_config));
+      configlen = sizeof(gpu_config);
     }
     else {
       // Set
       // config.gpu_options.allow_growth = True
       // config.gpu_options.visible_device_list = '<deviceid>'
-      uint8_t config[7] = {0x32, 0x05, 0x20, 0x01, 0x2a, 0x01, 0x30};
+      const uint8_t gpu_config[7] = {0x32, 0x05, 0x20, 0x01, 0x2a, 0x01, 0x30};
+      memcpy(config, gpu_config, sizeof(gpu_config));
       config[6] += (uint8_t)deviceid;
-      TF_SetConfig(sessionOptions, (void *)config, 7, status);
+      configlen = sizeof(gpu_config);
     }
   }
 
+  if (tfIntraOpThreads > 0) {
+    // Set
+    // config.intra_op_parallelism_threads = <threads>
+    // field 2 as a varint
+    config[configlen++] = 0x10;
+    unsigned long long threads = tfIntraOpThreads;
+    while (threads >= 0x80) {
+      config[configlen++] = (uint8_t)(threads | 0x80);
+      threads >>= 7;
+    }
+    config[configlen++] = (uint8_t)threads;
+  }
+
+  if (configlen > 0) {
+    TF_SetConfig(sessionOptions, (void *)config, configlen, optionsStatus);
+  }
+
   if (TF_GetCode(optionsStatus) != TF_OK) {
-    RAI_SetError(error, RAI_EMODELCONFIGURE, RedisModule_Strdup(TF_Message(status)));
+    RAI_SetError(error, RAI_EMODELCONFIGURE, RedisModule_Strdup(TF_Message(optionsStatus)));
     // TODO: free memory
     return NULL;
   }
@@ -494,12 +518,22 @@ int RAI_ModelRunTF(RAI_ModelRunCtx* mctx, RAI_Error *error) {
   }
 
   for(size_t i=0; i<noutputs; ++i) {
+    RAI_TensorBuffer* buffer = RAI_TensorBufferCreate(outputTensorsValues[i], RAI_TFTensorRelease);
     for (size_t b=0; b<nbatches; b++) {
-      RAI_Tensor* output_tensor = RAI_TensorCreateFromTFTensor(outputTensorsValues[i], batch_offsets[b], batch_sizes[b]);
+      RAI_Tensor* output_tensor = RAI_TensorCreateFromTFTensor(buffer, batch_offsets[b], batch_sizes[b]);
+      if (output_tensor == NULL) {
+        RAI_TensorBufferRelease(buffer);
+        for (size_t j=i+1; j<noutputs; ++j) {
+          TF_DeleteTensor(outputTensorsValues[j]);
+        }
+        RAI_SetError(error, RAI_EMODELRUN, "ERR unsupported data type in model output");
+        TF_DeleteStatus(status);
+        return 1;
+      }
       mctx->batches[b].outputs[i].tensor = RAI_TensorGetShallowCopy(output_tensor);
       RAI_TensorFree(output_tensor);
     }
-    TF_DeleteTensor(outputTensorsValues[i]);
+    RAI_TensorBufferRelease(buffer);
   }
 
   // TODO: add (make sure we deallocate once)
@@ -515,6 +549,61 @@ int RAI_ModelRunTF(RAI_ModelRunCtx* mctx, RAI_Error *error) {
   return 0;
 }
 
+int RAI_ModelSignatureTF(RAI_Model *model, RAI_ModelInputShape **inputshapes, size_t *noutputs,
+                         RAI_Error *error) {
+  TF_Status *status = TF_NewStatus();
+
+  const size_t ninputs = model->inputs ? array_len(model->inputs) : 0;
+  RAI_ModelInputShape *shapes = array_new(RAI_ModelInputShape, ninputs);
+
+  for (size_t i=0; i<ninputs; i++) {
+    TF_Output port;
+    port.oper = TF_GraphOperationByName(model->model, model->inputs[i]);
+    port.index = 0;
+    if (port.oper == NULL) {
+      RAI_SetError(error, RAI_EMODELRUN, "ERR Input node not found in graph");
+      goto error;
+    }
+
+    int ndims = TF_GraphGetTensorNumDims(model->model, port, status);
+    if (TF_GetCode(status) != TF_OK || ndims < 0) {
+      RAI_SetError(error, RAI_EMODELRUN, "ERR Input node has no known rank");
+      goto error;
+    }
+
+    int64_t dims[ndims];
+    TF_GraphGetTensorShape(model->model, port, dims, ndims, status);
+    if (TF_GetCode(status) != TF_OK) {
+      RAI_SetError(error, RAI_EMODELRUN, TF_Message(status));
+      goto error;
+    }
+
+    RAI_ModelInputShape shape = {
+      .dtype = RAI_GetDLDataTypeFromTF(TF_OperationOutputType(port)),
+      .dims = array_new(long long, ndims)
+    };
+    for (int j=0; j<ndims; j++) {
+      shape.dims = array_append(shape.dims, dims[j]);
+    }
+    shapes = array_append(shapes, shape);
+  }
+
+  TF_DeleteStatus(status);
+
+  *inputshapes = shapes;
+  *noutputs = model->outputs ? array_len(model->outputs) : 0;
+
+  return 0;
+
+error:
+  for (size_t i=0; i<array_len(shapes); i++) {
+    array_free(shapes[i].dims);
+  }
+  array_free(shapes);
+  TF_DeleteStatus(status);
+  return 1;
+}
+
 int RAI_ModelSerializeTF(RAI_Model *model, char **buffer, size_t *len, RAI_Error *error) {
   TF_Buffer *tf_buffer = TF_NewBuffer();
   TF_Status *status = TF_NewStatus();
@@ -8,6 +8,8 @@
 
 int RAI_InitBackendTF(int (*get_api_fn)(const char *, void *));
 
+int RAI_SetOptionTF(const char* name, const char* value, RAI_Error* error);
+
 RAI_Model *RAI_ModelCreateTF(RAI_Backend backend, const char* devicestr, RAI_ModelOpts opts,
                              size_t ninputs, const char **inputs,
                              size_t noutputs, const char **outputs,
@@ -18,6 +20,9 @@ void RAI_ModelFreeTF(RAI_Model *model, RAI_Error *error);
 
 int RAI_ModelRunTF(RAI_ModelRunCtx *mctx, RAI_Error *error);
 
+int RAI_ModelSignatureTF(RAI_Model *model, RAI_ModelInputShape **inputshapes, size_t *noutputs,
+                         RAI_Error *error);
+
 int RAI_ModelSerializeTF(RAI_Model *model, char **buffer, size_t *len, RAI_Error *error);
 
 #endif /* SRC_BACKENDS_TENSORFLOW_H_ */
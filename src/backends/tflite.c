@@ -3,6 +3,7 @@
 #include "tensor.h"
 #include "util/arr_rm_alloc.h"
 #include "libtflite_c/tflite_c.h"
+#include <stdlib.h>
 
 int RAI_InitBackendTFLite(int (*get_api_fn)(const char *, void *)) {
   get_api_fn("RedisModule_Alloc", ((void **)&RedisModule_Alloc));
@@ -10,6 +11,51 @@ int RAI_InitBackendTFLite(int (*get_api_fn)(const char *, void *)) {
   get_api_fn("RedisModule_Free", ((void **)&RedisModule_Free));
   get_api_fn("RedisModule_Realloc", ((void **)&RedisModule_Realloc));
   get_api_fn("RedisModule_Strdup", ((void **)&RedisModule_Strdup));
+  get_api_fn("RAI_LazyFreeLarge", ((void **)&RAI_TensorLazyFree));
+
+  return REDISMODULE_OK;
+}
+
+// settings of models set without THREADS or XNNPACK, see AI.CONFIG BACKEND
+static long long tfliteThreads = 1;
+static RAI_Switch tfliteXnnpack = RAI_SWITCH_OFF;
+
+#if RAI_TFLITE_USE_XNNPACK
+static const int tfliteHasXnnpack = 1;
+#else
+static const int tfliteHasXnnpack = 0;
+#endif
+
+int RAI_SetOptionTFLite(const char* name, const char* value, RAI_Error* error) {
+  if (strcasecmp(name, "THREADS") == 0) {
+    char* end;
+    long long threads = strtoll(value, &end, 10);
+    if (*value == '\0' || *end != '\0' || threads < 1) {
+      RAI_SetError(error, RAI_EBACKENDCONFIGURE, "ERR TFLITE THREADS: invalid number of threads");
+      return REDISMODULE_ERR;
+    }
+    tfliteThreads = threads;
+  }
+  else if (strcasecmp(name, "XNNPACK") == 0) {
+    if (strcasecmp(value, "ON") == 0) {
+      if (!tfliteHasXnnpack) {
+        RAI_SetError(error, RAI_EBACKENDCONFIGURE, "ERR TFLITE XNNPACK: not available in this build");
+        return REDISMODULE_ERR;
+      }
+      tfliteXnnpack = RAI_SWITCH_ON;
+    }
+    else if (strcasecmp(value, "OFF") == 0) {
+      tfliteXnnpack = RAI_SWITCH_OFF;
+    }
+    else {
+      RAI_SetError(error, RAI_EBACKENDCONFIGURE, "ERR TFLITE XNNPACK: use ON or OFF");
+      return REDISMODULE_ERR;
+    }
+  }
+  else {
+    RAI_SetError(error, RAI_EBACKENDCONFIGURE, "ERR TFLITE: unsupported option");
+    return REDISMODULE_ERR;
+  }
 
   return REDISMODULE_OK;
 }
@@ -43,8 +89,19 @@ RAI_Model *RAI_ModelCreateTFLite(RAI_Backend backend, const char* devicestr, RAI
       return NULL;
   }
 
+  // the settings in use are kept with the model, so that it is restored
+  // with them and they are reported by AI.INFO
+  if (opts.threads == 0) {
+    opts.threads = tfliteThreads;
+  }
+  if (opts.xnnpack == RAI_SWITCH_DEFAULT) {
+    opts.xnnpack = tfliteXnnpack;
+  }
+
   char* error_descr = NULL;
-  void* model = tfliteLoadModel(modeldef, modellen, dl_device, deviceid, &error_descr, RedisModule_Alloc);
+  void* model = tfliteLoadModel(modeldef, modellen, dl_device, deviceid,
+                                opts.threads, opts.xnnpack == RAI_SWITCH_ON,
+                                &error_descr, RedisModule_Alloc);
 
   if (model == NULL) {
     RAI_SetError(error, RAI_EMODELCREATE, error_descr);
@@ -177,6 +234,36 @@ int RAI_ModelRunTFLite(RAI_ModelRunCtx* mctx, RAI_Error *error) {
   return 0;
 }
 
+int RAI_ModelSignatureTFLite(RAI_Model *model, RAI_ModelInputShape **inputshapes, size_t *noutputs,
+                             RAI_Error *error) {
+  const long ninputs = tfliteModelNumInputs(model->model);
+
+  RAI_ModelInputShape *shapes = array_new(RAI_ModelInputShape, ninputs);
+
+  for (long i=0; i<ninputs; i++) {
+    DLDataType dtype;
+    int64_t* dims = NULL;
+    int ndims = tfliteModelInputShape(model->model, i, &dtype, &dims, RedisModule_Alloc);
+
+    RAI_ModelInputShape shape = {
+      .dtype = dtype,
+      .dims = array_new(long long, ndims)
+    };
+    for (int j=0; j<ndims; j++) {
+      shape.dims = array_append(shape.dims, dims[j]);
+    }
+    if (dims) {
+      RedisModule_Free(dims);
+    }
+    shapes = array_append(shapes, shape);
+  }
+
+  *inputshapes = shapes;
+  *noutputs = tfliteModelNumOutputs(model->model);
+
+  return 0;
+}
+
 int RAI_ModelSerializeTFLite(RAI_Model *model, char **buffer, size_t *len, RAI_Error *error) {
   RAI_TfLiteBuffer* tflitebuffer = (RAI_TfLiteBuffer*)model->data;
   *buffer = RedisModule_Calloc(tflitebuffer->len, sizeof(char));
@@ -12,10 +12,15 @@ RAI_Model *RAI_ModelCreateTFLite(RAI_Backend backend, const char* devicestr, RAI
                                  const char *modeldef, size_t modellen,
                                  RAI_Error *err);
 
+int RAI_SetOptionTFLite(const char* name, const char* value, RAI_Error* error);
+
 void RAI_ModelFreeTFLite(RAI_Model *model, RAI_Error *error);
 
 int RAI_ModelRunTFLite(RAI_ModelRunCtx *mctx, RAI_Error *error);
 
+int RAI_ModelSignatureTFLite(RAI_Model *model, RAI_ModelInputShape **inputshapes, size_t *noutputs,
+                             RAI_Error *error);
+
 int RAI_ModelSerializeTFLite(RAI_Model *model, char **buffer, size_t *len, RAI_Error *error);
 
 #endif /* SRC_BACKENDS_TFLITE_H_ */
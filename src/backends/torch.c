@@ -3,6 +3,8 @@
 #include "tensor.h"
 #include "util/arr_rm_alloc.h"
 #include "libtorch_c/torch_c.h"
+#include <limits.h>
+#include <stdlib.h>
 
 int RAI_InitBackendTorch(int (*get_api_fn)(const char *, void *)) {
   get_api_fn("RedisModule_Alloc", ((void **)&RedisModule_Alloc));
@@ -10,6 +12,44 @@ int RAI_InitBackendTorch(int (*get_api_fn)(const char *, void *)) {
   get_api_fn("RedisModule_Free", ((void **)&RedisModule_Free));
   get_api_fn("RedisModule_Realloc", ((void **)&RedisModule_Realloc));
   get_api_fn("RedisModule_Strdup", ((void **)&RedisModule_Strdup));
+  get_api_fn("RAI_LazyFreeLarge", ((void **)&RAI_TensorLazyFree));
+
+  return REDISMODULE_OK;
+}
+
+int RAI_SetOptionTorch(const char* name, const char* value, RAI_Error* error) {
+  int interop;
+  if (strcasecmp(name, "INTRA_OP_THREADS") == 0) {
+    interop = 0;
+  }
+  else if (strcasecmp(name, "INTER_OP_THREADS") == 0) {
+    interop = 1;
+  }
+  else {
+    RAI_SetError(error, RAI_EBACKENDCONFIGURE, "ERR TORCH: unsupported option");
+    return REDISMODULE_ERR;
+  }
+
+  char* end;
+  long long threads = strtoll(value, &end, 10);
+  if (*value == '\0' || *end != '\0' || threads < 1 || threads > INT_MAX) {
+    RAI_SetError(error, RAI_EBACKENDCONFIGURE, "ERR TORCH: invalid number of threads");
+    return REDISMODULE_ERR;
+  }
+
+  char* error_descr = NULL;
+  if (interop) {
+    torchSetInterOpThreads((int)threads, &error_descr, RedisModule_Alloc);
+  }
+  else {
+    torchSetIntraOpThreads((int)threads, &error_descr, RedisModule_Alloc);
+  }
+
+  if (error_descr != NULL) {
+    RAI_SetError(error, RAI_EBACKENDCONFIGURE, error_descr);
+    RedisModule_Free(error_descr);
+    return REDISMODULE_ERR;
+  }
 
   return REDISMODULE_OK;
 }
@@ -40,7 +80,8 @@ RAI_Model *RAI_ModelCreateTorch(RAI_Backend backend, const char* devicestr, RAI_
   }
 
   char* error_descr = NULL;
-  void* model = torchLoadModel(modeldef, modellen, dl_device, deviceid, &error_descr, RedisModule_Alloc);
+  void* model = torchLoadModel(modeldef, modellen, dl_device, deviceid, opts.optimize,
+                               &error_descr, RedisModule_Alloc);
 
   if (model == NULL) {
     RAI_SetError(error, RAI_EMODELCREATE, error_descr);
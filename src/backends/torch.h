@@ -9,6 +9,8 @@
 
 int RAI_InitBackendTorch(int (*get_api_fn)(const char *, void *));
 
+int RAI_SetOptionTorch(const char* name, const char* value, RAI_Error* error);
+
 RAI_Model *RAI_ModelCreateTorch(RAI_Backend backend, const char* devicestr, RAI_ModelOpts opts,
                                 const char *modeldef, size_t modellen,
                                 RAI_Error *err);
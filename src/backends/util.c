@@ -1,5 +1,7 @@
 #include "backends/util.h"
 
+#include <string.h>
+
 int parseDeviceStr(const char* devicestr, RAI_Device* device, int64_t* deviceid) {
   if (strcasecmp(devicestr, "CPU") == 0) {
     *device = RAI_DEVICE_CPU;
@@ -19,3 +21,106 @@ int parseDeviceStr(const char* devicestr, RAI_Device* device, int64_t* deviceid)
 
   return 1;
 }
+
+/* SHA-256 (FIPS 180-4), used to name compile cache entries: a digest that
+ * collisions can't be crafted for is what makes it safe to load a cached
+ * model in place of the blob it was compiled from. */
+
+static const uint32_t RAI_Sha256K[64] = {
+  0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+  0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+  0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+  0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+  0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+  0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+  0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+  0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+};
+
+#define RAI_ROTR32(x, n) (((x) >> (n)) | ((x) << (32 - (n))))
+
+static void RAI_Sha256Block(RAI_Sha256* ctx, const unsigned char* block) {
+  uint32_t w[64];
+  for (int i=0; i<16; i++) {
+    w[i] = ((uint32_t)block[4*i] << 24) | ((uint32_t)block[4*i+1] << 16) |
+           ((uint32_t)block[4*i+2] << 8) | (uint32_t)block[4*i+3];
+  }
+  for (int i=16; i<64; i++) {
+    const uint32_t s0 = RAI_ROTR32(w[i-15], 7) ^ RAI_ROTR32(w[i-15], 18) ^ (w[i-15] >> 3);
+    const uint32_t s1 = RAI_ROTR32(w[i-2], 17) ^ RAI_ROTR32(w[i-2], 19) ^ (w[i-2] >> 10);
+    w[i] = w[i-16] + s0 + w[i-7] + s1;
+  }
+
+  uint32_t a = ctx->state[0], b = ctx->state[1], c = ctx->state[2], d = ctx->state[3];
+  uint32_t e = ctx->state[4], f = ctx->state[5], g = ctx->state[6], h = ctx->state[7];
+  for (int i=0; i<64; i++) {
+    const uint32_t s1 = RAI_ROTR32(e, 6) ^ RAI_ROTR32(e, 11) ^ RAI_ROTR32(e, 25);
+    const uint32_t ch = (e & f) ^ (~e & g);
+    const uint32_t t1 = h + s1 + ch + RAI_Sha256K[i] + w[i];
+    const uint32_t s0 = RAI_ROTR32(a, 2) ^ RAI_ROTR32(a, 13) ^ RAI_ROTR32(a, 22);
+    const uint32_t maj = (a & b) ^ (a & c) ^ (b & c);
+    const uint32_t t2 = s0 + maj;
+    h = g;
+    g = f;
+    f = e;
+    e = d + t1;
+    d = c;
+    c = b;
+    b = a;
+    a = t1 + t2;
+  }
+
+  ctx->state[0] += a;
+  ctx->state[1] += b;
+  ctx->state[2] += c;
+  ctx->state[3] += d;
+  ctx->state[4] += e;
+  ctx->state[5] += f;
+  ctx->state[6] += g;
+  ctx->state[7] += h;
+}
+
+void RAI_Sha256Init(RAI_Sha256* ctx) {
+  static const uint32_t init[8] = {
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+  };
+  memcpy(ctx->state, init, sizeof(init));
+  ctx->len = 0;
+}
+
+void RAI_Sha256Update(RAI_Sha256* ctx, const void* data, size_t len) {
+  const unsigned char* bytes = data;
+  size_t used = ctx->len % 64;
+  ctx->len += len;
+  if (used > 0) {
+    const size_t n = len < 64 - used ? len : 64 - used;
+    memcpy(ctx->buffer + used, bytes, n);
+    bytes += n;
+    len -= n;
+    if (used + n < 64) {
+      return;
+    }
+    RAI_Sha256Block(ctx, ctx->buffer);
+  }
+  for (; len >= 64; bytes += 64, len -= 64) {
+    RAI_Sha256Block(ctx, bytes);
+  }
+  memcpy(ctx->buffer, bytes, len);
+}
+
+void RAI_Sha256Final(RAI_Sha256* ctx, unsigned char digest[RAI_SHA256_SIZE]) {
+  const uint64_t bits = ctx->len * 8;
+  unsigned char pad[72] = {0x80};
+  const size_t used = ctx->len % 64;
+  const size_t padlen = used < 56 ? 56 - used : 120 - used;
+  for (int i=0; i<8; i++) {
+    pad[padlen + i] = (unsigned char)(bits >> (56 - 8*i));
+  }
+  RAI_Sha256Update(ctx, pad, padlen + 8);
+  for (int i=0; i<8; i++) {
+    digest[4*i] = (unsigned char)(ctx->state[i] >> 24);
+    digest[4*i+1] = (unsigned char)(ctx->state[i] >> 16);
+    digest[4*i+2] = (unsigned char)(ctx->state[i] >> 8);
+    digest[4*i+3] = (unsigned char)ctx->state[i];
+  }
+}
@@ -8,4 +8,16 @@
 
 int parseDeviceStr(const char* devicestr, RAI_Device* device, int64_t* deviceid);
 
+#define RAI_SHA256_SIZE 32
+
+typedef struct RAI_Sha256 {
+  uint32_t state[8];
+  uint64_t len;
+  unsigned char buffer[64];
+} RAI_Sha256;
+
+void RAI_Sha256Init(RAI_Sha256* ctx);
+void RAI_Sha256Update(RAI_Sha256* ctx, const void* data, size_t len);
+void RAI_Sha256Final(RAI_Sha256* ctx, unsigned char digest[RAI_SHA256_SIZE]);
+
 #endif /* SRC_BACKENDS_UTIL_H_ */
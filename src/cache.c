@@ -0,0 +1,282 @@
+#include "cache.h"
+#include "redismodule.h"
+
+#include <limits.h>
+#include <string.h>
+#include <time.h>
+
+#include "util/arr_rm_alloc.h"
+#include "util/dict.h"
+
+typedef struct RAI_RunCacheEntry {
+  uint64_t key;
+  // Inputs are kept to tell hash collisions apart from hits
+  RAI_Tensor** inputs;
+  RAI_Tensor** outputs;
+  size_t bytes;
+  // 0 if the entry does not expire
+  long long expires_ms;
+  struct RAI_RunCacheEntry* prev;
+  struct RAI_RunCacheEntry* next;
+} RAI_RunCacheEntry;
+
+struct RAI_RunCache {
+  AI_dict* entries;
+  // Most recently used entry first
+  RAI_RunCacheEntry* head;
+  RAI_RunCacheEntry* tail;
+  size_t maxbytes;
+  long long ttl_ms;
+  size_t bytes;
+  long long hits;
+  long long misses;
+  long long evictions;
+};
+
+static uint64_t RAI_RunCacheHashCallback(const void *key) {
+  return *(const uint64_t*)key;
+}
+
+static int RAI_RunCacheKeyCompare(void *privdata, const void *key1, const void *key2) {
+  DICT_NOTUSED(privdata);
+  return *(const uint64_t*)key1 == *(const uint64_t*)key2;
+}
+
+// Keys point into the entries, which are owned by the LRU list
+static AI_dictType RAI_RunCacheDictType = {
+  RAI_RunCacheHashCallback,
+  NULL,
+  NULL,
+  RAI_RunCacheKeyCompare,
+  NULL,
+  NULL
+};
+
+static long long RAI_RunCacheMstime(void) {
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return (long long)ts.tv_sec * 1000 + ts.tv_nsec / 1000000;
+}
+
+RAI_RunCache* RAI_RunCacheCreate(size_t maxbytes, long long ttl_ms) {
+  RAI_RunCache* cache = RedisModule_Calloc(1, sizeof(*cache));
+  cache->entries = AI_dictCreate(&RAI_RunCacheDictType, NULL);
+  cache->maxbytes = maxbytes;
+  cache->ttl_ms = ttl_ms;
+  return cache;
+}
+
+static void RAI_RunCacheFreeTensors(RAI_Tensor** tensors) {
+  for (size_t i=0; i<array_len(tensors); i++) {
+    RAI_TensorFree(tensors[i]);
+  }
+  array_free(tensors);
+}
+
+static void RAI_RunCacheUnlink(RAI_RunCache* cache, RAI_RunCacheEntry* entry) {
+  if (entry->prev) {
+    entry->prev->next = entry->next;
+  }
+  else {
+    cache->head = entry->next;
+  }
+  if (entry->next) {
+    entry->next->prev = entry->prev;
+  }
+  else {
+    cache->tail = entry->prev;
+  }
+  entry->prev = NULL;
+  entry->next = NULL;
+}
+
+static void RAI_RunCachePushHead(RAI_RunCache* cache, RAI_RunCacheEntry* entry) {
+  entry->next = cache->head;
+  if (cache->head) {
+    cache->head->prev = entry;
+  }
+  cache->head = entry;
+  if (cache->tail == NULL) {
+    cache->tail = entry;
+  }
+}
+
+static void RAI_RunCacheRemove(RAI_RunCache* cache, RAI_RunCacheEntry* entry) {
+  AI_dictDelete(cache->entries, &entry->key);
+  RAI_RunCacheUnlink(cache, entry);
+  cache->bytes -= entry->bytes;
+  RAI_RunCacheFreeTensors(entry->inputs);
+  RAI_RunCacheFreeTensors(entry->outputs);
+  RedisModule_Free(entry);
+}
+
+void RAI_RunCacheFree(RAI_RunCache* cache) {
+  RAI_RunCacheEntry* entry = cache->head;
+  while (entry) {
+    RAI_RunCacheEntry* next = entry->next;
+    RAI_RunCacheFreeTensors(entry->inputs);
+    RAI_RunCacheFreeTensors(entry->outputs);
+    RedisModule_Free(entry);
+    entry = next;
+  }
+  AI_dictRelease(cache->entries);
+  RedisModule_Free(cache);
+}
+
+static uint64_t RAI_RunCacheCombine(uint64_t h, uint64_t v) {
+  return h ^ (v + 0x9e3779b97f4a7c15ULL + (h << 6) + (h >> 2));
+}
+
+/* The dict hash takes an int length, so larger buffers are hashed in
+ * chunks. */
+static uint64_t RAI_RunCacheHashBytes(uint64_t h, const char* data, size_t len) {
+  do {
+    const size_t chunk = len < INT_MAX ? len : INT_MAX;
+    h = RAI_RunCacheCombine(h, AI_dictGenHashFunction(data, (int)chunk));
+    data += chunk;
+    len -= chunk;
+  } while (len > 0);
+  return h;
+}
+
+uint64_t RAI_RunCacheKey(long long version, RAI_Tensor** inputs, size_t ninputs) {
+  uint64_t h = RAI_RunCacheCombine(0, (uint64_t)version);
+  for (size_t i=0; i<ninputs; i++) {
+    RAI_Tensor* t = inputs[i];
+    const DLDataType dtype = RAI_TensorDataType(t);
+    const int ndims = RAI_TensorNumDims(t);
+    long long meta[ndims + 3];
+    meta[0] = dtype.code;
+    meta[1] = dtype.bits;
+    meta[2] = ndims;
+    for (int j=0; j<ndims; j++) {
+      meta[j + 3] = RAI_TensorDim(t, j);
+    }
+    h = RAI_RunCacheHashBytes(h, (const char*)meta, sizeof(meta));
+    h = RAI_RunCacheHashBytes(h, RAI_TensorData(t), RAI_TensorByteSize(t));
+  }
+  return h;
+}
+
+static int RAI_RunCacheSameTensor(RAI_Tensor* a, RAI_Tensor* b) {
+  if (a == b) {
+    return 1;
+  }
+  const DLDataType adtype = RAI_TensorDataType(a);
+  const DLDataType bdtype = RAI_TensorDataType(b);
+  if (adtype.code != bdtype.code || adtype.bits != bdtype.bits) {
+    return 0;
+  }
+  const int ndims = RAI_TensorNumDims(a);
+  if (ndims != RAI_TensorNumDims(b)) {
+    return 0;
+  }
+  for (int i=0; i<ndims; i++) {
+    if (RAI_TensorDim(a, i) != RAI_TensorDim(b, i)) {
+      return 0;
+    }
+  }
+  return memcmp(RAI_TensorData(a), RAI_TensorData(b), RAI_TensorByteSize(a)) == 0;
+}
+
+/* Return the noutputs outputs cached for the inputs, owned by the cache, or
+ * NULL. */
+RAI_Tensor** RAI_RunCacheGet(RAI_RunCache* cache, uint64_t key, RAI_Tensor** inputs, size_t ninputs,
+                             size_t noutputs) {
+  AI_dictEntry* de = AI_dictFind(cache->entries, &key);
+  RAI_RunCacheEntry* entry = de ? AI_dictGetVal(de) : NULL;
+
+  if (entry && entry->expires_ms > 0 && entry->expires_ms <= RAI_RunCacheMstime()) {
+    RAI_RunCacheRemove(cache, entry);
+    entry = NULL;
+  }
+
+  if (entry && array_len(entry->inputs) == ninputs && array_len(entry->outputs) == noutputs) {
+    size_t i = 0;
+    while (i < ninputs && RAI_RunCacheSameTensor(entry->inputs[i], inputs[i])) {
+      i++;
+    }
+    if (i == ninputs) {
+      RAI_RunCacheUnlink(cache, entry);
+      RAI_RunCachePushHead(cache, entry);
+      cache->hits++;
+      return entry->outputs;
+    }
+  }
+
+  cache->misses++;
+  return NULL;
+}
+
+static RAI_Tensor** RAI_RunCacheCopyTensors(RAI_Tensor** tensors, size_t n) {
+  RAI_Tensor** copies = array_new(RAI_Tensor*, n);
+  for (size_t i=0; i<n; i++) {
+    copies = array_append(copies, RAI_TensorGetShallowCopy(tensors[i]));
+  }
+  return copies;
+}
+
+/* Store the outputs of a run, evicting the least recently used entries
+ * above the memory cap. Entries larger than the cap are not stored. */
+void RAI_RunCachePut(RAI_RunCache* cache, uint64_t key, RAI_Tensor** inputs, size_t ninputs,
+                     RAI_Tensor** outputs, size_t noutputs) {
+  size_t bytes = sizeof(RAI_RunCacheEntry);
+  for (size_t i=0; i<ninputs; i++) {
+    bytes += RAI_TensorByteSize(inputs[i]);
+  }
+  for (size_t i=0; i<noutputs; i++) {
+    bytes += RAI_TensorByteSize(outputs[i]);
+  }
+  if (bytes > cache->maxbytes) {
+    return;
+  }
+
+  AI_dictEntry* de = AI_dictFind(cache->entries, &key);
+  if (de) {
+    RAI_RunCacheRemove(cache, AI_dictGetVal(de));
+  }
+
+  while (cache->tail && cache->bytes + bytes > cache->maxbytes) {
+    RAI_RunCacheRemove(cache, cache->tail);
+    cache->evictions++;
+  }
+
+  RAI_RunCacheEntry* entry = RedisModule_Calloc(1, sizeof(*entry));
+  entry->key = key;
+  entry->inputs = RAI_RunCacheCopyTensors(inputs, ninputs);
+  entry->outputs = RAI_RunCacheCopyTensors(outputs, noutputs);
+  entry->bytes = bytes;
+  if (cache->ttl_ms > 0) {
+    entry->expires_ms = RAI_RunCacheMstime() + cache->ttl_ms;
+  }
+
+  AI_dictAdd(cache->entries, &entry->key, entry);
+  RAI_RunCachePushHead(cache, entry);
+  cache->bytes += bytes;
+}
+
+void RAI_RunCacheResetStats(RAI_RunCache* cache) {
+  cache->hits = 0;
+  cache->misses = 0;
+  cache->evictions = 0;
+}
+
+long long RAI_RunCacheHits(RAI_RunCache* cache) {
+  return cache->hits;
+}
+
+long long RAI_RunCacheMisses(RAI_RunCache* cache) {
+  return cache->misses;
+}
+
+long long RAI_RunCacheEvictions(RAI_RunCache* cache) {
+  return cache->evictions;
+}
+
+long long RAI_RunCacheEntries(RAI_RunCache* cache) {
+  return AI_dictSize(cache->entries);
+}
+
+long long RAI_RunCacheBytes(RAI_RunCache* cache) {
+  return cache->bytes;
+}
@@ -0,0 +1,27 @@
+#ifndef SRC_CACHE_H_
+#define SRC_CACHE_H_
+
+#include <stdint.h>
+#include "tensor.h"
+
+// Outputs of previous runs of a model, keyed by a hash of the model version
+// and of the input tensors. Only accessed from the main thread.
+typedef struct RAI_RunCache RAI_RunCache;
+
+RAI_RunCache* RAI_RunCacheCreate(size_t maxbytes, long long ttl_ms);
+void RAI_RunCacheFree(RAI_RunCache* cache);
+
+uint64_t RAI_RunCacheKey(long long version, RAI_Tensor** inputs, size_t ninputs);
+RAI_Tensor** RAI_RunCacheGet(RAI_RunCache* cache, uint64_t key, RAI_Tensor** inputs, size_t ninputs,
+                             size_t noutputs);
+void RAI_RunCachePut(RAI_RunCache* cache, uint64_t key, RAI_Tensor** inputs, size_t ninputs,
+                     RAI_Tensor** outputs, size_t noutputs);
+
+void RAI_RunCacheResetStats(RAI_RunCache* cache);
+long long RAI_RunCacheHits(RAI_RunCache* cache);
+long long RAI_RunCacheMisses(RAI_RunCache* cache);
+long long RAI_RunCacheEvictions(RAI_RunCache* cache);
+long long RAI_RunCacheEntries(RAI_RunCache* cache);
+long long RAI_RunCacheBytes(RAI_RunCache* cache);
+
+#endif /* SRC_CACHE_H_ */
@@ -13,6 +13,15 @@ typedef enum {
   RAI_BACKEND_ONNXRUNTIME,
 } RAI_Backend;
 
+// How models and scripts are brought up when loaded from RDB:
+// EAGER creates backend sessions while loading, LAZY defers it to first run,
+// BACKGROUND defers it and compiles pending values from a background thread
+typedef enum {
+  RAI_LOADING_EAGER = 0,
+  RAI_LOADING_LAZY,
+  RAI_LOADING_BACKGROUND
+} RAI_LoadingMode;
+
 // NOTE: entry in queue hash is formed by
 // device * MAX_DEVICE_ID + deviceid
 
@@ -23,8 +32,16 @@ typedef enum {
 
 #define RAI_ENC_VER 900
 
+// RDB encoding version of models:
+// 1 adds the input shapes given with SHAPE in MODELSET, the MODELSET options
+// (OPTLEVEL, EXECMODE, MEMPATTERN, CPUARENA, THREADS, XNNPACK, OPTIMIZE,
+// REPLICATE, CACHE and TTL) and the version of the model reported by AI.INFO
+#define RAI_MODEL_ENC_VER 1
+
 //#define RAI_COPY_RUN_INPUT
-#define RAI_COPY_RUN_OUTPUT
+// Define to copy TF and ONNX model outputs instead of referencing the
+// buffers the backends allocate for them
+//#define RAI_COPY_RUN_OUTPUT
 #define RAI_PRINT_BACKEND_ERRORS
 
 #endif /* SRC_CONFIG_H_ */
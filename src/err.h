@@ -15,7 +15,9 @@ typedef enum {
   RAI_ESCRIPTRUN,
   RAI_EUNSUPPORTEDBACKEND,
   RAI_EBACKENDNOTLOADED,
-  RAI_ESCRIPTFREE
+  RAI_ESCRIPTFREE,
+  RAI_EBACKENDCONFIGURE,
+  RAI_EDAGRUN
 } RAI_ErrorCode;
 
 typedef struct RAI_Error {
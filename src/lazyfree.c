@@ -0,0 +1,74 @@
+#include "lazyfree.h"
+#include "redismodule.h"
+
+#include <pthread.h>
+#include <stdbool.h>
+
+#include "util/arr_rm_alloc.h"
+
+/* Tensors holding at least this many bytes are freed on the lazyfree thread
+ * when their key is deleted or overwritten. Models and scripts, whose size
+ * isn't known without serializing them, are always freed there unless it
+ * is 0, which frees everything on the main thread. */
+long long RAI_lazyfreeThreshold = RAI_DEFAULT_LAZYFREE_THRESHOLD;
+
+typedef struct RAI_LazyFreeJob {
+  void (*free_fn)(void*);
+  void* value;
+} RAI_LazyFreeJob;
+
+static RAI_LazyFreeJob* lazyfree_jobs = NULL;
+static pthread_mutex_t lazyfree_jobs_mutex = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t lazyfree_jobs_condition_var = PTHREAD_COND_INITIALIZER;
+static pthread_t lazyfree_thread;
+static int lazyfree_thread_started = 0;
+
+static void *RAI_LazyFree_ThreadMain(void *arg) {
+  while (true) {
+    pthread_mutex_lock(&lazyfree_jobs_mutex);
+    while (array_len(lazyfree_jobs) == 0) {
+      pthread_cond_wait(&lazyfree_jobs_condition_var, &lazyfree_jobs_mutex);
+    }
+    RAI_LazyFreeJob job = array_pop(lazyfree_jobs);
+    pthread_mutex_unlock(&lazyfree_jobs_mutex);
+
+    job.free_fn(job.value);
+  }
+
+  return NULL;
+}
+
+/* Free a value on the lazyfree thread. The caller must hold the only
+ * reference to it, and free_fn must not touch state owned by the main
+ * thread. */
+void RAI_LazyFree(void (*free_fn)(void*), void* value) {
+  pthread_mutex_lock(&lazyfree_jobs_mutex);
+  if (!lazyfree_thread_started) {
+    lazyfree_thread_started = pthread_create(&lazyfree_thread, NULL, RAI_LazyFree_ThreadMain, NULL) == 0;
+  }
+  if (!lazyfree_thread_started) {
+    pthread_mutex_unlock(&lazyfree_jobs_mutex);
+    free_fn(value);
+    return;
+  }
+  if (lazyfree_jobs == NULL) {
+    lazyfree_jobs = array_new(RAI_LazyFreeJob, 16);
+  }
+  RAI_LazyFreeJob job = {
+    .free_fn = free_fn,
+    .value = value
+  };
+  lazyfree_jobs = array_append(lazyfree_jobs, job);
+  pthread_cond_signal(&lazyfree_jobs_condition_var);
+  pthread_mutex_unlock(&lazyfree_jobs_mutex);
+}
+
+/* Free a value of the given size on the lazyfree thread if it reaches the
+ * threshold. Return 0 if it didn't, the caller then frees it. */
+int RAI_LazyFreeLarge(void (*free_fn)(void*), void* value, size_t bytes) {
+  if (RAI_lazyfreeThreshold <= 0 || bytes < (size_t)RAI_lazyfreeThreshold) {
+    return 0;
+  }
+  RAI_LazyFree(free_fn, value);
+  return 1;
+}
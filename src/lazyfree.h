@@ -0,0 +1,13 @@
+#ifndef SRC_LAZYFREE_H_
+#define SRC_LAZYFREE_H_
+
+#include <stddef.h>
+
+#define RAI_DEFAULT_LAZYFREE_THRESHOLD (1024 * 1024)
+
+extern long long RAI_lazyfreeThreshold;
+
+void RAI_LazyFree(void (*free_fn)(void*), void* value);
+int RAI_LazyFreeLarge(void (*free_fn)(void*), void* value, size_t bytes);
+
+#endif /* SRC_LAZYFREE_H_ */
@@ -1,10 +1,18 @@
 #include "tflite_c.h"
 #include <iostream>
 #include <sstream>
+#include <cstddef>
+#include <cstdint>
+#include <map>
+#include <mutex>
+#include <vector>
 #include "tensorflow/lite/interpreter.h"
 #include "tensorflow/lite/kernels/register.h"
 #include "tensorflow/lite/model.h"
 #include "tensorflow/lite/tools/evaluation/utils.h"
+#if RAI_TFLITE_USE_XNNPACK
+#include "tensorflow/lite/delegates/xnnpack/xnnpack_delegate.h"
+#endif
 
 namespace {
 
@@ -96,6 +104,10 @@ void copyToTfLiteTensor(std::shared_ptr<tflite::Interpreter> interpreter,
 
   size_t nbytes = dltensorBytes(input);
 
+  if (nbytes != tensor->bytes) {
+    throw std::logic_error("Input tensor size does not match the model input");
+  }
+
   switch (tensor->type) {
     case kTfLiteUInt8:
       memcpy(interpreter->typed_tensor<uint8_t>(tflite_input), input->dl_tensor.data, nbytes);
@@ -123,6 +135,29 @@ void copyToTfLiteTensor(std::shared_ptr<tflite::Interpreter> interpreter,
   }
 }
 
+// Whether an input tensor of the interpreter can be pointed at the data of
+// a RedisAI tensor instead of having it copied in. This is limited to
+// tensors planned in the arena and not handed to a delegate, with a
+// matching type and size, and suitably aligned data.
+bool canBindTfLiteTensor(const TfLiteTensor* tensor, DLManagedTensor* input) {
+  if (tensor->allocation_type != kTfLiteArenaRw ||
+      tensor->buffer_handle != kTfLiteNullBufferHandle ||
+      tensor->type == kTfLiteFloat16) {
+    return false;
+  }
+
+  DLDataType dtype = getDLDataType(tensor);
+  if (dtype.code != input->dl_tensor.dtype.code || dtype.bits != input->dl_tensor.dtype.bits) {
+    return false;
+  }
+
+  if (reinterpret_cast<uintptr_t>(input->dl_tensor.data) % alignof(std::max_align_t) != 0) {
+    return false;
+  }
+
+  return dltensorBytes(input) == tensor->bytes;
+}
+
 void deleter(DLManagedTensor * arg) {
   delete[] (uint8_t*)arg->dl_tensor.data;
   delete[] arg->dl_tensor.shape;
@@ -200,65 +235,193 @@ DLManagedTensor* toManagedDLPack(std::shared_ptr<tflite::Interpreter> interprete
 
 void setError(const char* what, char **error, void* (*alloc)(size_t)) {
   size_t len = strlen(what);
-  *error = (char*)alloc(len * sizeof(char));
+  *error = (char*)alloc((len + 1) * sizeof(char));
   strcpy(*error, what);
 }
 
+struct InterpreterContext {
+  std::shared_ptr<tflite::Interpreter> interpreter;
+  // inputs can only be bound to RedisAI tensors when no tensor is dynamic,
+  // as the arena planner resets the data of all tensors when it runs again
+  // during Invoke to allocate dynamic ones
+  bool bind_inputs;
+  // held while the interpreter runs, the workers of a device queue share
+  // the interpreters of a model
+  std::shared_ptr<std::mutex> lock;
+};
+
+// Interpreters are kept for at most this many batch sizes besides the one
+// of the model, further ones are built for a single run
+const size_t kMaxBatchInterpreters = 16;
+
 struct ModelContext {
   std::shared_ptr<tflite::FlatBufferModel> model;
   std::shared_ptr<tflite::Interpreter> interpreter;
   std::string buffer;
   DLDeviceType device;
   int64_t device_id;
+  int num_threads;
+  bool use_xnnpack;
+  bool bind_inputs;
+  std::shared_ptr<std::mutex> interpreter_lock;
+  // interpreters with the batch dimension of their inputs resized, by batch size
+  std::map<int64_t, InterpreterContext> batch_interpreters;
+  std::mutex batch_interpreters_lock;
 };
 
-}
-
-extern "C" void tfliteBasicTest() {
-}
-
-extern "C" void* tfliteLoadModel(const char* graph, size_t graphlen, DLDeviceType device, int64_t device_id,
-                                 char **error, void* (*alloc)(size_t)) {
-  std::string graphstr(graph, graphlen);
-
-  std::shared_ptr<tflite::FlatBufferModel> model;
+// Builds an interpreter for model, with the first dimension of its inputs
+// resized to batch_size unless it is negative
+InterpreterContext buildInterpreter(tflite::FlatBufferModel& model, DLDeviceType device,
+                                    int num_threads, bool use_xnnpack,
+                                    int64_t batch_size, std::string& error) {
   std::unique_ptr<tflite::Interpreter> interpreter_;
-  model = tflite::FlatBufferModel::BuildFromBuffer(graphstr.c_str(), graphlen);
-  if (!model) {
-    setError("Failed to load model from buffer", error, alloc);
-    return NULL;
-  }
 
   tflite::ops::builtin::BuiltinOpResolver resolver;
 
-  tflite::InterpreterBuilder(*model, resolver)(&interpreter_);
+  tflite::InterpreterBuilder(model, resolver)(&interpreter_);
   if (!interpreter_) {
-    setError("Failed to construct interpreter", error, alloc);
-    return NULL;
+    error = "Failed to construct interpreter";
+    return InterpreterContext{nullptr, false};
+  }
+
+  interpreter_->SetNumThreads(num_threads);
+
+  bool delegated = false;
+
+  if (batch_size >= 0) {
+    for (int input : interpreter_->inputs()) {
+      const TfLiteIntArray* dims = interpreter_->tensor(input)->dims;
+      if (dims->size == 0) {
+        continue;
+      }
+      std::vector<int> batched_dims(dims->data, dims->data + dims->size);
+      batched_dims[0] = batch_size;
+      if (interpreter_->ResizeInputTensor(input, batched_dims) != kTfLiteOk) {
+        error = "Failed to resize inputs to the batch size";
+        return InterpreterContext{nullptr, false};
+      }
+    }
   }
 
 #if RAI_TFLITE_USE_CUDA
   if (device == DLDeviceType::kDLGPU) {
-    tflite::Interpreter::TfLiteDelegatePtr delegate = tflite::evaluation::CreateGPUDelegate(model.get());
+    tflite::Interpreter::TfLiteDelegatePtr delegate = tflite::evaluation::CreateGPUDelegate(&model);
     if (interpreter_->ModifyGraphWithDelegate(std::move(delegate)) != kTfLiteOk) {
-      setError("Failed to set GPU delegate", error, alloc);
-      return NULL;
+      error = "Failed to set GPU delegate";
+      return InterpreterContext{nullptr, false};
     }
+    delegated = true;
+  }
+#endif
+
+#if RAI_TFLITE_USE_XNNPACK
+  // operators XNNPACK does not support are left to the builtin kernels
+  if (use_xnnpack && device == DLDeviceType::kDLCPU) {
+    TfLiteXNNPackDelegateOptions options = TfLiteXNNPackDelegateOptionsDefault();
+    options.num_threads = num_threads;
+    tflite::Interpreter::TfLiteDelegatePtr delegate(TfLiteXNNPackDelegateCreate(&options),
+                                                    TfLiteXNNPackDelegateDelete);
+    if (interpreter_->ModifyGraphWithDelegate(std::move(delegate)) != kTfLiteOk) {
+      error = "Failed to set XNNPACK delegate";
+      return InterpreterContext{nullptr, false};
+    }
+    delegated = true;
+  }
+#else
+  if (use_xnnpack) {
+    error = "XNNPACK is not available in this build";
+    return InterpreterContext{nullptr, false};
   }
 #endif
 
   if (interpreter_->AllocateTensors() != kTfLiteOk) {
-    setError("Failed to allocate tensors", error, alloc);
+    error = "Failed to allocate tensors";
+    return InterpreterContext{nullptr, false};
+  }
+
+  // delegates may keep the input data pointers they find on the first run
+  bool bind_inputs = !delegated;
+  for (size_t i=0; bind_inputs && i<interpreter_->tensors_size(); i++) {
+    if (interpreter_->tensor(i)->allocation_type == kTfLiteDynamic) {
+      bind_inputs = false;
+      break;
+    }
+  }
+
+  return InterpreterContext{std::move(interpreter_), bind_inputs, std::make_shared<std::mutex>()};
+}
+
+// Interpreter whose inputs have the batch size of the given ones, built on
+// first use for batch sizes other than the one of the model
+InterpreterContext getInterpreter(ModelContext* ctx, long n_inputs, DLManagedTensor** inputs,
+                                  std::string& error) {
+  InterpreterContext base{ctx->interpreter, ctx->bind_inputs, ctx->interpreter_lock};
+
+  if (n_inputs == 0 || inputs[0]->dl_tensor.ndim == 0) {
+    return base;
+  }
+
+  const TfLiteIntArray* dims = ctx->interpreter->tensor(ctx->interpreter->inputs()[0])->dims;
+  const int64_t batch_size = inputs[0]->dl_tensor.shape[0];
+  if (dims->size == 0 || dims->data[0] == batch_size) {
+    return base;
+  }
+
+  {
+    std::lock_guard<std::mutex> guard(ctx->batch_interpreters_lock);
+    auto it = ctx->batch_interpreters.find(batch_size);
+    if (it != ctx->batch_interpreters.end()) {
+      return it->second;
+    }
+  }
+
+  InterpreterContext batched = buildInterpreter(*ctx->model, ctx->device, ctx->num_threads, ctx->use_xnnpack,
+                                                batch_size, error);
+  if (!batched.interpreter) {
+    return batched;
+  }
+
+  std::lock_guard<std::mutex> guard(ctx->batch_interpreters_lock);
+  if (ctx->batch_interpreters.size() < kMaxBatchInterpreters) {
+    ctx->batch_interpreters.emplace(batch_size, batched);
+  }
+
+  return batched;
+}
+
+}
+
+extern "C" void tfliteBasicTest() {
+}
+
+extern "C" void* tfliteLoadModel(const char* graph, size_t graphlen, DLDeviceType device, int64_t device_id,
+                                 int num_threads, int use_xnnpack,
+                                 char **error, void* (*alloc)(size_t)) {
+  std::string graphstr(graph, graphlen);
+
+  std::shared_ptr<tflite::FlatBufferModel> model;
+  model = tflite::FlatBufferModel::BuildFromBuffer(graphstr.c_str(), graphlen);
+  if (!model) {
+    setError("Failed to load model from buffer", error, alloc);
     return NULL;
   }
 
-  std::shared_ptr<tflite::Interpreter> interpreter = std::move(interpreter_);
+  std::string build_error;
+  InterpreterContext interpreter = buildInterpreter(*model, device, num_threads, use_xnnpack, -1, build_error);
+  if (!interpreter.interpreter) {
+    setError(build_error.c_str(), error, alloc);
+    return NULL;
+  }
 
   ModelContext* ctx = new ModelContext();
   ctx->device = device;
   ctx->device_id = device_id;
+  ctx->num_threads = num_threads;
+  ctx->use_xnnpack = use_xnnpack;
+  ctx->bind_inputs = interpreter.bind_inputs;
+  ctx->interpreter_lock = std::move(interpreter.lock);
   ctx->model = std::move(model);
-  ctx->interpreter = std::move(interpreter);
+  ctx->interpreter = std::move(interpreter.interpreter);
   ctx->buffer = std::move(graphstr);
 
   return ctx;
@@ -270,33 +433,60 @@ extern "C" void tfliteRunModel(void* ctx,
                                char **error, void* (*alloc)(size_t)) {
   ModelContext* ctx_ = (ModelContext*)ctx;
 
-  auto interpreter = ctx_->interpreter;
-  auto model = ctx_->model;
-
-  const std::vector<int> tflite_inputs = interpreter->inputs();
-  const std::vector<int> tflite_outputs = interpreter->outputs();
-
-  if (n_inputs != tflite_inputs.size()) {
+  if (n_inputs != ctx_->interpreter->inputs().size()) {
     setError("Inconsistent number of inputs", error, alloc);
     return;
   }
 
-  if (n_outputs != tflite_outputs.size()) {
+  if (n_outputs != ctx_->interpreter->outputs().size()) {
     setError("Inconsistent number of outputs", error, alloc);
     return;
   }
 
+  std::string build_error;
+  InterpreterContext interpreter_ctx = getInterpreter(ctx_, n_inputs, inputs, build_error);
+  if (!interpreter_ctx.interpreter) {
+    setError(build_error.c_str(), error, alloc);
+    return;
+  }
+
+  auto interpreter = interpreter_ctx.interpreter;
+  std::lock_guard<std::mutex> run_guard(*interpreter_ctx.lock);
+
+  const std::vector<int> tflite_inputs = interpreter->inputs();
+  const std::vector<int> tflite_outputs = interpreter->outputs();
+
+  // arena data of the inputs bound to RedisAI tensors, restored after the run
+  std::vector<char*> arena_data(tflite_inputs.size(), nullptr);
+
+  auto unbind_inputs = [&]() {
+    for (size_t i=0; i<tflite_inputs.size(); i++) {
+      if (arena_data[i] != nullptr) {
+        interpreter->tensor(tflite_inputs[i])->data.raw = arena_data[i];
+      }
+    }
+  };
+
   try {
     for (size_t i=0; i<tflite_inputs.size(); i++) {
-      copyToTfLiteTensor(interpreter, tflite_inputs[i], inputs[i]);
+      TfLiteTensor* tensor = interpreter->tensor(tflite_inputs[i]);
+      if (interpreter_ctx.bind_inputs && canBindTfLiteTensor(tensor, inputs[i])) {
+        arena_data[i] = tensor->data.raw;
+        tensor->data.raw = (char*)inputs[i]->dl_tensor.data;
+      }
+      else {
+        copyToTfLiteTensor(interpreter, tflite_inputs[i], inputs[i]);
+      }
     }
   }
   catch(std::exception& e) {
+    unbind_inputs();
     setError(e.what(), error, alloc);
     return;
   }
 
   if (interpreter->Invoke() != kTfLiteOk) {
+    unbind_inputs();
     setError("Failed to invoke TfLite", error, alloc);
     return;
   }
@@ -307,9 +497,40 @@ extern "C" void tfliteRunModel(void* ctx,
     }
   }
   catch(std::exception& e) {
+    unbind_inputs();
     setError(e.what(), error, alloc);
     return;
   }
+
+  unbind_inputs();
+}
+
+extern "C" long tfliteModelNumInputs(void* ctx) {
+  ModelContext* ctx_ = (ModelContext*)ctx;
+  return ctx_->interpreter->inputs().size();
+}
+
+extern "C" long tfliteModelNumOutputs(void* ctx) {
+  ModelContext* ctx_ = (ModelContext*)ctx;
+  return ctx_->interpreter->outputs().size();
+}
+
+extern "C" int tfliteModelInputShape(void* ctx, long index, DLDataType* dtype, int64_t** dims,
+                                     void* (*alloc)(size_t)) {
+  ModelContext* ctx_ = (ModelContext*)ctx;
+  auto interpreter = ctx_->interpreter;
+
+  const TfLiteTensor* tensor = interpreter->tensor(interpreter->inputs()[index]);
+
+  *dtype = getDLDataType(tensor);
+
+  const int ndims = tensor->dims->size;
+  *dims = (int64_t*)alloc(ndims * sizeof(int64_t));
+  for (int i=0; i<ndims; i++) {
+    (*dims)[i] = tensor->dims->data[i];
+  }
+
+  return ndims;
 }
 
 extern "C" void tfliteSerializeModel(void* ctx, char **buffer, size_t *len,
@@ -10,6 +10,7 @@ extern "C" {
 // void tfliteBasicTest();
 
 void* tfliteLoadModel(const char* model, size_t modellen, DLDeviceType device, int64_t device_id,
+                      int num_threads, int use_xnnpack,
                       char **error, void* (*alloc)(size_t));
 
 void tfliteRunModel(void* ctx,
@@ -17,6 +18,13 @@ void tfliteRunModel(void* ctx,
                     long nOutputs, DLManagedTensor** outputs,
                     char **error, void* (*alloc)(size_t));
 
+long tfliteModelNumInputs(void* ctx);
+
+long tfliteModelNumOutputs(void* ctx);
+
+int tfliteModelInputShape(void* ctx, long index, DLDataType* dtype, int64_t** dims,
+                          void* (*alloc)(size_t));
+
 void tfliteSerializeModel(void* ctx, char **buffer, size_t *len,
                           char **error, void* (*alloc)(size_t));
 
@@ -2,10 +2,14 @@
 #include <torch/torch.h>
 #include <torch/csrc/jit/import.h>
 #include <torch/csrc/jit/script/compilation_unit.h>
+#if RAI_TORCH_USE_FREEZE
+#include <torch/csrc/jit/passes/freeze_module.h>
+#endif
 #include <iostream>
 #include <sstream>
 
 #include <ATen/Functions.h>
+#include <ATen/Parallel.h>
 
 namespace {
 
@@ -186,11 +190,18 @@ struct ModuleContext {
   std::shared_ptr<torch::jit::script::CompilationUnit> cu;
   DLDeviceType device;
   int64_t device_id;
+  // serialized model the module was transformed from (e.g. frozen), empty
+  // if the module is saved as is
+  std::string blob;
 };
 
 void torchRunModule(ModuleContext* ctx, const char* fnName,
                     long nInputs, DLManagedTensor** inputs,
                     long nOutputs, DLManagedTensor** outputs) {
+  // OpenMP keeps the pool size per calling thread, so propagate the configured
+  // intra-op size to the RedisAI worker running this module
+  at::init_num_threads();
+
   // Checks device, if GPU then move input to GPU before running
   // TODO: This will need to change at some point, as individual tensors will have their placement
   // and script will only make sure that placement is correct
@@ -317,7 +328,7 @@ extern "C" void* torchCompileScript(const char* script, DLDeviceType device, int
 }
 
 extern "C" void* torchLoadModel(const char* graph, size_t graphlen, DLDeviceType device, int64_t device_id,
-                                char **error, void* (*alloc)(size_t))
+                                int optimize, char **error, void* (*alloc)(size_t))
 {
   std::string graphstr(graph, graphlen);
   std::istringstream graph_stream(graphstr, std::ios_base::binary);
@@ -333,6 +344,20 @@ extern "C" void* torchLoadModel(const char* graph, size_t graphlen, DLDeviceType
     }
     torch::Device aten_device(aten_device_type, device_id);
     module->to(aten_device);
+    if (optimize) {
+      // models are only used for inference, so dropout and batch norm
+      // layers can run in eval mode
+      module->eval();
+#if RAI_TORCH_USE_FREEZE
+      // inlines parameters and attributes into the graph as constants, so
+      // that they can be folded
+      module = std::make_shared<torch::jit::script::Module>(torch::jit::freeze_module(*module));
+#endif
+    }
+    if (optimize) {
+      // MODELGET and persistence return the model as it was given
+      ctx->blob = std::move(graphstr);
+    }
     ctx->module = module;
     ctx->cu = nullptr;
   }
@@ -384,8 +409,10 @@ extern "C" void torchSerializeModel(void* modelCtx, char **buffer, size_t *len,
   ModuleContext* ctx = (ModuleContext*)modelCtx;
   std::ostringstream out;
   try {
-    ctx->module->save(out);
-    auto out_str = out.str();
+    if (ctx->blob.empty()) {
+      ctx->module->save(out);
+    }
+    auto out_str = ctx->blob.empty() ? out.str() : ctx->blob;
     int size = out_str.size();
     *buffer = (char *)alloc(size);
     memcpy(*buffer, out_str.c_str(), size);
@@ -398,6 +425,31 @@ extern "C" void torchSerializeModel(void* modelCtx, char **buffer, size_t *len,
   }
 }
 
+extern "C" void torchSetIntraOpThreads(int num_threads, char **error, void* (*alloc)(size_t))
+{
+  try {
+    at::set_num_threads(num_threads);
+  }
+  catch(std::exception& e) {
+    size_t len = strlen(e.what());
+    *error = (char*)alloc((len + 1) * sizeof(char));
+    strcpy(*error, e.what());
+  }
+}
+
+extern "C" void torchSetInterOpThreads(int num_threads, char **error, void* (*alloc)(size_t))
+{
+  try {
+    // Throws if the inter-op pool has already been started
+    at::set_num_interop_threads(num_threads);
+  }
+  catch(std::exception& e) {
+    size_t len = strlen(e.what());
+    *error = (char*)alloc((len + 1) * sizeof(char));
+    strcpy(*error, e.what());
+  }
+}
+
 extern "C" void torchDeallocContext(void* ctx)
 {
   ModuleContext* ctx_ = (ModuleContext*)ctx;
@@ -17,7 +17,7 @@ void* torchCompileScript(const char* script, DLDeviceType device, int64_t device
                          char **error, void* (*alloc)(size_t));
 
 void* torchLoadModel(const char* model, size_t modellen, DLDeviceType device, int64_t device_id,
-                     char **error, void* (*alloc)(size_t));
+                     int optimize, char **error, void* (*alloc)(size_t));
 
 void torchRunScript(void* scriptCtx, const char* fnName,
                     long nInputs, DLManagedTensor** inputs,
@@ -32,6 +32,10 @@ void torchRunModel(void* modelCtx,
 void torchSerializeModel(void* modelCtx, char **buffer, size_t *len,
                          char **error, void* (*alloc)(size_t));
 
+void torchSetIntraOpThreads(int num_threads, char **error, void* (*alloc)(size_t));
+
+void torchSetInterOpThreads(int num_threads, char **error, void* (*alloc)(size_t));
+
 void torchDeallocContext(void* ctx);
 
 #ifdef __cplusplus
@@ -0,0 +1,343 @@
+#include "loader.h"
+#include "backends.h"
+#include "stats.h"
+
+#include <pthread.h>
+#include <stdbool.h>
+#include <strings.h>
+
+#include "rmutil/alloc.h"
+#include "util/arr_rm_alloc.h"
+
+RAI_LoadingMode RAI_loadingMode = RAI_LOADING_EAGER;
+long long RAI_warmupOnLoad = 0;
+
+typedef struct RAI_PendingLoad {
+  RAI_RunType type;
+  void* value;
+} RAI_PendingLoad;
+
+static RAI_PendingLoad* pending_loads = NULL;
+static pthread_mutex_t pending_loads_mutex = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t pending_loads_condition_var = PTHREAD_COND_INITIALIZER;
+static pthread_t loader_thread;
+static int loader_thread_started = 0;
+
+int RAI_LoadingModeFromString(const char* modestr, RAI_LoadingMode* mode) {
+  if (strcasecmp(modestr, "EAGER") == 0) {
+    *mode = RAI_LOADING_EAGER;
+  }
+  else if (strcasecmp(modestr, "LAZY") == 0) {
+    *mode = RAI_LOADING_LAZY;
+  }
+  else if (strcasecmp(modestr, "BACKGROUND") == 0) {
+    *mode = RAI_LOADING_BACKGROUND;
+  }
+  else {
+    return REDISMODULE_ERR;
+  }
+  return REDISMODULE_OK;
+}
+
+const char* RAI_LoadingModeName(RAI_LoadingMode mode) {
+  switch (mode) {
+    case RAI_LOADING_EAGER:
+      return "EAGER";
+    case RAI_LOADING_LAZY:
+      return "LAZY";
+    case RAI_LOADING_BACKGROUND:
+      return "BACKGROUND";
+  }
+  return NULL;
+}
+
+/* Number of calls recorded in run_stats for a pending value.
+ * Must be called with the GIL held. */
+static long long RAI_PendingLoadCalls(RAI_PendingLoad* load) {
+  void* infokey = load->type == RAI_MODEL ? ((RAI_Model*)load->value)->infokey
+                                          : ((RAI_Script*)load->value)->infokey;
+  if (infokey == NULL) {
+    return 0;
+  }
+  AI_dictEntry *stats_entry = AI_dictFind(run_stats, infokey);
+  if (stats_entry == NULL) {
+    return 0;
+  }
+  struct RedisAI_RunStats *rstats = AI_dictGetVal(stats_entry);
+  return rstats->calls;
+}
+
+static void RAI_PendingLoadRelease(RAI_PendingLoad* load) {
+  RAI_Error err = {0};
+  if (load->type == RAI_MODEL) {
+    RAI_ModelFree(load->value, &err);
+  }
+  else {
+    RAI_ScriptFree(load->value, &err);
+  }
+  RAI_ClearError(&err);
+}
+
+/* Compile pending models and scripts one at a time, most called first. */
+static void *RAI_Loader_ThreadMain(void *arg) {
+  RedisModuleCtx* ctx = RedisModule_GetThreadSafeContext(NULL);
+
+  while (true) {
+    pthread_mutex_lock(&pending_loads_mutex);
+    while (array_len(pending_loads) == 0) {
+      pthread_cond_wait(&pending_loads_condition_var, &pending_loads_mutex);
+    }
+    pthread_mutex_unlock(&pending_loads_mutex);
+
+    // run_stats and the backends are owned by the main thread
+    RedisModule_ThreadSafeContextLock(ctx);
+    pthread_mutex_lock(&pending_loads_mutex);
+
+    size_t next = 0;
+    long long next_calls = -1;
+    for (size_t i=0; i<array_len(pending_loads); i++) {
+      long long calls = RAI_PendingLoadCalls(&pending_loads[i]);
+      if (calls > next_calls) {
+        next = i;
+        next_calls = calls;
+      }
+    }
+    RAI_PendingLoad load = pending_loads[next];
+    pending_loads[next] = array_tail(pending_loads);
+    array_pop(pending_loads);
+
+    pthread_mutex_unlock(&pending_loads_mutex);
+
+    long long refCount = load.type == RAI_MODEL ? ((RAI_Model*)load.value)->refCount
+                                                : ((RAI_Script*)load.value)->refCount;
+    if (refCount == 1) {
+      // The key was deleted or overwritten in the meantime
+      RAI_PendingLoadRelease(&load);
+      RedisModule_ThreadSafeContextUnlock(ctx);
+      continue;
+    }
+
+    RAI_Backend backend = load.type == RAI_MODEL ? ((RAI_Model*)load.value)->backend : RAI_BACKEND_TORCH;
+    int backend_ret = RAI_EnsureBackendLoaded(ctx, backend);
+
+    RedisModule_ThreadSafeContextUnlock(ctx);
+
+    RAI_Error err = {0};
+    if (backend_ret == REDISMODULE_OK) {
+      if (load.type == RAI_MODEL) {
+        if (RAI_ModelMaterialize(load.value, &err) == REDISMODULE_OK && RAI_warmupOnLoad > 0) {
+          RAI_ModelWarmup(load.value, RAI_warmupOnLoad, &err);
+        }
+      }
+      else {
+        RAI_ScriptMaterialize(load.value, &err);
+      }
+    }
+
+    RedisModule_ThreadSafeContextLock(ctx);
+    if (backend_ret != REDISMODULE_OK) {
+      RedisModule_Log(ctx, "warning", "Could not load %s backend, deferring compilation to first run",
+                      RAI_BackendName(backend));
+    }
+    else if (err.code != RAI_OK) {
+      RedisModule_Log(ctx, "warning", "Background compilation failed: %s", err.detail_oneline);
+    }
+    RAI_ClearError(&err);
+    RAI_PendingLoadRelease(&load);
+    RedisModule_ThreadSafeContextUnlock(ctx);
+  }
+
+  return NULL;
+}
+
+static void RAI_LoaderEnqueue(RAI_RunType type, void* value) {
+  pthread_mutex_lock(&pending_loads_mutex);
+  if (pending_loads == NULL) {
+    pending_loads = array_new(RAI_PendingLoad, 16);
+  }
+  RAI_PendingLoad load = {
+    .type = type,
+    .value = value
+  };
+  pending_loads = array_append(pending_loads, load);
+  if (!loader_thread_started) {
+    loader_thread_started = pthread_create(&loader_thread, NULL, RAI_Loader_ThreadMain, NULL) == 0;
+  }
+  pthread_cond_signal(&pending_loads_condition_var);
+  pthread_mutex_unlock(&pending_loads_mutex);
+}
+
+/* Queue a lazily created model for background compilation. The loader
+ * holds a reference to the model until it is done with it. */
+void RAI_LoaderEnqueueModel(RAI_Model* model) {
+  RAI_LoaderEnqueue(RAI_MODEL, RAI_ModelGetShallowCopy(model));
+}
+
+void RAI_LoaderEnqueueScript(RAI_Script* script) {
+  RAI_LoaderEnqueue(RAI_SCRIPT, RAI_ScriptGetShallowCopy(script));
+}
+
+long long RAI_loadingThreads = 0;
+
+typedef struct RAI_CompileJob {
+  RAI_RunType type;
+  void* value;
+  int status;
+  RAI_Error err;
+  RAI_Error warmup_err;
+} RAI_CompileJob;
+
+static RAI_CompileJob** compile_jobs = NULL;
+static size_t compile_next = 0;
+static size_t compile_done = 0;
+static pthread_mutex_t compile_jobs_mutex = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t compile_jobs_condition_var = PTHREAD_COND_INITIALIZER;
+static pthread_cond_t compile_done_condition_var = PTHREAD_COND_INITIALIZER;
+static long long compile_threads_started = 0;
+static int compile_join_scheduled = 0;
+
+/* Compile the values submitted during RDB load. Only backend sessions are
+ * created here; references are taken and released on the main thread. */
+static void *RAI_Compile_ThreadMain(void *arg) {
+  while (true) {
+    pthread_mutex_lock(&compile_jobs_mutex);
+    while (compile_next >= array_len(compile_jobs)) {
+      pthread_cond_wait(&compile_jobs_condition_var, &compile_jobs_mutex);
+    }
+    RAI_CompileJob* job = compile_jobs[compile_next++];
+    pthread_mutex_unlock(&compile_jobs_mutex);
+
+    if (job->type == RAI_MODEL) {
+      job->status = RAI_ModelMaterialize(job->value, &job->err);
+      if (job->status == REDISMODULE_OK && RAI_warmupOnLoad > 0) {
+        RAI_ModelWarmup(job->value, RAI_warmupOnLoad, &job->warmup_err);
+      }
+    }
+    else {
+      job->status = RAI_ScriptMaterialize(job->value, &job->err);
+    }
+
+    pthread_mutex_lock(&compile_jobs_mutex);
+    compile_done++;
+    pthread_cond_signal(&compile_done_condition_var);
+    pthread_mutex_unlock(&compile_jobs_mutex);
+  }
+
+  return NULL;
+}
+
+static void RAI_LoaderJoinTimer(RedisModuleCtx *ctx, void *data) {
+  compile_join_scheduled = 0;
+  RAI_LoaderJoin(ctx);
+}
+
+static int RAI_LoaderCompile(RedisModuleCtx* ctx, RAI_RunType type, void* value) {
+  pthread_mutex_lock(&compile_jobs_mutex);
+  if (compile_threads_started < RAI_loadingThreads) {
+    pthread_t thread;
+    if (pthread_create(&thread, NULL, RAI_Compile_ThreadMain, NULL) == 0) {
+      pthread_detach(thread);
+      compile_threads_started++;
+    }
+  }
+  // Only queue the job if a thread is there to run it, otherwise
+  // RAI_LoaderJoin would wait for it forever
+  if (compile_threads_started == 0) {
+    pthread_mutex_unlock(&compile_jobs_mutex);
+    return REDISMODULE_ERR;
+  }
+
+  RAI_CompileJob* job = RedisModule_Calloc(1, sizeof(*job));
+  job->type = type;
+  job->value = value;
+  job->status = REDISMODULE_OK;
+
+  if (compile_jobs == NULL) {
+    compile_jobs = array_new(RAI_CompileJob*, 16);
+  }
+  compile_jobs = array_append(compile_jobs, job);
+  pthread_cond_signal(&compile_jobs_condition_var);
+  pthread_mutex_unlock(&compile_jobs_mutex);
+
+  // RDB files written without the module aux field do not trigger the
+  // join at the end of loading; the timer fires once loading is over
+  if (!compile_join_scheduled) {
+    RedisModule_CreateTimer(ctx, 0, RAI_LoaderJoinTimer, NULL);
+    compile_join_scheduled = 1;
+  }
+
+  return REDISMODULE_OK;
+}
+
+/* Hand a model created with RAI_ModelCreateLazy to the compile threads.
+ * Returns REDISMODULE_ERR if no compile thread could be started, in which
+ * case the model is left to be compiled by the caller. */
+int RAI_LoaderCompileModel(RedisModuleCtx* ctx, RAI_Model* model) {
+  RAI_Model* value = RAI_ModelGetShallowCopy(model);
+  if (RAI_LoaderCompile(ctx, RAI_MODEL, value) != REDISMODULE_OK) {
+    RAI_Error err = {0};
+    RAI_ModelFree(value, &err);
+    return REDISMODULE_ERR;
+  }
+  return REDISMODULE_OK;
+}
+
+int RAI_LoaderCompileScript(RedisModuleCtx* ctx, RAI_Script* script) {
+  RAI_Script* value = RAI_ScriptGetShallowCopy(script);
+  if (RAI_LoaderCompile(ctx, RAI_SCRIPT, value) != REDISMODULE_OK) {
+    RAI_Error err = {0};
+    RAI_ScriptFree(value, &err);
+    return REDISMODULE_ERR;
+  }
+  return REDISMODULE_OK;
+}
+
+/* Wait for all submitted compilations to finish. Must be called from the
+ * main thread. Returns REDISMODULE_ERR if any of them failed. */
+int RAI_LoaderJoin(RedisModuleCtx* ctx) {
+  int ret = REDISMODULE_OK;
+
+  pthread_mutex_lock(&compile_jobs_mutex);
+  while (compile_done < array_len(compile_jobs)) {
+    pthread_cond_wait(&compile_done_condition_var, &compile_jobs_mutex);
+  }
+
+  for (size_t i=0; i<array_len(compile_jobs); i++) {
+    RAI_CompileJob* job = compile_jobs[i];
+    if (job->status != REDISMODULE_OK) {
+      RedisModule_Log(ctx, "warning", "Could not compile %s on load: %s",
+                      job->type == RAI_MODEL ? "model" : "script",
+                      job->err.detail_oneline ? job->err.detail_oneline : "unknown error");
+      ret = REDISMODULE_ERR;
+    }
+    if (job->warmup_err.code != RAI_OK) {
+      RedisModule_Log(ctx, "warning", "Could not warm up model on load: %s", job->warmup_err.detail_oneline);
+    }
+    RAI_ClearError(&job->err);
+    RAI_ClearError(&job->warmup_err);
+    RAI_PendingLoad load = {
+      .type = job->type,
+      .value = job->value
+    };
+    RAI_PendingLoadRelease(&load);
+    RedisModule_Free(job);
+  }
+  if (compile_jobs) {
+    compile_jobs = array_trimm_len(compile_jobs, 0);
+  }
+  compile_next = 0;
+  compile_done = 0;
+  pthread_mutex_unlock(&compile_jobs_mutex);
+
+  return ret;
+}
+
+/* Warm up a model loaded from RDB on the calling thread. Failures are
+ * logged and do not prevent the model from being loaded. */
+void RAI_LoaderWarmupModel(RedisModuleCtx* ctx, RAI_Model* model) {
+  RAI_Error err = {0};
+  if (RAI_ModelWarmup(model, RAI_warmupOnLoad, &err) != REDISMODULE_OK) {
+    RedisModule_Log(ctx, "warning", "Could not warm up model on load: %s", err.detail_oneline);
+  }
+  RAI_ClearError(&err);
+}
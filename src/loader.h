@@ -0,0 +1,25 @@
+#ifndef SRC_LOADER_H_
+#define SRC_LOADER_H_
+
+#include "config.h"
+#include "model.h"
+#include "script.h"
+#include "redismodule.h"
+
+extern RAI_LoadingMode RAI_loadingMode;
+extern long long RAI_loadingThreads;
+extern long long RAI_warmupOnLoad;
+
+int RAI_LoadingModeFromString(const char* modestr, RAI_LoadingMode* mode);
+const char* RAI_LoadingModeName(RAI_LoadingMode mode);
+
+void RAI_LoaderEnqueueModel(RAI_Model* model);
+void RAI_LoaderEnqueueScript(RAI_Script* script);
+
+int RAI_LoaderCompileModel(RedisModuleCtx* ctx, RAI_Model* model);
+int RAI_LoaderCompileScript(RedisModuleCtx* ctx, RAI_Script* script);
+int RAI_LoaderJoin(RedisModuleCtx* ctx);
+
+void RAI_LoaderWarmupModel(RedisModuleCtx* ctx, RAI_Model* model);
+
+#endif /* SRC_LOADER_H_ */
@@ -2,12 +2,25 @@
 #include "model_struct.h"
 #include "backends.h"
 #include "stats.h"
+#include "loader.h"
+#include "lazyfree.h"
 
 #include "rmutil/alloc.h"
 #include "util/arr_rm_alloc.h"
+#include <strings.h>
+#include <time.h>
 
 RedisModuleType *RedisAI_ModelType = NULL;
 
+long long RAI_modelSessionMemoryLimit = 0;
+
+// Models holding a backend session, most recently used first
+static RAI_Model* RAI_sessionsHead = NULL;
+static RAI_Model* RAI_sessionsTail = NULL;
+static size_t RAI_sessionsMemory = 0;
+
+static int RAI_ModelOptsValid(const RAI_ModelOpts* opts);
+
 static void* RAI_Model_RdbLoad(struct RedisModuleIO *io, int encver) {
   // if (encver != RAI_ENC_VER) {
   //   /* We should actually log an error here, or try to implement
@@ -32,7 +45,7 @@ static void* RAI_Model_RdbLoad(struct RedisModuleIO *io, int encver) {
 
   const size_t noutputs = RedisModule_LoadUnsigned(io);
 
-  const char **outputs = RedisModule_Alloc(ninputs * sizeof(char*));
+  const char **outputs = RedisModule_Alloc(noutputs * sizeof(char*));
 
   for (size_t i=0; i<noutputs; i++) {
     outputs[i] = RedisModule_LoadStringBuffer(io, NULL);
@@ -43,14 +56,78 @@ static void* RAI_Model_RdbLoad(struct RedisModuleIO *io, int encver) {
     .minbatchsize = minbatchsize
   };
 
+  RAI_ModelInputShape* inputshapes = NULL;
+  long long version = 1;
+  if (encver >= 1) {
+    const size_t nshapes = RedisModule_LoadUnsigned(io);
+    if (nshapes > 0) {
+      inputshapes = array_new(RAI_ModelInputShape, nshapes);
+    }
+    for (size_t i=0; i<nshapes; i++) {
+      RAI_ModelInputShape shape = {0};
+      shape.dtype.code = RedisModule_LoadUnsigned(io);
+      shape.dtype.bits = RedisModule_LoadUnsigned(io);
+      shape.dtype.lanes = 1;
+      const size_t ndims = RedisModule_LoadUnsigned(io);
+      shape.dims = array_new(long long, ndims);
+      for (size_t j=0; j<ndims; j++) {
+        shape.dims = array_append(shape.dims, RedisModule_LoadSigned(io));
+      }
+      inputshapes = array_append(inputshapes, shape);
+    }
+
+    opts.optlevel = RedisModule_LoadUnsigned(io);
+    opts.execmode = RedisModule_LoadUnsigned(io);
+    opts.mempattern = RedisModule_LoadUnsigned(io);
+    opts.cpuarena = RedisModule_LoadUnsigned(io);
+    opts.threads = RedisModule_LoadSigned(io);
+    opts.xnnpack = RedisModule_LoadUnsigned(io);
+    opts.optimize = RedisModule_LoadUnsigned(io);
+    opts.replicate = RedisModule_LoadUnsigned(io);
+    opts.cachesize = RedisModule_LoadUnsigned(io);
+    opts.cachettl = RedisModule_LoadSigned(io);
+    version = RedisModule_LoadSigned(io);
+  }
+
   size_t len;
 
   char *buffer = RedisModule_LoadStringBuffer(io, &len);
 
+  if (!RAI_ModelOptsValid(&opts)) {
+    RedisModule_Log(RedisModule_GetContextFromIO(io), "warning",
+                    "Could not load model: invalid option value, the RDB file may be corrupt");
+    RedisModule_Free((char*)devicestr);
+    RedisModule_Free((char*)tag);
+    for (size_t i=0; i<ninputs; i++) {
+      RedisModule_Free((char*)inputs[i]);
+    }
+    RedisModule_Free(inputs);
+    for (size_t i=0; i<noutputs; i++) {
+      RedisModule_Free((char*)outputs[i]);
+    }
+    RedisModule_Free(outputs);
+    RAI_ModelFreeInputShapes(inputshapes);
+    RedisModule_Free(buffer);
+    return NULL;
+  }
+
   RAI_Error err = {0};
 
-  RAI_Model *model = RAI_ModelCreate(backend, devicestr, tag, opts, ninputs, inputs, noutputs, outputs,
-                                     buffer, len, &err);
+  RAI_Model *model = NULL;
+
+  // eager loading can still hand compilation to the loading threads,
+  // as long as the backend is available before they start
+  const int compile_in_threads = RAI_loadingMode == RAI_LOADING_EAGER && RAI_loadingThreads > 0 &&
+                                 RAI_EnsureBackendLoaded(RedisModule_GetContextFromIO(io), backend) == REDISMODULE_OK;
+
+  if (RAI_loadingMode != RAI_LOADING_EAGER || compile_in_threads) {
+    model = RAI_ModelCreateLazy(backend, devicestr, tag, opts, ninputs, inputs, noutputs, outputs,
+                                buffer, len);
+  }
+  else {
+    model = RAI_ModelCreate(backend, devicestr, tag, opts, ninputs, inputs, noutputs, outputs,
+                            buffer, len, &err);
+  }
 
   if (err.code == RAI_EBACKENDNOTLOADED) {
     RedisModuleCtx* ctx = RedisModule_GetContextFromIO(io);
@@ -64,9 +141,25 @@ static void* RAI_Model_RdbLoad(struct RedisModuleIO *io, int encver) {
     model = RAI_ModelCreate(backend, devicestr, tag, opts, ninputs, inputs, noutputs, outputs, buffer, len, &err);
   }
  
+  if (model) {
+    model->inputshapes = inputshapes;
+    inputshapes = NULL;
+    model->version = version;
+  }
+
+  if (compile_in_threads && RAI_LoaderCompileModel(RedisModule_GetContextFromIO(io), model) != REDISMODULE_OK) {
+    if (RAI_ModelMaterialize(model, &err) != REDISMODULE_OK) {
+      RAI_Error free_err = {0};
+      RAI_ModelFree(model, &free_err);
+      RAI_ClearError(&free_err);
+      model = NULL;
+    }
+  }
+
   if (err.code != RAI_OK) {
     printf("ERR: %s\n", err.detail);
     RAI_ClearError(&err);
+    RAI_ModelFreeInputShapes(inputshapes);
     if (buffer) {
       RedisModule_Free(buffer);
     }
@@ -87,6 +180,18 @@ static void* RAI_Model_RdbLoad(struct RedisModuleIO *io, int encver) {
 
   RedisModule_Free(stats_keystr);
 
+  if (RAI_loadingMode == RAI_LOADING_BACKGROUND) {
+    RAI_LoaderEnqueueModel(model);
+  }
+  else if (RAI_loadingMode == RAI_LOADING_EAGER && !compile_in_threads && RAI_warmupOnLoad > 0) {
+    RAI_LoaderWarmupModel(stats_ctx, model);
+  }
+
+  // Lazily loaded models get a session, and are accounted, on first use
+  if (RAI_loadingMode != RAI_LOADING_LAZY) {
+    RAI_ModelTouchSession(model);
+  }
+
   return model;
 }
 
@@ -120,6 +225,28 @@ static void RAI_Model_RdbSave(RedisModuleIO *io, void *value) {
   for (size_t i=0; i<model->noutputs; i++) {
     RedisModule_SaveStringBuffer(io, model->outputs[i], strlen(model->outputs[i]) + 1);
   }
+  const size_t nshapes = model->inputshapes ? array_len(model->inputshapes) : 0;
+  RedisModule_SaveUnsigned(io, nshapes);
+  for (size_t i=0; i<nshapes; i++) {
+    RAI_ModelInputShape* shape = &model->inputshapes[i];
+    RedisModule_SaveUnsigned(io, shape->dtype.code);
+    RedisModule_SaveUnsigned(io, shape->dtype.bits);
+    RedisModule_SaveUnsigned(io, array_len(shape->dims));
+    for (size_t j=0; j<array_len(shape->dims); j++) {
+      RedisModule_SaveSigned(io, shape->dims[j]);
+    }
+  }
+  RedisModule_SaveUnsigned(io, model->opts.optlevel);
+  RedisModule_SaveUnsigned(io, model->opts.execmode);
+  RedisModule_SaveUnsigned(io, model->opts.mempattern);
+  RedisModule_SaveUnsigned(io, model->opts.cpuarena);
+  RedisModule_SaveSigned(io, model->opts.threads);
+  RedisModule_SaveUnsigned(io, model->opts.xnnpack);
+  RedisModule_SaveUnsigned(io, model->opts.optimize);
+  RedisModule_SaveUnsigned(io, model->opts.replicate);
+  RedisModule_SaveUnsigned(io, model->opts.cachesize);
+  RedisModule_SaveSigned(io, model->opts.cachettl);
+  RedisModule_SaveSigned(io, model->version);
   RedisModule_SaveStringBuffer(io, buffer, len);
 
   if (buffer) {
@@ -127,6 +254,22 @@ static void RAI_Model_RdbSave(RedisModuleIO *io, void *value) {
   }
 }
 
+/* Loading threads compile models and scripts while the RDB is read; the
+ * aux field saved after all keys lets loading wait for them to finish. */
+static int RAI_Model_AuxLoad(RedisModuleIO *io, int encver, int when) {
+  RedisModule_LoadUnsigned(io);
+
+  if (when == REDISMODULE_AUX_AFTER_RDB) {
+    return RAI_LoaderJoin(RedisModule_GetContextFromIO(io));
+  }
+
+  return REDISMODULE_OK;
+}
+
+static void RAI_Model_AuxSave(RedisModuleIO *io, int when) {
+  RedisModule_SaveUnsigned(io, 0);
+}
+
 static void RAI_Model_AofRewrite(RedisModuleIO *aof, RedisModuleString *key, void *value) {
   RAI_Model *model = (RAI_Model*)value;
 
@@ -145,7 +288,11 @@ static void RAI_Model_AofRewrite(RedisModuleIO *aof, RedisModuleString *key, voi
     return;
   }
 
-  // AI.MODELSET model_key backend device [INPUTS name1 name2 ... OUTPUTS name1 name2 ...] model_blob
+  // AI.MODELSET model_key backend device TAG tag BATCHSIZE n MINBATCHSIZE m [OPTLEVEL level] [EXECMODE mode]
+  //             [MEMPATTERN ON|OFF] [CPUARENA ON|OFF] [THREADS n] [XNNPACK ON|OFF] [OPTIMIZE]
+  //             [REPLICATE NONE|COMMAND] [CACHE maxbytes [TTL ms]]
+  //             [SHAPE type dim1 dim2 ...]
+  //             [INPUTS name1 name2 ... OUTPUTS name1 name2 ...] model_blob
 
   RedisModuleString **inputs_ = array_new(RedisModuleString*, model->ninputs);
   RedisModuleString **outputs_ = array_new(RedisModuleString*, model->noutputs);
@@ -160,17 +307,96 @@ static void RAI_Model_AofRewrite(RedisModuleIO *aof, RedisModuleString *key, voi
     array_append(outputs_, RedisModule_CreateString(ctx, model->outputs[i], strlen(model->outputs[i])));
   }
 
+  // backend specific options are only emitted when set, as MODELSET
+  // rejects them for the other backends
+  RedisModuleString **opts_ = array_new(RedisModuleString*, 8);
+
+  if (model->opts.optlevel != RAI_OPTLEVEL_DEFAULT) {
+    const char* optlevelstr = RAI_OptLevelName(model->opts.optlevel);
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, "OPTLEVEL", strlen("OPTLEVEL")));
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, optlevelstr, strlen(optlevelstr)));
+  }
+  if (model->opts.execmode != RAI_EXECMODE_DEFAULT) {
+    const char* execmodestr = RAI_ExecModeName(model->opts.execmode);
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, "EXECMODE", strlen("EXECMODE")));
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, execmodestr, strlen(execmodestr)));
+  }
+  if (model->opts.mempattern != RAI_SWITCH_DEFAULT) {
+    const char* mempatternstr = RAI_SwitchName(model->opts.mempattern);
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, "MEMPATTERN", strlen("MEMPATTERN")));
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, mempatternstr, strlen(mempatternstr)));
+  }
+  if (model->opts.cpuarena != RAI_SWITCH_DEFAULT) {
+    const char* cpuarenastr = RAI_SwitchName(model->opts.cpuarena);
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, "CPUARENA", strlen("CPUARENA")));
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, cpuarenastr, strlen(cpuarenastr)));
+  }
+  if (model->opts.threads > 0) {
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, "THREADS", strlen("THREADS")));
+    opts_ = array_append(opts_, RedisModule_CreateStringFromLongLong(ctx, model->opts.threads));
+  }
+  if (model->opts.xnnpack != RAI_SWITCH_DEFAULT) {
+    const char* xnnpackstr = RAI_SwitchName(model->opts.xnnpack);
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, "XNNPACK", strlen("XNNPACK")));
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, xnnpackstr, strlen(xnnpackstr)));
+  }
+  if (model->opts.optimize) {
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, "OPTIMIZE", strlen("OPTIMIZE")));
+  }
+  if (model->opts.replicate != RAI_REPLICATE_BLOB) {
+    const char* replicatestr = RAI_ReplicateName(model->opts.replicate);
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, "REPLICATE", strlen("REPLICATE")));
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, replicatestr, strlen(replicatestr)));
+  }
+  if (model->opts.cachesize > 0) {
+    opts_ = array_append(opts_, RedisModule_CreateString(ctx, "CACHE", strlen("CACHE")));
+    opts_ = array_append(opts_, RedisModule_CreateStringFromLongLong(ctx, model->opts.cachesize));
+    if (model->opts.cachettl > 0) {
+      opts_ = array_append(opts_, RedisModule_CreateString(ctx, "TTL", strlen("TTL")));
+      opts_ = array_append(opts_, RedisModule_CreateStringFromLongLong(ctx, model->opts.cachettl));
+    }
+  }
+
+  RedisModuleString **shapes_ = array_new(RedisModuleString*, 1);
+
+  for (size_t i=0; i<array_len(model->inputshapes); i++) {
+    RAI_ModelInputShape* shape = &model->inputshapes[i];
+    char *dtypestr = NULL;
+    Tensor_DataTypeStr(shape->dtype, &dtypestr);
+    shapes_ = array_append(shapes_, RedisModule_CreateString(ctx, "SHAPE", strlen("SHAPE")));
+    shapes_ = array_append(shapes_, RedisModule_CreateString(ctx, dtypestr, strlen(dtypestr)));
+    RedisModule_Free(dtypestr);
+    for (size_t j=0; j<array_len(shape->dims); j++) {
+      shapes_ = array_append(shapes_, RedisModule_CreateStringFromLongLong(ctx, shape->dims[j]));
+    }
+  }
+
   const char* backendstr = RAI_BackendName(model->backend);
 
-  RedisModule_EmitAOF(aof, "AI.MODELSET", "slccclclcvcvb",
+  RedisModule_EmitAOF(aof, "AI.MODELSET", "sccccclclvvcvcvb",
                       key,
-                      backendstr, model->devicestr, model->tag,
+                      backendstr, model->devicestr,
+                      "TAG", model->tag,
                       "BATCHSIZE", model->opts.batchsize,
                       "MINBATCHSIZE", model->opts.minbatchsize,
+                      opts_, (size_t)array_len(opts_),
+                      shapes_, (size_t)array_len(shapes_),
                       "INPUTS", inputs_, model->ninputs,
                       "OUTPUTS", outputs_, model->noutputs,
                       buffer, len);
 
+  for (size_t i=0; i<array_len(shapes_); i++) {
+    RedisModule_FreeString(ctx, shapes_[i]);
+  }
+
+  array_free(shapes_);
+
+  for (size_t i=0; i<array_len(opts_); i++) {
+    RedisModule_FreeString(ctx, opts_[i]);
+  }
+
+  array_free(opts_);
+
   if (buffer) {
     RedisModule_Free(buffer);
   }
@@ -189,7 +415,7 @@ static void RAI_Model_AofRewrite(RedisModuleIO *aof, RedisModuleString *key, voi
 }
 
 // TODO: pass err in?
-static void RAI_Model_DTFree(void *value) {
+static void RAI_Model_LazyFree(void *value) {
   RAI_Error err = {0};
   RAI_ModelFree(value, &err);
   if (err.code != RAI_OK) {
@@ -198,6 +424,61 @@ static void RAI_Model_DTFree(void *value) {
   }
 }
 
+static void RAI_ModelRelease(RAI_Model* model, RAI_Error* err);
+
+static void RAI_Model_LazyRelease(void *value) {
+  RAI_Error err = {0};
+  RAI_ModelRelease(value, &err);
+  if (err.code != RAI_OK) {
+    printf("ERR: %s\n", err.detail);
+    RAI_ClearError(&err);
+  }
+}
+
+static void RAI_ModelUnlinkSession(RAI_Model* model) {
+  if (!model->lru_linked) {
+    return;
+  }
+  if (model->lru_prev) {
+    model->lru_prev->lru_next = model->lru_next;
+  }
+  else {
+    RAI_sessionsHead = model->lru_next;
+  }
+  if (model->lru_next) {
+    model->lru_next->lru_prev = model->lru_prev;
+  }
+  else {
+    RAI_sessionsTail = model->lru_prev;
+  }
+  model->lru_prev = NULL;
+  model->lru_next = NULL;
+  model->lru_linked = 0;
+  RAI_sessionsMemory -= model->sessionsize;
+}
+
+static void RAI_Model_DTFree(void *value) {
+  RAI_Model* model = value;
+  RAI_ModelUnlinkSession(model);
+  // run_stats is owned by the main thread, while the last reference may be
+  // released by a run still in flight on a worker thread. The entry also
+  // belongs to the key, which may be set again before those runs finish.
+  RAI_RemoveStatsEntry(model->infokey);
+  model->infokey = NULL;
+  // Runs in flight no longer fill the cache once it is gone
+  if (model->cache) {
+    RAI_RunCacheFree(model->cache);
+    model->cache = NULL;
+  }
+  // tearing down a backend session can take long, hand it to the lazyfree
+  // thread when the key holds the last reference
+  if (__atomic_load_n(&model->refCount, __ATOMIC_ACQUIRE) == 1 && RAI_lazyfreeThreshold > 0) {
+    RAI_LazyFree(RAI_Model_LazyFree, model);
+    return;
+  }
+  RAI_Model_LazyFree(model);
+}
+
 int RAI_ModelInit(RedisModuleCtx* ctx) {
   RedisModuleTypeMethods tmModel = {
       .version = REDISMODULE_TYPE_METHOD_VERSION,
@@ -206,17 +487,32 @@ int RAI_ModelInit(RedisModuleCtx* ctx) {
       .aof_rewrite = RAI_Model_AofRewrite,
       .mem_usage = NULL,
       .free = RAI_Model_DTFree,
-      .digest = NULL
+      .digest = NULL,
+      .aux_load = RAI_Model_AuxLoad
   };
 
-  RedisAI_ModelType = RedisModule_CreateDataType(ctx, "AI__MODEL", 0, &tmModel);
+  // Earlier versions of the module can't load RDB files holding the aux
+  // field, so it is only saved by instances that load with threads
+  if (RAI_loadingThreads > 0) {
+    tmModel.aux_save = RAI_Model_AuxSave;
+    tmModel.aux_save_triggers = REDISMODULE_AUX_AFTER_RDB;
+  }
+
+  RedisAI_ModelType = RedisModule_CreateDataType(ctx, "AI__MODEL", RAI_MODEL_ENC_VER, &tmModel);
   return RedisAI_ModelType != NULL;
 }
 
-RAI_Model *RAI_ModelCreate(RAI_Backend backend, const char* devicestr, const char* tag, RAI_ModelOpts opts,
-                           size_t ninputs, const char **inputs,
-                           size_t noutputs, const char **outputs,
-                           const char *modeldef, size_t modellen, RAI_Error* err) {
+static void RAI_ModelInitSync(RAI_Model* model) {
+  model->version = 1;
+  model->materializing = 0;
+  pthread_mutex_init(&model->lock, NULL);
+  pthread_cond_init(&model->materialized, NULL);
+}
+
+static RAI_Model *RAI_ModelCreateBackend(RAI_Backend backend, const char* devicestr, RAI_ModelOpts opts,
+                                         size_t ninputs, const char **inputs,
+                                         size_t noutputs, const char **outputs,
+                                         const char *modeldef, size_t modellen, RAI_Error* err) {
   RAI_Model *model;
   if (backend == RAI_BACKEND_TENSORFLOW) {
     if (!RAI_backends.tf.model_create_with_nodes) {
@@ -240,69 +536,365 @@ RAI_Model *RAI_ModelCreate(RAI_Backend backend, const char* devicestr, const cha
     model = RAI_backends.torch.model_create(backend, devicestr, opts, modeldef, modellen, err);
   }
   else if (backend == RAI_BACKEND_ONNXRUNTIME) {
-    if (!RAI_backends.onnx.model_create) {
+    if (!RAI_backends.onnx.model_create_with_nodes) {
       RAI_SetError(err, RAI_EBACKENDNOTLOADED, "ERR Backend not loaded: ONNX");
       return NULL;
     }
-    model = RAI_backends.onnx.model_create(backend, devicestr, opts, modeldef, modellen, err);
+    model = RAI_backends.onnx.model_create_with_nodes(backend, devicestr, opts, ninputs, inputs, noutputs, outputs, modeldef, modellen, err);
   }
   else {
     RAI_SetError(err, RAI_EUNSUPPORTEDBACKEND, "ERR Unsupported backend\n");
     return NULL;
   }
 
+  if (model) {
+    model->ninputs = model->inputs ? array_len(model->inputs) : 0;
+    model->noutputs = model->outputs ? array_len(model->outputs) : 0;
+  }
+
+  return model;
+}
+
+RAI_Model *RAI_ModelCreate(RAI_Backend backend, const char* devicestr, const char* tag, RAI_ModelOpts opts,
+                           size_t ninputs, const char **inputs,
+                           size_t noutputs, const char **outputs,
+                           const char *modeldef, size_t modellen, RAI_Error* err) {
+  RAI_Model *model = RAI_ModelCreateBackend(backend, devicestr, opts, ninputs, inputs, noutputs, outputs,
+                                            modeldef, modellen, err);
+
   if (model) {
     model->tag = RedisModule_Strdup(tag);
+    model->sessionsize = modellen;
+    if (RAI_modelSessionMemoryLimit > 0) {
+      model->sessiondef = RedisModule_Alloc(modellen);
+      memcpy(model->sessiondef, modeldef, modellen);
+      model->sessiondeflen = modellen;
+    }
+    if (opts.cachesize > 0) {
+      model->cache = RAI_RunCacheCreate(opts.cachesize, opts.cachettl);
+    }
+    RAI_ModelInitSync(model);
+  }
+
+  return model;
+}
+
+static char **RAI_ModelCopyNames(size_t n, const char **names) {
+  if (n == 0) {
+    return NULL;
+  }
+  char **names_ = array_new(char*, n);
+  for (size_t i=0; i<n; i++) {
+    array_append(names_, RedisModule_Strdup(names[i]));
+  }
+  return names_;
+}
+
+static void RAI_ModelFreeNames(char **names) {
+  if (names == NULL) {
+    return;
+  }
+  for (size_t i=0; i<array_len(names); i++) {
+    RedisModule_Free(names[i]);
+  }
+  array_free(names);
+}
+
+static long long RAI_ModelUstime(void) {
+  struct timespec ts;
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return (long long)ts.tv_sec * 1000000 + ts.tv_nsec / 1000;
+}
+
+/* Create a model holding only its definition and metadata. The backend
+ * session is created on first use, see RAI_ModelMaterialize. */
+RAI_Model *RAI_ModelCreateLazy(RAI_Backend backend, const char* devicestr, const char* tag, RAI_ModelOpts opts,
+                               size_t ninputs, const char **inputs,
+                               size_t noutputs, const char **outputs,
+                               const char *modeldef, size_t modellen) {
+  RAI_Model* model = RedisModule_Calloc(1, sizeof(*model));
+  model->backend = backend;
+  model->devicestr = RedisModule_Strdup(devicestr);
+  model->tag = RedisModule_Strdup(tag);
+  model->opts = opts;
+  model->inputs = RAI_ModelCopyNames(ninputs, inputs);
+  model->ninputs = model->inputs ? ninputs : 0;
+  model->outputs = RAI_ModelCopyNames(noutputs, outputs);
+  model->noutputs = model->outputs ? noutputs : 0;
+  model->refCount = 1;
+  model->modeldef = RedisModule_Alloc(modellen);
+  memcpy(model->modeldef, modeldef, modellen);
+  model->modellen = modellen;
+  model->sessionsize = modellen;
+  if (opts.cachesize > 0) {
+    model->cache = RAI_RunCacheCreate(opts.cachesize, opts.cachettl);
   }
+  RAI_ModelInitSync(model);
 
   return model;
 }
 
+int RAI_ModelIsMaterialized(RAI_Model* model) {
+  pthread_mutex_lock(&model->lock);
+  int ret = model->modeldef == NULL;
+  pthread_mutex_unlock(&model->lock);
+  return ret;
+}
+
+/* Create the backend session of a lazily created model. Concurrent callers
+ * wait for the first one to finish; on failure the definition is kept so
+ * that the next call retries. */
+int RAI_ModelMaterialize(RAI_Model* model, RAI_Error* err) {
+  pthread_mutex_lock(&model->lock);
+  while (model->materializing) {
+    pthread_cond_wait(&model->materialized, &model->lock);
+  }
+  if (model->modeldef == NULL) {
+    pthread_mutex_unlock(&model->lock);
+    return REDISMODULE_OK;
+  }
+  model->materializing = 1;
+  pthread_mutex_unlock(&model->lock);
+
+  const long long start = RAI_ModelUstime();
+
+  // devicestr, names and definition are not modified while materializing,
+  // so the session can be created without holding the lock
+  RAI_Model* created = RAI_ModelCreateBackend(model->backend, model->devicestr, model->opts,
+                                              model->ninputs, (const char **)model->inputs,
+                                              model->noutputs, (const char **)model->outputs,
+                                              model->modeldef, model->modellen, err);
+
+  pthread_mutex_lock(&model->lock);
+  if (created) {
+    // Readers on the main thread may be holding devicestr and the names,
+    // so keep ours and release the copies made by the backend
+    model->model = created->model;
+    model->session = created->session;
+    model->data = created->data;
+    RedisModule_Free(created->devicestr);
+    RAI_ModelFreeNames(created->inputs);
+    RAI_ModelFreeNames(created->outputs);
+    RedisModule_Free(created);
+    if (RAI_modelSessionMemoryLimit > 0) {
+      model->sessiondef = model->modeldef;
+      model->sessiondeflen = model->modellen;
+    }
+    else {
+      RedisModule_Free(model->modeldef);
+    }
+    model->modeldef = NULL;
+    model->modellen = 0;
+    if (model->evicted) {
+      model->evicted = 0;
+      model->recompiles++;
+      model->recompile_us += RAI_ModelUstime() - start;
+    }
+  }
+  model->materializing = 0;
+  pthread_cond_broadcast(&model->materialized);
+  pthread_mutex_unlock(&model->lock);
+
+  return created ? REDISMODULE_OK : REDISMODULE_ERR;
+}
+
 void RAI_ModelFree(RAI_Model* model, RAI_Error* err) {
-  if (--model->refCount > 0){
+  if (__atomic_sub_fetch(&model->refCount, 1, __ATOMIC_ACQ_REL) > 0) {
     return;
   }
 
+  RAI_ModelRelease(model, err);
+}
+
+/* Release the backend session of a model, together with the devicestr and
+ * names the backend owns. */
+static int RAI_ModelFreeBackend(RAI_Model* model, RAI_Error* err) {
   if (model->backend == RAI_BACKEND_TENSORFLOW) {
     if (!RAI_backends.tf.model_free) {
       RAI_SetError(err, RAI_EBACKENDNOTLOADED, "ERR Backend not loaded: TF\n");
-      return;
+      return REDISMODULE_ERR;
     }
     RAI_backends.tf.model_free(model, err);
   }
   else if (model->backend == RAI_BACKEND_TFLITE) {
     if (!RAI_backends.tflite.model_free) {
       RAI_SetError(err, RAI_EBACKENDNOTLOADED, "ERR Backend not loaded: TFLITE");
-      return;
+      return REDISMODULE_ERR;
     }
     RAI_backends.tflite.model_free(model, err);
   }
   else if (model->backend == RAI_BACKEND_TORCH) {
     if (!RAI_backends.torch.model_free) {
       RAI_SetError(err, RAI_EBACKENDNOTLOADED, "ERR Backend not loaded: TORCH");
-      return;
+      return REDISMODULE_ERR;
     }
     RAI_backends.torch.model_free(model, err);
   }
   else if (model->backend == RAI_BACKEND_ONNXRUNTIME) {
     if (!RAI_backends.onnx.model_free) {
       RAI_SetError(err, RAI_EBACKENDNOTLOADED, "ERR Backend not loaded: ONNX");
-      return;
+      return REDISMODULE_ERR;
     }
     RAI_backends.onnx.model_free(model, err);
   }
   else {
     RAI_SetError(err, RAI_EUNSUPPORTEDBACKEND, "Unsupported backend\n");
+    return REDISMODULE_ERR;
+  }
+  return REDISMODULE_OK;
+}
+
+static void RAI_ModelRelease(RAI_Model* model, RAI_Error* err) {
+  if (model->modeldef) {
+    // No backend session was ever created for this model, or it was evicted
+    RedisModule_Free(model->modeldef);
+    RedisModule_Free(model->devicestr);
+    RAI_ModelFreeNames(model->inputs);
+    RAI_ModelFreeNames(model->outputs);
+  }
+  else if (RAI_ModelFreeBackend(model, err) != REDISMODULE_OK) {
     return;
   }
 
+  if (model->sessiondef) {
+    RedisModule_Free(model->sessiondef);
+  }
+
   RedisModule_Free(model->tag);
 
+  RAI_ModelFreeInputShapes(model->inputshapes);
+
   RAI_RemoveStatsEntry(model->infokey);
 
+  if (model->cache) {
+    RAI_RunCacheFree(model->cache);
+  }
+
+  pthread_mutex_destroy(&model->lock);
+  pthread_cond_destroy(&model->materialized);
+
   RedisModule_Free(model);
 }
 
+/* Tear down a session released by RAI_ModelEvictSession. Runs on the
+ * lazyfree thread, so errors can only be printed. */
+static void RAI_ModelFreeSession(void *value) {
+  RAI_Model* session = value;
+  // TF and ONNX release the names along with the session, TORCH and TFLITE
+  // don't use them
+  const int backend_frees_names = session->backend == RAI_BACKEND_TENSORFLOW ||
+                                  session->backend == RAI_BACKEND_ONNXRUNTIME;
+  RAI_Error err = {0};
+  if (RAI_ModelFreeBackend(session, &err) != REDISMODULE_OK || err.code != RAI_OK) {
+    printf("ERR: %s\n", err.detail);
+    RAI_ClearError(&err);
+    RedisModule_Free(session->devicestr);
+    RAI_ModelFreeNames(session->inputs);
+    RAI_ModelFreeNames(session->outputs);
+  }
+  else if (!backend_frees_names) {
+    RAI_ModelFreeNames(session->inputs);
+    RAI_ModelFreeNames(session->outputs);
+  }
+  RedisModule_Free(session);
+}
+
+/* Release the backend session of an idle model, keeping its definition so
+ * that RAI_ModelMaterialize rebuilds the session on next use. The model
+ * only needs the definition from then on, so the session itself is torn
+ * down on the lazyfree thread. The definition kept along with the session
+ * is reused, only models set before MODEL_SESSION_MEMORY_LIMIT was
+ * configured have to be serialized. */
+static int RAI_ModelEvictSession(RAI_Model* model, RAI_Error* err) {
+  if (!RAI_ModelIsMaterialized(model)) {
+    return REDISMODULE_OK;
+  }
+
+  const long long start = RAI_ModelUstime();
+
+  char* modeldef = model->sessiondef;
+  size_t modellen = model->sessiondeflen;
+  if (modeldef == NULL &&
+      RAI_ModelSerialize(model, &modeldef, &modellen, err) != REDISMODULE_OK) {
+    return REDISMODULE_ERR;
+  }
+
+  // The backend releases devicestr and the names along with the session,
+  // hand it copies so that ours stay valid
+  RAI_Model* session = RedisModule_Calloc(1, sizeof(*session));
+  session->model = model->model;
+  session->session = model->session;
+  session->backend = model->backend;
+  session->devicestr = RedisModule_Strdup(model->devicestr);
+  session->opts = model->opts;
+  session->inputs = RAI_ModelCopyNames(model->ninputs, (const char **)model->inputs);
+  session->ninputs = model->ninputs;
+  session->outputs = RAI_ModelCopyNames(model->noutputs, (const char **)model->outputs);
+  session->noutputs = model->noutputs;
+  session->data = model->data;
+
+  pthread_mutex_lock(&model->lock);
+  model->model = NULL;
+  model->session = NULL;
+  model->data = NULL;
+  model->modeldef = modeldef;
+  model->modellen = modellen;
+  model->sessiondef = NULL;
+  model->sessiondeflen = 0;
+  model->evicted = 1;
+  model->evictions++;
+  model->eviction_us += RAI_ModelUstime() - start;
+  pthread_mutex_unlock(&model->lock);
+
+  if (RAI_lazyfreeThreshold > 0) {
+    RAI_LazyFree(RAI_ModelFreeSession, session);
+  }
+  else {
+    RAI_ModelFreeSession(session);
+  }
+
+  return REDISMODULE_OK;
+}
+
+void RAI_ModelTouchSession(RAI_Model* model) {
+  RAI_ModelUnlinkSession(model);
+  model->lru_next = RAI_sessionsHead;
+  if (RAI_sessionsHead) {
+    RAI_sessionsHead->lru_prev = model;
+  }
+  RAI_sessionsHead = model;
+  if (RAI_sessionsTail == NULL) {
+    RAI_sessionsTail = model;
+  }
+  model->lru_linked = 1;
+  RAI_sessionsMemory += model->sessionsize;
+}
+
+void RAI_ModelEvictSessions(RedisModuleCtx* ctx) {
+  if (RAI_modelSessionMemoryLimit <= 0) {
+    return;
+  }
+
+  // The most recently used session is kept even if it doesn't fit
+  RAI_Model* model = RAI_sessionsTail;
+  while (model && model != RAI_sessionsHead && RAI_sessionsMemory > RAI_modelSessionMemoryLimit) {
+    RAI_Model* prev = model->lru_prev;
+    // Sessions of models referenced by pending runs or by the loading
+    // threads are in use and can't be released
+    if (__atomic_load_n(&model->refCount, __ATOMIC_ACQUIRE) == 1) {
+      RAI_Error err = {0};
+      if (RAI_ModelEvictSession(model, &err) == REDISMODULE_OK) {
+        RAI_ModelUnlinkSession(model);
+      }
+      else {
+        RedisModule_Log(ctx, "warning", "Could not evict model session: %s", err.detail_oneline);
+        RAI_ClearError(&err);
+      }
+    }
+    model = prev;
+  }
+}
+
 RAI_ModelRunCtx* RAI_ModelRunCtxCreate(RAI_Model* model) {
 #define BATCH_INITIAL_SIZE 10
   RAI_ModelRunCtx* mctx = RedisModule_Calloc(1, sizeof(*mctx));
@@ -396,7 +988,7 @@ RAI_Tensor* RAI_ModelRunCtxOutputTensor(RAI_ModelRunCtx* mctx, size_t id, size_t
   return mctx->batches[id].outputs[index].tensor;
 }
 
-void RAI_ModelRunCtxFree(RAI_ModelRunCtx* mctx) {
+static void RAI_ModelRunCtxFreeBatches(RAI_ModelRunCtx* mctx) {
   for (size_t b=0; b<array_len(mctx->batches); ++b) {
     for (size_t i=0; i<array_len(mctx->batches[b].inputs); ++i) {
       RAI_TensorFree(mctx->batches[b].inputs[i].tensor);
@@ -410,21 +1002,43 @@ void RAI_ModelRunCtxFree(RAI_ModelRunCtx* mctx) {
     }
     array_free(mctx->batches[b].outputs);
   }
+  array_free(mctx->batches);
+}
+
+void RAI_ModelRunCtxFree(RAI_ModelRunCtx* mctx) {
+  RAI_ModelRunCtxFreeBatches(mctx);
+
+  RAI_Model* model = mctx->model;
+  RedisModule_Free(mctx);
+
+  // The last reference is held by a run only when the key was deleted or
+  // set to a new version while the run was queued: drain the old version
+  // without blocking the caller, which is either a run queue or the main
+  // thread replying to the client.
+  if (__atomic_sub_fetch(&model->refCount, 1, __ATOMIC_ACQ_REL) > 0) {
+    return;
+  }
+  if (RAI_lazyfreeThreshold > 0) {
+    RAI_LazyFree(RAI_Model_LazyRelease, model);
+    return;
+  }
 
   RAI_Error err = {0};
-  RAI_ModelFree(mctx->model, &err);
+  RAI_ModelRelease(model, &err);
 
   if (err.code != RAI_OK) {
     // TODO: take it to client somehow
     RAI_ClearError(&err);
   }
-
-  RedisModule_Free(mctx);
 }
 
 int RAI_ModelRun(RAI_ModelRunCtx* mctx, RAI_Error* err) {
   int ret;
 
+  if (RAI_ModelMaterialize(mctx->model, err) != REDISMODULE_OK) {
+    return REDISMODULE_ERR;
+  }
+
   switch (mctx->model->backend) {
     case RAI_BACKEND_TENSORFLOW:
       if (!RAI_backends.tf.model_run) {
@@ -463,13 +1077,24 @@ int RAI_ModelRun(RAI_ModelRunCtx* mctx, RAI_Error* err) {
 }
 
 RAI_Model* RAI_ModelGetShallowCopy(RAI_Model* model) {
-  ++model->refCount;
+  __atomic_add_fetch(&model->refCount, 1, __ATOMIC_RELAXED);
   return model;
 }
 
 int RAI_ModelSerialize(RAI_Model *model, char **buffer, size_t *len, RAI_Error *err) {
   int ret;
 
+  pthread_mutex_lock(&model->lock);
+  if (model->modeldef || model->sessiondef) {
+    const char *def = model->modeldef ? model->modeldef : model->sessiondef;
+    *len = model->modeldef ? model->modellen : model->sessiondeflen;
+    *buffer = RedisModule_Alloc(*len);
+    memcpy(*buffer, def, *len);
+    pthread_mutex_unlock(&model->lock);
+    return REDISMODULE_OK;
+  }
+  pthread_mutex_unlock(&model->lock);
+
   switch (model->backend) {
     case RAI_BACKEND_TENSORFLOW:
       if (!RAI_backends.tf.model_serialize) {
@@ -506,3 +1131,226 @@ int RAI_ModelSerialize(RAI_Model *model, char **buffer, size_t *len, RAI_Error *
 
   return ret;
 }
+
+void RAI_ModelFreeInputShapes(RAI_ModelInputShape* inputshapes) {
+  if (inputshapes == NULL) {
+    return;
+  }
+  for (size_t i=0; i<array_len(inputshapes); i++) {
+    array_free(inputshapes[i].dims);
+  }
+  array_free(inputshapes);
+}
+
+/* Input shapes used for warm-up runs: the ones given with SHAPE, or the
+ * ones reported by the backend. Also returns the number of outputs the
+ * backend expects, 0 if it does not tell. */
+static RAI_ModelInputShape* RAI_ModelWarmupShapes(RAI_Model* model, size_t* noutputs, RAI_Error* err) {
+  RAI_LoadedBackend* backend = NULL;
+  switch (model->backend) {
+    case RAI_BACKEND_TENSORFLOW:
+      backend = &RAI_backends.tf;
+      break;
+    case RAI_BACKEND_TFLITE:
+      backend = &RAI_backends.tflite;
+      break;
+    case RAI_BACKEND_TORCH:
+      backend = &RAI_backends.torch;
+      break;
+    case RAI_BACKEND_ONNXRUNTIME:
+      backend = &RAI_backends.onnx;
+      break;
+  }
+
+  RAI_ModelInputShape* shapes = NULL;
+  *noutputs = model->noutputs;
+
+  if (backend && backend->model_signature &&
+      backend->model_signature(model, &shapes, noutputs, err) != 0) {
+    if (model->inputshapes == NULL) {
+      return NULL;
+    }
+    // shapes given with SHAPE do not need the backend
+    RAI_ClearError(err);
+    shapes = NULL;
+    *noutputs = model->noutputs;
+  }
+
+  // models set with OUTPUTS names only run those
+  if (model->outputs) {
+    *noutputs = model->noutputs;
+  }
+
+  if (model->inputshapes) {
+    RAI_ModelFreeInputShapes(shapes);
+    shapes = array_new(RAI_ModelInputShape, array_len(model->inputshapes));
+    for (size_t i=0; i<array_len(model->inputshapes); i++) {
+      RAI_ModelInputShape shape = {
+        .dtype = model->inputshapes[i].dtype,
+        .dims = array_new(long long, array_len(model->inputshapes[i].dims))
+      };
+      for (size_t j=0; j<array_len(model->inputshapes[i].dims); j++) {
+        shape.dims = array_append(shape.dims, model->inputshapes[i].dims[j]);
+      }
+      shapes = array_append(shapes, shape);
+    }
+  }
+
+  if (shapes == NULL) {
+    char msg[80];
+    sprintf(msg, "ERR WARMUP requires SHAPE for the inputs of %s models", RAI_BackendName(model->backend));
+    RAI_SetError(err, RAI_EMODELRUN, msg);
+    return NULL;
+  }
+
+  // input names are looked up by position
+  if (model->inputs && array_len(shapes) != model->ninputs) {
+    RAI_ModelFreeInputShapes(shapes);
+    RAI_SetError(err, RAI_EMODELRUN, "ERR Number of SHAPE entries and model INPUTS do not match");
+    return NULL;
+  }
+
+  return shapes;
+}
+
+/* Largest batch size used for warm-up runs. Warm-up during MODELSET runs on
+ * the main thread, so it is kept short whatever BATCHSIZE is. */
+#define RAI_WARMUP_MAX_BATCHSIZE 256
+
+/* Run the model on zero-filled inputs, so that backends allocate memory and
+ * pick kernels before the model serves traffic. With BATCHSIZE set, each
+ * power of two batch size up to BATCHSIZE (at most RAI_WARMUP_MAX_BATCHSIZE)
+ * is run, since that is what batched requests look like to the backend. The
+ * caller must hold a reference. */
+int RAI_ModelWarmup(RAI_Model* model, size_t runs, RAI_Error* err) {
+  if (RAI_ModelMaterialize(model, err) != REDISMODULE_OK) {
+    return REDISMODULE_ERR;
+  }
+
+  size_t noutputs;
+  RAI_ModelInputShape* shapes = RAI_ModelWarmupShapes(model, &noutputs, err);
+  if (shapes == NULL) {
+    return REDISMODULE_ERR;
+  }
+
+  size_t batch_sizes[64];
+  size_t nbatch_sizes = 0;
+  if (model->opts.batchsize > 0) {
+    const size_t max_batchsize = model->opts.batchsize < RAI_WARMUP_MAX_BATCHSIZE ?
+                                 model->opts.batchsize : RAI_WARMUP_MAX_BATCHSIZE;
+    for (size_t b=1; b<max_batchsize; b*=2) {
+      batch_sizes[nbatch_sizes++] = b;
+    }
+    batch_sizes[nbatch_sizes++] = max_batchsize;
+  }
+  else {
+    // keep the batch dimension of the input shapes
+    batch_sizes[nbatch_sizes++] = 0;
+  }
+
+  int ret = REDISMODULE_OK;
+
+  for (size_t b=0; b<nbatch_sizes && ret == REDISMODULE_OK; b++) {
+    // the run context does not take a reference on the model: warm-up can
+    // run outside of the main thread, where reference counts can't be updated
+    RAI_ModelRunCtx mctx = {
+      .model = model,
+      .batches = array_new(RAI_ModelCtxBatch, 1)
+    };
+    RAI_ModelRunCtxAddBatch(&mctx);
+
+    for (size_t i=0; i<array_len(shapes); i++) {
+      const int ndims = array_len(shapes[i].dims);
+      long long dims[ndims];
+      for (int j=0; j<ndims; j++) {
+        // unknown dimensions are run with size 1
+        dims[j] = shapes[i].dims[j] > 0 ? shapes[i].dims[j] : 1;
+      }
+      if (ndims > 0 && batch_sizes[b] > 0) {
+        dims[0] = batch_sizes[b];
+      }
+      RAI_Tensor* t = RAI_TensorCreateWithDLDataType(shapes[i].dtype, dims, ndims, TENSORALLOC_CALLOC);
+      RAI_ModelRunCtxAddInput(&mctx, 0, model->inputs ? model->inputs[i] : NULL, t);
+      RAI_TensorFree(t);
+    }
+
+    for (size_t i=0; i<noutputs; i++) {
+      RAI_ModelRunCtxAddOutput(&mctx, 0, model->outputs ? model->outputs[i] : NULL);
+    }
+
+    for (size_t r=0; r<runs && ret == REDISMODULE_OK; r++) {
+      ret = RAI_ModelRun(&mctx, err);
+      // outputs are not needed, drop them before the next run
+      for (size_t i=0; i<array_len(mctx.batches[0].outputs); i++) {
+        if (mctx.batches[0].outputs[i].tensor) {
+          RAI_TensorFree(mctx.batches[0].outputs[i].tensor);
+          mctx.batches[0].outputs[i].tensor = NULL;
+        }
+      }
+    }
+
+    RAI_ModelRunCtxFreeBatches(&mctx);
+  }
+
+  RAI_ModelFreeInputShapes(shapes);
+
+  return ret;
+}
+
+static const char* RAI_OptLevelNames[] = {NULL, "DISABLE", "BASIC", "EXTENDED", "ALL"};
+static const char* RAI_ExecModeNames[] = {NULL, "SEQUENTIAL", "PARALLEL"};
+static const char* RAI_SwitchNames[] = {NULL, "OFF", "ON"};
+static const char* RAI_ReplicateNames[] = {"BLOB", "NONE", "COMMAND"};
+
+static int RAI_OptionFromString(const char* str, const char** names, size_t nnames, int* value) {
+  for (size_t i=0; i<nnames; i++) {
+    if (names[i] && strcasecmp(str, names[i]) == 0) {
+      *value = i;
+      return REDISMODULE_OK;
+    }
+  }
+  return REDISMODULE_ERR;
+}
+
+int RAI_OptLevelFromString(const char* str, RAI_OptLevel* optlevel) {
+  return RAI_OptionFromString(str, RAI_OptLevelNames, sizeof(RAI_OptLevelNames)/sizeof(char*), (int*)optlevel);
+}
+
+int RAI_ExecModeFromString(const char* str, RAI_ExecMode* execmode) {
+  return RAI_OptionFromString(str, RAI_ExecModeNames, sizeof(RAI_ExecModeNames)/sizeof(char*), (int*)execmode);
+}
+
+int RAI_SwitchFromString(const char* str, RAI_Switch* value) {
+  return RAI_OptionFromString(str, RAI_SwitchNames, sizeof(RAI_SwitchNames)/sizeof(char*), (int*)value);
+}
+
+int RAI_ReplicateFromString(const char* str, RAI_Replicate* replicate) {
+  return RAI_OptionFromString(str, RAI_ReplicateNames, sizeof(RAI_ReplicateNames)/sizeof(char*), (int*)replicate);
+}
+
+const char* RAI_OptLevelName(RAI_OptLevel optlevel) {
+  return RAI_OptLevelNames[optlevel];
+}
+
+const char* RAI_ExecModeName(RAI_ExecMode execmode) {
+  return RAI_ExecModeNames[execmode];
+}
+
+const char* RAI_SwitchName(RAI_Switch value) {
+  return RAI_SwitchNames[value];
+}
+
+const char* RAI_ReplicateName(RAI_Replicate replicate) {
+  return RAI_ReplicateNames[replicate];
+}
+
+/* Check that options read from an RDB file have a name, as those given to
+ * MODELSET do. */
+static int RAI_ModelOptsValid(const RAI_ModelOpts* opts) {
+  return (size_t)opts->optlevel < sizeof(RAI_OptLevelNames)/sizeof(char*) &&
+         (size_t)opts->execmode < sizeof(RAI_ExecModeNames)/sizeof(char*) &&
+         (size_t)opts->mempattern < sizeof(RAI_SwitchNames)/sizeof(char*) &&
+         (size_t)opts->cpuarena < sizeof(RAI_SwitchNames)/sizeof(char*) &&
+         (size_t)opts->xnnpack < sizeof(RAI_SwitchNames)/sizeof(char*) &&
+         (size_t)opts->replicate < sizeof(RAI_ReplicateNames)/sizeof(char*);
+}
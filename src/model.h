@@ -8,13 +8,24 @@
 #include "err.h"
 
 extern RedisModuleType *RedisAI_ModelType;
+extern long long RAI_modelSessionMemoryLimit;
 
 int RAI_ModelInit(RedisModuleCtx* ctx);
 RAI_Model *RAI_ModelCreate(RAI_Backend backend, const char* devicestr, const char* tag, RAI_ModelOpts opts,
                            size_t ninputs, const char **inputs,
                            size_t noutputs, const char **outputs,
                            const char *modeldef, size_t modellen, RAI_Error* err);
+RAI_Model *RAI_ModelCreateLazy(RAI_Backend backend, const char* devicestr, const char* tag, RAI_ModelOpts opts,
+                               size_t ninputs, const char **inputs,
+                               size_t noutputs, const char **outputs,
+                               const char *modeldef, size_t modellen);
+int RAI_ModelIsMaterialized(RAI_Model* model);
+int RAI_ModelMaterialize(RAI_Model* model, RAI_Error* err);
 void RAI_ModelFree(RAI_Model* model, RAI_Error* err);
+void RAI_ModelFreeInputShapes(RAI_ModelInputShape* inputshapes);
+
+void RAI_ModelTouchSession(RAI_Model* model);
+void RAI_ModelEvictSessions(RedisModuleCtx* ctx);
 
 RAI_ModelRunCtx* RAI_ModelRunCtxCreate(RAI_Model* model);
 
@@ -30,8 +41,18 @@ RAI_Tensor* RAI_ModelRunCtxOutputTensor(RAI_ModelRunCtx* mctx, size_t id, size_t
 void RAI_ModelRunCtxFree(RAI_ModelRunCtx* mctx);
 
 int RAI_ModelRun(RAI_ModelRunCtx* mctx, RAI_Error* err);
+int RAI_ModelWarmup(RAI_Model* model, size_t runs, RAI_Error* err);
 RAI_Model* RAI_ModelGetShallowCopy(RAI_Model* model);
 
+int RAI_OptLevelFromString(const char* str, RAI_OptLevel* optlevel);
+int RAI_ExecModeFromString(const char* str, RAI_ExecMode* execmode);
+int RAI_SwitchFromString(const char* str, RAI_Switch* value);
+int RAI_ReplicateFromString(const char* str, RAI_Replicate* replicate);
+const char* RAI_OptLevelName(RAI_OptLevel optlevel);
+const char* RAI_ExecModeName(RAI_ExecMode execmode);
+const char* RAI_SwitchName(RAI_Switch value);
+const char* RAI_ReplicateName(RAI_Replicate replicate);
+
 int RAI_ModelSerialize(RAI_Model *model, char **buffer, size_t *len, RAI_Error *err);
 
 #endif /* SRC_MODEL_H_ */
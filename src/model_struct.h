@@ -1,14 +1,69 @@
 #ifndef SRC_MODEL_STRUCT_H_
 #define SRC_MODEL_STRUCT_H_
 
+#include <pthread.h>
 #include "config.h"
 #include "tensor_struct.h"
+#include "cache.h"
+
+// Session options given in MODELSET. The DEFAULT values leave the choice to
+// the backend, so that models set without them keep their behavior.
+typedef enum {
+  RAI_OPTLEVEL_DEFAULT = 0,
+  RAI_OPTLEVEL_DISABLE,
+  RAI_OPTLEVEL_BASIC,
+  RAI_OPTLEVEL_EXTENDED,
+  RAI_OPTLEVEL_ALL
+} RAI_OptLevel;
+
+typedef enum {
+  RAI_EXECMODE_DEFAULT = 0,
+  RAI_EXECMODE_SEQUENTIAL,
+  RAI_EXECMODE_PARALLEL
+} RAI_ExecMode;
+
+typedef enum {
+  RAI_SWITCH_DEFAULT = 0,
+  RAI_SWITCH_OFF,
+  RAI_SWITCH_ON
+} RAI_Switch;
+
+// How the outputs of MODELRUN are sent to replicas and the AOF: BLOB as
+// TENSORSET commands, NONE not at all, COMMAND by replicating MODELRUN
+// itself so that replicas compute the outputs
+typedef enum {
+  RAI_REPLICATE_BLOB = 0,
+  RAI_REPLICATE_NONE,
+  RAI_REPLICATE_COMMAND
+} RAI_Replicate;
 
 typedef struct RAI_ModelOpts {
   size_t batchsize;
   size_t minbatchsize;
+  RAI_OptLevel optlevel;
+  RAI_ExecMode execmode;
+  RAI_Switch mempattern;
+  RAI_Switch cpuarena;
+  // interpreter threads and XNNPACK delegate of TFLITE models, 0 and
+  // DEFAULT take the backend settings
+  long long threads;
+  RAI_Switch xnnpack;
+  // whether TORCH models are prepared for inference when loaded
+  int optimize;
+  RAI_Replicate replicate;
+  // memory cap in bytes of the run result cache, 0 disables it, and time
+  // to live of its entries in milliseconds, 0 for no expiry
+  size_t cachesize;
+  long long cachettl;
 } RAI_ModelOpts;
 
+// Data type and shape of a model input, as given with SHAPE in MODELSET or
+// reported by the backend. Unknown dimensions are set to -1.
+typedef struct RAI_ModelInputShape {
+  DLDataType dtype;
+  long long* dims;
+} RAI_ModelInputShape;
+
 typedef struct RAI_Model {
   void* model;
   // TODO: use session pool? The ideal would be to use one session per client.
@@ -23,9 +78,48 @@ typedef struct RAI_Model {
   size_t ninputs;
   char **outputs;
   size_t noutputs;
+  // Input shapes used to generate warm-up inputs, NULL if not given
+  RAI_ModelInputShape* inputshapes;
   long long refCount;
+  // Number of times the key holding the model has been set, starting at 1.
+  // Runs queued before an overwrite keep a reference to the version they
+  // were submitted against.
+  long long version;
   void* data;
   void* infokey;
+  // Serialized model definition. It is only set while the backend session
+  // has not been created yet (e.g. models loaded lazily from RDB), in which
+  // case the session is created on first use by RAI_ModelMaterialize.
+  char* modeldef;
+  size_t modellen;
+  // Definition the session was created from, kept along with the session
+  // while MODEL_SESSION_MEMORY_LIMIT is set, so that the session can be
+  // evicted without serializing it on the main thread
+  char* sessiondef;
+  size_t sessiondeflen;
+  int materializing;
+  pthread_mutex_t lock;
+  pthread_cond_t materialized;
+  // Memory accounted to the backend session against
+  // MODEL_SESSION_MEMORY_LIMIT, estimated as the size of the definition
+  size_t sessionsize;
+  // Least recently used list of the models holding a session, only
+  // accessed from the main thread
+  struct RAI_Model* lru_prev;
+  struct RAI_Model* lru_next;
+  int lru_linked;
+  // Set when the session was evicted and not rebuilt yet
+  int evicted;
+  long long evictions;
+  long long eviction_us;
+  long long recompiles;
+  long long recompile_us;
+  // Outputs of previous runs when CACHE is set, only accessed from the main
+  // thread and released when the key no longer holds the model
+  RAI_RunCache* cache;
+  // MODELRUN requests answered with the outputs of an identical request
+  // pending at the same time, only accessed from the main thread
+  long long coalesced;
 } RAI_Model;
 
 typedef struct RAI_ModelCtxParam {
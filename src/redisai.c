@@ -4,6 +4,8 @@
 #include "script.h"
 #include "backends.h"
 #include "stats.h"
+#include "loader.h"
+#include "lazyfree.h"
 #include <string.h>
 #include <pthread.h>
 #include <sys/time.h>
@@ -28,7 +30,13 @@ typedef struct RunQueueInfo {
 } RunQueueInfo;
 
 static AI_dict *run_queues = NULL;
-static long long perqueueThreadPoolSize = REDISAI_DEFAULT_THREADS_PER_QUEUE;
+long long perqueueThreadPoolSize = REDISAI_DEFAULT_THREADS_PER_QUEUE;
+
+// MODELRUN requests waiting in a run queue, by model and input tensors, so
+// that identical requests pending at the same time are run once. Entries
+// are added from the main thread and removed by the worker dequeuing them.
+static AI_dict *pending_runs = NULL;
+static pthread_mutex_t pending_runs_mutex = PTHREAD_MUTEX_INITIALIZER;
 
 int freeRunQueueInfo(RunQueueInfo* info) {
   int result = REDISMODULE_OK;
@@ -52,6 +60,11 @@ int freeRunQueueInfo(RunQueueInfo* info) {
 
 void *RedisAI_Run_ThreadMain(void *arg);
 
+int RAI_ParseTensorGetFormat(RedisModuleString *fmt, int *datafmt);
+int RAI_ReplyWithTensor(RedisModuleCtx *ctx, int datafmt, RAI_Tensor *t);
+int RAI_ParseTensorSetArgs(RedisModuleCtx *ctx, RedisModuleString **argv, int argc, RAI_Tensor **tensor);
+static void RedisAI_AsyncRunDone(struct RedisAI_RunInfo *rinfo);
+
 /* Ensure that the the run queue for the device exists.
  * If not, create it. */
 int ensureRunQueue(const char* devicestr) {
@@ -175,8 +188,248 @@ int RAI_GetTensorFromKeyspace(RedisModuleCtx *ctx, RedisModuleString *keyName,
   return REDISMODULE_OK;
 }
 
+/* ---------------------------- AI.DAGRUN ---------------------------------- */
+
+typedef enum RedisAI_DagCommand {
+  REDISAI_DAG_CMD_TENSORSET = 0,
+  REDISAI_DAG_CMD_TENSORGET,
+  REDISAI_DAG_CMD_MODELRUN,
+  REDISAI_DAG_CMD_SCRIPTRUN
+} RedisAI_DagCommand;
+
+typedef struct RedisAI_DagOp {
+  RedisAI_DagCommand command;
+  // Model or script key of a run
+  RedisModuleString *runkey;
+  // Names of the tensors read and written in the DAG tensor context
+  RedisModuleString **inkeys;
+  RedisModuleString **outkeys;
+  // Tensor set by TENSORSET, or read by TENSORGET when executed
+  RAI_Tensor *tensor;
+  int datafmt;
+  RAI_ModelRunCtx *mctx;
+  RAI_ScriptRunCtx *sctx;
+  RunQueueInfo *run_queue_info;
+  int executed;
+  int status;
+  long long duration_us;
+  RAI_Error *err;
+} RedisAI_DagOp;
+
+struct RedisAI_DagRunInfo {
+  RedisAI_DagOp *ops;
+  size_t current;
+  // Request local tensors by name, they never reach the keyspace unless
+  // listed in persistkeys
+  AI_dict *tensors;
+  RedisModuleString **persistkeys;
+};
+
+static RAI_Tensor* RedisAI_DagGetTensor(struct RedisAI_DagRunInfo *dag, RedisModuleString *name) {
+  AI_dictEntry *entry = AI_dictFind(dag->tensors, RedisModule_StringPtrLen(name, NULL));
+  return entry ? AI_dictGetVal(entry) : NULL;
+}
+
+/* Store a tensor in the DAG context, taking ownership of the reference. */
+static void RedisAI_DagSetTensor(struct RedisAI_DagRunInfo *dag, RedisModuleString *name, RAI_Tensor *t) {
+  const char *namestr = RedisModule_StringPtrLen(name, NULL);
+  AI_dictEntry *entry = AI_dictFind(dag->tensors, namestr);
+  if (entry) {
+    RAI_TensorFree(AI_dictGetVal(entry));
+    AI_dictSetVal(dag->tensors, entry, t);
+  }
+  else {
+    AI_dictAdd(dag->tensors, (void*)namestr, t);
+  }
+}
+
+static void RedisAI_FreeDagRunInfo(struct RedisAI_DagRunInfo *dag) {
+  for (size_t i=0; i<array_len(dag->ops); i++) {
+    RedisAI_DagOp *op = &dag->ops[i];
+    if (op->runkey) {
+      RedisModule_FreeString(NULL, op->runkey);
+    }
+    for (size_t j=0; j<array_len(op->inkeys); j++) {
+      RedisModule_FreeString(NULL, op->inkeys[j]);
+    }
+    array_free(op->inkeys);
+    for (size_t j=0; j<array_len(op->outkeys); j++) {
+      RedisModule_FreeString(NULL, op->outkeys[j]);
+    }
+    array_free(op->outkeys);
+    if (op->tensor) {
+      RAI_TensorFree(op->tensor);
+    }
+    if (op->mctx) {
+      RAI_ModelRunCtxFree(op->mctx);
+    }
+    if (op->sctx) {
+      RAI_ScriptRunCtxFree(op->sctx);
+    }
+    if (op->err) {
+      RAI_ClearError(op->err);
+      RedisModule_Free(op->err);
+    }
+  }
+  array_free(dag->ops);
+
+  AI_dictIterator *iter = AI_dictGetSafeIterator(dag->tensors);
+  AI_dictEntry *entry = AI_dictNext(iter);
+  while (entry) {
+    RAI_TensorFree(AI_dictGetVal(entry));
+    entry = AI_dictNext(iter);
+  }
+  AI_dictReleaseIterator(iter);
+  AI_dictRelease(dag->tensors);
+
+  for (size_t i=0; i<array_len(dag->persistkeys); i++) {
+    RedisModule_FreeString(NULL, dag->persistkeys[i]);
+  }
+  array_free(dag->persistkeys);
+
+  RedisModule_Free(dag);
+}
+
+static void RedisAI_DagOpFail(RedisAI_DagOp *op, const char *msg) {
+  op->executed = 1;
+  op->status = 1;
+  op->err = RedisModule_Calloc(1, sizeof(RAI_Error));
+  RAI_SetError(op->err, RAI_EDAGRUN, msg);
+}
+
+/* Execute the DAG steps that only touch its tensor context, up to the next
+ * model or script run, which is queued on the device of the model or
+ * script. Once all the steps are done, or one of them failed, the client
+ * is unblocked. Called from the main thread when the DAG is submitted and
+ * from the worker threads after each run. */
+static void RedisAI_DagAdvance(struct RedisAI_RunInfo *rinfo) {
+  struct RedisAI_DagRunInfo *dag = rinfo->dag;
+
+  while (dag->current < array_len(dag->ops)) {
+    RedisAI_DagOp *op = &dag->ops[dag->current];
+
+    if (op->command == REDISAI_DAG_CMD_TENSORSET) {
+      RedisAI_DagSetTensor(dag, op->outkeys[0], RAI_TensorGetShallowCopy(op->tensor));
+    }
+    else if (op->command == REDISAI_DAG_CMD_TENSORGET) {
+      RAI_Tensor *t = RedisAI_DagGetTensor(dag, op->inkeys[0]);
+      if (t == NULL) {
+        RedisAI_DagOpFail(op, "ERR tensor key is empty");
+        break;
+      }
+      op->tensor = RAI_TensorGetShallowCopy(t);
+    }
+    else {
+      // inputs are bound now, as they may be outputs of the previous steps
+      for (size_t i=0; i<array_len(op->inkeys); i++) {
+        RAI_Tensor *t = RedisAI_DagGetTensor(dag, op->inkeys[i]);
+        if (t == NULL) {
+          RedisAI_DagOpFail(op, "ERR INPUT key cannot be found in DAG");
+          break;
+        }
+        if (op->mctx) {
+          // Opname here is passed without copying
+          RAI_Model *model = op->mctx->model;
+          const char *opname = model->inputs ? model->inputs[i] : NULL;
+          RAI_ModelRunCtxAddInput(op->mctx, 0, opname, t);
+        }
+        else {
+          RAI_ScriptRunCtxAddInput(op->sctx, t);
+        }
+      }
+      if (op->executed) {
+        break;
+      }
+
+      rinfo->mctx = op->mctx;
+      rinfo->sctx = op->sctx;
+
+      RunQueueInfo *run_queue_info = op->run_queue_info;
+      pthread_mutex_lock(&run_queue_info->run_queue_mutex);
+      queuePush(run_queue_info->run_queue, rinfo);
+      pthread_cond_signal(&run_queue_info->queue_condition_var);
+      pthread_mutex_unlock(&run_queue_info->run_queue_mutex);
+      return;
+    }
+
+    op->executed = 1;
+    dag->current++;
+  }
+
+  if (rinfo->client != NULL) {
+    RedisModule_UnblockClient(rinfo->client, rinfo);
+  }
+}
+
+/* Collect the result of the run step of a DAG and go on with the next
+ * steps. Called from the worker thread that ran the step. */
+static void RedisAI_DagRunStepDone(struct RedisAI_RunInfo *rinfo) {
+  struct RedisAI_DagRunInfo *dag = rinfo->dag;
+  RedisAI_DagOp *op = &dag->ops[dag->current];
+
+  op->executed = 1;
+  op->status = rinfo->status;
+  op->duration_us = rinfo->duration_us;
+  op->err = rinfo->err;
+  rinfo->err = NULL;
+  rinfo->mctx = NULL;
+  rinfo->sctx = NULL;
+
+  if (op->status) {
+    RedisModule_UnblockClient(rinfo->client, rinfo);
+    return;
+  }
+
+  for (size_t o=0; o<array_len(op->outkeys); o++) {
+    RAI_Tensor *t = NULL;
+    if (op->mctx) {
+      t = RAI_ModelRunCtxOutputTensor(op->mctx, 0, o);
+    }
+    else {
+      t = RAI_ScriptRunCtxOutputTensor(op->sctx, o);
+    }
+    if (t) {
+      RedisAI_DagSetTensor(dag, op->outkeys[o], RAI_TensorGetShallowCopy(t));
+    }
+  }
+
+  dag->current++;
+  RedisAI_DagAdvance(rinfo);
+}
+
+/* ------------------------- AI.MODELRUNMULTI ------------------------------ */
+
+struct RedisAI_MultiRunInfo {
+  struct RedisAI_RunInfo **samples;
+  // Samples queued and not run yet, decremented by the workers
+  size_t pending;
+  RedisModuleBlockedClient *client;
+};
+
+/* Called from the worker thread that ran a sample, the client is unblocked
+ * once the last sample has run. */
+static void RedisAI_MultiRunSampleDone(struct RedisAI_RunInfo *rinfo) {
+  struct RedisAI_MultiRunInfo *multi = rinfo->multi;
+  if (__atomic_sub_fetch(&multi->pending, 1, __ATOMIC_ACQ_REL) == 0) {
+    RedisModule_UnblockClient(multi->client, multi);
+  }
+}
+
+void RedisAI_FreeRunInfo(RedisModuleCtx *ctx, struct RedisAI_RunInfo *rinfo);
+
+static void RedisAI_FreeMultiRunInfo(RedisModuleCtx *ctx, struct RedisAI_MultiRunInfo *multi) {
+  for (size_t i=0; i<array_len(multi->samples); i++) {
+    RedisAI_FreeRunInfo(ctx, multi->samples[i]);
+  }
+  array_free(multi->samples);
+  RedisModule_Free(multi);
+}
+
 void RedisAI_FreeRunInfo(RedisModuleCtx *ctx, struct RedisAI_RunInfo *rinfo) {
-  if (rinfo->mctx) {
+  if (rinfo->dag) {
+    RedisAI_FreeDagRunInfo(rinfo->dag);
+  }
+  else if (rinfo->mctx) {
     for(int i = 0 ; i < RAI_ModelRunCtxNumOutputs(rinfo->mctx) ; ++i){
       RedisModule_FreeString(ctx, rinfo->outkeys[i]);
     }
@@ -190,12 +443,31 @@ void RedisAI_FreeRunInfo(RedisModuleCtx *ctx, struct RedisAI_RunInfo *rinfo) {
     RedisModule_Free(rinfo->outkeys);
     RAI_ScriptRunCtxFree(rinfo->sctx);
   }
+  else if (rinfo->warmup) {
+    // the model was not stored
+    RAI_Error err = {0};
+    RAI_ModelFree(rinfo->warmup, &err);
+    RAI_ClearError(&err);
+  }
+
+  if (rinfo->outputs) {
+    for (size_t i=0; i<array_len(rinfo->outputs); i++) {
+      if (rinfo->outputs[i]) {
+        RAI_TensorFree(rinfo->outputs[i]);
+      }
+    }
+    array_free(rinfo->outputs);
+  }
 
   if (rinfo->err) {
     RAI_ClearError(rinfo->err);
     RedisModule_Free(rinfo->err);
   }
 
+  if (rinfo->pendingkey) {
+    RedisModule_Free(rinfo->pendingkey);
+  }
+
   RedisModule_Free(rinfo);
 }
 
@@ -204,11 +476,41 @@ void RedisAI_FreeRunStats(RedisModuleCtx *ctx, struct RedisAI_RunStats *rstats)
   RedisModule_Free(rstats->devicestr);
 }
 
+/* Give a coalesced request the outputs and status of the run it waited on. */
+static void RedisAI_CopyRunResult(struct RedisAI_RunInfo *src, struct RedisAI_RunInfo *dst) {
+  const size_t noutputs = RAI_ModelRunCtxNumOutputs(src->mctx);
+  for (size_t o=0; o<noutputs; o++) {
+    RAI_Tensor* tensor = src->mctx->batches[0].outputs[o].tensor;
+    dst->mctx->batches[0].outputs[o].tensor = tensor ? RAI_TensorGetShallowCopy(tensor) : NULL;
+  }
+
+  dst->status = src->status;
+  dst->duration_us = src->duration_us;
+  dst->err = RedisModule_Calloc(1, sizeof(RAI_Error));
+  dst->err->code = src->err->code;
+  if (src->err->code != RAI_OK) {
+    dst->err->detail = RedisModule_Strdup(src->err->detail);
+    dst->err->detail_oneline = RedisModule_Strdup(src->err->detail_oneline);
+  }
+}
+
 void *RedisAI_RunSession(struct RedisAI_RunInfo **batch_rinfo) {
   if (array_len(batch_rinfo) == 0) {
     return NULL;
   }
 
+  // Requests arriving from now on can't join the ones being run
+  for (long long i=0; i<array_len(batch_rinfo); i++) {
+    struct RedisAI_RunInfo *rinfo = batch_rinfo[i];
+    if (rinfo->pendingkey) {
+      pthread_mutex_lock(&pending_runs_mutex);
+      AI_dictDelete(pending_runs, rinfo->pendingkey);
+      pthread_mutex_unlock(&pending_runs_mutex);
+      RedisModule_Free(rinfo->pendingkey);
+      rinfo->pendingkey = NULL;
+    }
+  }
+
   RAI_Error* err = RedisModule_Calloc(1, sizeof(RAI_Error));
   long long rtime;
   int status;
@@ -233,6 +535,9 @@ void *RedisAI_RunSession(struct RedisAI_RunInfo **batch_rinfo) {
   else if (sctx) {
     status = RAI_ScriptRun(sctx, err);
   }
+  else {
+    status = RAI_ModelWarmup(batch_rinfo[0]->warmup, batch_rinfo[0]->warmup_runs, err);
+  }
   rtime = ustime() - start;
 
   for (long long i=0; i<array_len(batch_rinfo); i++) {
@@ -264,7 +569,29 @@ void *RedisAI_RunSession(struct RedisAI_RunInfo **batch_rinfo) {
       rinfo->err->detail = RedisModule_Strdup(err->detail);
       rinfo->err->detail_oneline = RedisModule_Strdup(err->detail_oneline);
     }
-    if (rinfo->client != NULL) {
+    if (rinfo->followers) {
+      // all the outputs are shared before any client is unblocked, as
+      // replying to a client releases its references to them
+      for (size_t f=0; f<array_len(rinfo->followers); f++) {
+        RedisAI_CopyRunResult(rinfo, rinfo->followers[f]);
+      }
+      for (size_t f=0; f<array_len(rinfo->followers); f++) {
+        RedisModule_UnblockClient(rinfo->followers[f]->client, rinfo->followers[f]);
+      }
+      array_free(rinfo->followers);
+      rinfo->followers = NULL;
+    }
+    if (rinfo->dag) {
+      // the DAG goes on with its next step, or unblocks its client
+      RedisAI_DagRunStepDone(rinfo);
+    }
+    else if (rinfo->multi) {
+      RedisAI_MultiRunSampleDone(rinfo);
+    }
+    else if (rinfo->ticket) {
+      RedisAI_AsyncRunDone(rinfo);
+    }
+    else if (rinfo->client != NULL) {
       RedisModule_UnblockClient(rinfo->client, rinfo);
     }
   }
@@ -313,11 +640,55 @@ void RedisAI_ReplicateTensorSet(RedisModuleCtx *ctx, RedisModuleString *key, RAI
   RedisModule_Free(dtypestr);
 }
 
-int RedisAI_Run_Reply(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
-  REDISMODULE_NOT_USED(argv);
-  REDISMODULE_NOT_USED(argc);
-  struct RedisAI_RunInfo *rinfo = RedisModule_GetBlockedClientPrivateData(ctx);
-  
+/* Store the outputs of a successful model run in the cache of the model. */
+static void RedisAI_Run_CacheOutputs(struct RedisAI_RunInfo *rinfo) {
+  RAI_Model *model = rinfo->mctx->model;
+  // The key may have been deleted or set again while the run was queued
+  if (!model->cache) {
+    return;
+  }
+
+  const size_t ninputs = RAI_ModelRunCtxNumInputs(rinfo->mctx);
+  const size_t noutputs = RAI_ModelRunCtxNumOutputs(rinfo->mctx);
+  RAI_Tensor *inputs[ninputs];
+  RAI_Tensor *outputs[noutputs];
+  for (size_t i=0; i<ninputs; i++) {
+    inputs[i] = RAI_ModelRunCtxInputTensor(rinfo->mctx, 0, i);
+  }
+  for (size_t i=0; i<noutputs; i++) {
+    outputs[i] = RAI_ModelRunCtxOutputTensor(rinfo->mctx, 0, i);
+    if (outputs[i] == NULL) {
+      return;
+    }
+  }
+
+  RAI_RunCachePut(model->cache, rinfo->cachekey, inputs, ninputs, outputs, noutputs);
+}
+
+static RAI_Tensor *RedisAI_Run_OutputTensor(struct RedisAI_RunInfo *rinfo, size_t i) {
+  if (rinfo->outputs) {
+    return rinfo->outputs[i];
+  }
+  if (rinfo->mctx) {
+    return RAI_ModelRunCtxOutputTensor(rinfo->mctx, 0, i);
+  }
+  return RAI_ScriptRunCtxOutputTensor(rinfo->sctx, i);
+}
+
+static size_t RedisAI_Run_NumOutputs(struct RedisAI_RunInfo *rinfo) {
+  if (rinfo->outputs) {
+    return array_len(rinfo->outputs);
+  }
+  if (rinfo->mctx) {
+    return RAI_ModelRunCtxNumOutputs(rinfo->mctx);
+  }
+  return RAI_ScriptRunCtxNumOutputs(rinfo->sctx);
+}
+
+/* Store the outputs of a completed run in their keys, replicate them and
+ * account for the run in its stats. On failure the run is marked as failed
+ * and REDISMODULE_ERR is returned. */
+static int RedisAI_Run_StoreOutputs(RedisModuleCtx *ctx, struct RedisAI_RunInfo *rinfo) {
   const char* runkey = RedisModule_StringPtrLen(rinfo->runkey, NULL);
   AI_dictEntry *stats_entry = AI_dictFind(run_stats, runkey);
 
@@ -332,48 +703,43 @@ int RedisAI_Run_Reply(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
       rstats->calls += 1;
       rstats->nerrors += 1;
     }
-    int ret = RedisModule_ReplyWithError(ctx, rinfo->err->detail_oneline);
-    RedisAI_FreeRunInfo(ctx, rinfo);
-    return ret;
-  }
-
-  size_t num_outputs = 0;
-  if (rinfo->mctx) {
-    num_outputs = RAI_ModelRunCtxNumOutputs(rinfo->mctx);
-  }
-  else if (rinfo->sctx) {
-    num_outputs = RAI_ScriptRunCtxNumOutputs(rinfo->sctx);
+    return REDISMODULE_ERR;
   }
 
+  const size_t num_outputs = RedisAI_Run_NumOutputs(rinfo);
   int64_t batch_size = 0;
 
   for (size_t i=0; i<num_outputs; ++i) {
-    RedisModuleKey *outkey;
-    const int status = RAI_OpenKey_Tensor(ctx, rinfo->outkeys[i], &outkey, REDISMODULE_READ|REDISMODULE_WRITE);
-    if(status==REDISMODULE_ERR){
-        RedisAI_FreeRunInfo(ctx, rinfo);
-        if (rstats) {
-          rstats->calls += 1;
-          rstats->nerrors += 1;
-        }
-        return REDISMODULE_ERR;
+    RAI_Tensor *t = RedisAI_Run_OutputTensor(rinfo, i);
+    if (rinfo->mctx && t && batch_size == 0) {
+      batch_size = RAI_TensorDim(t, 0);
     }
-    RAI_Tensor *t = NULL;
-    if (rinfo->mctx) {
-      t = RAI_ModelRunCtxOutputTensor(rinfo->mctx, 0, i);
-      if (t && batch_size == 0) {
-        batch_size = RAI_TensorDim(t, 0);
-      }
+
+    if (rinfo->return_tensors) {
+      continue;
     }
-    else if (rinfo->sctx) {
-      t = RAI_ScriptRunCtxOutputTensor(rinfo->sctx, i);
+
+    RedisModuleKey *outkey = RedisModule_OpenKey(ctx, rinfo->outkeys[i], REDISMODULE_READ|REDISMODULE_WRITE);
+    if (RedisModule_KeyType(outkey) != REDISMODULE_KEYTYPE_EMPTY &&
+        RedisModule_ModuleTypeGetType(outkey) != RedisAI_TensorType) {
+      RedisModule_CloseKey(outkey);
+      rinfo->status = 1;
+      if (rinfo->err == NULL) {
+        rinfo->err = RedisModule_Calloc(1, sizeof(RAI_Error));
+      }
+      RAI_SetError(rinfo->err, rinfo->mctx ? RAI_EMODELRUN : RAI_ESCRIPTRUN, REDISMODULE_ERRORMSG_WRONGTYPE);
+      if (rstats) {
+        rstats->calls += 1;
+        rstats->nerrors += 1;
+      }
+      return REDISMODULE_ERR;
     }
     if (t) {
       RedisModule_ModuleTypeSetValue(outkey, RedisAI_TensorType, RAI_TensorGetShallowCopy(t));
     }
     RedisModule_CloseKey(outkey);
 
-    if (t) {
+    if (t && rinfo->replicate_outputs) {
       RedisAI_ReplicateTensorSet(ctx, rinfo->outkeys[i], t);
     }
   }
@@ -390,97 +756,501 @@ int RedisAI_Run_Reply(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
   // FIXME This crashes Redis, we need to investigate.
   //RedisModule_CloseKey(rinfo->modelkey);
 
-  RedisAI_FreeRunInfo(ctx, rinfo);
+  if (rinfo->cacheable) {
+    RedisAI_Run_CacheOutputs(rinfo);
+  }
 
-  return RedisModule_ReplyWithSimpleString(ctx, "OK");
+  return REDISMODULE_OK;
 }
 
-size_t RAI_RunInfoBatchSize(struct RedisAI_RunInfo* rinfo) {
-  if (rinfo->mctx == NULL) {
-    return -1;
+/* Reply with the result of a run whose outputs were stored, and release
+ * the run. */
+static int RedisAI_Run_ReplyWithResult(RedisModuleCtx *ctx, struct RedisAI_RunInfo *rinfo) {
+  int ret;
+  if (rinfo->status) {
+    ret = RedisModule_ReplyWithError(ctx, rinfo->err->detail_oneline);
+  }
+  else if (rinfo->return_tensors) {
+    const size_t num_outputs = RedisAI_Run_NumOutputs(rinfo);
+    ret = RedisModule_ReplyWithArray(ctx, num_outputs);
+    for (size_t i=0; i<num_outputs; ++i) {
+      RAI_Tensor *t = RedisAI_Run_OutputTensor(rinfo, i);
+      if (t) {
+        RAI_ReplyWithTensor(ctx, rinfo->datafmt, t);
+      }
+      else {
+        RedisModule_ReplyWithNull(ctx);
+      }
+    }
+  }
+  else {
+    ret = RedisModule_ReplyWithSimpleString(ctx, "OK");
   }
+  RedisAI_FreeRunInfo(ctx, rinfo);
+  return ret;
+}
 
-  size_t ninputs = RAI_ModelRunCtxNumInputs(rinfo->mctx);
+/* Reply to a run and store its outputs, either after a worker ran it or
+ * directly from the command when its outputs were cached. */
+static int RedisAI_Run_ReplyWithOutputs(RedisModuleCtx *ctx, struct RedisAI_RunInfo *rinfo) {
+  RedisAI_Run_StoreOutputs(ctx, rinfo);
+  return RedisAI_Run_ReplyWithResult(ctx, rinfo);
+}
 
-  int batchsize = 0;
+int RedisAI_Run_Reply(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  REDISMODULE_NOT_USED(argv);
+  REDISMODULE_NOT_USED(argc);
+  struct RedisAI_RunInfo *rinfo = RedisModule_GetBlockedClientPrivateData(ctx);
+  return RedisAI_Run_ReplyWithOutputs(ctx, rinfo);
+}
 
-  if (ninputs == 0) {
-    return batchsize;
+/* ------------------------- ASYNC and AI.WAIT ----------------------------- */
+
+// The ticket of each ASYNC run is published on this channel once its outputs
+// are stored
+#define REDISAI_ASYNC_CHANNEL "redisai:runs"
+
+typedef struct RedisAI_AsyncRun {
+  struct RedisAI_RunInfo *rinfo;
+  // Set once the run completed, its result is kept until collected
+  int done;
+  // Client blocked in AI.WAIT for the run, if any. It stays set once the
+  // result is handed to it, until its free_privdata callback runs.
+  RedisModuleBlockedClient *waiter;
+} RedisAI_AsyncRun;
+
+// ASYNC runs by ticket, only accessed with the GIL held
+static AI_dict *async_runs = NULL;
+static long long async_next_ticket = 0;
+
+// Milliseconds the result of an ASYNC run is kept once completed, 0 keeps
+// it until collected
+static long long async_result_ttl = REDISAI_DEFAULT_ASYNC_RESULT_TTL;
+
+typedef struct RedisAI_AsyncExpiry {
+  long long ticket;
+  mstime_t done_at;
+} RedisAI_AsyncExpiry;
+
+// Completed runs in completion order, from async_expiries_head on
+static RedisAI_AsyncExpiry *async_expiries = NULL;
+static size_t async_expiries_head = 0;
+
+/* Drop the results that were not collected within ASYNC_RESULT_TTL. Called
+ * with the GIL held whenever ASYNC runs are created, completed or waited
+ * on. */
+static void RedisAI_AsyncRunExpire(RedisModuleCtx *ctx) {
+  if (async_result_ttl == 0) {
+    return;
   }
-
-  for (size_t i=0; i<ninputs; i++) {
-    RAI_Tensor* input = RAI_ModelRunCtxInputTensor(rinfo->mctx, 0, i);
-
-    if (i == 0) {
-      batchsize = RAI_TensorDim(input, 0);
+  const mstime_t now = mstime();
+  while (async_expiries_head < array_len(async_expiries) &&
+         now - async_expiries[async_expiries_head].done_at >= async_result_ttl) {
+    char ticketstr[32];
+    snprintf(ticketstr, sizeof(ticketstr), "%lld", async_expiries[async_expiries_head].ticket);
+    async_expiries_head++;
+    AI_dictEntry *entry = AI_dictFind(async_runs, ticketstr);
+    // collected results are no longer there
+    if (entry == NULL) {
       continue;
     }
-
-    if (batchsize != RAI_TensorDim(input, 0)) {
-      batchsize = 0;
-      break;
+    RedisAI_AsyncRun *async = AI_dictGetVal(entry);
+    if (async->done && async->waiter == NULL) {
+      AI_dictDelete(async_runs, ticketstr);
+      RedisAI_FreeRunInfo(ctx, async->rinfo);
+      RedisModule_Free(async);
     }
   }
-
-  return batchsize;
+  if (async_expiries_head == array_len(async_expiries)) {
+    async_expiries = array_trimm_len(async_expiries, 0);
+    async_expiries_head = 0;
+  }
 }
 
-int RAI_RunInfoBatchable(struct RedisAI_RunInfo* rinfo1, struct RedisAI_RunInfo* rinfo2) {
-  if (rinfo1->mctx == NULL || rinfo2->mctx == NULL) {
-    return 0;
-  }
+/* Give a ticket to a run replied to through AI.WAIT. Runs received from the
+ * master or loaded from the AOF are not waited on, so their result is not
+ * kept. */
+static long long RedisAI_AsyncRunCreate(RedisModuleCtx *ctx, struct RedisAI_RunInfo *rinfo) {
+  rinfo->ticket = ++async_next_ticket;
 
-  if (rinfo1->mctx->model != rinfo2->mctx->model) {
-    return 0;
+  if (RedisModule_GetContextFlags(ctx) & (REDISMODULE_CTX_FLAGS_REPLICATED|REDISMODULE_CTX_FLAGS_LOADING)) {
+    return rinfo->ticket;
   }
 
-  int ninputs1 = RAI_ModelRunCtxNumInputs(rinfo1->mctx);
-  int ninputs2 = RAI_ModelRunCtxNumInputs(rinfo2->mctx);
+  RedisAI_AsyncRunExpire(ctx);
 
-  if (ninputs1 != ninputs2) {
-    return 0;
-  }
+  char ticketstr[32];
+  snprintf(ticketstr, sizeof(ticketstr), "%lld", rinfo->ticket);
+  RedisAI_AsyncRun *async = RedisModule_Calloc(1, sizeof(RedisAI_AsyncRun));
+  async->rinfo = rinfo;
+  AI_dictAdd(async_runs, ticketstr, async);
+  return rinfo->ticket;
+}
 
-  for (int i=0; i<ninputs1; i++) {
-    RAI_Tensor* input1 = RAI_ModelRunCtxInputTensor(rinfo1->mctx, 0, i);
-    RAI_Tensor* input2 = RAI_ModelRunCtxInputTensor(rinfo2->mctx, 0, i);
+/* Keep only the outputs of a completed run, releasing its model or script
+ * and its output key names. */
+static void RedisAI_Run_KeepOutputs(RedisModuleCtx *ctx, struct RedisAI_RunInfo *rinfo) {
+  const size_t num_outputs = RedisAI_Run_NumOutputs(rinfo);
+  RAI_Tensor **outputs = array_new(RAI_Tensor*, num_outputs > 0 ? num_outputs : 1);
+  for (size_t i=0; i<num_outputs; i++) {
+    RAI_Tensor *t = RedisAI_Run_OutputTensor(rinfo, i);
+    outputs = array_append(outputs, t ? RAI_TensorGetShallowCopy(t) : NULL);
+  }
 
-    int ndims1 = RAI_TensorNumDims(input1);
-    int ndims2 = RAI_TensorNumDims(input2);
+  for (size_t i=0; i<num_outputs; i++) {
+    RedisModule_FreeString(ctx, rinfo->outkeys[i]);
+  }
+  RedisModule_Free(rinfo->outkeys);
+  rinfo->outkeys = NULL;
+  if (rinfo->mctx) {
+    RAI_ModelRunCtxFree(rinfo->mctx);
+    rinfo->mctx = NULL;
+  }
+  else {
+    RAI_ScriptRunCtxFree(rinfo->sctx);
+    rinfo->sctx = NULL;
+  }
+  rinfo->outputs = outputs;
+}
 
-    if (ndims1 != ndims2) {
-      return 0;
-    }
+/* Publish the ticket of a run whose outputs were stored, and hand its result
+ * to the client waiting for it, if any. */
+static void RedisAI_AsyncRunComplete(RedisModuleCtx *ctx, struct RedisAI_RunInfo *rinfo) {
+  RedisModuleCallReply *reply = RedisModule_Call(ctx, "PUBLISH", "cl", REDISAI_ASYNC_CHANNEL, rinfo->ticket);
+  if (reply) {
+    RedisModule_FreeCallReply(reply);
+  }
 
-    if (ndims1 == 0) {
-      continue;
-    }
+  char ticketstr[32];
+  snprintf(ticketstr, sizeof(ticketstr), "%lld", rinfo->ticket);
+  AI_dictEntry *entry = AI_dictFind(async_runs, ticketstr);
+  if (entry == NULL) {
+    RedisAI_FreeRunInfo(ctx, rinfo);
+    return;
+  }
 
-    for (int j=1; j<ndims1; j++) {
-      int dim1 = RAI_TensorDim(input1, j);
-      int dim2 = RAI_TensorDim(input2, j);
-      if (dim1 != dim2) {
-        return 0;
-      }
-    }
+  RedisAI_AsyncRun *async = AI_dictGetVal(entry);
+  RedisAI_Run_KeepOutputs(ctx, rinfo);
+  async->done = 1;
+  if (async_result_ttl > 0) {
+    RedisAI_AsyncExpiry expiry = {
+      .ticket = rinfo->ticket,
+      .done_at = mstime()
+    };
+    async_expiries = array_append(async_expiries, expiry);
+  }
+  // The result stays under its ticket until replied: the waiter may time
+  // out or disconnect before its reply callback runs
+  if (async->waiter) {
+    RedisModule_UnblockClient(async->waiter, async);
   }
 
-  return 1;
+  RedisAI_AsyncRunExpire(ctx);
 }
 
-void *RedisAI_Run_ThreadMain(void *arg) {
+/* Reply with the result of a completed run and forget its ticket. */
+static int RedisAI_AsyncRunReply(RedisModuleCtx *ctx, RedisAI_AsyncRun *async) {
+  struct RedisAI_RunInfo *rinfo = async->rinfo;
+  char ticketstr[32];
+  snprintf(ticketstr, sizeof(ticketstr), "%lld", rinfo->ticket);
+  AI_dictDelete(async_runs, ticketstr);
+  async->rinfo = NULL;
+  return RedisAI_Run_ReplyWithResult(ctx, rinfo);
+}
 
-  RunQueueInfo* run_queue_info = (RunQueueInfo*)arg;
+/* Called from the worker thread that ran an ASYNC run. */
+static void RedisAI_AsyncRunDone(struct RedisAI_RunInfo *rinfo) {
+  RedisModuleCtx *ctx = RedisModule_GetThreadSafeContext(NULL);
+  RedisModule_ThreadSafeContextLock(ctx);
+  RedisAI_Run_StoreOutputs(ctx, rinfo);
+  RedisAI_AsyncRunComplete(ctx, rinfo);
+  RedisModule_ThreadSafeContextUnlock(ctx);
+  RedisModule_FreeThreadSafeContext(ctx);
+}
 
-  pthread_mutex_lock(&run_queue_info->run_queue_mutex);
-  while (true){
-    int rc = pthread_cond_wait(&run_queue_info->queue_condition_var, &run_queue_info->run_queue_mutex);
+int RedisAI_Wait_Reply(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  REDISMODULE_NOT_USED(argv);
+  REDISMODULE_NOT_USED(argc);
+  RedisAI_AsyncRun *async = RedisModule_GetBlockedClientPrivateData(ctx);
+  return RedisAI_AsyncRunReply(ctx, async);
+}
 
-    long long run_queue_len = queueLength(run_queue_info->run_queue);
+/* The run is looked up by the ticket in argv, as older Redis versions don't
+ * give the timeout callback the privdata of a client unblocked meanwhile. */
+int RedisAI_Wait_Timeout(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  RedisModuleBlockedClient *bc = RedisModule_GetBlockedClientHandle(ctx);
+  long long ticket;
+  if (RedisModule_StringToLongLong(argv[1], &ticket) != REDISMODULE_OK) {
+    return RedisModule_ReplyWithNull(ctx);
+  }
+  char ticketstr[32];
+  snprintf(ticketstr, sizeof(ticketstr), "%lld", ticket);
+  AI_dictEntry *entry = AI_dictFind(async_runs, ticketstr);
+  if (entry == NULL) {
+    return RedisModule_ReplyWithNull(ctx);
+  }
+  RedisAI_AsyncRun *async = AI_dictGetVal(entry);
+  if (async->waiter != bc) {
+    return RedisModule_ReplyWithNull(ctx);
+  }
 
-    while (run_queue_len > 0) {
-      queueItem **evicted_items = NULL;
-      struct RedisAI_RunInfo **batch_rinfo = NULL;
+  // The run completed before the timeout was handled: reply with it rather
+  // than dropping it, its free_privdata callback releases the rest
+  if (async->done) {
+    return RedisAI_AsyncRunReply(ctx, async);
+  }
+
+  // Otherwise the ticket can be waited on again
+  async->waiter = NULL;
+  RedisModule_UnblockClient(bc, NULL);
+  return RedisModule_ReplyWithNull(ctx);
+}
+
+/* Called once the result was handed to the waiter. If it wasn't replied,
+ * because the client disconnected, the waiter is unlinked and the result
+ * can still be collected until it expires. */
+void RedisAI_Wait_FreeData(RedisModuleCtx *ctx, void *privdata) {
+  RedisAI_AsyncRun *async = privdata;
+  if (async->rinfo) {
+    async->waiter = NULL;
+    return;
+  }
+  RedisModule_Free(async);
+}
+
+/**
+ * AI.WAIT ticket [timeout]
+ *
+ * Reply with the result of an ASYNC run as AI.MODELRUN would have, blocking
+ * for at most timeout milliseconds (0 waits forever) until it completes.
+ */
+int RedisAI_Wait_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  if (argc != 2 && argc != 3) return RedisModule_WrongArity(ctx);
+
+  long long ticket;
+  if (RedisModule_StringToLongLong(argv[1], &ticket) != REDISMODULE_OK) {
+    return RedisModule_ReplyWithError(ctx, "ERR invalid ticket");
+  }
+  long long timeout = 0;
+  if (argc == 3 && (RedisModule_StringToLongLong(argv[2], &timeout) != REDISMODULE_OK || timeout < 0)) {
+    return RedisModule_ReplyWithError(ctx, "ERR invalid timeout");
+  }
+
+  RedisAI_AsyncRunExpire(ctx);
+
+  char ticketstr[32];
+  snprintf(ticketstr, sizeof(ticketstr), "%lld", ticket);
+  AI_dictEntry *entry = AI_dictFind(async_runs, ticketstr);
+  if (entry == NULL) {
+    return RedisModule_ReplyWithError(ctx, "ERR unknown ticket");
+  }
+
+  RedisAI_AsyncRun *async = AI_dictGetVal(entry);
+  if (async->waiter) {
+    return RedisModule_ReplyWithError(ctx, "ERR ticket is already waited on");
+  }
+
+  if (async->done) {
+    const int ret = RedisAI_AsyncRunReply(ctx, async);
+    RedisModule_Free(async);
+    return ret;
+  }
+
+  async->waiter = RedisModule_BlockClient(ctx, RedisAI_Wait_Reply, RedisAI_Wait_Timeout,
+                                          RedisAI_Wait_FreeData, timeout);
+  return REDISMODULE_OK;
+}
+
+/* Parse RETURN BLOB|VALUES at argpos, the options of MODELRUN or SCRIPTRUN
+ * that come before INPUTS, and advance argpos past it. Returns 1 if it was
+ * given, 0 if not and -1 if the format is invalid. */
+static int RedisAI_ParseRunReturn(RedisModuleString **argv, int argc, int *argpos, int *datafmt) {
+  if (*argpos + 1 >= argc ||
+      strcasecmp(RedisModule_StringPtrLen(argv[*argpos], NULL), "RETURN")) {
+    return 0;
+  }
+  if (RAI_ParseTensorGetFormat(argv[*argpos+1], datafmt) != REDISMODULE_OK ||
+      *datafmt == REDISAI_DATA_NONE) {
+    return -1;
+  }
+  *argpos += 2;
+  return 1;
+}
+
+/* Strip a trailing ASYNC from the arguments of MODELRUN. */
+static int RedisAI_ParseRunAsync(RedisModuleString **argv, int *argc) {
+  if (*argc < 2 || strcasecmp(RedisModule_StringPtrLen(argv[*argc-1], NULL), "ASYNC")) {
+    return 0;
+  }
+  *argc -= 1;
+  return 1;
+}
+
+/* An input given as `$ type dim1..dimN BLOB data | VALUES val1..valN` is a
+ * tensor local to the run instead of a key. */
+static int RedisAI_Run_IsInlineTensor(RedisModuleString *arg) {
+  return strcmp(RedisModule_StringPtrLen(arg, NULL), "$") == 0;
+}
+
+/* Return the number of arguments of the inline tensor following `$`, or -1 if
+ * its data is missing. */
+static int RedisAI_Run_InlineTensorArgc(RedisModuleString **argv, int argc) {
+  long long len = 1;
+  for (int argpos=1; argpos<argc; argpos++) {
+    const char *opt = RedisModule_StringPtrLen(argv[argpos], NULL);
+    if (!strcasecmp(opt, "BLOB")) {
+      return argpos + 1 < argc ? argpos + 2 : -1;
+    }
+    if (!strcasecmp(opt, "VALUES")) {
+      return len < argc - argpos ? argpos + 1 + len : -1;
+    }
+    long long dimension;
+    if (RedisModule_StringToLongLong(argv[argpos], &dimension) != REDISMODULE_OK ||
+        dimension <= 0) {
+      return -1;
+    }
+    // only the number of values matters, which is bounded by argc; len is
+    // at most argc, so checking against argc / len keeps the product from
+    // overflowing
+    len = dimension < argc / len ? len * dimension : argc;
+  }
+  return -1;
+}
+
+/* Parse the inline tensor following `$` into a new tensor. Return the number
+ * of arguments it takes, or -1 after replying with an error on failure. */
+static int RedisAI_Run_ParseInlineTensor(RedisModuleCtx *ctx, RedisModuleString **argv, int argc,
+                                         RAI_Tensor **tensor) {
+  const int tensor_argc = RedisAI_Run_InlineTensorArgc(argv, argc);
+  if (tensor_argc < 0) {
+    RedisModule_ReplyWithError(ctx, "ERR invalid inline tensor");
+    return -1;
+  }
+  if (RAI_ParseTensorSetArgs(ctx, argv, tensor_argc, tensor) != REDISMODULE_OK) {
+    return -1;
+  }
+  return tensor_argc;
+}
+
+/* Report the keys of MODELRUN, MODELRUNMULTI or SCRIPTRUN, the inputs start
+ * at argpos. MODELRUNMULTI repeats INPUTS and OUTPUTS for each sample. With
+ * RETURN the outputs are not written to keys. */
+static int RedisAI_Run_KeyPositions(RedisModuleCtx *ctx, RedisModuleString **argv, int argc,
+                                    int argpos, int return_tensors) {
+  RedisModule_KeyAtPos(ctx, 1);
+  int is_input = 1;
+  for (int i=argpos; i<argc; i++) {
+    const char* arg = RedisModule_StringPtrLen(argv[i], NULL);
+    if (strcasecmp(arg, "INPUTS") == 0) {
+      is_input = 1;
+      continue;
+    }
+    if (strcasecmp(arg, "OUTPUTS") == 0) {
+      is_input = 0;
+      continue;
+    }
+    if (!is_input && return_tensors) {
+      continue;
+    }
+    if (is_input && RedisAI_Run_IsInlineTensor(argv[i])) {
+      const int tensor_argc = RedisAI_Run_InlineTensorArgc(argv+i+1, argc-i-1);
+      if (tensor_argc < 0) {
+        break;
+      }
+      i += tensor_argc;
+      continue;
+    }
+    RedisModule_KeyAtPos(ctx, i);
+  }
+  return REDISMODULE_OK;
+}
+
+size_t RAI_RunInfoBatchSize(struct RedisAI_RunInfo* rinfo) {
+  if (rinfo->mctx == NULL) {
+    return -1;
+  }
+
+  size_t ninputs = RAI_ModelRunCtxNumInputs(rinfo->mctx);
+
+  int batchsize = 0;
+
+  if (ninputs == 0) {
+    return batchsize;
+  }
+
+  for (size_t i=0; i<ninputs; i++) {
+    RAI_Tensor* input = RAI_ModelRunCtxInputTensor(rinfo->mctx, 0, i);
+
+    if (i == 0) {
+      batchsize = RAI_TensorDim(input, 0);
+      continue;
+    }
+
+    if (batchsize != RAI_TensorDim(input, 0)) {
+      batchsize = 0;
+      break;
+    }
+  }
+
+  return batchsize;
+}
+
+int RAI_RunInfoBatchable(struct RedisAI_RunInfo* rinfo1, struct RedisAI_RunInfo* rinfo2) {
+  if (rinfo1->mctx == NULL || rinfo2->mctx == NULL) {
+    return 0;
+  }
+
+  if (rinfo1->mctx->model != rinfo2->mctx->model) {
+    return 0;
+  }
+
+  int ninputs1 = RAI_ModelRunCtxNumInputs(rinfo1->mctx);
+  int ninputs2 = RAI_ModelRunCtxNumInputs(rinfo2->mctx);
+
+  if (ninputs1 != ninputs2) {
+    return 0;
+  }
+
+  for (int i=0; i<ninputs1; i++) {
+    RAI_Tensor* input1 = RAI_ModelRunCtxInputTensor(rinfo1->mctx, 0, i);
+    RAI_Tensor* input2 = RAI_ModelRunCtxInputTensor(rinfo2->mctx, 0, i);
+
+    int ndims1 = RAI_TensorNumDims(input1);
+    int ndims2 = RAI_TensorNumDims(input2);
+
+    if (ndims1 != ndims2) {
+      return 0;
+    }
+
+    if (ndims1 == 0) {
+      continue;
+    }
+
+    for (int j=1; j<ndims1; j++) {
+      int dim1 = RAI_TensorDim(input1, j);
+      int dim2 = RAI_TensorDim(input2, j);
+      if (dim1 != dim2) {
+        return 0;
+      }
+    }
+  }
+
+  return 1;
+}
+
+void *RedisAI_Run_ThreadMain(void *arg) {
+
+  RunQueueInfo* run_queue_info = (RunQueueInfo*)arg;
+
+  pthread_mutex_lock(&run_queue_info->run_queue_mutex);
+  while (true){
+    int rc = pthread_cond_wait(&run_queue_info->queue_condition_var, &run_queue_info->run_queue_mutex);
+
+    long long run_queue_len = queueLength(run_queue_info->run_queue);
+
+    while (run_queue_len > 0) {
+      queueItem **evicted_items = NULL;
+      struct RedisAI_RunInfo **batch_rinfo = NULL;
 
       queueItem *item = queueFront(run_queue_info->run_queue);
 
@@ -497,7 +1267,7 @@ void *RedisAI_Run_ThreadMain(void *arg) {
         array_append(evicted_items, item);
         array_append(batch_rinfo, rinfo);
 
-        if (rinfo->sctx) {
+        if (rinfo->sctx || rinfo->warmup) {
           break;
         }
 
@@ -576,33 +1346,29 @@ void *RedisAI_Run_ThreadMain(void *arg) {
 
 /* ----------------------- RedisAI Module Commands ------------------------- */
 
-/**
- * AI.TENSORSET key type dim1..dimN [BLOB data | VALUES val1..valN]
- */
-int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
-  if (argc < 4) return RedisModule_WrongArity(ctx);
-
-  RedisModuleKey *key;
-  const int status = RAI_OpenKey_Tensor(ctx, argv[1], &key, REDISMODULE_READ|REDISMODULE_WRITE);
-  if(status==REDISMODULE_ERR){
-      return REDISMODULE_ERR;
+/* Parse `type dim1..dimN [BLOB data | VALUES val1..valN]` into a new tensor.
+ * Return REDISMODULE_ERR after replying with an error on failure. */
+int RAI_ParseTensorSetArgs(RedisModuleCtx *ctx, RedisModuleString **argv, int argc, RAI_Tensor **tensor) {
+  if (argc < 2) {
+    RedisModule_WrongArity(ctx);
+    return REDISMODULE_ERR;
   }
 
   // get the tensor datatype
-  const char* typestr = RedisModule_StringPtrLen(argv[2], NULL);
+  const char* typestr = RedisModule_StringPtrLen(argv[0], NULL);
   size_t datasize = RAI_TensorDataSizeFromString(typestr);
   if (!datasize){
-    return RedisModule_ReplyWithError(ctx, "ERR invalid data type");
+    RedisModule_ReplyWithError(ctx, "ERR invalid data type");
+    return REDISMODULE_ERR;
   }
 
-  const char* fmtstr;
   int datafmt = REDISAI_DATA_NONE;
   int tensorAllocMode = TENSORALLOC_CALLOC;
   size_t ndims = 0;
   long long len = 1;
   long long* dims = NULL;
-  size_t argpos = 3;
-  long long remaining_args = argc-1;
+  size_t argpos = 1;
+  long long remaining_args = argc;
 
   for (; argpos <= argc-1; argpos++){
     const char *opt = RedisModule_StringPtrLen(argv[argpos], NULL);
@@ -614,8 +1380,8 @@ int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
       // check right away if the arity is correct
       if (remaining_args != 1 ){
         RedisModule_Free(dims);
-        RedisModule_CloseKey(key);
-        return RedisModule_WrongArity(ctx);
+        RedisModule_WrongArity(ctx);
+        return REDISMODULE_ERR;
       }
       argpos++;
       break;
@@ -627,8 +1393,8 @@ int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
       // check right away if the arity is correct
       if (remaining_args != len ){ 
         RedisModule_Free(dims);
-        RedisModule_CloseKey(key);
-        return RedisModule_WrongArity(ctx);
+        RedisModule_WrongArity(ctx);
+        return REDISMODULE_ERR;
       }
       argpos++;
       break;
@@ -637,9 +1403,8 @@ int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
       const int retval = RedisModule_StringToLongLong(argv[argpos],&dimension);
       if (retval != REDISMODULE_OK || dimension <= 0) {
           RedisModule_Free(dims);
-          RedisModule_CloseKey(key);
-          return RedisModule_ReplyWithError(ctx,
-              "ERR invalid or negative value found in tensor shape");
+          RedisModule_ReplyWithError(ctx, "ERR invalid or negative value found in tensor shape");
+          return REDISMODULE_ERR;
       }
       
       ndims++;
@@ -651,13 +1416,12 @@ int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
 
   const long long nbytes = len * datasize;
   size_t datalen;
-  const char *data;
   DLDataType datatype = RAI_TensorDataTypeFromString(typestr);
   RAI_Tensor *t = RAI_TensorCreateWithDLDataType(datatype, dims, ndims, tensorAllocMode);
   if (!t){
     RedisModule_Free(dims);
-    RedisModule_CloseKey(key);
-    return RedisModule_ReplyWithError(ctx, "ERR could not create tensor");
+    RedisModule_ReplyWithError(ctx, "ERR could not create tensor");
+    return REDISMODULE_ERR;
   }
   size_t i = 0;
   switch (datafmt){
@@ -665,8 +1429,8 @@ int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
       RedisModule_StringPtrLen(argv[argpos],&datalen);
       if (datalen != nbytes){
         RAI_TensorFree(t);
-        RedisModule_CloseKey(key);
-        return RedisModule_ReplyWithError(ctx, "ERR data length does not match tensor shape and type");
+        RedisModule_ReplyWithError(ctx, "ERR data length does not match tensor shape and type");
+        return REDISMODULE_ERR;
       }
       RedisModule_RetainString(NULL,argv[argpos]);
       RAI_TensorSetDataFromRS(t,argv[argpos]);
@@ -678,14 +1442,14 @@ int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
           const int retval = RedisModule_StringToDouble(argv[argpos],&val);
           if (retval != REDISMODULE_OK) {
             RAI_TensorFree(t);
-            RedisModule_CloseKey(key);
-            return RedisModule_ReplyWithError(ctx, "ERR invalid value");
+            RedisModule_ReplyWithError(ctx, "ERR invalid value");
+            return REDISMODULE_ERR;
           }
           const int retset = RAI_TensorSetValueFromDouble(t, i, val);
           if (retset == -1){
             RAI_TensorFree(t);
-            RedisModule_CloseKey(key);
-            return RedisModule_ReplyWithError(ctx, "ERR cannot specify values for this datatype");
+            RedisModule_ReplyWithError(ctx, "ERR cannot specify values for this datatype");
+            return REDISMODULE_ERR;
           }
         }
         else{
@@ -693,14 +1457,14 @@ int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
           const int retval = RedisModule_StringToLongLong(argv[argpos],&val);
           if (retval != REDISMODULE_OK) {
             RAI_TensorFree(t);
-            RedisModule_CloseKey(key);
-            return RedisModule_ReplyWithError(ctx, "ERR invalid value");
+            RedisModule_ReplyWithError(ctx, "ERR invalid value");
+            return REDISMODULE_ERR;
           }
           const int retset = RAI_TensorSetValueFromLongLong(t, i, val);
           if (retset == -1){
             RAI_TensorFree(t);
-            RedisModule_CloseKey(key);
-            return RedisModule_ReplyWithError(ctx, "ERR cannot specify values for this datatype");
+            RedisModule_ReplyWithError(ctx, "ERR cannot specify values for this datatype");
+            return REDISMODULE_ERR;
           }
         }
         i++;
@@ -710,6 +1474,29 @@ int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
       // default does not require tensor data setting since calloc setted it to 0
       break;
   }
+
+  *tensor = t;
+  return REDISMODULE_OK;
+}
+
+/**
+ * AI.TENSORSET key type dim1..dimN [BLOB data | VALUES val1..valN]
+ */
+int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  if (argc < 4) return RedisModule_WrongArity(ctx);
+
+  RedisModuleKey *key;
+  const int status = RAI_OpenKey_Tensor(ctx, argv[1], &key, REDISMODULE_READ|REDISMODULE_WRITE);
+  if(status==REDISMODULE_ERR){
+      return REDISMODULE_ERR;
+  }
+
+  RAI_Tensor *t = NULL;
+  if (RAI_ParseTensorSetArgs(ctx, argv+2, argc-2, &t) != REDISMODULE_OK) {
+    RedisModule_CloseKey(key);
+    return REDISMODULE_ERR;
+  }
+
   if( RedisModule_ModuleTypeSetValue(key, RedisAI_TensorType, t) != REDISMODULE_OK ){
     RAI_TensorFree(t);
     RedisModule_CloseKey(key);
@@ -721,46 +1508,36 @@ int RedisAI_TensorSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
   return REDISMODULE_OK;
 }
 
-/**
-* AI.TENSORGET tensor_key [BLOB | VALUES | META]
-*/
-int RedisAI_TensorGet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
-  if (argc != 3) return RedisModule_WrongArity(ctx);
-
-  RAI_Tensor *t;
-  RedisModuleKey *key;
-  const int status = RAI_GetTensorFromKeyspace(ctx, argv[1], &key, &t, REDISMODULE_READ);
-  if(status==REDISMODULE_ERR){
-      return REDISMODULE_ERR;
-  }
-
-  int datafmt;
-  long long resplen = 2;
-  const char *fmtstr = RedisModule_StringPtrLen(argv[2], NULL);
+/* Parse the BLOB | VALUES | META format of TENSORGET. */
+int RAI_ParseTensorGetFormat(RedisModuleString *fmt, int *datafmt) {
+  const char *fmtstr = RedisModule_StringPtrLen(fmt, NULL);
   if (!strcasecmp(fmtstr, "BLOB")) {
-    datafmt = REDISAI_DATA_BLOB;
-    resplen = 3;
+    *datafmt = REDISAI_DATA_BLOB;
   } else if (!strcasecmp(fmtstr, "VALUES")) {
-    datafmt = REDISAI_DATA_VALUES;
-    resplen = 3;
+    *datafmt = REDISAI_DATA_VALUES;
   } else if (!strcasecmp(fmtstr, "META")) {
-    datafmt = REDISAI_DATA_NONE;
+    *datafmt = REDISAI_DATA_NONE;
   } else {
-    RedisModule_CloseKey(key);
-    return RedisModule_ReplyWithError(ctx, "ERR unsupported data format");
+    return REDISMODULE_ERR;
   }
+  return REDISMODULE_OK;
+}
 
-  const long long ndims = RAI_TensorNumDims(t);
-  
-  RedisModule_ReplyWithArray(ctx, resplen);
-
+/* Reply with the type and shape of a tensor, followed by its data unless
+ * datafmt is REDISAI_DATA_NONE. */
+int RAI_ReplyWithTensor(RedisModuleCtx *ctx, int datafmt, RAI_Tensor *t) {
   char *dtypestr = NULL;
   const int dtypestr_result = Tensor_DataTypeStr(RAI_TensorDataType(t), &dtypestr);
   if(dtypestr_result==REDISMODULE_ERR){
-    RedisModule_CloseKey(key);
     return RedisModule_ReplyWithError(ctx, "ERR unsupported dtype");
   }
+
+  const long long ndims = RAI_TensorNumDims(t);
+
+  RedisModule_ReplyWithArray(ctx, datafmt == REDISAI_DATA_NONE ? 2 : 3);
+
   RedisModule_ReplyWithSimpleString(ctx, dtypestr);
+  RedisModule_Free(dtypestr);
 
   RedisModule_ReplyWithArray(ctx, ndims);
   for (long long i=0; i<ndims; i++) {
@@ -772,15 +1549,9 @@ int RedisAI_TensorGet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
     long long size = RAI_TensorByteSize(t);
     char *data = RAI_TensorData(t);
 
-    int ret = RedisModule_ReplyWithStringBuffer(ctx, data, size);
-
-    if (ret != REDISMODULE_OK) {
-      RedisModule_CloseKey(key);
-      return ret;
-    }
+    return RedisModule_ReplyWithStringBuffer(ctx, data, size);
   }
   else if (datafmt == REDISAI_DATA_VALUES) {
-    long long ndims = RAI_TensorNumDims(t);
     long long len = 1;
     long long i;
     for (i=0; i<ndims; i++) {
@@ -796,7 +1567,6 @@ int RedisAI_TensorGet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
       for (i=0; i<len; i++) {
         int ret = RAI_TensorGetValueAsDouble(t, i, &val);
         if (!ret) {
-          RedisModule_CloseKey(key);
           return RedisModule_ReplyWithError(ctx, "ERR cannot get values for this datatype");
         }
         RedisModule_ReplyWithDouble(ctx, val);
@@ -807,37 +1577,131 @@ int RedisAI_TensorGet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
       for (i=0; i<len; i++) {
         int ret = RAI_TensorGetValueAsLongLong(t, i, &val);
         if (!ret) {
-          RedisModule_CloseKey(key);
           return RedisModule_ReplyWithError(ctx, "ERR cannot get values for this datatype");
         }
         RedisModule_ReplyWithLongLong(ctx, val);
       }
     }
   }
-  RedisModule_CloseKey(key);
 
   return REDISMODULE_OK;
 }
 
 /**
-* AI.MODELSET model_key backend device [TAG tag] [BATCHSIZE n [MINBATCHSIZE m]] [INPUTS name1 name2 ... OUTPUTS name1 name2 ...] model_blob
+* AI.TENSORGET tensor_key [BLOB | VALUES | META]
 */
-int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
-  RedisModule_AutoMemory(ctx);
+int RedisAI_TensorGet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  if (argc != 3) return RedisModule_WrongArity(ctx);
 
-  if (argc < 4) return RedisModule_WrongArity(ctx);
+  RAI_Tensor *t;
+  RedisModuleKey *key;
+  const int status = RAI_GetTensorFromKeyspace(ctx, argv[1], &key, &t, REDISMODULE_READ);
+  if(status==REDISMODULE_ERR){
+      return REDISMODULE_ERR;
+  }
 
-  ArgsCursor ac;
-  ArgsCursor_InitRString(&ac, argv+1, argc-1);
+  int datafmt;
+  if (RAI_ParseTensorGetFormat(argv[2], &datafmt) != REDISMODULE_OK) {
+    RedisModule_CloseKey(key);
+    return RedisModule_ReplyWithError(ctx, "ERR unsupported data format");
+  }
 
-  RedisModuleString* keystr;
-  AC_GetRString(&ac, &keystr, 0);
+  int ret = RAI_ReplyWithTensor(ctx, datafmt, t);
+  RedisModule_CloseKey(key);
 
-  const char* bckstr;
-  int backend;
-  AC_GetString(&ac, &bckstr, NULL, 0); 
-  if (strcasecmp(bckstr, "TF") == 0) {
-    backend = RAI_BACKEND_TENSORFLOW;
+  return ret;
+}
+
+/* Store a model created by MODELSET in its key. Return REDISMODULE_ERR
+ * after replying with an error if the key holds another type, in which case
+ * the model is freed. */
+static int RedisAI_ModelSet_Store(RedisModuleCtx *ctx, RedisModuleString *keystr, RAI_Model *model) {
+  RAI_Error err = {0};
+  RedisModuleKey *key = RedisModule_OpenKey(ctx, keystr,
+      REDISMODULE_READ|REDISMODULE_WRITE);
+  int type = RedisModule_KeyType(key);
+  if (type != REDISMODULE_KEYTYPE_EMPTY &&
+      !(type == REDISMODULE_KEYTYPE_MODULE &&
+        RedisModule_ModuleTypeGetType(key) == RedisAI_ModelType)) {
+    RedisModule_CloseKey(key);
+    RAI_ModelFree(model, &err);
+    RAI_ClearError(&err);
+    RedisModule_ReplyWithError(ctx, REDISMODULE_ERRORMSG_WRONGTYPE);
+    return REDISMODULE_ERR;
+  }
+
+  // Swap the new version in. Runs queued against the previous one hold a
+  // reference to it, so it is only released once the last of them is done.
+  if (type == REDISMODULE_KEYTYPE_MODULE) {
+    RAI_Model *prev = RedisModule_ModuleTypeGetValue(key);
+    model->version = prev->version + 1;
+  }
+
+  RedisModule_ModuleTypeSetValue(key, RedisAI_ModelType, model);
+
+  model->infokey = RAI_AddStatsEntry(ctx, keystr, RAI_MODEL, model->backend, model->devicestr, model->tag);
+
+  RAI_ModelTouchSession(model);
+  RAI_ModelEvictSessions(ctx);
+
+  RedisModule_CloseKey(key);
+
+  return REDISMODULE_OK;
+}
+
+/* Store a model once its WARMUP runs completed on the run queue. The key
+ * is looked up again, as it may have been set meanwhile. */
+int RedisAI_ModelSet_Reply(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  struct RedisAI_RunInfo *rinfo = RedisModule_GetBlockedClientPrivateData(ctx);
+
+  if (rinfo->err->code != RAI_OK) {
+    return RedisModule_ReplyWithError(ctx, rinfo->err->detail_oneline);
+  }
+
+  RAI_Model *model = rinfo->warmup;
+  // stored or freed by RedisAI_ModelSet_Store, either way no longer ours
+  rinfo->warmup = NULL;
+  if (RedisAI_ModelSet_Store(ctx, argv[1], model) != REDISMODULE_OK) {
+    return REDISMODULE_OK;
+  }
+
+  RedisModule_ReplyWithSimpleString(ctx, "OK");
+
+  RedisModule_Replicate(ctx, "AI.MODELSET", "v", argv+1, (size_t)argc-1);
+
+  return REDISMODULE_OK;
+}
+
+/* Also called when the client disconnected before the warm-up completed,
+ * in which case the model is not stored. */
+void RedisAI_ModelSet_FreeData(RedisModuleCtx *ctx, void *privdata) {
+  RedisAI_FreeRunInfo(ctx, privdata);
+}
+
+/**
+* AI.MODELSET model_key backend device [TAG tag] [BATCHSIZE n [MINBATCHSIZE m]]
+*             [OPTLEVEL DISABLE|BASIC|EXTENDED|ALL] [EXECMODE SEQUENTIAL|PARALLEL]
+*             [MEMPATTERN ON|OFF] [CPUARENA ON|OFF] [THREADS n] [XNNPACK ON|OFF] [OPTIMIZE]
+*             [REPLICATE BLOB|NONE|COMMAND] [CACHE maxbytes [TTL ms]]
+*             [WARMUP n] [SHAPE type dim1 dim2 ...]
+*             [INPUTS name1 name2 ... OUTPUTS name1 name2 ...] model_blob
+*/
+int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  RedisModule_AutoMemory(ctx);
+
+  if (argc < 4) return RedisModule_WrongArity(ctx);
+
+  ArgsCursor ac;
+  ArgsCursor_InitRString(&ac, argv+1, argc-1);
+
+  RedisModuleString* keystr;
+  AC_GetRString(&ac, &keystr, 0);
+
+  const char* bckstr;
+  int backend;
+  AC_GetString(&ac, &bckstr, NULL, 0); 
+  if (strcasecmp(bckstr, "TF") == 0) {
+    backend = RAI_BACKEND_TENSORFLOW;
   }
   else if (strcasecmp(bckstr, "TFLITE") == 0) {
     backend = RAI_BACKEND_TFLITE;
@@ -866,9 +1730,6 @@ int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
 
   unsigned long long batchsize = 0;
   if (AC_AdvanceIfMatch(&ac, "BATCHSIZE")) {
-    if (backend == RAI_BACKEND_TFLITE) {
-      return RedisModule_ReplyWithError(ctx, "ERR Auto-batching not supported by the TFLITE backend");
-    }
     if (AC_GetUnsignedLongLong(&ac, &batchsize, 0) != AC_OK) {
       return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for BATCHSIZE");
     }
@@ -876,16 +1737,144 @@ int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
 
   unsigned long long minbatchsize = 0;
   if (AC_AdvanceIfMatch(&ac, "MINBATCHSIZE")) {
-    if (batchsize == 0) {
-      return RedisModule_ReplyWithError(ctx, "ERR MINBATCHSIZE specified without BATCHSIZE");
-    }
     if (AC_GetUnsignedLongLong(&ac, &minbatchsize, 0) != AC_OK) {
       return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for MINBATCHSIZE");
     }
+    if (batchsize == 0 && minbatchsize > 0) {
+      return RedisModule_ReplyWithError(ctx, "ERR MINBATCHSIZE specified without BATCHSIZE");
+    }
+  }
+
+  RAI_OptLevel optlevel = RAI_OPTLEVEL_DEFAULT;
+  if (AC_AdvanceIfMatch(&ac, "OPTLEVEL")) {
+    const char* optlevelstr;
+    if (AC_GetString(&ac, &optlevelstr, NULL, 0) != AC_OK ||
+        RAI_OptLevelFromString(optlevelstr, &optlevel) != REDISMODULE_OK) {
+      return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for OPTLEVEL");
+    }
+  }
+
+  RAI_ExecMode execmode = RAI_EXECMODE_DEFAULT;
+  if (AC_AdvanceIfMatch(&ac, "EXECMODE")) {
+    const char* execmodestr;
+    if (AC_GetString(&ac, &execmodestr, NULL, 0) != AC_OK ||
+        RAI_ExecModeFromString(execmodestr, &execmode) != REDISMODULE_OK) {
+      return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for EXECMODE");
+    }
+  }
+
+  RAI_Switch mempattern = RAI_SWITCH_DEFAULT;
+  if (AC_AdvanceIfMatch(&ac, "MEMPATTERN")) {
+    const char* mempatternstr;
+    if (AC_GetString(&ac, &mempatternstr, NULL, 0) != AC_OK ||
+        RAI_SwitchFromString(mempatternstr, &mempattern) != REDISMODULE_OK) {
+      return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for MEMPATTERN");
+    }
+  }
+
+  RAI_Switch cpuarena = RAI_SWITCH_DEFAULT;
+  if (AC_AdvanceIfMatch(&ac, "CPUARENA")) {
+    const char* cpuarenastr;
+    if (AC_GetString(&ac, &cpuarenastr, NULL, 0) != AC_OK ||
+        RAI_SwitchFromString(cpuarenastr, &cpuarena) != REDISMODULE_OK) {
+      return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for CPUARENA");
+    }
+  }
+
+  if (backend != RAI_BACKEND_ONNXRUNTIME &&
+      (optlevel != RAI_OPTLEVEL_DEFAULT || execmode != RAI_EXECMODE_DEFAULT ||
+       mempattern != RAI_SWITCH_DEFAULT || cpuarena != RAI_SWITCH_DEFAULT)) {
+    return RedisModule_ReplyWithError(ctx, "ERR Session options only supported by the ONNX backend");
+  }
+
+  long long threads = 0;
+  if (AC_AdvanceIfMatch(&ac, "THREADS")) {
+    if (AC_GetLongLong(&ac, &threads, AC_F_GE1) != AC_OK) {
+      return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for THREADS");
+    }
+  }
+
+  RAI_Switch xnnpack = RAI_SWITCH_DEFAULT;
+  if (AC_AdvanceIfMatch(&ac, "XNNPACK")) {
+    const char* xnnpackstr;
+    if (AC_GetString(&ac, &xnnpackstr, NULL, 0) != AC_OK ||
+        RAI_SwitchFromString(xnnpackstr, &xnnpack) != REDISMODULE_OK) {
+      return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for XNNPACK");
+    }
+  }
+
+  if (backend != RAI_BACKEND_TFLITE && (threads != 0 || xnnpack != RAI_SWITCH_DEFAULT)) {
+    return RedisModule_ReplyWithError(ctx, "ERR Interpreter options only supported by the TFLITE backend");
+  }
+
+  int optimize = 0;
+  if (AC_AdvanceIfMatch(&ac, "OPTIMIZE")) {
+    if (backend != RAI_BACKEND_TORCH) {
+      return RedisModule_ReplyWithError(ctx, "ERR OPTIMIZE only supported by the TORCH backend");
+    }
+    optimize = 1;
+  }
+
+  RAI_Replicate replicate = RAI_REPLICATE_BLOB;
+  if (AC_AdvanceIfMatch(&ac, "REPLICATE")) {
+    const char* replicatestr;
+    if (AC_GetString(&ac, &replicatestr, NULL, 0) != AC_OK ||
+        RAI_ReplicateFromString(replicatestr, &replicate) != REDISMODULE_OK) {
+      return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for REPLICATE");
+    }
+  }
+
+  unsigned long long cachesize = 0;
+  long long cachettl = 0;
+  if (AC_AdvanceIfMatch(&ac, "CACHE")) {
+    if (AC_GetUnsignedLongLong(&ac, &cachesize, AC_F_GE1) != AC_OK) {
+      return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for CACHE");
+    }
+    if (AC_AdvanceIfMatch(&ac, "TTL")) {
+      if (AC_GetLongLong(&ac, &cachettl, AC_F_GE1) != AC_OK) {
+        return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for TTL");
+      }
+    }
+  }
+
+  unsigned long long warmup = 0;
+  if (AC_AdvanceIfMatch(&ac, "WARMUP")) {
+    if (AC_GetUnsignedLongLong(&ac, &warmup, 0) != AC_OK) {
+      return RedisModule_ReplyWithError(ctx, "ERR Invalid argument for WARMUP");
+    }
+  }
+
+  RAI_ModelInputShape* inputshapes = NULL;
+  while (AC_AdvanceIfMatch(&ac, "SHAPE")) {
+    const char* typestr;
+    if (AC_GetString(&ac, &typestr, NULL, 0) != AC_OK ||
+        RAI_TensorDataSizeFromString(typestr) == 0) {
+      RAI_ModelFreeInputShapes(inputshapes);
+      return RedisModule_ReplyWithError(ctx, "ERR invalid data type for SHAPE");
+    }
+    RAI_ModelInputShape shape = {
+      .dtype = RAI_TensorDataTypeFromString(typestr),
+      .dims = array_new(long long, 4)
+    };
+    long long dim;
+    // the model blob always follows the dimensions
+    while (AC_NumRemaining(&ac) > 1 && AC_GetLongLong(&ac, &dim, AC_F_GE1) == AC_OK) {
+      shape.dims = array_append(shape.dims, dim);
+    }
+    if (array_len(shape.dims) == 0) {
+      array_free(shape.dims);
+      RAI_ModelFreeInputShapes(inputshapes);
+      return RedisModule_ReplyWithError(ctx, "ERR SHAPE requires at least one dimension");
+    }
+    if (inputshapes == NULL) {
+      inputshapes = array_new(RAI_ModelInputShape, 1);
+    }
+    inputshapes = array_append(inputshapes, shape);
   }
 
 
   if (AC_IsAtEnd(&ac)) {
+    RAI_ModelFreeInputShapes(inputshapes);
     return RedisModule_ReplyWithError(ctx, "ERR Insufficient arguments, missing model BLOB");
   }
 
@@ -893,6 +1882,7 @@ int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
   AC_GetSliceToOffset(&ac, &optionsac, argc-2);
 
   if (optionsac.argc == 0 && backend == RAI_BACKEND_TENSORFLOW) {
+    RAI_ModelFreeInputShapes(inputshapes);
     return RedisModule_ReplyWithError(ctx, "ERR Insufficient arguments, INPUTS and OUTPUTS not specified");
   }
 
@@ -900,6 +1890,7 @@ int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
   ArgsCursor outac = {0};
   if (optionsac.argc > 0) {
     if (!AC_AdvanceIfMatch(&optionsac, "INPUTS")) {
+      RAI_ModelFreeInputShapes(inputshapes);
       return RedisModule_ReplyWithError(ctx, "ERR INPUTS not specified");
     }
 
@@ -908,6 +1899,7 @@ int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
 
     if (!AC_IsAtEnd(&optionsac)) {
       if (!AC_AdvanceIfMatch(&optionsac, "OUTPUTS")) {
+        RAI_ModelFreeInputShapes(inputshapes);
         return RedisModule_ReplyWithError(ctx, "ERR OUTPUTS not specified");
       }
 
@@ -929,7 +1921,17 @@ int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
 
   RAI_ModelOpts opts = {
     .batchsize = batchsize,
-    .minbatchsize = minbatchsize
+    .minbatchsize = minbatchsize,
+    .optlevel = optlevel,
+    .execmode = execmode,
+    .mempattern = mempattern,
+    .cpuarena = cpuarena,
+    .threads = threads,
+    .xnnpack = xnnpack,
+    .optimize = optimize,
+    .replicate = replicate,
+    .cachesize = cachesize,
+    .cachettl = cachettl
   };
 
   RAI_Model *model = NULL;
@@ -949,6 +1951,7 @@ int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
       RedisModule_Log(ctx, "error", "could not load %s default backend\n", bckstr);
       int ret = RedisModule_ReplyWithError(ctx, "ERR Could not load backend");
       RAI_ClearError(&err);
+      RAI_ModelFreeInputShapes(inputshapes);
       return ret;
     }
     RAI_ClearError(&err);
@@ -961,9 +1964,12 @@ int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
     #endif
     int ret = RedisModule_ReplyWithError(ctx, err.detail_oneline);
     RAI_ClearError(&err);
+    RAI_ModelFreeInputShapes(inputshapes);
     return ret;
   }
 
+  model->inputshapes = inputshapes;
+
   // TODO: if backend loaded, make sure there's a queue
 
   if (ensureRunQueue(devicestr) == REDISMODULE_ERR) {
@@ -997,12 +2003,40 @@ int RedisAI_ModelSet_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
     }
     return RedisModule_ReplyWithError(ctx, REDISMODULE_ERRORMSG_WRONGTYPE);
   }
+  RedisModule_CloseKey(key);
 
-  RedisModule_ModuleTypeSetValue(key, RedisAI_ModelType, model);
+  if (warmup > 0) {
+    // Clients that can't be blocked, and commands received from the master
+    // or loaded from the AOF, warm up on the main thread
+    const int flags = RedisModule_GetContextFlags(ctx);
+    if (flags & (REDISMODULE_CTX_FLAGS_LUA|REDISMODULE_CTX_FLAGS_MULTI|
+                 REDISMODULE_CTX_FLAGS_REPLICATED|REDISMODULE_CTX_FLAGS_LOADING)) {
+      if (RAI_ModelWarmup(model, warmup, &err) != REDISMODULE_OK) {
+        int ret = RedisModule_ReplyWithError(ctx, err.detail_oneline);
+        RAI_ClearError(&err);
+        RAI_ModelFree(model, &err);
+        RAI_ClearError(&err);
+        return ret;
+      }
+    }
+    else {
+      struct RedisAI_RunInfo *rinfo = RedisModule_Calloc(1, sizeof(struct RedisAI_RunInfo));
+      rinfo->warmup = model;
+      rinfo->warmup_runs = warmup;
+      rinfo->client = RedisModule_BlockClient(ctx, RedisAI_ModelSet_Reply, NULL, RedisAI_ModelSet_FreeData, 0);
 
-  model->infokey = RAI_AddStatsEntry(ctx, keystr, RAI_MODEL, backend, devicestr, tag);
+      RunQueueInfo *run_queue_info = AI_dictGetVal(AI_dictFind(run_queues, devicestr));
+      pthread_mutex_lock(&run_queue_info->run_queue_mutex);
+      queuePush(run_queue_info->run_queue, rinfo);
+      pthread_cond_signal(&run_queue_info->queue_condition_var);
+      pthread_mutex_unlock(&run_queue_info->run_queue_mutex);
+      return REDISMODULE_OK;
+    }
+  }
 
-  RedisModule_CloseKey(key);
+  if (RedisAI_ModelSet_Store(ctx, keystr, model) != REDISMODULE_OK) {
+    return REDISMODULE_OK;
+  }
 
   RedisModule_ReplyWithSimpleString(ctx, "OK");
 
@@ -1125,44 +2159,14 @@ int RedisAI_ModelList_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
   return REDISMODULE_OK;
 }
 
-/**
- * AI.MODELRUN model_key INPUTS input_key1 ... OUTPUTS output_key1 ...
- *
- * The request is queued and evaded asynchronously from a separate thread. The
- * client blocks until the computation finishes.
- *
- * 1. clone inputs as needed in the main thread (only the alternative is to
- * lock)
- * 2. spawn the new thread for running the model
- * 3. have reply callback put the data back into the key
- * 
- * This way we avoid any race condition. The only gotcha is making sure no one
- * overwrites the model until it's done computing.
- * This means that setModel will decode on a candidate pointer, and will then
- * be picked up on the next round. We also need to signal when it's time to
- * dispose of the old model. The key is having a single thread looping
- * forexecution
- */
-int RedisAI_ModelRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
-                                  int argc) {
-  if (argc < 3) return RedisModule_WrongArity(ctx);
-
-  RAI_Model *mto;
-  RedisModuleKey *modelKey;
-  const int status = RAI_GetModelFromKeyspace(ctx, argv[1], &modelKey, &mto, REDISMODULE_READ);
-  if(status==REDISMODULE_ERR){
-      return REDISMODULE_ERR;
-  }
-
-  const char *inputstr = RedisModule_StringPtrLen(argv[2], NULL);
-  if (strcasecmp(inputstr, "INPUTS")) {
-    RedisModule_CloseKey(modelKey);
-    return RedisModule_ReplyWithError(ctx, "ERR INPUTS not specified");
-  }
-
+/* Create a run of the model on `input_key1 ... OUTPUTS output_key1 ...`,
+ * the arguments following INPUTS. Return NULL after replying with an error
+ * on failure. */
+static struct RedisAI_RunInfo *RedisAI_ModelRun_CreateRunInfo(RedisModuleCtx *ctx, RedisModuleString *runkey,
+                                                              RAI_Model *mto, RedisModuleString **argv, int argc) {
   struct RedisAI_RunInfo *rinfo = RedisModule_Calloc(1, sizeof(struct RedisAI_RunInfo));
-  RedisModule_RetainString(NULL, argv[1]);
-  rinfo->runkey = argv[1];
+  RedisModule_RetainString(NULL, runkey);
+  rinfo->runkey = runkey;
   rinfo->mctx = RAI_ModelRunCtxCreate(mto);
   rinfo->sctx = NULL;
   rinfo->outkeys = NULL;
@@ -1176,7 +2180,7 @@ int RedisAI_ModelRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
   size_t noutputs = 0;
   int outputs_flag_count = 0;
 
-  for (size_t argpos = 3; argpos <= argc - 1; argpos++) {
+  for (int argpos = 0; argpos <= argc - 1; argpos++) {
     const char *arg_string = RedisModule_StringPtrLen(argv[argpos], NULL);
     if (!strcasecmp(arg_string, "OUTPUTS") && outputs_flag_count == 0) {
       is_input = 1;
@@ -1186,7 +2190,44 @@ int RedisAI_ModelRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
         rinfo->outkeys =
           RedisModule_Calloc(expected_noutputs, sizeof(RedisModuleString *));
       }
+    } else if (is_input == 0 && RedisAI_Run_IsInlineTensor(argv[argpos])) {
+      if (mto->inputs && ninputs >= array_len(mto->inputs)) {
+        RedisAI_FreeRunInfo(ctx, rinfo);
+        RedisModule_ReplyWithError(ctx, "Number of names given as INPUTS during MODELSET and keys given as INPUTS here do not match");
+        return NULL;
+      }
+      RAI_Tensor *inputTensor;
+      const int tensor_argc =
+        RedisAI_Run_ParseInlineTensor(ctx, argv+argpos+1, argc-argpos-1, &inputTensor);
+      if (tensor_argc < 0) {
+        RedisAI_FreeRunInfo(ctx, rinfo);
+        return NULL;
+      }
+      const char *opname = NULL;
+      if (mto->inputs) {
+        opname = mto->inputs[ninputs];
+      }
+      // the run context holds the only reference to the tensor
+      const int added = RAI_ModelRunCtxAddInput(rinfo->mctx, 0, opname, inputTensor);
+      RAI_TensorFree(inputTensor);
+      if (!added) {
+        RedisAI_FreeRunInfo(ctx, rinfo);
+        RedisModule_ReplyWithError(ctx, "ERR Input key not found");
+        return NULL;
+      }
+      ninputs++;
+      argpos += tensor_argc;
     } else {
+      if (is_input == 0 && mto->inputs && ninputs >= array_len(mto->inputs)) {
+        RedisAI_FreeRunInfo(ctx, rinfo);
+        RedisModule_ReplyWithError(ctx, "Number of names given as INPUTS during MODELSET and keys given as INPUTS here do not match");
+        return NULL;
+      }
+      if (is_input == 1 && mto->outputs && noutputs >= array_len(mto->outputs)) {
+        RedisAI_FreeRunInfo(ctx, rinfo);
+        RedisModule_ReplyWithError(ctx, "Number of names given as OUTPUTS during MODELSET and keys given as OUTPUTS here do not match");
+        return NULL;
+      }
       RedisModule_RetainString(NULL, argv[argpos]);
       if (is_input == 0) {
         RAI_Tensor *inputTensor;
@@ -1194,9 +2235,8 @@ int RedisAI_ModelRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
         const int status = RAI_GetTensorFromKeyspace(
             ctx, argv[argpos], &tensorKey, &inputTensor, REDISMODULE_READ);
         if (status == REDISMODULE_ERR) {
-          // TODO: free rinfo
-          RedisModule_CloseKey(modelKey);
-          return REDISMODULE_ERR;
+          RedisAI_FreeRunInfo(ctx, rinfo);
+          return NULL;
         }
         RedisModule_CloseKey(tensorKey);
         // Opname here is passed without copying
@@ -1205,8 +2245,9 @@ int RedisAI_ModelRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
           opname = mto->inputs[ninputs];
         }
         if (!RAI_ModelRunCtxAddInput(rinfo->mctx, 0, opname, inputTensor)) {
-          // todo free rinfo
-          return RedisModule_ReplyWithError(ctx, "ERR Input key not found");
+          RedisAI_FreeRunInfo(ctx, rinfo);
+          RedisModule_ReplyWithError(ctx, "ERR Input key not found");
+          return NULL;
         }
         ninputs++;
       } else {
@@ -1216,8 +2257,9 @@ int RedisAI_ModelRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
           opname = mto->outputs[noutputs];
         }
         if (!RAI_ModelRunCtxAddOutput(rinfo->mctx, 0, opname)) {
-          // todo free rinfo
-          return RedisModule_ReplyWithError(ctx, "ERR Output key not found");
+          RedisAI_FreeRunInfo(ctx, rinfo);
+          RedisModule_ReplyWithError(ctx, "ERR Output key not found");
+          return NULL;
         }
         rinfo->outkeys[noutputs] = argv[argpos];
         noutputs++;
@@ -1226,85 +2268,445 @@ int RedisAI_ModelRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv,
   }
 
   if (mto->inputs && array_len(mto->inputs) != ninputs) {
-    return RedisModule_ReplyWithError(
+    RedisAI_FreeRunInfo(ctx, rinfo);
+    RedisModule_ReplyWithError(
         ctx,
         "Number of names given as INPUTS during MODELSET and keys given as INPUTS here do not match");
+    return NULL;
   }
 
   if (mto->outputs && array_len(mto->outputs) != noutputs) {
-    return RedisModule_ReplyWithError(
+    RedisAI_FreeRunInfo(ctx, rinfo);
+    RedisModule_ReplyWithError(
         ctx,
         "Number of names given as OUTPUTS during MODELSET and keys given as OUTPUTS here do not match");
+    return NULL;
   }
 
-  AI_dictEntry *entry = AI_dictFind(run_queues, mto->devicestr);
-  RunQueueInfo *run_queue_info = NULL;
-  if (!entry) {
-    // If the queue does not exist, initialize it
-    if (ensureRunQueue(mto->devicestr) == REDISMODULE_ERR) {
-      return RedisModule_ReplyWithError(ctx, "ERR Queue not initialized for device");
-    }
-    entry = AI_dictFind(run_queues, mto->devicestr);
-    run_queue_info = AI_dictGetVal(entry);
-  } else {
-    run_queue_info = AI_dictGetVal(entry);
-  }
+  return rinfo;
+}
 
-  rinfo->client = RedisModule_BlockClient(ctx, RedisAI_Run_Reply, NULL, RedisAI_FreeData, 0);
-  // RedisModule_SetDisconnectCallback(rinfo->client, RedisAI_Disconnected);
+/* Look the inputs of a run up in the cache of its model. On a hit, set the
+ * outputs of the run and return 1. Otherwise the run is marked to fill the
+ * cache when it completes. */
+static int RedisAI_ModelRun_GetCachedOutputs(struct RedisAI_RunInfo *rinfo) {
+  RAI_Model *mto = rinfo->mctx->model;
+  if (!mto->cache) {
+    return 0;
+  }
 
-  pthread_mutex_lock(&run_queue_info->run_queue_mutex);
-  queuePush(run_queue_info->run_queue, rinfo);
-  pthread_cond_signal(&run_queue_info->queue_condition_var);
-  pthread_mutex_unlock(&run_queue_info->run_queue_mutex);
+  const size_t ninputs = RAI_ModelRunCtxNumInputs(rinfo->mctx);
+  const size_t noutputs = RAI_ModelRunCtxNumOutputs(rinfo->mctx);
+  RAI_Tensor *inputs[ninputs];
+  for (size_t i=0; i<ninputs; i++) {
+    inputs[i] = RAI_ModelRunCtxInputTensor(rinfo->mctx, 0, i);
+  }
+  rinfo->cachekey = RAI_RunCacheKey(mto->version, inputs, ninputs);
+  rinfo->cacheable = 1;
 
-  return REDISMODULE_OK;
+  RAI_Tensor **cached = RAI_RunCacheGet(mto->cache, rinfo->cachekey, inputs, ninputs, noutputs);
+  if (cached == NULL) {
+    return 0;
+  }
+  for (size_t i=0; i<noutputs; i++) {
+    rinfo->mctx->batches[0].outputs[i].tensor = RAI_TensorGetShallowCopy(cached[i]);
+  }
+  rinfo->cacheable = 0;
+  return 1;
 }
 
-/** 
-* AI.SCRIPTRUN script_key fn_name INPUTS input_key1 ... OUTPUTS output_key1 ...
-*/
-int RedisAI_ScriptRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
-  if (argc < 4) return RedisModule_WrongArity(ctx);
+/**
+ * AI.MODELRUN model_key [NOREPLICATE] [RETURN BLOB|VALUES] INPUTS input_key1 ...
+ *             OUTPUTS output_key1 ...
+ *
+ * The request is queued and evaded asynchronously from a separate thread. The
+ * client blocks until the computation finishes.
+ *
+ * 1. clone inputs as needed in the main thread (only the alternative is to
+ * lock)
+ * 2. spawn the new thread for running the model
+ * 3. have reply callback put the data back into the key
+ * 
+ * This way we avoid any race condition. The only gotcha is making sure no one
+ * overwrites the model until it's done computing.
+ * This means that setModel will decode on a candidate pointer, and will then
+ * be picked up on the next round. We also need to signal when it's time to
+ * dispose of the old model. The key is having a single thread looping
+ * forexecution
+ *
+ * With readonly set (AI.MODELRUN_RO), outputs are always returned as with
+ * RETURN, so that the command can be served by replicas.
+ */
+static int RedisAI_ModelRun_Common(RedisModuleCtx *ctx, RedisModuleString **argv,
+                                   int argc, int readonly) {
+  const int async = RedisAI_ParseRunAsync(argv, &argc);
 
-  if (RedisModule_IsKeysPositionRequest(ctx)) {
-    RedisModule_KeyAtPos(ctx, 1);
-    for (int i=3; i<argc; i++) {
-      const char* arg = RedisModule_StringPtrLen(argv[i], NULL);
-      if (strcasecmp(arg, "INPUTS") == 0 || strcasecmp(arg, "OUTPUTS") == 0) {
-        continue;
-      }
-      RedisModule_KeyAtPos(ctx, i);
-    }
-    return REDISMODULE_OK;
+  const int noreplicate = argc > 2 &&
+    !strcasecmp(RedisModule_StringPtrLen(argv[2], NULL), "NOREPLICATE");
+
+  int argpos = 2 + noreplicate;
+  int datafmt = REDISAI_DATA_NONE;
+  int return_tensors = RedisAI_ParseRunReturn(argv, argc, &argpos, &datafmt);
+  if (readonly && return_tensors == 0) {
+    return_tensors = 1;
+    datafmt = REDISAI_DATA_BLOB;
   }
 
-  RedisModule_AutoMemory(ctx);
+  if (RedisModule_IsKeysPositionRequest(ctx)) {
+    return RedisAI_Run_KeyPositions(ctx, argv, argc, argpos + 1, return_tensors);
+  }
 
-  ArgsCursor ac;
-  ArgsCursor_InitRString(&ac, argv+1, argc-1);
+  if (return_tensors < 0) {
+    return RedisModule_ReplyWithError(ctx, "ERR unsupported data format for RETURN");
+  }
 
-  RedisModuleString* keystr;
-  AC_GetRString(&ac, &keystr, 0);
+  if (argc < argpos + 1) return RedisModule_WrongArity(ctx);
 
-  RAI_Script *sto;
-  RedisModuleKey *key;
-  const int status = RAI_GetScriptFromKeyspace(ctx, argv[1], &key, &sto, REDISMODULE_READ);
+  RAI_Model *mto;
+  RedisModuleKey *modelKey;
+  const int status = RAI_GetModelFromKeyspace(ctx, argv[1], &modelKey, &mto, REDISMODULE_READ);
   if(status==REDISMODULE_ERR){
       return REDISMODULE_ERR;
   }
 
-  const char* fnname;
-  AC_GetString(&ac, &fnname, NULL, 0); 
+  const char *inputstr = RedisModule_StringPtrLen(argv[argpos], NULL);
+  if (strcasecmp(inputstr, "INPUTS")) {
+    RedisModule_CloseKey(modelKey);
+    return RedisModule_ReplyWithError(ctx, "ERR INPUTS not specified");
+  }
 
-  ArgsCursor inac = {0};
-  ArgsCursor outac = {0};
+  // Models loaded lazily are compiled on the worker thread, but the backend
+  // library has to be loaded from the main thread
+  if (RAI_EnsureBackendLoaded(ctx, mto->backend) == REDISMODULE_ERR) {
+    RedisModule_CloseKey(modelKey);
+    return RedisModule_ReplyWithError(ctx, "ERR Could not load backend");
+  }
 
-  if (!AC_AdvanceIfMatch(&ac, "INPUTS")) {
-    return RedisModule_ReplyWithError(ctx, "INPUTS not specified");
+  struct RedisAI_RunInfo *rinfo =
+    RedisAI_ModelRun_CreateRunInfo(ctx, argv[1], mto, argv+argpos+1, argc-argpos-1);
+  if (rinfo == NULL) {
+    RedisModule_CloseKey(modelKey);
+    return REDISMODULE_ERR;
   }
 
-  const char* matches[] = {"OUTPUTS"};
+  // The run holds a reference to the model, so its session is not evicted
+  // before the run completes
+  RAI_ModelTouchSession(mto);
+  RAI_ModelEvictSessions(ctx);
+
+  rinfo->return_tensors = return_tensors;
+  rinfo->datafmt = datafmt;
+  rinfo->replicate_outputs = !noreplicate && mto->opts.replicate == RAI_REPLICATE_BLOB;
+
+  const size_t ninputs = RAI_ModelRunCtxNumInputs(rinfo->mctx);
+  const size_t noutputs = RAI_ModelRunCtxNumOutputs(rinfo->mctx);
+
+  // Replicas run the model on the inputs replicated so far, which are the
+  // ones the run was given
+  const int replicate_command =
+    !noreplicate && !return_tensors && mto->opts.replicate == RAI_REPLICATE_COMMAND;
+
+  if (RedisAI_ModelRun_GetCachedOutputs(rinfo)) {
+    if (replicate_command) {
+      RedisModule_ReplicateVerbatim(ctx);
+    }
+    if (async) {
+      const long long ticket = RedisAI_AsyncRunCreate(ctx, rinfo);
+      RedisAI_Run_StoreOutputs(ctx, rinfo);
+      RedisAI_AsyncRunComplete(ctx, rinfo);
+      return RedisModule_ReplyWithLongLong(ctx, ticket);
+    }
+    return RedisAI_Run_ReplyWithOutputs(ctx, rinfo);
+  }
+
+  AI_dictEntry *entry = AI_dictFind(run_queues, mto->devicestr);
+  RunQueueInfo *run_queue_info = NULL;
+  if (!entry) {
+    // If the queue does not exist, initialize it
+    if (ensureRunQueue(mto->devicestr) == REDISMODULE_ERR) {
+      return RedisModule_ReplyWithError(ctx, "ERR Queue not initialized for device");
+    }
+    entry = AI_dictFind(run_queues, mto->devicestr);
+    run_queue_info = AI_dictGetVal(entry);
+  } else {
+    run_queue_info = AI_dictGetVal(entry);
+  }
+
+  // Identical requests already queued are run once, unless the model waits
+  // for MINBATCHSIZE requests to fill its batches. Models and input tensors
+  // are referenced by the queued request, so their addresses identify them
+  // until it is dequeued. ASYNC requests have no client to wait with.
+  if (mto->opts.minbatchsize == 0 && !async) {
+    char pendingkey[32 * (ninputs + 2)];
+    int len = snprintf(pendingkey, sizeof(pendingkey), "%p:%zu", (void*)mto, noutputs);
+    for (size_t i=0; i<ninputs; i++) {
+      len += snprintf(pendingkey + len, sizeof(pendingkey) - len, ":%p",
+                      (void*)RAI_ModelRunCtxInputTensor(rinfo->mctx, 0, i));
+    }
+
+    pthread_mutex_lock(&pending_runs_mutex);
+    AI_dictEntry *pending = AI_dictFind(pending_runs, pendingkey);
+    if (pending) {
+      struct RedisAI_RunInfo *leader = AI_dictGetVal(pending);
+      rinfo->client = RedisModule_BlockClient(ctx, RedisAI_Run_Reply, NULL, RedisAI_FreeData, 0);
+      // the request it waits on fills the cache
+      rinfo->cacheable = 0;
+      if (leader->followers == NULL) {
+        leader->followers = array_new(struct RedisAI_RunInfo*, 1);
+      }
+      leader->followers = array_append(leader->followers, rinfo);
+      pthread_mutex_unlock(&pending_runs_mutex);
+
+      mto->coalesced++;
+      if (replicate_command) {
+        RedisModule_ReplicateVerbatim(ctx);
+      }
+      return REDISMODULE_OK;
+    }
+    AI_dictAdd(pending_runs, pendingkey, rinfo);
+    pthread_mutex_unlock(&pending_runs_mutex);
+    rinfo->pendingkey = RedisModule_Strdup(pendingkey);
+  }
+
+  long long ticket = 0;
+  if (async) {
+    ticket = RedisAI_AsyncRunCreate(ctx, rinfo);
+  }
+  else {
+    rinfo->client = RedisModule_BlockClient(ctx, RedisAI_Run_Reply, NULL, RedisAI_FreeData, 0);
+    // RedisModule_SetDisconnectCallback(rinfo->client, RedisAI_Disconnected);
+  }
+
+  pthread_mutex_lock(&run_queue_info->run_queue_mutex);
+  queuePush(run_queue_info->run_queue, rinfo);
+  pthread_cond_signal(&run_queue_info->queue_condition_var);
+  pthread_mutex_unlock(&run_queue_info->run_queue_mutex);
+
+  if (replicate_command) {
+    RedisModule_ReplicateVerbatim(ctx);
+  }
+
+  if (async) {
+    return RedisModule_ReplyWithLongLong(ctx, ticket);
+  }
+  return REDISMODULE_OK;
+}
+
+int RedisAI_ModelRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  return RedisAI_ModelRun_Common(ctx, argv, argc, 0);
+}
+
+/**
+ * AI.MODELRUN_RO model_key [RETURN BLOB|VALUES] INPUTS input_key1 ... OUTPUTS output_key1 ...
+ */
+int RedisAI_ModelRunRO_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  return RedisAI_ModelRun_Common(ctx, argv, argc, 1);
+}
+
+static int RedisAI_MultiRun_ReplyWithSamples(RedisModuleCtx *ctx, struct RedisAI_MultiRunInfo *multi) {
+  RedisModule_ReplyWithArray(ctx, array_len(multi->samples));
+  for (size_t i=0; i<array_len(multi->samples); i++) {
+    RedisAI_Run_ReplyWithOutputs(ctx, multi->samples[i]);
+  }
+  array_free(multi->samples);
+  RedisModule_Free(multi);
+  return REDISMODULE_OK;
+}
+
+int RedisAI_MultiRun_Reply(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  REDISMODULE_NOT_USED(argv);
+  REDISMODULE_NOT_USED(argc);
+  struct RedisAI_MultiRunInfo *multi = RedisModule_GetBlockedClientPrivateData(ctx);
+  return RedisAI_MultiRun_ReplyWithSamples(ctx, multi);
+}
+
+/**
+ * AI.MODELRUNMULTI model_key [NOREPLICATE] [RETURN BLOB|VALUES] INPUTS input_key1 ...
+ *                  OUTPUTS output_key1 ... [INPUTS input_key1 ... OUTPUTS output_key1 ...] ...
+ *
+ * Run a model on several independent samples, each given as in AI.MODELRUN.
+ * The samples are queued together and can be batched with each other, the
+ * client is replied once all of them have run.
+ */
+int RedisAI_ModelRunMulti_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  const int noreplicate = argc > 2 &&
+    !strcasecmp(RedisModule_StringPtrLen(argv[2], NULL), "NOREPLICATE");
+
+  int argpos = 2 + noreplicate;
+  int datafmt = REDISAI_DATA_NONE;
+  const int return_tensors = RedisAI_ParseRunReturn(argv, argc, &argpos, &datafmt);
+
+  if (RedisModule_IsKeysPositionRequest(ctx)) {
+    return RedisAI_Run_KeyPositions(ctx, argv, argc, argpos + 1, return_tensors);
+  }
+
+  if (return_tensors < 0) {
+    return RedisModule_ReplyWithError(ctx, "ERR unsupported data format for RETURN");
+  }
+
+  if (argc < argpos + 1) return RedisModule_WrongArity(ctx);
+
+  RAI_Model *mto;
+  RedisModuleKey *modelKey;
+  const int status = RAI_GetModelFromKeyspace(ctx, argv[1], &modelKey, &mto, REDISMODULE_READ);
+  if(status==REDISMODULE_ERR){
+      return REDISMODULE_ERR;
+  }
+
+  if (RAI_EnsureBackendLoaded(ctx, mto->backend) == REDISMODULE_ERR) {
+    RedisModule_CloseKey(modelKey);
+    return RedisModule_ReplyWithError(ctx, "ERR Could not load backend");
+  }
+
+  struct RedisAI_MultiRunInfo *multi = RedisModule_Calloc(1, sizeof(struct RedisAI_MultiRunInfo));
+  multi->samples = array_new(struct RedisAI_RunInfo*, 1);
+
+  // Each sample starts at INPUTS and ends before the next INPUTS, skipping
+  // the arguments of inline tensors
+  while (argpos < argc) {
+    if (strcasecmp(RedisModule_StringPtrLen(argv[argpos], NULL), "INPUTS")) {
+      RedisAI_FreeMultiRunInfo(ctx, multi);
+      RedisModule_CloseKey(modelKey);
+      return RedisModule_ReplyWithError(ctx, "ERR INPUTS not specified");
+    }
+
+    int end = argpos + 1;
+    int is_input = 1;
+    while (end < argc) {
+      const char *arg = RedisModule_StringPtrLen(argv[end], NULL);
+      if (!strcasecmp(arg, "INPUTS")) {
+        break;
+      }
+      if (!strcasecmp(arg, "OUTPUTS")) {
+        is_input = 0;
+      }
+      else if (is_input && RedisAI_Run_IsInlineTensor(argv[end])) {
+        const int tensor_argc = RedisAI_Run_InlineTensorArgc(argv+end+1, argc-end-1);
+        if (tensor_argc > 0) {
+          end += tensor_argc;
+        }
+      }
+      end++;
+    }
+
+    struct RedisAI_RunInfo *rinfo =
+      RedisAI_ModelRun_CreateRunInfo(ctx, argv[1], mto, argv+argpos+1, end-argpos-1);
+    if (rinfo == NULL) {
+      RedisAI_FreeMultiRunInfo(ctx, multi);
+      RedisModule_CloseKey(modelKey);
+      return REDISMODULE_ERR;
+    }
+    rinfo->return_tensors = return_tensors;
+    rinfo->datafmt = datafmt;
+    rinfo->replicate_outputs = !noreplicate && mto->opts.replicate == RAI_REPLICATE_BLOB;
+    rinfo->multi = multi;
+    multi->samples = array_append(multi->samples, rinfo);
+
+    argpos = end;
+  }
+
+  RAI_ModelTouchSession(mto);
+  RAI_ModelEvictSessions(ctx);
+
+  AI_dictEntry *entry = AI_dictFind(run_queues, mto->devicestr);
+  if (!entry) {
+    if (ensureRunQueue(mto->devicestr) == REDISMODULE_ERR) {
+      RedisAI_FreeMultiRunInfo(ctx, multi);
+      RedisModule_CloseKey(modelKey);
+      return RedisModule_ReplyWithError(ctx, "ERR Queue not initialized for device");
+    }
+    entry = AI_dictFind(run_queues, mto->devicestr);
+  }
+  RunQueueInfo *run_queue_info = AI_dictGetVal(entry);
+
+  if (!noreplicate && !return_tensors && mto->opts.replicate == RAI_REPLICATE_COMMAND) {
+    RedisModule_ReplicateVerbatim(ctx);
+  }
+
+  // Samples found in the cache of the model are not queued
+  struct RedisAI_RunInfo *queued[array_len(multi->samples)];
+  size_t nqueued = 0;
+  for (size_t i=0; i<array_len(multi->samples); i++) {
+    if (!RedisAI_ModelRun_GetCachedOutputs(multi->samples[i])) {
+      queued[nqueued++] = multi->samples[i];
+    }
+  }
+  if (nqueued == 0) {
+    return RedisAI_MultiRun_ReplyWithSamples(ctx, multi);
+  }
+
+  multi->pending = nqueued;
+  multi->client = RedisModule_BlockClient(ctx, RedisAI_MultiRun_Reply, NULL, RedisAI_FreeData, 0);
+
+  pthread_mutex_lock(&run_queue_info->run_queue_mutex);
+  for (size_t i=0; i<nqueued; i++) {
+    queuePush(run_queue_info->run_queue, queued[i]);
+  }
+  pthread_cond_broadcast(&run_queue_info->queue_condition_var);
+  pthread_mutex_unlock(&run_queue_info->run_queue_mutex);
+
+  return REDISMODULE_OK;
+}
+
+/** 
+* AI.SCRIPTRUN script_key fn_name [RETURN BLOB|VALUES] INPUTS input_key1 ... OUTPUTS output_key1 ...
+*
+* With readonly set (AI.SCRIPTRUN_RO), outputs are always returned as with
+* RETURN.
+*/
+static int RedisAI_ScriptRun_Common(RedisModuleCtx *ctx, RedisModuleString **argv, int argc, int readonly) {
+  int argpos = 3;
+  int datafmt = REDISAI_DATA_NONE;
+  int return_tensors = RedisAI_ParseRunReturn(argv, argc, &argpos, &datafmt);
+  if (readonly && return_tensors == 0) {
+    return_tensors = 1;
+    datafmt = REDISAI_DATA_BLOB;
+  }
+
+  if (argc < argpos + 1) return RedisModule_WrongArity(ctx);
+
+  if (RedisModule_IsKeysPositionRequest(ctx)) {
+    return RedisAI_Run_KeyPositions(ctx, argv, argc, argpos + 1, return_tensors);
+  }
+
+  if (return_tensors < 0) {
+    return RedisModule_ReplyWithError(ctx, "ERR unsupported data format for RETURN");
+  }
+
+  RedisModule_AutoMemory(ctx);
+
+  ArgsCursor ac;
+  ArgsCursor_InitRString(&ac, argv+1, argc-1);
+
+  RedisModuleString* keystr;
+  AC_GetRString(&ac, &keystr, 0);
+
+  RAI_Script *sto;
+  RedisModuleKey *key;
+  const int status = RAI_GetScriptFromKeyspace(ctx, argv[1], &key, &sto, REDISMODULE_READ);
+  if(status==REDISMODULE_ERR){
+      return REDISMODULE_ERR;
+  }
+
+  if (RAI_EnsureBackendLoaded(ctx, RAI_BACKEND_TORCH) == REDISMODULE_ERR) {
+    RedisModule_CloseKey(key);
+    return RedisModule_ReplyWithError(ctx, "ERR Could not load backend");
+  }
+
+  const char* fnname;
+  AC_GetString(&ac, &fnname, NULL, 0); 
+
+  // Skip RETURN, parsed above
+  AC_AdvanceBy(&ac, argpos - 3);
+
+  ArgsCursor inac = {0};
+  ArgsCursor outac = {0};
+
+  if (!AC_AdvanceIfMatch(&ac, "INPUTS")) {
+    return RedisModule_ReplyWithError(ctx, "INPUTS not specified");
+  }
+
+  const char* matches[] = {"OUTPUTS"};
   AC_GetSliceUntilMatches(&ac, &inac, 1, matches);
 
   if (!AC_AdvanceIfMatch(&ac, "OUTPUTS")) {
@@ -1325,64 +2727,538 @@ int RedisAI_ScriptRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv
     AC_GetRString(&outac, outputs+i, 0); 
   }
 
-  RAI_ScriptRunCtx *sctx = RAI_ScriptRunCtxCreate(sto, fnname);
+  RAI_ScriptRunCtx *sctx = RAI_ScriptRunCtxCreate(sto, fnname);
+
+  RedisModuleString **outkeys;
+
+  for (size_t i=0; i<ninputs; i++) {
+    if (RedisAI_Run_IsInlineTensor(inputs[i])) {
+      RAI_Tensor *t;
+      const int tensor_argc =
+        RedisAI_Run_ParseInlineTensor(ctx, inputs+i+1, ninputs-i-1, &t);
+      if (tensor_argc < 0) {
+        RAI_ScriptRunCtxFree(sctx);
+        RedisModule_CloseKey(key);
+        return REDISMODULE_ERR;
+      }
+      // the run context holds the only reference to the tensor
+      const int added = RAI_ScriptRunCtxAddInput(sctx, t);
+      RAI_TensorFree(t);
+      if (!added) {
+        RAI_ScriptRunCtxFree(sctx);
+        RedisModule_CloseKey(key);
+        return RedisModule_ReplyWithError(ctx, "Input key not found");
+      }
+      i += tensor_argc;
+      continue;
+    }
+    RAI_Tensor *t;
+    RedisModuleKey *argkey;
+    const int status = RAI_GetTensorFromKeyspace(ctx, inputs[i], &argkey, &t, REDISMODULE_READ);
+    if(status==REDISMODULE_ERR){
+         RedisModule_CloseKey(key);
+        return REDISMODULE_ERR;
+    }
+    RedisModule_CloseKey(argkey);
+    if (!RAI_ScriptRunCtxAddInput(sctx, t)) {
+      RAI_ScriptRunCtxFree(sctx);
+      RedisModule_CloseKey(key);
+      return RedisModule_ReplyWithError(ctx, "Input key not found");
+    }
+  }
+
+  outkeys = RedisModule_Calloc(noutputs, sizeof(RedisModuleString*));
+  for (size_t i=0; i<noutputs; i++) {
+    if (!RAI_ScriptRunCtxAddOutput(sctx)) {
+      RAI_ScriptRunCtxFree(sctx);
+      RedisModule_CloseKey(key);
+      return RedisModule_ReplyWithError(ctx, "Output key not found");
+    }
+    RedisModule_RetainString(ctx, outputs[i]);
+    outkeys[i] = outputs[i];
+  }
+
+  struct RedisAI_RunInfo *rinfo = RedisModule_Calloc(1, sizeof(struct RedisAI_RunInfo));
+  rinfo->mctx = NULL;
+  rinfo->sctx = sctx;
+  RedisModule_RetainString(ctx, keystr);
+  rinfo->runkey = keystr;
+  rinfo->outkeys = outkeys;
+  rinfo->return_tensors = return_tensors;
+  rinfo->datafmt = datafmt;
+  rinfo->replicate_outputs = 1;
+  rinfo->err = NULL;
+  AI_dictEntry *entry = AI_dictFind(run_queues, sto->devicestr);
+  RunQueueInfo *run_queue_info = NULL;
+  if (!entry){
+    RAI_ScriptRunCtxFree(sctx);
+    return RedisModule_ReplyWithError(ctx, "Queue not initialized for device");
+  }
+  else{
+    run_queue_info = AI_dictGetVal(entry);
+  }
+
+  rinfo->client = RedisModule_BlockClient(ctx, RedisAI_Run_Reply, NULL, RedisAI_FreeData, 0);
+  // RedisModule_SetDisconnectCallback(rinfo->client, RedisAI_Disconnected);
+
+  pthread_mutex_lock(&run_queue_info->run_queue_mutex);
+  queuePush(run_queue_info->run_queue, rinfo);
+  pthread_cond_signal(&run_queue_info->queue_condition_var);
+  pthread_mutex_unlock(&run_queue_info->run_queue_mutex);
+
+  // Nothing is written with RETURN, so there is nothing to replicate
+  if (!return_tensors) {
+    RedisModule_ReplicateVerbatim(ctx);
+  }
+  RedisModule_CloseKey(key);
+
+  return REDISMODULE_OK;
+}
+
+int RedisAI_ScriptRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  return RedisAI_ScriptRun_Common(ctx, argv, argc, 0);
+}
+
+/**
+* AI.SCRIPTRUN_RO script_key fn_name [RETURN BLOB|VALUES] INPUTS input_key1 ... OUTPUTS output_key1 ...
+*/
+int RedisAI_ScriptRunRO_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  return RedisAI_ScriptRun_Common(ctx, argv, argc, 1);
+}
+
+static int RedisAI_DagIsSeparator(RedisModuleString *arg) {
+  return strcmp(RedisModule_StringPtrLen(arg, NULL), "|>") == 0;
+}
+
+static RedisModuleString *RedisAI_DagHoldString(RedisModuleString *str) {
+  RedisModule_RetainString(NULL, str);
+  return str;
+}
+
+static int RedisAI_DagHasName(AI_dict *names, RedisModuleString *name) {
+  return AI_dictFind(names, RedisModule_StringPtrLen(name, NULL)) != NULL;
+}
+
+static void RedisAI_DagAddName(AI_dict *names, RedisModuleString *name) {
+  if (!RedisAI_DagHasName(names, name)) {
+    AI_dictAdd(names, (void*)RedisModule_StringPtrLen(name, NULL), NULL);
+  }
+}
+
+/* Parse a `|>` separated step of AI.DAGRUN. names holds the tensors that are
+ * in the DAG context when the step is executed.
+ * Return REDISMODULE_ERR after replying with an error on failure. */
+static int RedisAI_DagParseOp(RedisModuleCtx *ctx, RedisModuleString **argv, int argc,
+                              AI_dict *names, RedisAI_DagOp *op) {
+  const char *cmd = RedisModule_StringPtrLen(argv[0], NULL);
+
+  if (!strcasecmp(cmd, "AI.TENSORSET")) {
+    op->command = REDISAI_DAG_CMD_TENSORSET;
+    if (argc < 4) {
+      RedisModule_WrongArity(ctx);
+      return REDISMODULE_ERR;
+    }
+    if (RAI_ParseTensorSetArgs(ctx, argv+2, argc-2, &op->tensor) != REDISMODULE_OK) {
+      return REDISMODULE_ERR;
+    }
+    op->outkeys = array_append(op->outkeys, RedisAI_DagHoldString(argv[1]));
+    RedisAI_DagAddName(names, argv[1]);
+    return REDISMODULE_OK;
+  }
+
+  if (!strcasecmp(cmd, "AI.TENSORGET")) {
+    op->command = REDISAI_DAG_CMD_TENSORGET;
+    if (argc != 3) {
+      RedisModule_WrongArity(ctx);
+      return REDISMODULE_ERR;
+    }
+    if (!RedisAI_DagHasName(names, argv[1])) {
+      RedisModule_ReplyWithError(ctx, "ERR tensor key is empty");
+      return REDISMODULE_ERR;
+    }
+    if (RAI_ParseTensorGetFormat(argv[2], &op->datafmt) != REDISMODULE_OK) {
+      RedisModule_ReplyWithError(ctx, "ERR unsupported data format");
+      return REDISMODULE_ERR;
+    }
+    op->inkeys = array_append(op->inkeys, RedisAI_DagHoldString(argv[1]));
+    return REDISMODULE_OK;
+  }
+
+  int argpos;
+  const char *devicestr;
+
+  if (!strcasecmp(cmd, "AI.MODELRUN")) {
+    op->command = REDISAI_DAG_CMD_MODELRUN;
+    if (argc < 3) {
+      RedisModule_WrongArity(ctx);
+      return REDISMODULE_ERR;
+    }
+
+    RAI_Model *mto;
+    RedisModuleKey *key;
+    if (RAI_GetModelFromKeyspace(ctx, argv[1], &key, &mto, REDISMODULE_READ) == REDISMODULE_ERR) {
+      return REDISMODULE_ERR;
+    }
+    RedisModule_CloseKey(key);
+
+    if (strcasecmp(RedisModule_StringPtrLen(argv[2], NULL), "INPUTS")) {
+      RedisModule_ReplyWithError(ctx, "ERR INPUTS not specified");
+      return REDISMODULE_ERR;
+    }
+
+    if (RAI_EnsureBackendLoaded(ctx, mto->backend) == REDISMODULE_ERR) {
+      RedisModule_ReplyWithError(ctx, "ERR Could not load backend");
+      return REDISMODULE_ERR;
+    }
+
+    op->mctx = RAI_ModelRunCtxCreate(mto);
+    RAI_ModelRunCtxAddBatch(op->mctx);
+    devicestr = mto->devicestr;
+    argpos = 3;
+  }
+  else if (!strcasecmp(cmd, "AI.SCRIPTRUN")) {
+    op->command = REDISAI_DAG_CMD_SCRIPTRUN;
+    if (argc < 4) {
+      RedisModule_WrongArity(ctx);
+      return REDISMODULE_ERR;
+    }
+
+    RAI_Script *sto;
+    RedisModuleKey *key;
+    if (RAI_GetScriptFromKeyspace(ctx, argv[1], &key, &sto, REDISMODULE_READ) == REDISMODULE_ERR) {
+      return REDISMODULE_ERR;
+    }
+    RedisModule_CloseKey(key);
+
+    if (strcasecmp(RedisModule_StringPtrLen(argv[3], NULL), "INPUTS")) {
+      RedisModule_ReplyWithError(ctx, "INPUTS not specified");
+      return REDISMODULE_ERR;
+    }
+
+    if (RAI_EnsureBackendLoaded(ctx, RAI_BACKEND_TORCH) == REDISMODULE_ERR) {
+      RedisModule_ReplyWithError(ctx, "ERR Could not load backend");
+      return REDISMODULE_ERR;
+    }
+
+    op->sctx = RAI_ScriptRunCtxCreate(sto, RedisModule_StringPtrLen(argv[2], NULL));
+    devicestr = sto->devicestr;
+    argpos = 4;
+  }
+  else {
+    RedisModule_ReplyWithError(ctx, "ERR unsupported command within DAG");
+    return REDISMODULE_ERR;
+  }
+
+  op->runkey = RedisAI_DagHoldString(argv[1]);
+
+  int is_output = 0;
+  for (; argpos < argc; argpos++) {
+    if (!is_output && !strcasecmp(RedisModule_StringPtrLen(argv[argpos], NULL), "OUTPUTS")) {
+      is_output = 1;
+      continue;
+    }
+    if (is_output) {
+      op->outkeys = array_append(op->outkeys, RedisAI_DagHoldString(argv[argpos]));
+    }
+    else {
+      if (!RedisAI_DagHasName(names, argv[argpos])) {
+        RedisModule_ReplyWithError(ctx, "ERR INPUT key cannot be found in DAG");
+        return REDISMODULE_ERR;
+      }
+      op->inkeys = array_append(op->inkeys, RedisAI_DagHoldString(argv[argpos]));
+    }
+  }
+
+  const size_t ninputs = array_len(op->inkeys);
+  const size_t noutputs = array_len(op->outkeys);
+
+  if (op->mctx) {
+    RAI_Model *mto = op->mctx->model;
+    if (mto->inputs && array_len(mto->inputs) != ninputs) {
+      RedisModule_ReplyWithError(ctx,
+          "Number of names given as INPUTS during MODELSET and keys given as INPUTS here do not match");
+      return REDISMODULE_ERR;
+    }
+    if (mto->outputs && array_len(mto->outputs) != noutputs) {
+      RedisModule_ReplyWithError(ctx,
+          "Number of names given as OUTPUTS during MODELSET and keys given as OUTPUTS here do not match");
+      return REDISMODULE_ERR;
+    }
+    for (size_t i=0; i<noutputs; i++) {
+      // Opname here is passed without copying
+      RAI_ModelRunCtxAddOutput(op->mctx, 0, mto->outputs ? mto->outputs[i] : NULL);
+    }
+    RAI_ModelTouchSession(mto);
+    RAI_ModelEvictSessions(ctx);
+  }
+  else {
+    if (!is_output) {
+      RedisModule_ReplyWithError(ctx, "OUTPUTS not specified");
+      return REDISMODULE_ERR;
+    }
+    for (size_t i=0; i<noutputs; i++) {
+      RAI_ScriptRunCtxAddOutput(op->sctx);
+    }
+  }
+
+  if (ensureRunQueue(devicestr) == REDISMODULE_ERR) {
+    RedisModule_ReplyWithError(ctx, "ERR Queue not initialized for device");
+    return REDISMODULE_ERR;
+  }
+  op->run_queue_info = AI_dictGetVal(AI_dictFind(run_queues, devicestr));
+
+  // outputs are only visible to the following steps
+  for (size_t i=0; i<noutputs; i++) {
+    RedisAI_DagAddName(names, op->outkeys[i]);
+  }
+
+  return REDISMODULE_OK;
+}
+
+/* Parse the LOAD and PERSIST arguments and the steps of AI.DAGRUN.
+ * Return REDISMODULE_ERR after replying with an error on failure. */
+static int RedisAI_DagParse(RedisModuleCtx *ctx, RedisModuleString **argv, int argc,
+                            struct RedisAI_DagRunInfo *dag, AI_dict *names) {
+  int argpos = 1;
+
+  while (argpos < argc && !RedisAI_DagIsSeparator(argv[argpos])) {
+    const char *arg = RedisModule_StringPtrLen(argv[argpos], NULL);
+    const int load = !strcasecmp(arg, "LOAD");
+    if (!load && strcasecmp(arg, "PERSIST")) {
+      RedisModule_ReplyWithError(ctx, "ERR unsupported argument before the DAG commands");
+      return REDISMODULE_ERR;
+    }
+
+    long long nkeys;
+    if (argpos + 1 >= argc ||
+        RedisModule_StringToLongLong(argv[argpos+1], &nkeys) != REDISMODULE_OK ||
+        nkeys <= 0 || argpos + 1 + nkeys >= argc ||
+        RedisAI_DagIsSeparator(argv[argpos+1+nkeys])) {
+      RedisModule_ReplyWithError(ctx, load ? "ERR invalid or negative value found in number of keys to LOAD"
+                                           : "ERR invalid or negative value found in number of keys to PERSIST");
+      return REDISMODULE_ERR;
+    }
+
+    for (long long i=0; i<nkeys; i++) {
+      RedisModuleString *keyname = argv[argpos+2+i];
+      RedisModuleKey *key;
+      if (load) {
+        RAI_Tensor *t;
+        if (RAI_GetTensorFromKeyspace(ctx, keyname, &key, &t, REDISMODULE_READ) == REDISMODULE_ERR) {
+          return REDISMODULE_ERR;
+        }
+        RedisModule_CloseKey(key);
+        RedisAI_DagSetTensor(dag, keyname, RAI_TensorGetShallowCopy(t));
+        RedisAI_DagAddName(names, keyname);
+      }
+      else {
+        if (RAI_OpenKey_Tensor(ctx, keyname, &key, REDISMODULE_READ) == REDISMODULE_ERR) {
+          return REDISMODULE_ERR;
+        }
+        RedisModule_CloseKey(key);
+        dag->persistkeys = array_append(dag->persistkeys, RedisAI_DagHoldString(keyname));
+      }
+    }
+
+    argpos += 2 + nkeys;
+  }
+
+  if (argpos >= argc) {
+    RedisModule_ReplyWithError(ctx, "ERR DAG is empty");
+    return REDISMODULE_ERR;
+  }
+
+  while (argpos < argc) {
+    // argv[argpos] is a separator
+    const int start = ++argpos;
+    while (argpos < argc && !RedisAI_DagIsSeparator(argv[argpos])) {
+      argpos++;
+    }
+    if (argpos == start) {
+      RedisModule_ReplyWithError(ctx, "ERR DAG command is empty");
+      return REDISMODULE_ERR;
+    }
+
+    RedisAI_DagOp op = {0};
+    op.inkeys = array_new(RedisModuleString*, 1);
+    op.outkeys = array_new(RedisModuleString*, 1);
+    dag->ops = array_append(dag->ops, op);
+    if (RedisAI_DagParseOp(ctx, argv+start, argpos-start, names, &array_tail(dag->ops)) != REDISMODULE_OK) {
+      return REDISMODULE_ERR;
+    }
+  }
+
+  for (size_t i=0; i<array_len(dag->persistkeys); i++) {
+    if (!RedisAI_DagHasName(names, dag->persistkeys[i])) {
+      RedisModule_ReplyWithError(ctx, "ERR PERSIST key cannot be found in DAG");
+      return REDISMODULE_ERR;
+    }
+  }
+
+  return REDISMODULE_OK;
+}
+
+static int RedisAI_DagReply(RedisModuleCtx *ctx, struct RedisAI_RunInfo *rinfo) {
+  struct RedisAI_DagRunInfo *dag = rinfo->dag;
+  const size_t nops = array_len(dag->ops);
+
+  int failed = 0;
+  for (size_t i=0; i<nops; i++) {
+    RedisAI_DagOp *op = &dag->ops[i];
+    if (op->executed && op->status) {
+      failed = 1;
+    }
+    if (!op->executed || !op->runkey) {
+      continue;
+    }
+
+    AI_dictEntry *stats_entry = AI_dictFind(run_stats, RedisModule_StringPtrLen(op->runkey, NULL));
+    if (!stats_entry) {
+      continue;
+    }
+    struct RedisAI_RunStats *rstats = AI_dictGetVal(stats_entry);
+    rstats->calls += 1;
+    if (op->status) {
+      rstats->nerrors += 1;
+      continue;
+    }
+    rstats->duration_us += op->duration_us;
+    if (op->mctx && RAI_ModelRunCtxNumOutputs(op->mctx) > 0) {
+      RAI_Tensor *t = RAI_ModelRunCtxOutputTensor(op->mctx, 0, 0);
+      if (t) {
+        rstats->samples += RAI_TensorDim(t, 0);
+      }
+    }
+  }
+
+  // Only the persisted tensors are written to the keyspace and replicated
+  if (!failed) {
+    for (size_t i=0; i<array_len(dag->persistkeys); i++) {
+      RAI_Tensor *t = RedisAI_DagGetTensor(dag, dag->persistkeys[i]);
+      if (t == NULL) {
+        continue;
+      }
+      RedisModuleKey *key = RedisModule_OpenKey(ctx, dag->persistkeys[i], REDISMODULE_READ|REDISMODULE_WRITE);
+      const int type = RedisModule_KeyType(key);
+      if (type != REDISMODULE_KEYTYPE_EMPTY &&
+          !(type == REDISMODULE_KEYTYPE_MODULE && RedisModule_ModuleTypeGetType(key) == RedisAI_TensorType)) {
+        // the key was set to another type while the DAG was running
+        RedisModule_CloseKey(key);
+        continue;
+      }
+      RedisModule_ModuleTypeSetValue(key, RedisAI_TensorType, RAI_TensorGetShallowCopy(t));
+      RedisModule_CloseKey(key);
+      RedisAI_ReplicateTensorSet(ctx, dag->persistkeys[i], t);
+    }
+  }
+
+  RedisModule_ReplyWithArray(ctx, nops);
+  for (size_t i=0; i<nops; i++) {
+    RedisAI_DagOp *op = &dag->ops[i];
+    if (!op->executed) {
+      RedisModule_ReplyWithSimpleString(ctx, "NA");
+    }
+    else if (op->status) {
+      RedisModule_ReplyWithError(ctx, op->err->detail_oneline);
+    }
+    else if (op->command == REDISAI_DAG_CMD_TENSORGET) {
+      RAI_ReplyWithTensor(ctx, op->datafmt, op->tensor);
+    }
+    else {
+      RedisModule_ReplyWithSimpleString(ctx, "OK");
+    }
+  }
+
+  return REDISMODULE_OK;
+}
 
-  RedisModuleString **outkeys;
+int RedisAI_DagRun_Reply(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  REDISMODULE_NOT_USED(argv);
+  REDISMODULE_NOT_USED(argc);
+  struct RedisAI_RunInfo *rinfo = RedisModule_GetBlockedClientPrivateData(ctx);
 
-  for (size_t i=0; i<ninputs; i++) {
-    RAI_Tensor *t;
-    RedisModuleKey *argkey;
-    const int status = RAI_GetTensorFromKeyspace(ctx, inputs[i], &argkey, &t, REDISMODULE_READ);
-    if(status==REDISMODULE_ERR){
-         RedisModule_CloseKey(key);
-        return REDISMODULE_ERR;
+  int ret = RedisAI_DagReply(ctx, rinfo);
+  RedisAI_FreeRunInfo(ctx, rinfo);
+
+  return ret;
+}
+
+static void RedisAI_DagRun_KeyPositions(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  int argpos = 1;
+  while (argpos < argc && !RedisAI_DagIsSeparator(argv[argpos])) {
+    long long nkeys;
+    if (argpos + 1 >= argc || RedisModule_StringToLongLong(argv[argpos+1], &nkeys) != REDISMODULE_OK) {
+      return;
     }
-    RedisModule_CloseKey(argkey);
-    if (!RAI_ScriptRunCtxAddInput(sctx, t)) {
-      RAI_ScriptRunCtxFree(sctx);
-      RedisModule_CloseKey(key);
-      return RedisModule_ReplyWithError(ctx, "Input key not found");
+    for (long long i=0; i<nkeys && argpos+2+i < argc; i++) {
+      RedisModule_KeyAtPos(ctx, argpos+2+i);
     }
+    argpos += 2 + nkeys;
   }
-
-  outkeys = RedisModule_Calloc(noutputs, sizeof(RedisModuleString*));
-  for (size_t i=0; i<noutputs; i++) {
-    if (!RAI_ScriptRunCtxAddOutput(sctx)) {
-      RAI_ScriptRunCtxFree(sctx);
-      RedisModule_CloseKey(key);
-      return RedisModule_ReplyWithError(ctx, "Output key not found");
+  for (; argpos + 2 < argc; argpos++) {
+    if (!RedisAI_DagIsSeparator(argv[argpos])) {
+      continue;
     }
-    RedisModule_RetainString(ctx, outputs[i]);
-    outkeys[i] = outputs[i];
+    const char *cmd = RedisModule_StringPtrLen(argv[argpos+1], NULL);
+    if (!strcasecmp(cmd, "AI.MODELRUN") || !strcasecmp(cmd, "AI.SCRIPTRUN")) {
+      RedisModule_KeyAtPos(ctx, argpos+2);
+    }
+  }
+}
+
+/**
+ * AI.DAGRUN [LOAD n key1 ... keyn] [PERSIST n key1 ... keyn] |> command1 ... |> commandN ...
+ *
+ * Run a pipeline of TENSORSET, TENSORGET, MODELRUN and SCRIPTRUN commands.
+ * The tensors they set and read live in a context local to the request,
+ * LOAD copies tensors from the keyspace into it and PERSIST writes tensors
+ * from it to the keyspace once the pipeline is done. The model and script
+ * runs are queued on the run queue of their device, where they are batched
+ * with other requests as MODELRUN would be, and the client is replied once
+ * with the result of each command.
+ */
+int RedisAI_DagRun_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  if (argc < 3) return RedisModule_WrongArity(ctx);
+
+  if (RedisModule_IsKeysPositionRequest(ctx)) {
+    RedisAI_DagRun_KeyPositions(ctx, argv, argc);
+    return REDISMODULE_OK;
   }
 
   struct RedisAI_RunInfo *rinfo = RedisModule_Calloc(1, sizeof(struct RedisAI_RunInfo));
-  rinfo->mctx = NULL;
-  rinfo->sctx = sctx;
-  RedisModule_RetainString(ctx, keystr);
-  rinfo->runkey = keystr;
-  rinfo->outkeys = outkeys;
-  rinfo->err = NULL;
-  AI_dictEntry *entry = AI_dictFind(run_queues, sto->devicestr);
-  RunQueueInfo *run_queue_info = NULL;
-  if (!entry){
-    RAI_ScriptRunCtxFree(sctx);
-    return RedisModule_ReplyWithError(ctx, "Queue not initialized for device");
+  struct RedisAI_DagRunInfo *dag = RedisModule_Calloc(1, sizeof(struct RedisAI_DagRunInfo));
+  dag->ops = array_new(RedisAI_DagOp, 4);
+  dag->tensors = AI_dictCreate(&AI_dictTypeHeapStrings, NULL);
+  dag->persistkeys = array_new(RedisModuleString*, 1);
+  rinfo->dag = dag;
+
+  AI_dict *names = AI_dictCreate(&AI_dictTypeHeapStrings, NULL);
+  const int status = RedisAI_DagParse(ctx, argv, argc, dag, names);
+  AI_dictRelease(names);
+
+  if (status != REDISMODULE_OK) {
+    RedisAI_FreeRunInfo(ctx, rinfo);
+    return REDISMODULE_OK;
   }
-  else{
-    run_queue_info = AI_dictGetVal(entry);
+
+  int nruns = 0;
+  for (size_t i=0; i<array_len(dag->ops); i++) {
+    if (dag->ops[i].mctx || dag->ops[i].sctx) {
+      nruns++;
+    }
   }
 
-  rinfo->client = RedisModule_BlockClient(ctx, RedisAI_Run_Reply, NULL, RedisAI_FreeData, 0);
-  // RedisModule_SetDisconnectCallback(rinfo->client, RedisAI_Disconnected);
+  // Without runs there is nothing to queue, the DAG is executed right away
+  if (nruns == 0) {
+    RedisAI_DagAdvance(rinfo);
+    int ret = RedisAI_DagReply(ctx, rinfo);
+    RedisAI_FreeRunInfo(ctx, rinfo);
+    return ret;
+  }
 
-  pthread_mutex_lock(&run_queue_info->run_queue_mutex);
-  queuePush(run_queue_info->run_queue, rinfo);
-  pthread_cond_signal(&run_queue_info->queue_condition_var);
-  pthread_mutex_unlock(&run_queue_info->run_queue_mutex);
+  rinfo->client = RedisModule_BlockClient(ctx, RedisAI_DagRun_Reply, NULL, RedisAI_FreeData, 0);
 
-  RedisModule_ReplicateVerbatim(ctx);
-  RedisModule_CloseKey(key);
+  RedisAI_DagAdvance(rinfo);
 
   return REDISMODULE_OK;
 }
@@ -1574,6 +3450,14 @@ int RedisAI_Info_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int
 
   struct RedisAI_RunStats *rstats = AI_dictGetVal(stats_entry);
 
+  RAI_Model *model = NULL;
+  if (rstats->type == 0) {
+    RedisModuleKey *key = RedisModule_OpenKey(ctx, rstats->key, REDISMODULE_READ);
+    if (RedisModule_ModuleTypeGetType(key) == RedisAI_ModelType) {
+      model = RedisModule_ModuleTypeGetValue(key);
+    }
+  }
+
   if (!AC_IsAtEnd(&ac)) {
     const char* opt;
     AC_GetString(&ac, &opt, NULL, 0); 
@@ -1583,12 +3467,29 @@ int RedisAI_Info_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int
       rstats->samples = 0;
       rstats->calls = 0;
       rstats->nerrors = 0;
+      if (model) {
+        pthread_mutex_lock(&model->lock);
+        model->evictions = 0;
+        model->eviction_us = 0;
+        model->recompiles = 0;
+        model->recompile_us = 0;
+        pthread_mutex_unlock(&model->lock);
+        model->coalesced = 0;
+        if (model->cache) {
+          RAI_RunCacheResetStats(model->cache);
+        }
+      }
       RedisModule_ReplyWithSimpleString(ctx, "OK");
       return REDISMODULE_OK;
     }
   }
 
-  RedisModule_ReplyWithArray(ctx, 18);
+  // TFLITE models also report the interpreter settings they run with
+  int tflite = model && model->backend == RAI_BACKEND_TFLITE;
+  // and models set with CACHE the use of their result cache
+  int cache = model && model->cache;
+
+  RedisModule_ReplyWithArray(ctx, 18 + (model ? 12 : 0) + (tflite ? 4 : 0) + (cache ? 10 : 0));
 
   RedisModule_ReplyWithSimpleString(ctx, "KEY");
   RedisModule_ReplyWithString(ctx, rstats->key);
@@ -1619,6 +3520,49 @@ int RedisAI_Info_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int
   RedisModule_ReplyWithSimpleString(ctx, "ERRORS");
   RedisModule_ReplyWithLongLong(ctx, rstats->nerrors);
 
+  if (model) {
+    RedisModule_ReplyWithSimpleString(ctx, "VERSION");
+    RedisModule_ReplyWithLongLong(ctx, model->version);
+
+    pthread_mutex_lock(&model->lock);
+    const long long evictions = model->evictions;
+    const long long eviction_us = model->eviction_us;
+    const long long recompiles = model->recompiles;
+    const long long recompile_us = model->recompile_us;
+    pthread_mutex_unlock(&model->lock);
+
+    RedisModule_ReplyWithSimpleString(ctx, "EVICTIONS");
+    RedisModule_ReplyWithLongLong(ctx, evictions);
+    RedisModule_ReplyWithSimpleString(ctx, "EVICTION_DURATION");
+    RedisModule_ReplyWithLongLong(ctx, eviction_us);
+    RedisModule_ReplyWithSimpleString(ctx, "RECOMPILES");
+    RedisModule_ReplyWithLongLong(ctx, recompiles);
+    RedisModule_ReplyWithSimpleString(ctx, "RECOMPILE_DURATION");
+    RedisModule_ReplyWithLongLong(ctx, recompile_us);
+    RedisModule_ReplyWithSimpleString(ctx, "COALESCED");
+    RedisModule_ReplyWithLongLong(ctx, model->coalesced);
+  }
+
+  if (tflite) {
+    RedisModule_ReplyWithSimpleString(ctx, "THREADS");
+    RedisModule_ReplyWithLongLong(ctx, model->opts.threads);
+    RedisModule_ReplyWithSimpleString(ctx, "XNNPACK");
+    RedisModule_ReplyWithSimpleString(ctx, model->opts.xnnpack == RAI_SWITCH_ON ? "ON" : "OFF");
+  }
+
+  if (cache) {
+    RedisModule_ReplyWithSimpleString(ctx, "CACHE_HITS");
+    RedisModule_ReplyWithLongLong(ctx, RAI_RunCacheHits(model->cache));
+    RedisModule_ReplyWithSimpleString(ctx, "CACHE_MISSES");
+    RedisModule_ReplyWithLongLong(ctx, RAI_RunCacheMisses(model->cache));
+    RedisModule_ReplyWithSimpleString(ctx, "CACHE_EVICTIONS");
+    RedisModule_ReplyWithLongLong(ctx, RAI_RunCacheEvictions(model->cache));
+    RedisModule_ReplyWithSimpleString(ctx, "CACHE_ENTRIES");
+    RedisModule_ReplyWithLongLong(ctx, RAI_RunCacheEntries(model->cache));
+    RedisModule_ReplyWithSimpleString(ctx, "CACHE_BYTES");
+    RedisModule_ReplyWithLongLong(ctx, RAI_RunCacheBytes(model->cache));
+  }
+
   return REDISMODULE_OK;
 }
 
@@ -1660,6 +3604,45 @@ int RedisAI_Config_LoadBackend(RedisModuleCtx *ctx, RedisModuleString **argv, in
   return RedisModule_ReplyWithError(ctx, "ERR error loading backend");
 }
 
+/**
+* AI.CONFIG BACKEND <backend_identifier> <option> <value> [<option> <value> ...]
+*/
+int RedisAI_Config_Backend(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
+  RedisModule_AutoMemory(ctx);
+
+  if (argc < 4 || argc % 2 != 0) return RedisModule_WrongArity(ctx);
+
+  const char* bckstr = RedisModule_StringPtrLen(argv[1], NULL);
+  int backend;
+  if (strcasecmp(bckstr, "TF") == 0) {
+    backend = RAI_BACKEND_TENSORFLOW;
+  }
+  else if (strcasecmp(bckstr, "TFLITE") == 0) {
+    backend = RAI_BACKEND_TFLITE;
+  }
+  else if (strcasecmp(bckstr, "TORCH") == 0) {
+    backend = RAI_BACKEND_TORCH;
+  }
+  else if (strcasecmp(bckstr, "ONNX") == 0) {
+    backend = RAI_BACKEND_ONNXRUNTIME;
+  }
+  else {
+    return RedisModule_ReplyWithError(ctx, "ERR unsupported backend");
+  }
+
+  for (int i=2; i<argc; i+=2) {
+    RAI_Error err = {0};
+    const char* name = RedisModule_StringPtrLen(argv[i], NULL);
+    const char* value = RedisModule_StringPtrLen(argv[i+1], NULL);
+    if (RAI_SetBackendOption(ctx, backend, name, value, &err) != REDISMODULE_OK) {
+      int ret = RedisModule_ReplyWithError(ctx, err.detail);
+      RAI_ClearError(&err);
+      return ret;
+    }
+  }
+
+  return RedisModule_ReplyWithSimpleString(ctx, "OK");
+}
 
 int RedisAI_Config_BackendsPath(RedisModuleCtx *ctx, const char *path) {
   RedisModule_AutoMemory(ctx);
@@ -1683,8 +3666,82 @@ int RedisAI_Config_QueueThreads(RedisModuleString *queueThreadsString) {
   return result;
 }
 
+int RedisAI_Config_LoadingMode(RedisModuleString *loadingModeString) {
+  const char *modestr = RedisModule_StringPtrLen(loadingModeString, NULL);
+  return RAI_LoadingModeFromString(modestr, &RAI_loadingMode);
+}
+
+int RedisAI_Config_LoadingThreads(RedisModuleString *loadingThreadsString) {
+  long long threads;
+  int result = RedisModule_StringToLongLong(loadingThreadsString, &threads);
+  // 0 disables the loading threads, models are then compiled by the loading thread
+  if (result == REDISMODULE_OK && threads < 0) {
+    result = REDISMODULE_ERR;
+  }
+  if (result == REDISMODULE_OK) {
+    RAI_loadingThreads = threads;
+  }
+  return result;
+}
+
+int RedisAI_Config_LazyfreeThreshold(RedisModuleString *thresholdString) {
+  long long threshold;
+  int result = RedisModule_StringToLongLong(thresholdString, &threshold);
+  // 0 frees everything on the main thread
+  if (result == REDISMODULE_OK && threshold < 0) {
+    result = REDISMODULE_ERR;
+  }
+  if (result == REDISMODULE_OK) {
+    RAI_lazyfreeThreshold = threshold;
+  }
+  return result;
+}
+
+int RedisAI_Config_ModelSessionMemoryLimit(RedisModuleString *limitString) {
+  long long limit;
+  int result = RedisModule_StringToLongLong(limitString, &limit);
+  // 0 keeps all sessions
+  if (result == REDISMODULE_OK && limit < 0) {
+    result = REDISMODULE_ERR;
+  }
+  if (result == REDISMODULE_OK) {
+    RAI_modelSessionMemoryLimit = limit;
+  }
+  return result;
+}
+
+int RedisAI_Config_AsyncResultTTL(RedisModuleString *ttlString) {
+  long long ttl;
+  int result = RedisModule_StringToLongLong(ttlString, &ttl);
+  // 0 keeps results until collected
+  if (result == REDISMODULE_OK && ttl < 0) {
+    result = REDISMODULE_ERR;
+  }
+  if (result == REDISMODULE_OK) {
+    async_result_ttl = ttl;
+  }
+  return result;
+}
+
+int RedisAI_Config_CompileCacheDir(RedisModuleString *pathString) {
+  const char *path = RedisModule_StringPtrLen(pathString, NULL);
+  return RAI_SetCompileCacheDir(path);
+}
+
+int RedisAI_Config_WarmupOnLoad(RedisModuleString *warmupString) {
+  long long runs;
+  int result = RedisModule_StringToLongLong(warmupString, &runs);
+  if (result == REDISMODULE_OK && runs < 0) {
+    result = REDISMODULE_ERR;
+  }
+  if (result == REDISMODULE_OK) {
+    RAI_warmupOnLoad = runs;
+  }
+  return result;
+}
+
 /** 
-* AI.CONFIG [BACKENDSPATH <default_location_of_backend_libraries> | LOADBACKEND <backend_identifier> <location_of_backend_library>]
+* AI.CONFIG [BACKENDSPATH <default_location_of_backend_libraries> | LOADBACKEND <backend_identifier> <location_of_backend_library> | BACKEND <backend_identifier> <option> <value> ... | LOADING_MODE <EAGER|LAZY|BACKGROUND> | LOADING_THREADS <threads> | WARMUP_ON_LOAD <runs> | COMPILE_CACHE_DIR <path> | LAZYFREE_THRESHOLD <bytes> | MODEL_SESSION_MEMORY_LIMIT <bytes> | ASYNC_RESULT_TTL <ms>]
 */
 int RedisAI_Config_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, int argc) {
   RedisModule_AutoMemory(ctx);
@@ -1701,6 +3758,10 @@ int RedisAI_Config_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, i
     return RedisAI_Config_LoadBackend(ctx, argv + 1, argc - 1);
   }
 
+  if (strcasecmp(subcommand, "BACKEND") == 0) {
+    return RedisAI_Config_Backend(ctx, argv + 1, argc - 1);
+  }
+
   if (strcasecmp(subcommand, "BACKENDSPATH") == 0) {
     if (argc > 2) {
       return RedisAI_Config_BackendsPath(ctx, RedisModule_StringPtrLen(argv[2], NULL));
@@ -1709,6 +3770,77 @@ int RedisAI_Config_RedisCommand(RedisModuleCtx *ctx, RedisModuleString **argv, i
     }
   }
 
+  if (strcasecmp(subcommand, "LOADING_MODE") == 0) {
+    if (argc != 3) {
+      return RedisModule_WrongArity(ctx);
+    }
+    if (RedisAI_Config_LoadingMode(argv[2]) == REDISMODULE_ERR) {
+      return RedisModule_ReplyWithError(ctx, "ERR LOADING_MODE: unsupported mode, use EAGER, LAZY or BACKGROUND");
+    }
+    return RedisModule_ReplyWithSimpleString(ctx, "OK");
+  }
+
+  if (strcasecmp(subcommand, "LOADING_THREADS") == 0) {
+    if (argc != 3) {
+      return RedisModule_WrongArity(ctx);
+    }
+    if (RedisAI_Config_LoadingThreads(argv[2]) == REDISMODULE_ERR) {
+      return RedisModule_ReplyWithError(ctx, "ERR LOADING_THREADS: invalid number of threads");
+    }
+    return RedisModule_ReplyWithSimpleString(ctx, "OK");
+  }
+
+  if (strcasecmp(subcommand, "WARMUP_ON_LOAD") == 0) {
+    if (argc != 3) {
+      return RedisModule_WrongArity(ctx);
+    }
+    if (RedisAI_Config_WarmupOnLoad(argv[2]) == REDISMODULE_ERR) {
+      return RedisModule_ReplyWithError(ctx, "ERR WARMUP_ON_LOAD: invalid number of runs");
+    }
+    return RedisModule_ReplyWithSimpleString(ctx, "OK");
+  }
+
+  if (strcasecmp(subcommand, "COMPILE_CACHE_DIR") == 0) {
+    if (argc != 3) {
+      return RedisModule_WrongArity(ctx);
+    }
+    if (RedisAI_Config_CompileCacheDir(argv[2]) == REDISMODULE_ERR) {
+      return RedisModule_ReplyWithError(ctx, "ERR COMPILE_CACHE_DIR: path is not a directory");
+    }
+    return RedisModule_ReplyWithSimpleString(ctx, "OK");
+  }
+
+  if (strcasecmp(subcommand, "LAZYFREE_THRESHOLD") == 0) {
+    if (argc != 3) {
+      return RedisModule_WrongArity(ctx);
+    }
+    if (RedisAI_Config_LazyfreeThreshold(argv[2]) == REDISMODULE_ERR) {
+      return RedisModule_ReplyWithError(ctx, "ERR LAZYFREE_THRESHOLD: invalid number of bytes");
+    }
+    return RedisModule_ReplyWithSimpleString(ctx, "OK");
+  }
+
+  if (strcasecmp(subcommand, "MODEL_SESSION_MEMORY_LIMIT") == 0) {
+    if (argc != 3) {
+      return RedisModule_WrongArity(ctx);
+    }
+    if (RedisAI_Config_ModelSessionMemoryLimit(argv[2]) == REDISMODULE_ERR) {
+      return RedisModule_ReplyWithError(ctx, "ERR MODEL_SESSION_MEMORY_LIMIT: invalid number of bytes");
+    }
+    RAI_ModelEvictSessions(ctx);
+    return RedisModule_ReplyWithSimpleString(ctx, "OK");
+  }
+
+  if (strcasecmp(subcommand, "ASYNC_RESULT_TTL") == 0) {
+    if (argc != 3) {
+      return RedisModule_WrongArity(ctx);
+    }
+    if (RedisAI_Config_AsyncResultTTL(argv[2]) == REDISMODULE_ERR) {
+      return RedisModule_ReplyWithError(ctx, "ERR ASYNC_RESULT_TTL: invalid number of milliseconds");
+    }
+    return RedisModule_ReplyWithSimpleString(ctx, "OK");
+  }
+
   return RedisModule_ReplyWithError(ctx, "ERR unsupported subcommand");
 }
 
@@ -1788,16 +3920,13 @@ int RedisModule_OnLoad(RedisModuleCtx *ctx, RedisModuleString **argv, int argc)
     return REDISMODULE_ERR;
   }
 
+  RAI_TensorLazyFree = RAI_LazyFreeLarge;
+
   if(!RAI_TensorInit(ctx)){
     RedisModule_Log(ctx, "warning", "can not initialize tensor dt\r\n");
     return REDISMODULE_ERR;
   }
 
-  if(!RAI_ModelInit(ctx)){
-    RedisModule_Log(ctx, "warning", "can not initialize model dt\r\n");
-    return REDISMODULE_ERR;
-  }
-
   if(!RAI_ScriptInit(ctx)){
     RedisModule_Log(ctx, "warning", "can not initialize script dt\r\n");
     return REDISMODULE_ERR;
@@ -1827,6 +3956,18 @@ int RedisModule_OnLoad(RedisModuleCtx *ctx, RedisModuleString **argv, int argc)
       == REDISMODULE_ERR)
     return REDISMODULE_ERR;
 
+  if (RedisModule_CreateCommand(ctx, "ai.modelrun_ro", RedisAI_ModelRunRO_RedisCommand, "readonly getkeys-api", 1, 1, 1)
+      == REDISMODULE_ERR)
+    return REDISMODULE_ERR;
+
+  if (RedisModule_CreateCommand(ctx, "ai.modelrunmulti", RedisAI_ModelRunMulti_RedisCommand, "write deny-oom getkeys-api", 3, 3, 1)
+      == REDISMODULE_ERR)
+    return REDISMODULE_ERR;
+
+  if (RedisModule_CreateCommand(ctx, "ai.wait", RedisAI_Wait_RedisCommand, "readonly", 0, 0, 0)
+      == REDISMODULE_ERR)
+    return REDISMODULE_ERR;
+
   if (RedisModule_CreateCommand(ctx, "ai._modellist", RedisAI_ModelList_RedisCommand, "readonly", 1, 1, 1)
       == REDISMODULE_ERR)
     return REDISMODULE_ERR;
@@ -1847,6 +3988,14 @@ int RedisModule_OnLoad(RedisModuleCtx *ctx, RedisModuleString **argv, int argc)
       == REDISMODULE_ERR)
     return REDISMODULE_ERR;
 
+  if (RedisModule_CreateCommand(ctx, "ai.scriptrun_ro", RedisAI_ScriptRunRO_RedisCommand, "readonly getkeys-api", 1, 1, 1)
+      == REDISMODULE_ERR)
+    return REDISMODULE_ERR;
+
+  if (RedisModule_CreateCommand(ctx, "ai.dagrun", RedisAI_DagRun_RedisCommand, "write deny-oom getkeys-api", 1, 1, 1)
+      == REDISMODULE_ERR)
+    return REDISMODULE_ERR;
+
   if (RedisModule_CreateCommand(ctx, "ai._scriptlist", RedisAI_ScriptList_RedisCommand, "readonly", 1, 1, 1)
       == REDISMODULE_ERR)
     return REDISMODULE_ERR;
@@ -1863,7 +4012,8 @@ int RedisModule_OnLoad(RedisModuleCtx *ctx, RedisModuleString **argv, int argc)
     RedisModule_Log(ctx, "warning", "Even number of arguments provided to module. Please provide arguments as KEY VAL pairs");
   }
 
-  // need BACKENDSPATH set up before loading specific backends
+  // need BACKENDSPATH set up before loading specific backends, and
+  // THREADS_PER_QUEUE before backends size their thread pools
   for (int i=0; i<argc/2; i++) {
     const char *key = RedisModule_StringPtrLen(argv[2*i], NULL);
     const char *val = RedisModule_StringPtrLen(argv[2*i + 1], NULL);
@@ -1872,6 +4022,24 @@ int RedisModule_OnLoad(RedisModuleCtx *ctx, RedisModuleString **argv, int argc)
     if (strcasecmp(key, "BACKENDSPATH") == 0) {
       ret = RedisAI_Config_BackendsPath(ctx, val);
     }
+    // enable configuring the main thread to create a fixed number of worker threads up front per device.
+    // by default we'll use 1
+    else if (strcasecmp(key, "THREADS_PER_QUEUE") == 0) {
+      ret = RedisAI_Config_QueueThreads(argv[2*i + 1]);
+      if (ret == REDISMODULE_OK){
+        char *buffer = RedisModule_Alloc((3 + strlen(REDISAI_INFOMSG_THREADS_PER_QUEUE) + strlen(val)) * sizeof(*buffer));
+        sprintf(buffer, "%s: %s", REDISAI_INFOMSG_THREADS_PER_QUEUE, val);
+        RedisModule_Log(ctx, "verbose", buffer);
+        RedisModule_Free(buffer);
+      }
+    }
+
+    if (ret == REDISMODULE_ERR) {
+      char* buffer = RedisModule_Alloc((4 + strlen(REDISAI_ERRORMSG_PROCESSING_ARG) + strlen(key) + strlen(val)) * sizeof(*buffer));
+      sprintf(buffer, "%s: %s %s", REDISAI_ERRORMSG_PROCESSING_ARG, key, val);
+      RedisModule_Log(ctx, "warning", buffer);
+      RedisModule_Free(buffer);
+    }
   }
 
   for (int i=0; i<argc/2; i++) {
@@ -1891,18 +4059,50 @@ int RedisModule_OnLoad(RedisModuleCtx *ctx, RedisModuleString **argv, int argc)
     else if (strcasecmp(key, "ONNX") == 0) {
       ret = RAI_LoadBackend(ctx, RAI_BACKEND_ONNXRUNTIME, val);
     }
-    // enable configuring the main thread to create a fixed number of worker threads up front per device.
-    // by default we'll use 1
-    else if (strcasecmp(key, "THREADS_PER_QUEUE") == 0) {
-      ret = RedisAI_Config_QueueThreads(argv[2*i + 1]);
-      if (ret == REDISMODULE_OK){
-        char *buffer = RedisModule_Alloc((3 + strlen(REDISAI_INFOMSG_THREADS_PER_QUEUE) + strlen(val)) * sizeof(*buffer));
-        sprintf(buffer, "%s: %s", REDISAI_INFOMSG_THREADS_PER_QUEUE, val);
-        RedisModule_Log(ctx, "verbose", buffer);
-        RedisModule_Free(buffer);
+    else if (strcasecmp(key, "LOADING_MODE") == 0) {
+      ret = RedisAI_Config_LoadingMode(argv[2*i + 1]);
+      if (ret == REDISMODULE_OK) {
+        RedisModule_Log(ctx, "verbose", "%s: %s", REDISAI_INFOMSG_LOADING_MODE, val);
+      }
+    }
+    else if (strcasecmp(key, "LOADING_THREADS") == 0) {
+      ret = RedisAI_Config_LoadingThreads(argv[2*i + 1]);
+      if (ret == REDISMODULE_OK) {
+        RedisModule_Log(ctx, "verbose", "%s: %s", REDISAI_INFOMSG_LOADING_THREADS, val);
+      }
+    }
+    else if (strcasecmp(key, "WARMUP_ON_LOAD") == 0) {
+      ret = RedisAI_Config_WarmupOnLoad(argv[2*i + 1]);
+      if (ret == REDISMODULE_OK) {
+        RedisModule_Log(ctx, "verbose", "%s: %s", REDISAI_INFOMSG_WARMUP_ON_LOAD, val);
+      }
+    }
+    else if (strcasecmp(key, "COMPILE_CACHE_DIR") == 0) {
+      ret = RedisAI_Config_CompileCacheDir(argv[2*i + 1]);
+      if (ret == REDISMODULE_OK) {
+        RedisModule_Log(ctx, "verbose", "%s: %s", REDISAI_INFOMSG_COMPILE_CACHE_DIR, val);
+      }
+    }
+    else if (strcasecmp(key, "LAZYFREE_THRESHOLD") == 0) {
+      ret = RedisAI_Config_LazyfreeThreshold(argv[2*i + 1]);
+      if (ret == REDISMODULE_OK) {
+        RedisModule_Log(ctx, "verbose", "%s: %s", REDISAI_INFOMSG_LAZYFREE_THRESHOLD, val);
+      }
+    }
+    else if (strcasecmp(key, "MODEL_SESSION_MEMORY_LIMIT") == 0) {
+      ret = RedisAI_Config_ModelSessionMemoryLimit(argv[2*i + 1]);
+      if (ret == REDISMODULE_OK) {
+        RedisModule_Log(ctx, "verbose", "%s: %s", REDISAI_INFOMSG_MODEL_SESSION_MEMORY_LIMIT, val);
+      }
+    }
+    else if (strcasecmp(key, "ASYNC_RESULT_TTL") == 0) {
+      ret = RedisAI_Config_AsyncResultTTL(argv[2*i + 1]);
+      if (ret == REDISMODULE_OK) {
+        RedisModule_Log(ctx, "verbose", "%s: %s", REDISAI_INFOMSG_ASYNC_RESULT_TTL, val);
       }
     }
-    else if (strcasecmp(key, "BACKENDSPATH") == 0) {
+    else if (strcasecmp(key, "BACKENDSPATH") == 0 ||
+             strcasecmp(key, "THREADS_PER_QUEUE") == 0) {
       // aleady taken care of
     } else {
       ret = REDISMODULE_ERR;
@@ -1916,7 +4116,16 @@ int RedisModule_OnLoad(RedisModuleCtx *ctx, RedisModuleString **argv, int argc)
     }
   }
 
+  // the model type depends on LOADING_THREADS
+  if(!RAI_ModelInit(ctx)){
+    RedisModule_Log(ctx, "warning", "can not initialize model dt\r\n");
+    return REDISMODULE_ERR;
+  }
+
   run_queues = AI_dictCreate(&AI_dictTypeHeapStrings, NULL);
+  pending_runs = AI_dictCreate(&AI_dictTypeHeapStrings, NULL);
+  async_runs = AI_dictCreate(&AI_dictTypeHeapStrings, NULL);
+  async_expiries = array_new(RedisAI_AsyncExpiry, 16);
 
   if (ensureRunQueue("CPU") != REDISMODULE_OK){
     RedisModule_Log(ctx, "warning", "Queue not initialized for device CPU" );
@@ -26,10 +26,18 @@ typedef struct RAI_Error RAI_Error;
 #define REDISAI_DEVICE_CPU 0
 #define REDISAI_DEVICE_GPU 1
 #define REDISAI_DEFAULT_THREADS_PER_QUEUE 1
+#define REDISAI_DEFAULT_ASYNC_RESULT_TTL 60000
 
 #define REDISAI_ERRORMSG_PROCESSING_ARG "ERR: error processing argument"
 #define REDISAI_ERRORMSG_THREADS_PER_QUEUE "ERR: error setting THREADS_PER_QUEUE to"
 #define REDISAI_INFOMSG_THREADS_PER_QUEUE "Setting THREADS_PER_QUEUE parameter to"
+#define REDISAI_INFOMSG_LOADING_MODE "Setting LOADING_MODE parameter to"
+#define REDISAI_INFOMSG_LOADING_THREADS "Setting LOADING_THREADS parameter to"
+#define REDISAI_INFOMSG_WARMUP_ON_LOAD "Setting WARMUP_ON_LOAD parameter to"
+#define REDISAI_INFOMSG_COMPILE_CACHE_DIR "Setting COMPILE_CACHE_DIR parameter to"
+#define REDISAI_INFOMSG_LAZYFREE_THRESHOLD "Setting LAZYFREE_THRESHOLD parameter to"
+#define REDISAI_INFOMSG_MODEL_SESSION_MEMORY_LIMIT "Setting MODEL_SESSION_MEMORY_LIMIT parameter to"
+#define REDISAI_INFOMSG_ASYNC_RESULT_TTL "Setting ASYNC_RESULT_TTL parameter to"
 
 enum RedisAI_DataFmt {
   REDISAI_DATA_BLOB = 0,
@@ -41,11 +49,40 @@ struct RedisAI_RunInfo {
   RedisModuleBlockedClient *client;
   RedisModuleString *runkey;
   RedisModuleString **outkeys;
+  // Set by RETURN, outputs are sent in the reply in datafmt instead of
+  // being written to outkeys
+  int return_tensors;
+  int datafmt;
+  // Whether outputs written to outkeys are replicated as TENSORSET
+  int replicate_outputs;
+  // Set when the outputs of the run are to be stored in the cache of the
+  // model under cachekey
+  int cacheable;
+  uint64_t cachekey;
   RAI_ModelRunCtx *mctx;
   RAI_ScriptRunCtx *sctx;
   int status;
   long long duration_us;
   RAI_Error* err;
+  // Set for AI.DAGRUN, mctx or sctx then belong to the step being run
+  struct RedisAI_DagRunInfo *dag;
+  // Set while an identical MODELRUN can still join this one, followers
+  // are replied with its outputs when it completes
+  char *pendingkey;
+  struct RedisAI_RunInfo **followers;
+  // Set for AI.MODELRUNMULTI, the sample is replied with the other samples
+  // of the command
+  struct RedisAI_MultiRunInfo *multi;
+  // Set by ASYNC, the run is replied to AI.WAIT for this ticket instead of
+  // to the client that queued it
+  long long ticket;
+  // Outputs of a completed ASYNC run kept for AI.WAIT, which replaces mctx
+  // or sctx so that the model or script is not held until it is collected
+  RAI_Tensor **outputs;
+  // Set for MODELSET WARMUP, the model is warmed up on the run queue of its
+  // device and stored once done
+  RAI_Model *warmup;
+  long long warmup_runs;
 };
 
 RAI_Tensor* MODULE_API_FUNC(RedisAI_TensorCreate)(const char* dataTypeStr, long long* dims, int ndims);
@@ -2,6 +2,8 @@
 #include "script_struct.h"
 #include "backends.h"
 #include "stats.h"
+#include "loader.h"
+#include "lazyfree.h"
 
 #include "rmutil/alloc.h"
 #include "util/arr_rm_alloc.h"
@@ -23,7 +25,17 @@ static void* RAI_Script_RdbLoad(struct RedisModuleIO *io, int encver) {
   size_t len;
   char *scriptdef = RedisModule_LoadStringBuffer(io, &len);
 
-  RAI_Script *script = RAI_ScriptCreate(devicestr, tag, scriptdef, &err);
+  RAI_Script *script = NULL;
+
+  const int compile_in_threads = RAI_loadingMode == RAI_LOADING_EAGER && RAI_loadingThreads > 0 &&
+                                 RAI_EnsureBackendLoaded(RedisModule_GetContextFromIO(io), RAI_BACKEND_TORCH) == REDISMODULE_OK;
+
+  if (RAI_loadingMode != RAI_LOADING_EAGER || compile_in_threads) {
+    script = RAI_ScriptCreateLazy(devicestr, tag, scriptdef);
+  }
+  else {
+    script = RAI_ScriptCreate(devicestr, tag, scriptdef, &err);
+  }
 
   if (err.code == RAI_EBACKENDNOTLOADED) {
     RedisModuleCtx* ctx = RedisModule_GetContextFromIO(io);
@@ -37,11 +49,21 @@ static void* RAI_Script_RdbLoad(struct RedisModuleIO *io, int encver) {
     script = RAI_ScriptCreate(devicestr, tag, scriptdef, &err);
   }
  
+  if (compile_in_threads && RAI_LoaderCompileScript(RedisModule_GetContextFromIO(io), script) != REDISMODULE_OK) {
+    if (RAI_ScriptMaterialize(script, &err) != REDISMODULE_OK) {
+      RAI_Error free_err = {0};
+      RAI_ScriptFree(script, &free_err);
+      RAI_ClearError(&free_err);
+      script = NULL;
+    }
+  }
+
   RedisModule_Free(scriptdef);
 
   if (err.code != RAI_OK) {
     printf("ERR: %s\n", err.detail);
     RAI_ClearError(&err);
+    return NULL;
   }
 
   RedisModuleCtx* stats_ctx = RedisModule_GetContextFromIO(io);
@@ -54,6 +76,10 @@ static void* RAI_Script_RdbLoad(struct RedisModuleIO *io, int encver) {
 
   RedisModule_Free(stats_keystr);
 
+  if (RAI_loadingMode == RAI_LOADING_BACKGROUND) {
+    RAI_LoaderEnqueueScript(script);
+  }
+
   return script;
 }
 
@@ -73,7 +99,7 @@ static void RAI_Script_AofRewrite(RedisModuleIO *aof, RedisModuleString *key, vo
   RedisModule_EmitAOF(aof, "AI.SCRIPTSET", "sccc", key, script->devicestr, script->tag, script->scriptdef);
 }
 
-static void RAI_Script_DTFree(void *value) {
+static void RAI_Script_LazyFree(void *value) {
   RAI_Error err = {0};
   RAI_ScriptFree(value, &err);
   if (err.code != RAI_OK) {
@@ -82,6 +108,18 @@ static void RAI_Script_DTFree(void *value) {
   }
 }
 
+static void RAI_Script_DTFree(void *value) {
+  RAI_Script* script = value;
+  if (script->refCount == 1 && RAI_lazyfreeThreshold > 0) {
+    // run_stats is owned by the main thread
+    RAI_RemoveStatsEntry(script->infokey);
+    script->infokey = NULL;
+    RAI_LazyFree(RAI_Script_LazyFree, script);
+    return;
+  }
+  RAI_Script_LazyFree(script);
+}
+
 int RAI_ScriptInit(RedisModuleCtx* ctx) {
   RedisModuleTypeMethods tmScript = {
       .version = REDISMODULE_TYPE_METHOD_VERSION,
@@ -97,6 +135,12 @@ int RAI_ScriptInit(RedisModuleCtx* ctx) {
   return RedisAI_ScriptType != NULL;
 }
 
+static void RAI_ScriptInitSync(RAI_Script* script) {
+  script->materializing = 0;
+  pthread_mutex_init(&script->lock, NULL);
+  pthread_cond_init(&script->materialized, NULL);
+}
+
 RAI_Script *RAI_ScriptCreate( const char* devicestr, const char* tag, const char *scriptdef, RAI_Error* err) {
   if (!RAI_backends.torch.script_create) {
     RAI_SetError(err, RAI_EBACKENDNOTLOADED, "ERR Backend not loaded: TORCH");
@@ -106,17 +150,74 @@ RAI_Script *RAI_ScriptCreate( const char* devicestr, const char* tag, const char
 
   if (script) {
     script->tag = RedisModule_Strdup(tag);
+    RAI_ScriptInitSync(script);
   }
 
   return script;
 }
 
+/* Create a script holding only its source and metadata. The source is
+ * compiled on first use, see RAI_ScriptMaterialize. */
+RAI_Script *RAI_ScriptCreateLazy(const char* devicestr, const char* tag, const char *scriptdef) {
+  RAI_Script* script = RedisModule_Calloc(1, sizeof(*script));
+  script->script = NULL;
+  script->scriptdef = RedisModule_Strdup(scriptdef);
+  script->devicestr = RedisModule_Strdup(devicestr);
+  script->tag = RedisModule_Strdup(tag);
+  script->refCount = 1;
+  RAI_ScriptInitSync(script);
+
+  return script;
+}
+
+int RAI_ScriptIsMaterialized(RAI_Script* script) {
+  pthread_mutex_lock(&script->lock);
+  int ret = script->script != NULL;
+  pthread_mutex_unlock(&script->lock);
+  return ret;
+}
+
+/* Compile the source of a lazily created script. Concurrent callers wait
+ * for the first one to finish. */
+int RAI_ScriptMaterialize(RAI_Script* script, RAI_Error* err) {
+  pthread_mutex_lock(&script->lock);
+  while (script->materializing) {
+    pthread_cond_wait(&script->materialized, &script->lock);
+  }
+  if (script->script != NULL) {
+    pthread_mutex_unlock(&script->lock);
+    return REDISMODULE_OK;
+  }
+  if (!RAI_backends.torch.script_create) {
+    pthread_mutex_unlock(&script->lock);
+    RAI_SetError(err, RAI_EBACKENDNOTLOADED, "ERR Backend not loaded: TORCH");
+    return REDISMODULE_ERR;
+  }
+  script->materializing = 1;
+  pthread_mutex_unlock(&script->lock);
+
+  RAI_Script* created = RAI_backends.torch.script_create(script->devicestr, script->scriptdef, err);
+
+  pthread_mutex_lock(&script->lock);
+  if (created) {
+    script->script = created->script;
+    RedisModule_Free(created->scriptdef);
+    RedisModule_Free(created->devicestr);
+    RedisModule_Free(created);
+  }
+  script->materializing = 0;
+  pthread_cond_broadcast(&script->materialized);
+  pthread_mutex_unlock(&script->lock);
+
+  return created ? REDISMODULE_OK : REDISMODULE_ERR;
+}
+
 void RAI_ScriptFree(RAI_Script* script, RAI_Error* err) {
   if (--script->refCount > 0){
     return;
   }
 
-  if (!RAI_backends.torch.script_free) {
+  if (script->script != NULL && !RAI_backends.torch.script_free) {
     RAI_SetError(err, RAI_EBACKENDNOTLOADED, "ERR Backend not loaded: TORCH");
     return;
   }
@@ -124,6 +225,17 @@ void RAI_ScriptFree(RAI_Script* script, RAI_Error* err) {
   RedisModule_Free(script->tag);
 
   RAI_RemoveStatsEntry(script->infokey);
+
+  pthread_mutex_destroy(&script->lock);
+  pthread_cond_destroy(&script->materialized);
+
+  if (script->script == NULL) {
+    // The script was never compiled
+    RedisModule_Free(script->scriptdef);
+    RedisModule_Free(script->devicestr);
+    RedisModule_Free(script);
+    return;
+  }
  
   RAI_backends.torch.script_free(script, err);
 }
@@ -199,6 +311,10 @@ int RAI_ScriptRun(RAI_ScriptRunCtx* sctx, RAI_Error* err) {
     RAI_SetError(err, RAI_EBACKENDNOTLOADED, "ERR Backend not loaded: TORCH");
     return REDISMODULE_ERR;
   }
+
+  if (RAI_ScriptMaterialize(sctx->script, err) != REDISMODULE_OK) {
+    return REDISMODULE_ERR;
+  }
  
   return RAI_backends.torch.script_run(sctx, err);
 }
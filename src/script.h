@@ -11,6 +11,9 @@ extern RedisModuleType *RedisAI_ScriptType;
 
 int RAI_ScriptInit(RedisModuleCtx* ctx);
 RAI_Script* RAI_ScriptCreate( const char* devicestr, const char* tag, const char* scriptdef, RAI_Error* err);
+RAI_Script* RAI_ScriptCreateLazy(const char* devicestr, const char* tag, const char* scriptdef);
+int RAI_ScriptIsMaterialized(RAI_Script* script);
+int RAI_ScriptMaterialize(RAI_Script* script, RAI_Error* err);
 void RAI_ScriptFree(RAI_Script* script, RAI_Error* err);
 
 RAI_ScriptRunCtx* RAI_ScriptRunCtxCreate(RAI_Script* script, const char *fnname);
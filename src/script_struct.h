@@ -1,6 +1,7 @@
 #ifndef SRC_SCRIPT_STRUCT_H_
 #define SRC_SCRIPT_STRUCT_H_
 
+#include <pthread.h>
 #include "config.h"
 #include "tensor_struct.h"
 
@@ -15,6 +16,11 @@ typedef struct RAI_Script {
   char* tag;
   long long refCount;
   void* infokey;
+  // When script is NULL the script has not been compiled yet (e.g. it was
+  // loaded lazily from RDB) and RAI_ScriptMaterialize compiles scriptdef.
+  int materializing;
+  pthread_mutex_t lock;
+  pthread_cond_t materialized;
 } RAI_Script;
 
 typedef struct RAI_ScriptCtxParam {
@@ -48,6 +48,10 @@ void RAI_ListStatsEntries(RAI_RunType type, long long* nkeys, RedisModuleString*
 }
 
 void RAI_RemoveStatsEntry(void* infokey) {
+  if (infokey == NULL) {
+    return;
+  }
+
   AI_dictEntry *stats_entry = AI_dictFind(run_stats, infokey);
 
   if (stats_entry) {
@@ -8,6 +8,8 @@
 
 RedisModuleType *RedisAI_TensorType = NULL;
 
+int (*RAI_TensorLazyFree)(void (*free_fn)(void*), void* value, size_t bytes) = NULL;
+
 DLDataType RAI_TensorDataTypeFromString(const char* typestr){
   if (strcasecmp(typestr, RAI_DATATYPE_STR_FLOAT) == 0){
     return (DLDataType){ .code = kDLFloat, .bits = 32, .lanes = 1};
@@ -215,10 +217,21 @@ static void RAI_Tensor_AofRewrite(RedisModuleIO *aof, RedisModuleString *key, vo
   RedisModule_Free(dtypestr);
 }
 
-static void RAI_Tensor_DTFree(void *value) {
+static void RAI_Tensor_LazyFree(void *value) {
   RAI_TensorFree(value);
 }
 
+static void RAI_Tensor_DTFree(void *value) {
+  RAI_Tensor* t = value;
+  // outputs overwritten by MODELRUN land here, don't let large buffers stall
+  // the main thread when the key holds the last reference
+  if (t->refCount == 1 && RAI_TensorLazyFree &&
+      RAI_TensorLazyFree(RAI_Tensor_LazyFree, t, RAI_TensorByteSize(t))) {
+    return;
+  }
+  RAI_TensorFree(t);
+}
+
 int RAI_TensorInit(RedisModuleCtx* ctx){
   RedisModuleTypeMethods tmTensor = {
       .version = REDISMODULE_TYPE_METHOD_VERSION,
@@ -414,6 +427,47 @@ RAI_Tensor* RAI_TensorCreateFromDLTensor(DLManagedTensor* dl_tensor) {
   return ret;
 }
 
+RAI_TensorBuffer* RAI_TensorBufferCreate(void* owner, void (*release)(void*)) {
+  RAI_TensorBuffer* buffer = RedisModule_Alloc(sizeof(*buffer));
+  buffer->owner = owner;
+  buffer->release = release;
+  buffer->refCount = 1;
+  return buffer;
+}
+
+// Tensors holding a buffer may be freed from the run threads as well as
+// from the main thread, so its reference count is updated atomically
+void RAI_TensorBufferRelease(RAI_TensorBuffer* buffer) {
+  if (__atomic_sub_fetch(&buffer->refCount, 1, __ATOMIC_ACQ_REL) == 0) {
+    buffer->release(buffer->owner);
+    RedisModule_Free(buffer);
+  }
+}
+
+static void RAI_TensorBufferDeleter(DLManagedTensor* dl_tensor) {
+  RedisModule_Free(dl_tensor->dl_tensor.shape);
+  RedisModule_Free(dl_tensor->dl_tensor.strides);
+  RAI_TensorBufferRelease(dl_tensor->manager_ctx);
+}
+
+// Creates a tensor over data owned by buffer, without copying it. The
+// tensor holds a reference to buffer until it is freed.
+RAI_Tensor* RAI_TensorCreateFromBuffer(RAI_TensorBuffer* buffer, DLDataType dtype, long long* dims, int ndims,
+                                       void* data) {
+  RAI_Tensor* ret = RAI_TensorCreateWithDLDataType(dtype, dims, ndims, TENSORALLOC_NONE);
+  if (ret == NULL) {
+    return NULL;
+  }
+
+  __atomic_add_fetch(&buffer->refCount, 1, __ATOMIC_RELAXED);
+
+  ret->tensor.dl_tensor.data = data;
+  ret->tensor.manager_ctx = buffer;
+  ret->tensor.deleter = RAI_TensorBufferDeleter;
+
+  return ret;
+}
+
 DLDataType RAI_TensorDataType(RAI_Tensor* t) {
   return t->tensor.dl_tensor.dtype;
 }
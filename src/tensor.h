@@ -22,10 +22,19 @@ static const char* RAI_DATATYPE_STR_UINT16 = "UINT16";
 
 extern RedisModuleType *RedisAI_TensorType;
 
+// RAI_LazyFreeLarge, lazyfree.c is only built into the main module. The
+// backends, which build this file too, get it from the get_api_fn given to
+// their init function, as they get the RedisModule_* functions.
+extern int (*RAI_TensorLazyFree)(void (*free_fn)(void*), void* value, size_t bytes);
+
 int RAI_TensorInit(RedisModuleCtx* ctx);
 RAI_Tensor* RAI_TensorCreate(const char* dataType, long long* dims, int ndims, int hasdata);
 RAI_Tensor* RAI_TensorCreateWithDLDataType(DLDataType dtype, long long* dims, int ndims, int tensorAllocMode);
 RAI_Tensor* RAI_TensorCreateFromDLTensor(DLManagedTensor* dl_tensor);
+RAI_TensorBuffer* RAI_TensorBufferCreate(void* owner, void (*release)(void*));
+void RAI_TensorBufferRelease(RAI_TensorBuffer* buffer);
+RAI_Tensor* RAI_TensorCreateFromBuffer(RAI_TensorBuffer* buffer, DLDataType dtype, long long* dims, int ndims,
+                                       void* data);
 RAI_Tensor* RAI_TensorCreateByConcatenatingTensors(RAI_Tensor** ts, long long n);
 RAI_Tensor* RAI_TensorCreateBySlicingTensor(RAI_Tensor* t, long long offset, long long len);
 size_t RAI_TensorLength(RAI_Tensor* t);
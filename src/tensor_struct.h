@@ -11,4 +11,13 @@ typedef struct RAI_Tensor {
   RedisModuleString* tensorRS;
 } RAI_Tensor;
 
+// Buffer allocated by a backend and shared by the tensors created over it,
+// e.g. the slices of a batched output. The backend release function is
+// called when the last of them is freed.
+typedef struct RAI_TensorBuffer {
+  void* owner;
+  void (*release)(void*);
+  long long refCount;
+} RAI_TensorBuffer;
+
 #endif /* SRC_TENSOR_STRUCT_H_ */
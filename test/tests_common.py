@@ -293,3 +293,35 @@ def test_tensorget_disconnect(env):
     env.assertEqual(ret, b'OK')
     ret = send_and_disconnect(('AI.TENSORGET', 't_FLOAT'), red)
     env.assertEqual(ret, None)
+
+
+def test_common_lazyfree(env):
+    con = env.getConnection()
+
+    try:
+        con.execute_command('AI.CONFIG', 'LAZYFREE_THRESHOLD', -1)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("LAZYFREE_THRESHOLD: invalid number of bytes", exception.__str__())
+
+    ret = con.execute_command('AI.CONFIG', 'LAZYFREE_THRESHOLD', 1024)
+    env.assertEqual(ret, b'OK')
+
+    blob = bytearray(4 * 1024 * 1024)
+    for i in range(10):
+        ret = con.execute_command('AI.TENSORSET', 'lazy', 'FLOAT', 1024, 1024, 'BLOB', blob)
+        env.assertEqual(ret, b'OK')
+    ret = con.execute_command('DEL', 'lazy')
+    env.assertEqual(ret, 1)
+
+    ret = con.execute_command('AI.CONFIG', 'LAZYFREE_THRESHOLD', 0)
+    env.assertEqual(ret, b'OK')
+
+    ret = con.execute_command('AI.TENSORSET', 'lazy', 'FLOAT', 1024, 1024, 'BLOB', blob)
+    env.assertEqual(ret, b'OK')
+    ret = con.execute_command('DEL', 'lazy')
+    env.assertEqual(ret, 1)
+
+    ret = con.execute_command('AI.CONFIG', 'LAZYFREE_THRESHOLD', 1024 * 1024)
+    env.assertEqual(ret, b'OK')
@@ -0,0 +1,138 @@
+import redis
+
+from includes import *
+
+'''
+python -m RLTest --test tests_dag.py --module path/to/redisai.so
+'''
+
+
+def load_dag_model_and_script(env, con, *modelset_args):
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+
+    with open(os.path.join(test_data_path, 'pt-minimal.pt'), 'rb') as f:
+        model_pb = f.read()
+    with open(os.path.join(test_data_path, 'script.txt'), 'rb') as f:
+        script = f.read()
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, *modelset_args, model_pb)
+    env.assertEqual(ret, b'OK')
+    ret = con.execute_command('AI.SCRIPTSET', 's', DEVICE, script)
+    env.assertEqual(ret, b'OK')
+
+
+def test_dag_modelrun_scriptrun(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+    load_dag_model_and_script(env, con)
+
+    ret = con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    env.assertEqual(ret, b'OK')
+
+    ret = con.execute_command('AI.DAGRUN', 'LOAD', 1, 'a', 'PERSIST', 1, 'd', '|>',
+                              'AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3, '|>',
+                              'AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c', '|>',
+                              'AI.SCRIPTRUN', 's', 'bar', 'INPUTS', 'c', 'c', 'OUTPUTS', 'd', '|>',
+                              'AI.TENSORGET', 'd', 'VALUES')
+    env.assertEqual(ret[:3], [b'OK', b'OK', b'OK'])
+    env.assertEqual(ret[3][-1], [b'8', b'12', b'8', b'12'])
+
+    # intermediates are not written to the keyspace
+    env.assertEqual(con.execute_command('EXISTS', 'b'), 0)
+    env.assertEqual(con.execute_command('EXISTS', 'c'), 0)
+
+    ensureSlaveSynced(con, env)
+
+    tensor = con.execute_command('AI.TENSORGET', 'd', 'VALUES')
+    env.assertEqual(tensor[-1], [b'8', b'12', b'8', b'12'])
+
+    if env.useSlaves:
+        con2 = env.getSlaveConnection()
+        env.assertEqual(con2.execute_command('AI.TENSORGET', 'd', 'VALUES'), tensor)
+        env.assertEqual(con2.execute_command('EXISTS', 'c'), 0)
+
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['CALLS'], 1)
+    env.assertEqual(info['SAMPLES'], 2)
+
+
+def test_dag_local_only(env):
+    con = env.getConnection()
+
+    ret = con.execute_command('AI.DAGRUN', '|>',
+                              'AI.TENSORSET', 'a', 'INT8', 2, 'VALUES', 1, 2, '|>',
+                              'AI.TENSORGET', 'a', 'META')
+    env.assertEqual(ret, [b'OK', [b'INT8', [2]]])
+    env.assertEqual(con.execute_command('EXISTS', 'a'), 0)
+
+
+def test_dag_error_replies(env):
+    con = env.getConnection()
+
+    ret = con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 'VALUES', 1, 2)
+    env.assertEqual(ret, b'OK')
+
+    def check_error(message, *args):
+        try:
+            con.execute_command('AI.DAGRUN', *args)
+            env.assertFalse(True)
+        except Exception as e:
+            env.assertEqual(type(e), redis.exceptions.ResponseError)
+            env.assertEqual(message, e.__str__())
+
+    check_error("tensor key is empty", 'LOAD', 1, 'missing', '|>', 'AI.TENSORGET', 'missing', 'META')
+    check_error("invalid or negative value found in number of keys to LOAD", 'LOAD', 2, 'a', '|>',
+                'AI.TENSORGET', 'a', 'META')
+    check_error("tensor key is empty", '|>', 'AI.TENSORGET', 'a', 'META')
+    check_error("unsupported command within DAG", 'LOAD', 1, 'a', '|>', 'AI.TENSORDEL', 'a')
+    check_error("PERSIST key cannot be found in DAG", 'LOAD', 1, 'a', 'PERSIST', 1, 'b', '|>',
+                'AI.TENSORGET', 'a', 'META')
+    check_error("unsupported data format", 'LOAD', 1, 'a', '|>', 'AI.TENSORGET', 'a', 'JSON')
+    check_error("DAG is empty", 'LOAD', 1, 'a')
+
+    if not TEST_PT:
+        return
+
+    load_dag_model_and_script(env, con)
+    check_error("INPUT key cannot be found in DAG", 'LOAD', 1, 'a', '|>',
+                'AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    # outputs of a step are only visible to the next steps
+    check_error("INPUT key cannot be found in DAG", 'LOAD', 1, 'a', '|>',
+                'AI.MODELRUN', 'm', 'INPUTS', 'a', 'c', 'OUTPUTS', 'c')
+
+
+def test_dag_modelrun_autobatch(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+    load_dag_model_and_script(env, con, 'BATCHSIZE', 4, 'MINBATCHSIZE', 3)
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    ensureSlaveSynced(con, env)
+
+    # neither request reaches MINBATCHSIZE alone, so the DAG step has to be
+    # batched with the MODELRUN
+    def run():
+        con = env.getConnection()
+        con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+
+    t = threading.Thread(target=run)
+    t.start()
+
+    ret = con.execute_command('AI.DAGRUN', 'LOAD', 2, 'a', 'b', '|>',
+                              'AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'f', '|>',
+                              'AI.TENSORGET', 'f', 'VALUES')
+    t.join()
+
+    env.assertEqual(ret[0], b'OK')
+    env.assertEqual(ret[1][-1], [b'4', b'6', b'4', b'6'])
+
+    tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+    env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
@@ -1,6 +1,8 @@
 import sys
 import os
 import subprocess
+import shutil
+import tempfile
 import redis
 from includes import *
 
@@ -199,6 +201,230 @@ def test_onnx_modelrun_mnist_autobatch(env):
     env.assertEqual(argmax, 1)
 
 
+def test_onnx_modelset_warmup(env):
+    if not TEST_ONNX:
+        env.debugPrint("skipping {} since TEST_ONNX=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'mnist.onnx')
+    sample_filename = os.path.join(test_data_path, 'one.raw')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    with open(sample_filename, 'rb') as f:
+        sample_raw = f.read()
+
+    # input shapes are read from the model
+    ret = con.execute_command('AI.MODELSET', 'm', 'ONNX', DEVICE, 'WARMUP', 3, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    try:
+        con.execute_command('AI.MODELSET', 'm', 'ONNX', DEVICE, 'WARMUP', 3, 'SHAPE', 'FLOAT', 1, 2, model_pb)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 1, 1, 28, 28, 'BLOB', sample_raw)
+
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'OUTPUTS', 'b')
+
+    tensor = con.execute_command('AI.TENSORGET', 'b', 'VALUES')
+    values = tensor[-1]
+    argmax = max(range(len(values)), key=lambda i: values[i])
+
+    env.assertEqual(argmax, 1)
+
+
+def test_onnx_compile_cache(env):
+    if not TEST_ONNX:
+        env.debugPrint("skipping {} since TEST_ONNX=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'mnist.onnx')
+    sample_filename = os.path.join(test_data_path, 'one.raw')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    with open(sample_filename, 'rb') as f:
+        sample_raw = f.read()
+
+    try:
+        con.execute_command('AI.CONFIG', 'COMPILE_CACHE_DIR', os.path.join(test_data_path, 'mnist.onnx'))
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("COMPILE_CACHE_DIR: path is not a directory", exception.__str__())
+
+    cache_dir = tempfile.mkdtemp()
+    ret = con.execute_command('AI.CONFIG', 'COMPILE_CACHE_DIR', cache_dir)
+    env.assertEqual(ret, b'OK')
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'ONNX', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    if not env.isCluster():
+        cached = [f for f in os.listdir(cache_dir) if not f.endswith('.tmp')]
+        env.assertEqual(len(cached), 1)
+
+    # the second model is created from the cache
+    ret = con.execute_command('AI.MODELSET', 'm_cached', 'ONNX', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    ret = con.execute_command('AI.MODELGET', 'm_cached', 'BLOB')
+    env.assertEqual(ret[-1], model_pb)
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 1, 1, 28, 28, 'BLOB', sample_raw)
+    con.execute_command('AI.MODELRUN', 'm_cached', 'INPUTS', 'a', 'OUTPUTS', 'b')
+
+    tensor = con.execute_command('AI.TENSORGET', 'b', 'VALUES')
+    values = tensor[-1]
+    argmax = max(range(len(values)), key=lambda i: values[i])
+
+    env.assertEqual(argmax, 1)
+
+    ret = con.execute_command('AI.CONFIG', 'COMPILE_CACHE_DIR', '')
+    env.assertEqual(ret, b'OK')
+    shutil.rmtree(cache_dir)
+
+
+def test_onnx_modelset_session_options(env):
+    if not TEST_ONNX:
+        env.debugPrint("skipping {} since TEST_ONNX=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'mnist.onnx')
+    sample_filename = os.path.join(test_data_path, 'one.raw')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    with open(sample_filename, 'rb') as f:
+        sample_raw = f.read()
+
+    try:
+        con.execute_command('AI.MODELSET', 'm', 'ONNX', DEVICE, 'OPTLEVEL', 'FASTEST', model_pb)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("Invalid argument for OPTLEVEL", exception.__str__())
+
+    try:
+        con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'CPUARENA', 'OFF', model_pb)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("Session options only supported by the ONNX backend", exception.__str__())
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'ONNX', DEVICE, 'OPTLEVEL', 'ALL', 'EXECMODE', 'PARALLEL',
+                              'MEMPATTERN', 'OFF', 'CPUARENA', 'OFF', model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 1, 1, 28, 28, 'BLOB', sample_raw)
+
+    # the options are stored with the model and survive a reload
+    for _ in env.reloadingIterator():
+        con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'OUTPUTS', 'b')
+
+        tensor = con.execute_command('AI.TENSORGET', 'b', 'VALUES')
+        values = tensor[-1]
+        argmax = max(range(len(values)), key=lambda i: values[i])
+
+        env.assertEqual(argmax, 1)
+
+
+def test_onnx_config_intra_op_threads(env):
+    if not TEST_ONNX:
+        env.debugPrint("skipping {} since TEST_ONNX=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'mnist.onnx')
+    sample_filename = os.path.join(test_data_path, 'one.raw')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    with open(sample_filename, 'rb') as f:
+        sample_raw = f.read()
+
+    try:
+        con.execute_command('AI.CONFIG', 'BACKEND', 'ONNX', 'INTRA_OP_THREADS', 0)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("ONNX: invalid number of threads", exception.__str__())
+
+    try:
+        con.execute_command('AI.CONFIG', 'BACKEND', 'ONNX', 'INTER_OP_THREADS', 2)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("ONNX: unsupported option", exception.__str__())
+
+    ret = con.execute_command('AI.CONFIG', 'BACKEND', 'ONNX', 'INTRA_OP_THREADS', 2)
+    env.assertEqual(ret, b'OK')
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'ONNX', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 1, 1, 28, 28, 'BLOB', sample_raw)
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'OUTPUTS', 'b')
+
+    tensor = con.execute_command('AI.TENSORGET', 'b', 'VALUES')
+    values = tensor[-1]
+    argmax = max(range(len(values)), key=lambda i: values[i])
+
+    env.assertEqual(argmax, 1)
+
+def test_onnx_output_outlives_model(env):
+    if not TEST_ONNX:
+        env.debugPrint("skipping {} since TEST_ONNX=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'mnist.onnx')
+    sample_filename = os.path.join(test_data_path, 'one.raw')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    with open(sample_filename, 'rb') as f:
+        sample_raw = f.read()
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'ONNX', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 1, 1, 28, 28, 'BLOB', sample_raw)
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'OUTPUTS', 'b')
+
+    # the output references the buffer allocated by the backend, which
+    # must stay valid once the model is gone
+    con.execute_command('DEL', 'm')
+
+    tensor = con.execute_command('AI.TENSORGET', 'b', 'VALUES')
+    values = tensor[-1]
+    argmax = max(range(len(values)), key=lambda i: values[i])
+
+    env.assertEqual(argmax, 1)
+
+    con.execute_command('DEL', 'b')
+
+
 def test_onnx_modelrun_iris(env):
     if not TEST_ONNX:
         env.debugPrint("skipping {} since TEST_ONNX=0".format(sys._getframe().f_code.co_name), force=True)
@@ -245,6 +471,45 @@ def test_onnx_modelrun_iris(env):
         env.assertEqual(logreg_out, logreg_out2)
 
 
+def test_onnx_modelrun_output_subset(env):
+    if not TEST_ONNX:
+        env.debugPrint("skipping {} since TEST_ONNX=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    logreg_model_filename = os.path.join(test_data_path, 'logreg_iris.onnx')
+
+    with open(logreg_model_filename, 'rb') as f:
+        logreg_model = f.read()
+
+    try:
+        con.execute_command('AI.MODELSET', 'logreg', 'ONNX', DEVICE, 'INPUTS', 'OUTPUTS', 'output_foo', logreg_model)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("Output not found in model: output_foo", exception.__str__())
+
+    ret = con.execute_command('AI.MODELSET', 'logreg', 'ONNX', DEVICE, 'INPUTS', 'OUTPUTS', 'output_label', logreg_model)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'features', 'FLOAT', 1, 4, 'VALUES', 5.1, 3.5, 1.4, 0.2)
+
+    try:
+        con.execute_command('AI.MODELRUN', 'logreg', 'INPUTS', 'features', 'OUTPUTS', 'logreg_out', 'logreg_probs')
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+
+    for _ in env.reloadingIterator():
+        ret = con.execute_command('AI.MODELRUN', 'logreg', 'INPUTS', 'features', 'OUTPUTS', 'logreg_out')
+        env.assertEqual(ret, b'OK')
+
+        logreg_out = con.execute_command('AI.TENSORGET', 'logreg_out', 'VALUES')
+        env.assertEqual(logreg_out[2][0], 0)
+
+
 def test_onnx_modelinfo(env):
     if not TEST_ONNX:
         env.debugPrint("skipping {} since TEST_ONNX=0".format(sys._getframe().f_code.co_name), force=True)
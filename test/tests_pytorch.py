@@ -133,6 +133,381 @@ def test_pytorch_modelrun(env):
         env.assertEqual(tensor2, tensor)
 
 
+def test_pytorch_run_return(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+
+    with open(os.path.join(test_data_path, 'pt-minimal.pt'), 'rb') as f:
+        model_pb = f.read()
+    with open(os.path.join(test_data_path, 'script.txt'), 'rb') as f:
+        script = f.read()
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+    ret = con.execute_command('AI.SCRIPTSET', 's', DEVICE, script)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    ret = con.execute_command('AI.MODELRUN', 'm', 'RETURN', 'VALUES', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    env.assertEqual(len(ret), 1)
+    env.assertEqual(ret[0][0], b'FLOAT')
+    env.assertEqual(ret[0][1], [2, 2])
+    env.assertEqual(ret[0][-1], [b'4', b'6', b'4', b'6'])
+
+    ret = con.execute_command('AI.SCRIPTRUN', 's', 'bar', 'RETURN', 'BLOB', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    env.assertEqual(ret[0][-1], np.array([4, 6, 4, 6], dtype=np.float32).tobytes())
+
+    # no output key is written, on the master or on the replicas
+    env.assertEqual(con.execute_command('EXISTS', 'c'), 0)
+
+    ensureSlaveSynced(con, env)
+
+    if env.useSlaves:
+        con2 = env.getSlaveConnection()
+        env.assertEqual(con2.execute_command('EXISTS', 'c'), 0)
+
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['CALLS'], 1)
+    env.assertEqual(info['SAMPLES'], 2)
+
+    try:
+        con.execute_command('AI.MODELRUN', 'm', 'RETURN', 'META', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+        env.assertFalse(True)
+    except Exception as e:
+        env.assertEqual(type(e), redis.exceptions.ResponseError)
+        env.assertEqual("unsupported data format for RETURN", e.__str__())
+
+    # keys named after the option are read as keys
+    con.execute_command('AI.TENSORSET', 'RETURN', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'VALUES', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    ret = con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'RETURN', 'VALUES', 'OUTPUTS', 'c')
+    env.assertEqual(ret, b'OK')
+    tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+    env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+
+
+def test_pytorch_run_inline_inputs(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+
+    with open(os.path.join(test_data_path, 'pt-minimal.pt'), 'rb') as f:
+        model_pb = f.read()
+    with open(os.path.join(test_data_path, 'script.txt'), 'rb') as f:
+        script = f.read()
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+    ret = con.execute_command('AI.SCRIPTSET', 's', DEVICE, script)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    blob = np.array([2, 3, 2, 3], dtype=np.float32).tobytes()
+
+    ret = con.execute_command('AI.MODELRUN', 'm', 'RETURN', 'VALUES', 'INPUTS', '$', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3,
+                              '$', 'FLOAT', 2, 2, 'BLOB', blob, 'OUTPUTS', 'c')
+    env.assertEqual(ret[0][-1], [b'4', b'6', b'4', b'6'])
+
+    ret = con.execute_command('AI.MODELRUN', 'm', 'INPUTS', '$', 'FLOAT', 2, 2, 'BLOB', blob, 'b',
+                              'OUTPUTS', 'c')
+    env.assertEqual(ret, b'OK')
+    tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+    env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+
+    ret = con.execute_command('AI.SCRIPTRUN', 's', 'bar', 'INPUTS', 'b', '$', 'FLOAT', 2, 2, 'BLOB', blob,
+                              'OUTPUTS', 'd')
+    env.assertEqual(ret, b'OK')
+    tensor = con.execute_command('AI.TENSORGET', 'd', 'VALUES')
+    env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+
+    # inline tensors are not stored
+    env.assertEqual(con.execute_command('EXISTS', '$'), 0)
+
+    ensureSlaveSynced(con, env)
+
+    if env.useSlaves:
+        con2 = env.getSlaveConnection()
+        tensor = con2.execute_command('AI.TENSORGET', 'd', 'VALUES')
+        env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+
+    for args in [['$', 'FLOAT', 2, 2, 'VALUES', 2, 3, 'b'], ['$', 'FLOAT', 2, 2, 'b'],
+                 ['$', 'FLOAT', 2, 2, 'BLOB', b'abc', 'b'],
+                 ['$', 'FLOAT', 2, 4611686018427387904, 'VALUES', 2, 'b']]:
+        try:
+            con.execute_command('AI.MODELRUN', 'm', 'INPUTS', *args, 'OUTPUTS', 'c')
+            env.assertFalse(True)
+        except Exception as e:
+            env.assertEqual(type(e), redis.exceptions.ResponseError)
+
+
+def test_pytorch_modelrun_replicate(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    try:
+        con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'REPLICATE', 'SOMETIMES', model_pb)
+        env.assertFalse(True)
+    except Exception as e:
+        env.assertEqual(type(e), redis.exceptions.ResponseError)
+        env.assertEqual("Invalid argument for REPLICATE", e.__str__())
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    ret = con.execute_command('AI.MODELSET', 'm_blob', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+    ret = con.execute_command('AI.MODELSET', 'm_none', 'TORCH', DEVICE, 'REPLICATE', 'NONE', model_pb)
+    env.assertEqual(ret, b'OK')
+    ret = con.execute_command('AI.MODELSET', 'm_command', 'TORCH', DEVICE, 'REPLICATE', 'COMMAND', model_pb)
+    env.assertEqual(ret, b'OK')
+
+    for key in ['m_blob', 'm_none', 'm_command']:
+        ret = con.execute_command('AI.MODELRUN', key, 'INPUTS', 'a', 'b', 'OUTPUTS', key + '_out')
+        env.assertEqual(ret, b'OK')
+    ret = con.execute_command('AI.MODELRUN', 'm_blob', 'NOREPLICATE', 'INPUTS', 'a', 'b', 'OUTPUTS', 'noreplicate_out')
+    env.assertEqual(ret, b'OK')
+
+    # the outputs are always written on the master
+    for key in ['m_blob_out', 'm_none_out', 'm_command_out', 'noreplicate_out']:
+        tensor = con.execute_command('AI.TENSORGET', key, 'VALUES')
+        env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+
+    ensureSlaveSynced(con, env)
+
+    if env.useSlaves:
+        con2 = env.getSlaveConnection()
+        # the replica runs the model itself for COMMAND
+        time.sleep(0.5)
+        for key in ['m_blob_out', 'm_command_out']:
+            tensor = con2.execute_command('AI.TENSORGET', key, 'VALUES')
+            env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+        env.assertEqual(con2.execute_command('EXISTS', 'm_none_out'), 0)
+        env.assertEqual(con2.execute_command('EXISTS', 'noreplicate_out'), 0)
+
+
+def test_pytorch_run_readonly(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+
+    with open(os.path.join(test_data_path, 'pt-minimal.pt'), 'rb') as f:
+        model_pb = f.read()
+    with open(os.path.join(test_data_path, 'script.txt'), 'rb') as f:
+        script = f.read()
+
+    con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+    con.execute_command('AI.SCRIPTSET', 's', DEVICE, script)
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    expected = np.array([4, 6, 4, 6], dtype=np.float32).tobytes()
+
+    ret = con.execute_command('AI.MODELRUN_RO', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    env.assertEqual(ret[0][-1], expected)
+    ret = con.execute_command('AI.SCRIPTRUN_RO', 's', 'bar', 'RETURN', 'VALUES', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    env.assertEqual(ret[0][-1], [b'4', b'6', b'4', b'6'])
+    env.assertEqual(con.execute_command('EXISTS', 'c'), 0)
+
+    ensureSlaveSynced(con, env)
+
+    if env.useSlaves:
+        con2 = env.getSlaveConnection()
+        ret = con2.execute_command('AI.MODELRUN_RO', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+        env.assertEqual(ret[0][-1], expected)
+        ret = con2.execute_command('AI.SCRIPTRUN_RO', 's', 'bar', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+        env.assertEqual(ret[0][-1], expected)
+        env.assertEqual(con2.execute_command('EXISTS', 'c'), 0)
+
+        # the write variant is still rejected by replicas
+        try:
+            con2.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+            env.assertFalse(True)
+        except Exception as e:
+            env.assertEqual(type(e), redis.exceptions.ReadOnlyError)
+
+
+def test_pytorch_modelrun_cache(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    for args in [['CACHE', 0], ['CACHE', 'big'], ['CACHE', 1000, 'TTL', -1]]:
+        try:
+            con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, *args, model_pb)
+            env.assertFalse(True)
+        except Exception as e:
+            env.assertEqual(type(e), redis.exceptions.ResponseError)
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'CACHE', 100000, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    for i in range(3):
+        ret = con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c{}'.format(i))
+        env.assertEqual(ret, b'OK')
+        tensor = con.execute_command('AI.TENSORGET', 'c{}'.format(i), 'VALUES')
+        env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+
+    ret = con.execute_command('AI.MODELRUN', 'm', 'RETURN', 'VALUES', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    env.assertEqual(ret[0][-1], [b'4', b'6', b'4', b'6'])
+
+    # same shape and type, different values
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 1, 1, 1, 1)
+    ret = con.execute_command('AI.MODELRUN', 'm', 'RETURN', 'VALUES', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    env.assertEqual(ret[0][-1], [b'3', b'4', b'3', b'4'])
+
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['CALLS'], 5)
+    env.assertEqual(info['CACHE_HITS'], 3)
+    env.assertEqual(info['CACHE_MISSES'], 2)
+    env.assertEqual(info['CACHE_ENTRIES'], 2)
+    env.assertTrue(info['CACHE_BYTES'] > 0)
+
+    ensureSlaveSynced(con, env)
+
+    if env.useSlaves:
+        con2 = env.getSlaveConnection()
+        tensor = con2.execute_command('AI.TENSORGET', 'c2', 'VALUES')
+        env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+
+    ret = con.execute_command('AI.INFO', 'm', 'RESETSTAT')
+    env.assertEqual(ret, b'OK')
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['CACHE_HITS'], 0)
+    env.assertEqual(info['CACHE_ENTRIES'], 2)
+
+    # setting the key again starts from an empty cache, entries expire after TTL
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'CACHE', 100000, 'TTL', 100, model_pb)
+    env.assertEqual(ret, b'OK')
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['CACHE_ENTRIES'], 0)
+
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    time.sleep(0.2)
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['CACHE_HITS'], 0)
+    env.assertEqual(info['CACHE_MISSES'], 2)
+
+    # entries larger than the cache are not stored, the oldest ones are evicted
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'CACHE', 1, model_pb)
+    env.assertEqual(ret, b'OK')
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['CACHE_ENTRIES'], 0)
+    env.assertEqual(info['CACHE_BYTES'], 0)
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'CACHE', 400, model_pb)
+    env.assertEqual(ret, b'OK')
+    for i in range(4):
+        con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', i, i, i, i)
+        con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertTrue(info['CACHE_EVICTIONS'] > 0)
+    env.assertTrue(info['CACHE_BYTES'] <= 400)
+
+
+def test_pytorch_modelrun_coalesce(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    # a slow script keeps the worker of the device queue busy, so the runs
+    # below are all pending at the same time
+    slow_script = 'def slow(a):\n    for i in range(200000):\n        a = a + 0\n    return a\n'
+    ret = con.execute_command('AI.SCRIPTSET', 's', DEVICE, slow_script)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    def run_slow():
+        con = env.getConnection()
+        con.execute_command('AI.SCRIPTRUN', 's', 'slow', 'INPUTS', 'a', 'OUTPUTS', 'd')
+
+    slow_thread = threading.Thread(target=run_slow)
+    slow_thread.start()
+    time.sleep(0.1)
+
+    nclients = 20
+    replies = [None] * nclients
+
+    def run(i):
+        con = env.getConnection()
+        if i % 2 == 0:
+            replies[i] = con.execute_command('AI.MODELRUN', 'm', 'RETURN', 'VALUES', 'INPUTS', 'a', 'b',
+                                             'OUTPUTS', 'c{}'.format(i))
+        else:
+            con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c{}'.format(i))
+            replies[i] = [con.execute_command('AI.TENSORGET', 'c{}'.format(i), 'VALUES')]
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(nclients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    slow_thread.join()
+
+    for reply in replies:
+        env.assertEqual(reply[0][-1], [b'4', b'6', b'4', b'6'])
+
+    # every request is accounted for, whether it ran or joined a pending one
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['CALLS'], nclients)
+    env.assertEqual(info['ERRORS'], 0)
+    env.assertTrue(0 < info['COALESCED'] < nclients)
+
+    ret = con.execute_command('AI.INFO', 'm', 'RESETSTAT')
+    env.assertEqual(ret, b'OK')
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['COALESCED'], 0)
+
+
 def test_pytorch_modelrun_autobatch(env):
     if not TEST_PT:
         return
@@ -145,37 +520,354 @@ def test_pytorch_modelrun_autobatch(env):
     with open(model_filename, 'rb') as f:
         model_pb = f.read()
 
-    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', 'CPU',
-                              'BATCHSIZE', 4, 'MINBATCHSIZE', 3, model_pb)
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', 'CPU',
+                              'BATCHSIZE', 4, 'MINBATCHSIZE', 3, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    con.execute_command('AI.TENSORSET', 'd', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'e', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    ensureSlaveSynced(con, env)
+
+    def run():
+        con = env.getConnection()
+        con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'd', 'e', 'OUTPUTS', 'f')
+        ensureSlaveSynced(con, env)
+
+    t = threading.Thread(target=run)
+    t.start()
+
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+
+    ensureSlaveSynced(con, env)
+
+    tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+    values = tensor[-1]
+    env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+
+    tensor = con.execute_command('AI.TENSORGET', 'f', 'VALUES')
+    values = tensor[-1]
+    env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+
+
+def test_pytorch_modelrunmulti(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    # the samples of a single command fill a batch of MINBATCHSIZE
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE,
+                              'BATCHSIZE', 4, 'MINBATCHSIZE', 4, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 1, 1, 1, 1)
+
+    ret = con.execute_command('AI.MODELRUNMULTI', 'm', 'INPUTS', 'a', 'a', 'OUTPUTS', 'c1',
+                              'INPUTS', 'a', 'b', 'OUTPUTS', 'c2')
+    env.assertEqual(ret, [b'OK', b'OK'])
+
+    tensor = con.execute_command('AI.TENSORGET', 'c1', 'VALUES')
+    env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+    tensor = con.execute_command('AI.TENSORGET', 'c2', 'VALUES')
+    env.assertEqual(tensor[-1], [b'3', b'4', b'3', b'4'])
+
+    ret = con.execute_command('AI.MODELRUNMULTI', 'm', 'RETURN', 'VALUES',
+                              'INPUTS', 'b', 'b', 'OUTPUTS', 'c',
+                              'INPUTS', '$', 'FLOAT', 2, 2, 'VALUES', 1, 2, 3, 4, 'b', 'OUTPUTS', 'c')
+    env.assertEqual(len(ret), 2)
+    env.assertEqual(ret[0][0][-1], [b'2', b'2', b'2', b'2'])
+    env.assertEqual(ret[1][0][-1], [b'2', b'3', b'4', b'5'])
+
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['CALLS'], 4)
+
+    ensureSlaveSynced(con, env)
+
+    if env.useSlaves:
+        con2 = env.getSlaveConnection()
+        tensor = con2.execute_command('AI.TENSORGET', 'c2', 'VALUES')
+        env.assertEqual(tensor[-1], [b'3', b'4', b'3', b'4'])
+
+    # every sample has input keys, and output keys unless RETURN is given
+    samples = ['INPUTS', 'a', 'b', 'OUTPUTS', 'c1', 'INPUTS', 'b', 'a', 'OUTPUTS', 'c2']
+    keys = con.execute_command('COMMAND', 'GETKEYS', 'AI.MODELRUNMULTI', 'm', *samples)
+    env.assertEqual(keys, [b'm', b'a', b'b', b'c1', b'b', b'a', b'c2'])
+    keys = con.execute_command('COMMAND', 'GETKEYS', 'AI.MODELRUNMULTI', 'm', 'RETURN', 'VALUES', *samples)
+    env.assertEqual(keys, [b'm', b'a', b'b', b'b', b'a'])
+
+    for args in [['INPUTS', 'a', 'a', 'OUTPUTS', 'c', 'INPUTS', 'a', 'z', 'OUTPUTS', 'c'],
+                 ['a', 'a', 'OUTPUTS', 'c']]:
+        try:
+            con.execute_command('AI.MODELRUNMULTI', 'm', *args)
+            env.assertFalse(True)
+        except Exception as e:
+            env.assertEqual(type(e), redis.exceptions.ResponseError)
+
+
+def test_pytorch_modelrun_async(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    pubsub = con.pubsub()
+    pubsub.subscribe('redisai:runs')
+    pubsub.get_message(timeout=1)
+
+    tickets = [con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c{}'.format(i), 'ASYNC')
+               for i in range(10)]
+    env.assertEqual(len(set(tickets)), 10)
+
+    published = set()
+    while len(published) < 10:
+        message = pubsub.get_message(timeout=5)
+        env.assertNotEqual(message, None)
+        if message is None:
+            break
+        published.add(int(message['data']))
+    env.assertEqual(published, set(tickets))
+
+    for i, ticket in enumerate(tickets):
+        env.assertEqual(con.execute_command('AI.WAIT', ticket), b'OK')
+        tensor = con.execute_command('AI.TENSORGET', 'c{}'.format(i), 'VALUES')
+        env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+
+    ticket = con.execute_command('AI.MODELRUN', 'm', 'RETURN', 'VALUES', 'INPUTS', 'a', 'b',
+                                 'OUTPUTS', 'd', 'ASYNC')
+    ret = con.execute_command('AI.WAIT', ticket, 5000)
+    env.assertEqual(ret[0][-1], [b'4', b'6', b'4', b'6'])
+    env.assertEqual(con.execute_command('EXISTS', 'd'), 0)
+
+    # a result is collected once
+    for args in [[ticket], ['notaticket'], [ticket, -1]]:
+        try:
+            con.execute_command('AI.WAIT', *args)
+            env.assertFalse(True)
+        except Exception as e:
+            env.assertEqual(type(e), redis.exceptions.ResponseError)
+
+    info = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info['CALLS'], 11)
+
+    ensureSlaveSynced(con, env)
+
+    if env.useSlaves:
+        con2 = env.getSlaveConnection()
+        tensor = con2.execute_command('AI.TENSORGET', 'c9', 'VALUES')
+        env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
+
+    # a completed result only holds its outputs, not the model
+    ticket = con.execute_command('AI.MODELRUN', 'm', 'RETURN', 'VALUES', 'INPUTS', 'a', 'b',
+                                 'OUTPUTS', 'e', 'ASYNC')
+    message = pubsub.get_message(timeout=5)
+    env.assertNotEqual(message, None)
+    con.execute_command('DEL', 'm')
+    ret = con.execute_command('AI.WAIT', ticket)
+    env.assertEqual(ret[0][-1], [b'4', b'6', b'4', b'6'])
+
+
+def test_pytorch_modelrun_async_expire(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    ret = con.execute_command('AI.CONFIG', 'ASYNC_RESULT_TTL', 100)
+    env.assertEqual(ret, b'OK')
+
+    pubsub = con.pubsub()
+    pubsub.subscribe('redisai:runs')
+    pubsub.get_message(timeout=1)
+
+    # the result of this run is never collected
+    ticket = con.execute_command('AI.MODELRUN', 'm', 'RETURN', 'VALUES', 'INPUTS', 'a', 'b',
+                                 'OUTPUTS', 'c', 'ASYNC')
+    message = pubsub.get_message(timeout=5)
+    env.assertNotEqual(message, None)
+    if message is not None:
+        env.assertEqual(int(message['data']), ticket)
+
+    time.sleep(0.2)
+
+    try:
+        con.execute_command('AI.WAIT', ticket)
+        env.assertFalse(True)
+    except Exception as e:
+        env.assertEqual(type(e), redis.exceptions.ResponseError)
+        env.assertEqual("unknown ticket", e.__str__())
+
+    # results collected in time are not affected
+    ret = con.execute_command('AI.CONFIG', 'ASYNC_RESULT_TTL', 60000)
+    env.assertEqual(ret, b'OK')
+    ticket = con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c', 'ASYNC')
+    env.assertEqual(con.execute_command('AI.WAIT', ticket, 5000), b'OK')
+
+    try:
+        con.execute_command('AI.CONFIG', 'ASYNC_RESULT_TTL', -1)
+        env.assertFalse(True)
+    except Exception as e:
+        env.assertEqual(type(e), redis.exceptions.ResponseError)
+
+
+def test_pytorch_modelset_hot_swap(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    ensureSlaveSynced(con, env)
+
+    # runs queued against a version keep it alive while the key is overwritten
+    errors = []
+
+    def run():
+        con = env.getConnection()
+        for i in range(50):
+            out = 'c{}'.format(i)
+            try:
+                con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', out)
+                tensor = con.execute_command('AI.TENSORGET', out, 'VALUES')
+                if tensor[-1] != [b'4', b'6', b'4', b'6']:
+                    errors.append(tensor[-1])
+            except Exception as e:
+                errors.append(e)
+
+    t = threading.Thread(target=run)
+    t.start()
+
+    for _ in range(10):
+        ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+        env.assertEqual(ret, b'OK')
+
+    t.join()
+    env.assertEqual(errors, [])
+
+    info_dict = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info_dict['VERSION'], 11)
+
+    # the version is saved with the model
+    con.execute_command('DEBUG', 'RELOAD')
+    info_dict = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info_dict['VERSION'], 11)
+
+    con.execute_command('DEL', 'm')
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+    info_dict = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info_dict['VERSION'], 1)
+
+
+def test_pytorch_model_session_eviction(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    # only the most recently used session fits
+    ret = con.execute_command('AI.CONFIG', 'MODEL_SESSION_MEMORY_LIMIT', 1)
+    env.assertEqual(ret, b'OK')
+
+    ret = con.execute_command('AI.MODELSET', 'm1', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+    ret = con.execute_command('AI.MODELSET', 'm2', 'TORCH', DEVICE, model_pb)
     env.assertEqual(ret, b'OK')
 
+    info_dict = info_to_dict(con.execute_command('AI.INFO', 'm1'))
+    env.assertEqual(info_dict['EVICTIONS'], 1)
+    env.assertEqual(info_dict['RECOMPILES'], 0)
+
     con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
     con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
 
-    con.execute_command('AI.TENSORSET', 'd', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
-    con.execute_command('AI.TENSORSET', 'e', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
-
-    ensureSlaveSynced(con, env)
+    ret = con.execute_command('AI.MODELRUN', 'm1', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    env.assertEqual(ret, b'OK')
+    tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+    env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
 
-    def run():
-        con = env.getConnection()
-        con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'd', 'e', 'OUTPUTS', 'f')
-        ensureSlaveSynced(con, env)
+    info_dict = info_to_dict(con.execute_command('AI.INFO', 'm1'))
+    env.assertEqual(info_dict['EVICTIONS'], 1)
+    env.assertEqual(info_dict['RECOMPILES'], 1)
+    env.assertTrue(info_dict['RECOMPILE_DURATION'] > 0)
 
-    t = threading.Thread(target=run)
-    t.start()
+    info_dict = info_to_dict(con.execute_command('AI.INFO', 'm2'))
+    env.assertEqual(info_dict['EVICTIONS'], 1)
 
-    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    # evicted models are still saved and served
+    model_serialized = con.execute_command('AI.MODELGET', 'm2', 'BLOB')
+    env.assertTrue(len(model_serialized[-1]) > 0)
 
-    ensureSlaveSynced(con, env)
+    ret = con.execute_command('AI.CONFIG', 'MODEL_SESSION_MEMORY_LIMIT', 0)
+    env.assertEqual(ret, b'OK')
 
+    ret = con.execute_command('AI.MODELRUN', 'm2', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    env.assertEqual(ret, b'OK')
     tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
-    values = tensor[-1]
-    env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+    env.assertEqual(tensor[-1], [b'4', b'6', b'4', b'6'])
 
-    tensor = con.execute_command('AI.TENSORGET', 'f', 'VALUES')
-    values = tensor[-1]
-    env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+    try:
+        con.execute_command('AI.CONFIG', 'MODEL_SESSION_MEMORY_LIMIT', -1)
+    except Exception as e:
+        exception = e
+    env.assertEqual(type(exception), redis.exceptions.ResponseError)
+    env.assertEqual("MODEL_SESSION_MEMORY_LIMIT: invalid number of bytes", exception.__str__())
 
 
 def test_pytorch_modelinfo(env):
@@ -677,4 +1369,286 @@ def test_pytorch_model_rdb_save_load(env):
     # Assert in memory tensor data is equal to loaded tensor data
     env.assertTrue(dtype_memory == dtype_after_rdbload)
     env.assertTrue(shape_memory == shape_after_rdbload)
-    env.assertTrue(data_memory == data_after_rdbload)
\ No newline at end of file
+    env.assertTrue(data_memory == data_after_rdbload)
+
+def test_pytorch_lazy_loading(env):
+    env.skipOnCluster()
+    if env.useAof or not TEST_PT:
+        env.debugPrint("skipping {}".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+    script_filename = os.path.join(test_data_path, 'script.txt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    with open(script_filename, 'rb') as f:
+        script = f.read()
+
+    con = env.getConnection()
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+    ret = con.execute_command('AI.SCRIPTSET', 'ket', DEVICE, script)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    model_serialized_memory = con.execute_command('AI.MODELGET', 'm', 'BLOB')
+
+    try:
+        con.execute_command('AI.CONFIG', 'LOADING_MODE', 'SOMETIMES')
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("LOADING_MODE: unsupported mode, use EAGER, LAZY or BACKGROUND", exception.__str__())
+
+    for mode in ['LAZY', 'BACKGROUND']:
+        ret = con.execute_command('AI.CONFIG', 'LOADING_MODE', mode)
+        env.assertEqual(ret, b'OK')
+
+        con.execute_command('DEBUG', 'RELOAD')
+
+        # blob is served before the model is compiled
+        model_serialized_after_reload = con.execute_command('AI.MODELGET', 'm', 'BLOB')
+        env.assertEqual(model_serialized_memory, model_serialized_after_reload)
+
+        con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+        tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+        values = tensor[-1]
+        env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+
+        con.execute_command('AI.SCRIPTRUN', 'ket', 'bar', 'INPUTS', 'a', 'b', 'OUTPUTS', 'd')
+        tensor = con.execute_command('AI.TENSORGET', 'd', 'VALUES')
+        values = tensor[-1]
+        env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+
+    con.execute_command('AI.CONFIG', 'LOADING_MODE', 'EAGER')
+
+
+def test_pytorch_loading_threads(env):
+    env.skipOnCluster()
+    if env.useAof or not TEST_PT:
+        env.debugPrint("skipping {}".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+    script_filename = os.path.join(test_data_path, 'script.txt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    with open(script_filename, 'rb') as f:
+        script = f.read()
+
+    con = env.getConnection()
+
+    for i in range(4):
+        ret = con.execute_command('AI.MODELSET', 'm{}'.format(i), 'TORCH', DEVICE, model_pb)
+        env.assertEqual(ret, b'OK')
+    ret = con.execute_command('AI.SCRIPTSET', 'ket', DEVICE, script)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    try:
+        con.execute_command('AI.CONFIG', 'LOADING_THREADS', -1)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("LOADING_THREADS: invalid number of threads", exception.__str__())
+
+    ret = con.execute_command('AI.CONFIG', 'LOADING_THREADS', 2)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('DEBUG', 'RELOAD')
+
+    for i in range(4):
+        con.execute_command('AI.MODELRUN', 'm{}'.format(i), 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+        tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+        values = tensor[-1]
+        env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+
+    con.execute_command('AI.SCRIPTRUN', 'ket', 'bar', 'INPUTS', 'a', 'b', 'OUTPUTS', 'd')
+    tensor = con.execute_command('AI.TENSORGET', 'd', 'VALUES')
+    values = tensor[-1]
+    env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+
+    con.execute_command('AI.CONFIG', 'LOADING_THREADS', 0)
+
+
+def test_pytorch_modelset_warmup(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    try:
+        con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'WARMUP', 2, model_pb)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("WARMUP requires SHAPE for the inputs of TORCH models", exception.__str__())
+
+    try:
+        con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'WARMUP', 2, 'SHAPE', 'BOOL', 2, 2, model_pb)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("invalid data type for SHAPE", exception.__str__())
+
+    try:
+        con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'WARMUP', 2, 'SHAPE', 'FLOAT', 'SHAPE', 'FLOAT', 2, 2, model_pb)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("SHAPE requires at least one dimension", exception.__str__())
+
+    # the model expects two inputs
+    try:
+        con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'WARMUP', 2, 'SHAPE', 'FLOAT', 2, 2, model_pb)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+
+    env.assertEqual(con.execute_command('EXISTS', 'm'), 0)
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'BATCHSIZE', 4, 'WARMUP', 2,
+                              'SHAPE', 'FLOAT', 2, 2, 'SHAPE', 'FLOAT', 2, 2, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+    values = tensor[-1]
+    env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+
+    # warm-up runs are not accounted in the run statistics
+    info = con.execute_command('AI.INFO', 'm')
+    info_dict = info_to_dict(info)
+    env.assertEqual(info_dict['CALLS'], 1)
+
+    # within a transaction the warm-up can't block the client and runs inline
+    pipe = con.pipeline(transaction=True)
+    pipe.execute_command('AI.MODELSET', 'm2', 'TORCH', DEVICE, 'WARMUP', 2,
+                         'SHAPE', 'FLOAT', 2, 2, 'SHAPE', 'FLOAT', 2, 2, model_pb)
+    pipe.execute_command('EXISTS', 'm2')
+    env.assertEqual(pipe.execute(), [b'OK', 1])
+
+    con.execute_command('SET', 'notamodel', 'x')
+    try:
+        con.execute_command('AI.MODELSET', 'notamodel', 'TORCH', DEVICE, 'WARMUP', 2,
+                            'SHAPE', 'FLOAT', 2, 2, 'SHAPE', 'FLOAT', 2, 2, model_pb)
+        env.assertTrue(False)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertTrue(exception.__str__().startswith("WRONGTYPE"))
+
+    if env.useAof or env.isCluster():
+        return
+
+    ret = con.execute_command('AI.CONFIG', 'WARMUP_ON_LOAD', 2)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('DEBUG', 'RELOAD')
+
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+    values = tensor[-1]
+    env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+
+    con.execute_command('AI.CONFIG', 'WARMUP_ON_LOAD', 0)
+
+
+def test_pytorch_modelset_optimize(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+    onnx_model_filename = os.path.join(test_data_path, 'mnist.onnx')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    with open(onnx_model_filename, 'rb') as f:
+        onnx_model_pb = f.read()
+
+    try:
+        con.execute_command('AI.MODELSET', 'm_onnx', 'ONNX', DEVICE, 'OPTIMIZE', onnx_model_pb)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("OPTIMIZE only supported by the TORCH backend", exception.__str__())
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, 'OPTIMIZE', model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    for _ in env.reloadingIterator():
+        con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+        tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+        values = tensor[-1]
+        env.assertEqual(values, [b'4', b'6', b'4', b'6'])
+
+
+def test_pytorch_backend_threads(env):
+    if not TEST_PT:
+        env.debugPrint("skipping {} since TEST_PT=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'pt-minimal.pt')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    try:
+        con.execute_command('AI.CONFIG', 'BACKEND', 'TORCH', 'INTRA_OP_THREADS', 0)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("TORCH: invalid number of threads", exception.__str__())
+
+    try:
+        con.execute_command('AI.CONFIG', 'BACKEND', 'TORCH', 'THREADS', 2)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("TORCH: unsupported option", exception.__str__())
+
+    ret = con.execute_command('AI.CONFIG', 'BACKEND', 'TORCH', 'INTRA_OP_THREADS', 2)
+    env.assertEqual(ret, b'OK')
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TORCH', DEVICE, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+    con.execute_command('AI.TENSORSET', 'b', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
+
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'b', 'OUTPUTS', 'c')
+    tensor = con.execute_command('AI.TENSORGET', 'c', 'VALUES')
+    values = tensor[-1]
+    env.assertEqual(values, [b'4', b'6', b'4', b'6'])
@@ -467,6 +467,18 @@ def test_run_tf_model_errors(env):
         env.assertEqual(type(exception), redis.exceptions.ResponseError)
         env.assertEqual("INPUTS not specified", exception.__str__())
 
+    # warm-up inputs are matched with INPUTS names by position
+    try:
+        con.execute_command('AI.MODELSET', 'm_3', 'TF', DEVICE, 'WARMUP', 1,
+                            'SHAPE', 'FLOAT', 2, 'SHAPE', 'FLOAT', 2, 'SHAPE', 'FLOAT', 2,
+                            'INPUTS', 'a', 'b', 'OUTPUTS', 'mul', model_pb)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("Number of SHAPE entries and model INPUTS do not match", exception.__str__())
+
+    env.assertEqual(con.execute_command('EXISTS', 'm_3'), 0)
+
 
 @skip_if_no_TF
 def test_run_tf_model_autobatch(env):
@@ -535,7 +547,9 @@ def test_tensorflow_modelinfo(env):
     info = con.execute_command('AI.INFO', 'm')  # Getting initial info before modelrun
     info_dict0 = info_to_dict(info)
     expected = {'KEY': 'm', 'TYPE': 'MODEL', 'BACKEND': 'TF', 'DEVICE': DEVICE,
-                'TAG': '', 'DURATION': 0, 'SAMPLES': 0, 'CALLS': 0, 'ERRORS': 0}
+                'TAG': '', 'DURATION': 0, 'SAMPLES': 0, 'CALLS': 0, 'ERRORS': 0,
+                'VERSION': 1, 'EVICTIONS': 0, 'EVICTION_DURATION': 0,
+                'RECOMPILES': 0, 'RECOMPILE_DURATION': 0, 'COALESCED': 0}
     env.assertEqual(info_dict0, expected)
 
     # second modelset; a corner case
@@ -544,7 +558,8 @@ def test_tensorflow_modelinfo(env):
     env.assertEqual(ret, b'OK')
     info = con.execute_command('AI.INFO', 'm')  # this will fail
     info_dict1 = info_to_dict(info)
-    env.assertEqual(info_dict1, info_dict0)
+    expected['VERSION'] = 2
+    env.assertEqual(info_dict1, expected)
 
     ret = con.execute_command(
         'AI.TENSORSET', 'a', 'FLOAT', 2, 2, 'VALUES', 2, 3, 2, 3)
@@ -192,12 +192,19 @@ def test_run_tflite_model_errors(env):
         env.assertEqual(type(exception), redis.exceptions.ResponseError)
         env.assertEqual("Inconsistent number of outputs", exception.__str__())
 
+    con.execute_command('AI.TENSORSET', 'small', 'FLOAT', 1, 1, 14, 28)
+
+    try:
+        con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'small', 'OUTPUTS', 'b', 'c')
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("Input tensor size does not match the model input", exception.__str__())
+
 
-# TODO: Autobatch is tricky with TFLITE because TFLITE expects a fixed batch
-#       size. At least we should constrain MINBATCHSIZE according to the
-#       hard-coded dims in the tflite model.
 def test_run_tflite_model_autobatch(env):
-    if not TEST_PT:
+    if not TEST_TFLITE:
+        env.debugPrint("skipping {} since TEST_TFLITE=0".format(sys._getframe().f_code.co_name), force=True)
         return
 
     con = env.getConnection()
@@ -212,37 +219,37 @@ def test_run_tflite_model_autobatch(env):
     with open(sample_filename, 'rb') as f:
         sample_raw = f.read()
 
-    try:
-        ret = con.execute_command('AI.MODELSET', 'm', 'TFLITE', 'CPU',
-                                  'BATCHSIZE', 2, 'MINBATCHSIZE', 2, model_pb)
-    except Exception as e:
-        exception = e
-        env.assertEqual(type(exception), redis.exceptions.ResponseError)
-        env.assertEqual("Auto-batching not supported by the TFLITE backend", exception.__str__())
+    ret = con.execute_command('AI.MODELSET', 'm', 'TFLITE', 'CPU',
+                              'BATCHSIZE', 2, 'MINBATCHSIZE', 2, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 1, 1, 28, 28, 'BLOB', sample_raw)
+    con.execute_command('AI.TENSORSET', 'c', 'FLOAT', 1, 1, 28, 28, 'BLOB', sample_raw)
+
+    ensureSlaveSynced(con, env)
 
-    # env.assertEqual(ret, b'OK')
+    def run():
+        con = env.getConnection()
+        con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'c', 'OUTPUTS', 'd', 'd2')
 
-    # con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 1, 1, 28, 28, 'BLOB', sample_raw)
-    # con.execute_command('AI.TENSORSET', 'c', 'FLOAT', 1, 1, 28, 28, 'BLOB', sample_raw)
+    t = threading.Thread(target=run)
+    t.start()
 
-    # def run():
-    #     con = env.getConnection()
-    #     con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'c', 'OUTPUTS', 'd', 'd2')
+    con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'OUTPUTS', 'b', 'b2')
 
-    # t = threading.Thread(target=run)
-    # t.start()
+    t.join()
 
-    # con.execute_command('AI.MODELRUN', 'm', 'INPUTS', 'a', 'OUTPUTS', 'b', 'b2')
+    ensureSlaveSynced(con, env)
 
-    # tensor = con.execute_command('AI.TENSORGET', 'b', 'VALUES')
-    # value = tensor[-1][0]
+    tensor = con.execute_command('AI.TENSORGET', 'b', 'VALUES')
+    value = tensor[-1][0]
 
-    # env.assertEqual(value, 1)
+    env.assertEqual(value, 1)
 
-    # tensor = con.execute_command('AI.TENSORGET', 'd', 'VALUES')
-    # value = tensor[-1][0]
+    tensor = con.execute_command('AI.TENSORGET', 'd', 'VALUES')
+    value = tensor[-1][0]
 
-    # env.assertEqual(value, 1)
+    env.assertEqual(value, 1)
 
 
 def test_tflite_modelinfo(env):
@@ -303,6 +310,59 @@ def test_tflite_modelinfo(env):
     env.assertEqual(info_dict_0['ERRORS'], 0)
 
 
+def test_tflite_threads(env):
+    if not TEST_TFLITE:
+        env.debugPrint("skipping {} since TEST_TFLITE=0".format(sys._getframe().f_code.co_name), force=True)
+        return
+
+    con = env.getConnection()
+    test_data_path = os.path.join(os.path.dirname(__file__), 'test_data')
+    model_filename = os.path.join(test_data_path, 'mnist_model_quant.tflite')
+    sample_filename = os.path.join(test_data_path, 'one.raw')
+
+    with open(model_filename, 'rb') as f:
+        model_pb = f.read()
+
+    with open(sample_filename, 'rb') as f:
+        sample_raw = f.read()
+
+    try:
+        con.execute_command('AI.CONFIG', 'BACKEND', 'TFLITE', 'THREADS', 0)
+    except Exception as e:
+        exception = e
+        env.assertEqual(type(exception), redis.exceptions.ResponseError)
+        env.assertEqual("TFLITE THREADS: invalid number of threads", exception.__str__())
+
+    ret = con.execute_command('AI.CONFIG', 'BACKEND', 'TFLITE', 'THREADS', 2)
+    env.assertEqual(ret, b'OK')
+
+    ret = con.execute_command('AI.MODELSET', 'm_default', 'TFLITE', 'CPU', model_pb)
+    env.assertEqual(ret, b'OK')
+
+    ret = con.execute_command('AI.MODELSET', 'm', 'TFLITE', 'CPU', 'THREADS', 4, model_pb)
+    env.assertEqual(ret, b'OK')
+
+    ret = con.execute_command('AI.TENSORSET', 'a', 'FLOAT', 1, 1, 28, 28, 'BLOB', sample_raw)
+    env.assertEqual(ret, b'OK')
+
+    for key in ['m_default', 'm']:
+        ret = con.execute_command('AI.MODELRUN', key, 'INPUTS', 'a', 'OUTPUTS', 'b', 'c')
+        env.assertEqual(ret, b'OK')
+
+        tensor = con.execute_command('AI.TENSORGET', 'b', 'VALUES')
+        env.assertEqual(tensor[-1][0], 1)
+
+    info_dict = info_to_dict(con.execute_command('AI.INFO', 'm_default'))
+    env.assertEqual(info_dict['THREADS'], 2)
+    env.assertEqual(info_dict['XNNPACK'], 'OFF')
+
+    info_dict = info_to_dict(con.execute_command('AI.INFO', 'm'))
+    env.assertEqual(info_dict['THREADS'], 4)
+
+    ret = con.execute_command('AI.CONFIG', 'BACKEND', 'TFLITE', 'THREADS', 1)
+    env.assertEqual(ret, b'OK')
+
+
 def test_tflite_modelrun_disconnect(env):
     if not TEST_TFLITE:
         env.debugPrint("skipping {} since TEST_TFLITE=0".format(sys._getframe().f_code.co_name), force=True)